@@ -8,19 +8,22 @@ import open3d.visualization.rendering as rendering
 import open3d as o3d
 import functools
 from functools import partial
-from nuscenes.utils.data_classes import Box
-from nuscenes.utils.geometry_utils import view_points, box_in_image, BoxVisibility
 import matplotlib.colors
 import numpy as np
 from pyquaternion import Quaternion
 from scipy.spatial.transform import Rotation
-from PIL import Image
 import random
-import os
 import sys
-import json
-import cv2
 from lct import Window
+from utils import box_store
+from utils import scene_loader
+from utils import pose_table
+from utils import image_utils
+from utils import frame_cache
+from utils import render_utils
+from utils import projection_utils
+from utils import point_grid
+from utils import scan_cache
 import platform
 # import uuid
 import secrets
@@ -28,6 +31,10 @@ import secrets
 from copy import deepcopy
 
 OS_STRING = platform.system()
+# Frames a box trajectory is drawn over, centered on the current frame
+TRAJECTORY_FRAMES = 7
+# Steps of the bisection that finds the depth buffer value of a picked point
+DEPTH_BISECTION_STEPS = 24
 ORIGIN = 0
 SIZE = 1
 ROTATION = 2
@@ -63,15 +70,17 @@ class Annotation:
 		self.camera_sensors = camera_sensors
 		self.rgb_sensor_name = self.camera_sensors[0]
 		self.lct_path = lct_path
-		self.image_path = os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, str(self.frame_num) + ".jpg")
-		self.image = Image.open(self.image_path)
+		self.scene = scene_loader.open_scene(self.lct_path)
+		self.poses = pose_table.load_pose_table(self.lct_path)
+		self.image_path = "cameras/" + self.rgb_sensor_name + "/" + str(self.frame_num) + ".jpg"
+		self.image = self.scene.read_image(self.image_path)
 		self.image_w = self.image.width
 		self.image_h = self.image.height
 		self.image = np.asarray(self.image)
 
 		self.lidar_sensors = lidar_sensors
 		self.lidar_sensor_name = lidar_sensors[0]
-		self.pcd_path = os.path.join(self.lct_path, "pointcloud", self.lidar_sensor_name, "0.pcd")
+		self.pcd_path = self.scene.points_path(self.lidar_sensor_name, 0)
 		self.pcd_paths = []
 
 		self.box_selected = None
@@ -102,7 +111,13 @@ class Annotation:
 
 		self.coord_frame = "coord_frame"
 
-		self.source_format = json.load(open(os.path.join(self.lct_path, "metadata.json")))["source-format"]
+		# The point cloud and the RGB camera line stay in the scene, frame switches only update them
+		self.pointcloud_slot = render_utils.PointCloudSlot(scene_widget.scene, "Point Cloud", self.pcd_mat)
+		self.rgb_line_slot = render_utils.PosedSlot(scene_widget.scene, "RGB Line", render_utils.camera_line(), self.line_mat)
+		# Spatial grid of the frame's points used for picking, built on the first click of every frame
+		self.point_grid = None
+
+		self.source_format = self.scene.read_json("metadata.json")["source-format"]
 
 		# mouse and key event modifiers
 		self.z_drag = False
@@ -129,7 +144,7 @@ class Annotation:
 		layout = gui.Vert(0.50 * em, margin)
 
 		# num of frames available to display
-		frames_available = [entry for entry in os.scandir(os.path.join(self.lct_path, "bounding")) if entry.name != ".DS_Store"] # ignore .DS_Store (MacOS)
+		frames_available = [entry for entry in self.scene.listdir("bounding") if entry != ".DS_Store"] # ignore .DS_Store (MacOS)
 		self.num_frames = len(frames_available)
 
 		# switch between frames
@@ -169,7 +184,7 @@ class Annotation:
 		bounding_toggle_layout.add_child(gui.Label("Toggle Predicted or GT"))
 		bounding_toggle_layout.add_child(self.bounding_toggle)
 
-		frames_available = [entry for entry in os.scandir(os.path.join(self.lct_path, "bounding"))]
+		frames_available = self.scene.listdir("bounding")
 		self.pred_frames = len(frames_available) - 1
 
 		self.propagated_gt_boxes = []
@@ -515,7 +530,14 @@ class Annotation:
 					self.box_selected = self.box_indices[closest_index]
 					self.select_box(closest_index) #select the nearest box
 
-			widget.scene.scene.render_to_depth_image(get_depth)
+			# The point under the mouse is looked up in the point grid of the frame, which avoids reading
+			# back a depth image. Clicks that miss every point (eg: on an empty box) still use the depth image
+			picked = self.pick_point(event.x, event.y)
+			if picked is not None:
+				world, self.curr_box_depth = picked
+				get_nearest(world)
+			else:
+				widget.scene.scene.render_to_depth_image(get_depth)
 			return gui.Widget.EventCallbackResult.HANDLED
 
 		#If shift button is down during click event, indicates potential drag operation
@@ -641,6 +663,37 @@ class Annotation:
 		self.update_props()
 		self.update_poses()
 
+	def pick_point(self, x, y):
+		"""Finds the point of the current frame under the mouse with the point grid
+			Args:
+				self: window object
+				x, y: mouse coordinates, as passed to camera.unproject
+			Returns:
+				(world coordinates, depth buffer value) of the point, or None if no point is under the mouse
+				"""
+		if self.point_grid is None:
+			self.point_grid = point_grid.PointGrid(self.pointcloud)
+		camera = self.scene_widget.scene.camera
+		width = self.scene_widget.frame.width
+		height = self.scene_widget.frame.height
+		near = np.asarray(camera.unproject(x, y, 0.0, width, height))
+		far = np.asarray(camera.unproject(x, y, 1.0, width, height))
+		world = self.point_grid.pick(near, far - near)
+		if world is None:
+			return None
+
+		# Depth buffer value of the point, found by bisection along the mouse ray so it matches unproject,
+		# which is what dragging uses it with
+		distance = np.linalg.norm(world - near)
+		low, high = 0.0, 1.0
+		for _ in range(DEPTH_BISECTION_STEPS):
+			middle = (low + high) / 2
+			if np.linalg.norm(np.asarray(camera.unproject(x, y, middle, width, height)) - near) < distance:
+				low = middle
+			else:
+				high = middle
+		return world, (low + high) / 2
+
 	#select_box takes a box name (string) and checks to see if a previous box has been selected
 	#then it modifies the appropriate line widths to select and deselect boxes
 	#it also moves the coordinate frame to the selected box
@@ -1047,84 +1100,32 @@ class Annotation:
 	#adapted from lct method, credit to Nicholas Revilla
 	def update_image(self):
 		"""Fetches new image from LVT Directory, and draws it onto a plt figure
-           Uses nuScenes API to project 3D bounding boxes onto that plt figure
-           Finally, extracts raw image data from plt figure and updates our image widget
+           Projects 3D bounding boxes onto that image with projection_utils
+           Finally, updates our image widget
             Args:
                 self: window object
             Returns:
                 None
                 """
-		# Extract new image from file
-		self.image = np.asarray(Image.open(self.image_path))
-
-		for b in self.boxes_to_render:
-			box = Box(b[0], b[1], Quaternion(b[2]), name=b[3], score=b[4],
-					  velocity=(0, 0, 0))
-			color = b[5]
-			
-
-			# Box is stored in vehicle frame, so transform it to RGB sensor frame
-			box.translate(-np.array(self.image_extrinsic['translation']))
-			box.rotate(Quaternion(self.image_extrinsic['rotation']).inverse)
-			curr_index = self.boxes_to_render.index(b)
-			line_weight = 2
-			# Thank you to Oscar Beijbom for providing this box rendering algorithm at https://github.com/nutonomy/nuscenes-devkit/blob/master/python-sdk/nuscenes/utils/data_classes.py
-			if box_in_image(box, np.asarray(self.image_intrinsic['matrix']), (self.image_w, self.image_h),
-							BoxVisibility.ANY):
-				# If the box is in view, then render it onto the PLT frame
-				corners = view_points(box.corners(), np.asarray(self.image_intrinsic['matrix']), normalize=True)[:2, :]
-
-				# If the box is in view and it is the currently selected box, highlight it
-				if curr_index == self.previous_index:
-						line_weight = 10
-				else:
-						line_weight = 2
-
-				def draw_rect(selected_corners, c):
-					prev = selected_corners[-1]
-					for corner in selected_corners:
-						cv2.line(self.image,
-								 (int(prev[0]), int(prev[1])),
-								 (int(corner[0]), int(corner[1])),
-								 c, line_weight)
-						prev = corner
-
-				# if b["confidence"] >= 100: # If the box is a ground truth box
-				# Draw the sides
-				for i in range(4):
-					cv2.line(self.image,
-							(int(corners.T[i][0]), int(corners.T[i][1])),
-							(int(corners.T[i + 4][0]), int(corners.T[i + 4][1])),
-							color, line_weight)
-
-				# Draw front (first 4 corners) and rear (last 4 corners) rectangles(3d)/lines(2d)
-				draw_rect(corners.T[:4], color)
-				draw_rect(corners.T[4:], color)
-				
-				# else: # If the box is a predicted box
-				# 	# Draw the sides
-				# 	for i in range(4):
-				# 		cv2.line(self.image,
-				# 				(int(corners.T[i][0]), int(corners.T[i][1])),
-				# 				(int(corners.T[i + 4][0]), int(corners.T[i + 4][1])),
-				# 				pred_color, line_weight)
-						
-				# 	# Draw front (first 4 corners) and rear (last 4 corners) rectangles(3d)/lines(2d)
-				# 	draw_rect(corners.T[:4], pred_color)
-				# 	draw_rect(corners.T[4:], pred_color)
-
-				# Draw line indicating the front
-				center_bottom_forward = np.mean(corners.T[2:4], axis=0)
-				center_bottom = np.mean(corners.T[[2, 3, 7, 6]], axis=0)
-				cv2.line(self.image,
-						 (int(center_bottom[0]), int(center_bottom[1])),
-						 (int(center_bottom_forward[0]), int(center_bottom_forward[1])),
-						 color, line_weight)
-
-				# might be useful later -- Only render confidence if this isnt at GT box
-				# if b["confidence"] < 100 and self.show_score:
-				# 	cv2.putText(self.image, str(b["confidence"]), (int(corners.T[0][0]), int(corners.T[1][1])),
-				# 				cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
+		# Extract new image from file, decoded at about the size of the image window
+		# Shared with the viewer through the frame cache, so it is copied before boxes are drawn onto it
+		image, scale, (self.image_w, self.image_h) = frame_cache.load_image(self.lct_path, self.rgb_sensor_name, self.frame_num)
+		self.image = image.copy()
+		intrinsic = image_utils.scale_intrinsics(self.image_intrinsic['matrix'], scale)
+		image_size = (self.image.shape[1], self.image.shape[0])
+
+		# Every box is projected at once, and every color drawn with one polylines call
+		projection = projection_utils.project_boxes(self.boxes_to_render, intrinsic, self.image_extrinsic, image_size)
+		# If the box is in view and it is the currently selected box, highlight it
+		line_weights = np.full(len(self.boxes_to_render), 2)
+		if 0 <= self.previous_index < len(self.boxes_to_render):
+			line_weights[self.previous_index] = 10
+		projection_utils.draw_projected_boxes(self.image, projection, [b[5] for b in self.boxes_to_render], line_weights)
+
+		# might be useful later -- Only render confidence if this isnt at GT box
+		# if b["confidence"] < 100 and self.show_score:
+		# 	cv2.putText(self.image, str(b["confidence"]), (int(corners.T[0][0]), int(corners.T[1][1])),
+		# 				cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 0, 0), 2)
 
 		new_image = o3d.geometry.Image(self.image)
 		self.image_widget.update_image(new_image)
@@ -1134,23 +1135,24 @@ class Annotation:
 		self.image_window.post_redraw()
 
 	def update_cam_pos_pcd(self):
-
-		self.scene_widget.scene.remove_geometry("RGB Line")
-		# Add Line that indicates current RGB Camera View
-		line = o3d.geometry.LineSet()
-		line.points = o3d.utility.Vector3dVector([[0, 0, 0], [0, 0, 2]])
-		line.lines = o3d.utility.Vector2iVector([[0, 1]])
-		line.colors = o3d.utility.Vector3dVector([[1.0, 0, 0]])
-
-		line.rotate(Quaternion(self.image_extrinsic['rotation']).rotation_matrix, [0, 0, 0])
-		line.translate(self.image_extrinsic['translation'])
-
-		line.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0, 0, 0])
-		line.translate(self.frame_extrinsic['translation'])
-
-		self.scene_widget.scene.add_geometry("RGB Line", line, self.line_mat)
+		# Move the line that indicates current RGB Camera View
+		self.rgb_line_slot.update(render_utils.pose_transform(self.frame_extrinsic, self.image_extrinsic))
 		self.point_cloud.post_redraw()
 
+	def remove_frame_geometry(self):
+		"""Removes the geometry that belongs to the boxes of the current frame
+			The point cloud and RGB line slots stay in the scene, so their GPU buffers are reused
+			Args:
+				self: window object
+			Returns:
+				None
+				"""
+		names = self.box_indices + self.volume_indices + [self.coord_frame, "Boxes", "reference"]
+		names += ['centroid' + str(i) for i in range(TRAJECTORY_FRAMES)] + ['segment' + str(i) for i in range(TRAJECTORY_FRAMES)]
+		for name in names:
+			if self.scene_widget.scene.has_geometry(name):
+				self.scene_widget.scene.remove_geometry(name)
+
 	def on_sensor_select(self, new_val, new_idx):
 		"""This updates the name of the selected rgb sensor after user input
            Updates the window with the new information
@@ -1172,11 +1174,9 @@ class Annotation:
                 None
                 """
 		# Pulling intrinsic and extrinsic data from LVT directory based on current selected frame and sensor
-		self.image_intrinsic = json.load(
-			open(os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, "intrinsics.json")))
-		self.image_extrinsic = json.load(
-			open(os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, "extrinsics.json")))
-		self.frame_extrinsic = json.load(open(os.path.join(self.lct_path, "ego", str(self.frame_num) + ".json")))
+		self.image_intrinsic = self.scene.read_json("cameras/" + self.rgb_sensor_name + "/intrinsics.json")
+		self.image_extrinsic = self.scene.read_json("cameras/" + self.rgb_sensor_name + "/extrinsics.json")
+		self.frame_extrinsic = self.poses.pose(self.frame_num)
 		self.update_image()
 		self.update_cam_pos_pcd()
 
@@ -1187,7 +1187,7 @@ class Annotation:
             Returns:
                 None
                 """
-		self.image_path = os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, str(self.frame_num) + ".jpg")
+		self.image_path = "cameras/" + self.rgb_sensor_name + "/" + str(self.frame_num) + ".jpg"
 		self.update_poses()
 
 	def on_frame_switch(self, new_val):
@@ -1353,13 +1353,14 @@ class Annotation:
 		for box in self.temp_pred_boxes["boxes"]:
 			box["data"]["propagate"] = False
 		if self.show_gt and not self.show_pred:
-			path = os.path.join(self.lct_path ,"bounding", str(self.frame_num), "boxes.json")
+			kind = "bounding"
 			boxes_to_save = {"boxes": [box for box in self.temp_boxes["boxes"]]}
 		elif self.show_pred and not self.show_gt:
-			path = os.path.join(self.lct_path ,"pred_bounding", str(self.frame_num), "boxes.json")
+			kind = "pred_bounding"
 			boxes_to_save = {"boxes": [box for box in self.temp_pred_boxes["boxes"]]}
-		with open(path, "w") as outfile:
-			outfile.write(json.dumps(boxes_to_save))
+		box_store.save_frame_boxes(self.lct_path, kind, self.frame_num, boxes_to_save)
+		# Error scans match this frame again, other frames keep their cached results
+		scan_cache.invalidate_frames(self.lct_path, [self.frame_num])
 
 	def save_as(self):
 		# opens a file browser to let user select place to save
@@ -1371,11 +1372,8 @@ class Annotation:
 
 	def save_and_propagate(self):
 		# propagates changes to the next frame
-		old_gt_boxes_path = os.path.join(self.lct_path ,"bounding", str(self.frame_num), "boxes.json")
-		old_pred_boxes_path = os.path.join(self.lct_path ,"pred_bounding", str(self.frame_num), "boxes.json")
-
-		old_pred_boxes = json.load(open(old_pred_boxes_path))
-		old_gt_boxes = json.load(open(old_gt_boxes_path))
+		old_pred_boxes = box_store.load_frame_boxes(self.lct_path, "pred_bounding", self.frame_num)
+		old_gt_boxes = box_store.load_frame_boxes(self.lct_path, "bounding", self.frame_num)
 
 		new_gt_boxes = [box for box in self.temp_boxes["boxes"] if (box not in old_gt_boxes["boxes"] and box["data"]["propagate"]==True)]
 		new_pred_boxes = [box for box in self.temp_pred_boxes["boxes"] if (box not in old_pred_boxes["boxes"] and box["data"]["propagate"]==True)]
@@ -1431,7 +1429,7 @@ class Annotation:
 
 		# get ego data for next frame
 		next_frame_num = self.frame_num + 1
-		next_frame_extrinsic = json.load(open(os.path.join(self.lct_path, "ego", str(next_frame_num) + ".json")))
+		next_frame_extrinsic = self.poses.pose(next_frame_num)
 
 		# Transform boxes to ego coordinate frame of the next frame
 		for box in global_new_gt_boxes:
@@ -1571,11 +1569,11 @@ class Annotation:
 				return
 		centroid_global_origins = []
 
-		for i in range(-3, 4):
+		for i in range(-(TRAJECTORY_FRAMES // 2), TRAJECTORY_FRAMES // 2 + 1):
 			# Load the annotations of this object from previous and next frames
 			try:
-				boxes_i = json.load(open(os.path.join(self.lct_path , "bounding", str(self.frame_num + i), "boxes.json")))
-				extrinsics_i = json.load(open(os.path.join(self.lct_path, "ego", str(self.frame_num + i) + ".json")))
+				boxes_i = box_store.load_frame_boxes(self.lct_path, "bounding", self.frame_num + i)
+				extrinsics_i = self.poses.pose(self.frame_num + i)
 			except FileNotFoundError:
 				continue
 
@@ -1665,7 +1663,7 @@ class Annotation:
                 """
 		self.pcd_paths.clear()
 		for sensor in self.lidar_sensors:
-			self.pcd_paths.append(os.path.join(self.lct_path, "pointcloud", sensor, str(self.frame_num) + ".pcd"))
+			self.pcd_paths.append(self.scene.points_path(sensor, self.frame_num))
 
 	def update_pointcloud(self):
 		"""Takes new pointcloud data and converts it to global frame, 
@@ -1675,46 +1673,34 @@ class Annotation:
 			Returns:
 				None
 				"""
-		self.scene_widget.scene.clear_geometry()
+		self.remove_frame_geometry()
 		self.boxes_in_scene = []
 		self.box_indices = []
 		self.volumes_in_scene = []
 		self.volume_indices = []
 		# Add Pointcloud
-		temp_points = np.empty((0,3))
 		for label in self.label_list:
 			self.scene_widget.remove_3d_label(label)
 
 		self.label_list = []
 
-		for i, pcd_path in enumerate(self.pcd_paths):
-			temp_cloud = o3d.io.read_point_cloud(pcd_path)
-			ego_rotation_matrix = Quaternion(self.frame_extrinsic['rotation']).rotation_matrix
-
-			# Transform lidar points into global frame
-			temp_cloud.rotate(ego_rotation_matrix, [0,0,0])
-			temp_cloud.translate(np.array(self.frame_extrinsic['translation']))
-			temp_points = np.concatenate((temp_points, np.asarray(temp_cloud.points)))
-
-		self.pointcloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(temp_points)))
-		# Add new global frame pointcloud to our 3D widget
-		self.scene_widget.scene.add_geometry("Point Cloud", self.pointcloud, self.pcd_mat)
+		# Transform lidar points straight into the buffer of the point cloud slot, which updates the
+		# GPU buffer in place when the number of points did not change
+		temp_points = frame_cache.load_points(self.lct_path, self.lidar_sensors, self.frame_num)
+		self.pointcloud = self.pointcloud_slot.update(temp_points, self.frame_extrinsic)
+		self.point_grid = None
 		self.scene_widget.scene.show_axes(True)
 		i = 0
 		mat = rendering.MaterialRecord()
 		mat.shader = "unlitLine"
 		mat.line_width = .25
 
+		# Box poses are moved to the global frame all at once, each box still gets its own geometry
+		# so it can be highlighted and dragged on its own
+		self.box_table = render_utils.box_table(self.boxes_to_render, self.frame_extrinsic)
 		for box in self.boxes_to_render:
-			size = [0,0,0]
-			# Open3D wants sizes in L,W,H
-			size[0] = box[SIZE][1]
-			size[1] = box[SIZE][0]
-			size[2] = box[SIZE][2]
 			color = box[COLOR]
-			bounding_box = o3d.geometry.OrientedBoundingBox(box[ORIGIN], Quaternion(box[ROTATION]).rotation_matrix, size)
-			bounding_box.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-			bounding_box.translate(np.array(self.frame_extrinsic['translation']))
+			bounding_box = self.box_table.oriented_box(i)
 			hex = '#%02x%02x%02x' % color # bounding_box.color needs to be a tuple of floats (color is a tuple of ints)
 			bounding_box.color = matplotlib.colors.to_rgb(hex)
 
@@ -1733,22 +1719,8 @@ class Annotation:
 		self.create_box_scene(self.scene_widget, self.boxes_to_render, self.frame_extrinsic)
 
 
-		#Add Line that indicates current RGB Camera View
-		line = o3d.geometry.LineSet()
-		line.points = o3d.utility.Vector3dVector([[0,0,0], [0,0,2]])
-		line.lines =  o3d.utility.Vector2iVector([[0,1]])
-		line.colors = o3d.utility.Vector3dVector([[1.0,0,0]])
-
-
-		line.rotate(Quaternion(self.image_extrinsic['rotation']).rotation_matrix, [0,0,0])
-		line.translate(self.image_extrinsic['translation'])
-
-
-		line.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-		line.translate(self.frame_extrinsic['translation'])
-
-
-		self.scene_widget.scene.add_geometry("RGB Line",line, mat)
+		#Move the line that indicates current RGB Camera View
+		self.rgb_line_slot.update(render_utils.pose_transform(self.frame_extrinsic, self.image_extrinsic))
 
 
 		# Force our widgets to update
@@ -1769,10 +1741,11 @@ class Annotation:
 		self.boxes_to_render = []
 
 		#
-		self.boxes = json.load(open(os.path.join(self.lct_path , "bounding", str(self.frame_num), "boxes.json")))
+		# Copies, since the box lists are edited in place
+		self.boxes = frame_cache.load_boxes(self.lct_path, "bounding", self.frame_num, copy_boxes=True)
 		self.temp_boxes = self.boxes.copy()
 		self.temp_boxes["boxes"].extend(self.propagated_gt_boxes)
-		self.pred_boxes = json.load(open(os.path.join(self.lct_path , "pred_bounding", str(self.frame_num), "boxes.json")))
+		self.pred_boxes = frame_cache.load_boxes(self.lct_path, "pred_bounding", self.frame_num, copy_boxes=True)
 		self.temp_pred_boxes = self.pred_boxes.copy()
 		self.temp_pred_boxes["boxes"].extend(self.propagated_pred_boxes)
 
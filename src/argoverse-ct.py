@@ -29,13 +29,18 @@ def parse_options():
     Returns:
         input_path: Path to argoverse dataset being read into LVT
         output_path: Path where user wants LVT to generate generic data format used in program
+        scene_names: Names of the scenes to convert
+        binary_points: True if point clouds should be stored as .bin files instead of .pcd files
+        build_lod: True if a level-of-detail pyramid should be built for the point clouds
     '''
     input_path = ""
     output_path = ""
     scene_names = []
+    binary_points = False
+    build_lod = False
 
     try:
-        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:", "help")
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:bl", "help")
     except getopt.GetoptError as err:
         print(err)
         sys.exit(2)
@@ -44,6 +49,8 @@ def parse_options():
         if opt in ("-h", "--help"):
             print("REQUIRED: -f to specify the path to the Argoverse file.")
             print("REQUIRED: -o to specify the name of the directory where the LVT format will go. Will be a folder in the current directory.")
+            print("OPTIONAL: -b to store point clouds in the float32 .bin format instead of .pcd.")
+            print("OPTIONAL: -l to build a level-of-detail pyramid so the viewer can stream point clouds coarse to fine.")
             sys.exit(2)
         elif opt == "-f":
             input_path = arg
@@ -53,10 +60,14 @@ def parse_options():
                 scene_names.extend(list_of_scenes)
         elif opt == "-o":
             output_path = arg
+        elif opt == "-b":
+            binary_points = True
+        elif opt == "-l":
+            build_lod = True
         else:
             sys.exit(2)
 
-    return (input_path, output_path, scene_names)        
+    return (input_path, output_path, scene_names, binary_points, build_lod)
 
 def extract_rgb(frame_num, timestamp, output_path, input_path):
     ''' Extracts the RGB data from an argoverse frame and puts it in the lct file system
@@ -79,19 +90,20 @@ def extract_rgb(frame_num, timestamp, output_path, input_path):
         m=min(timestamps, key=lambda x:abs(int(x)-int(timestamp)))
         dataformat_utils.add_rgb_frame_from_jpg(output_path, camera, frame_num, input_path+camera+"/"+m+".jpg")
 
-def extract_lidar(frame_num, timestamp, output_path, input_path):
+def extract_lidar(frame_num, timestamp, output_path, input_path, binary_points=False):
     ''' Extracts LiDAR data from an argoverse frame and puts it in the lct file system
     Args:
         frame_num: frame number synchronized with timestamp
         timestamp: timestamp
         input_path: path to argoverse data
         output_path: path where to generate generic data format
+        binary_points: True to write a .bin file (with intensities) instead of a .pcd file
     Returns:
         None
     '''
     lidar = pd.read_feather(input_path+timestamp+".feather")
     points = list(zip(lidar.x, lidar.y, lidar.z))
-    dataformat_utils.add_lidar_frame(output_path, "lidar", frame_num, points)
+    dataformat_utils.add_lidar_frame(output_path, "lidar", frame_num, points, lidar.intensity.values, binary_points)
 
 def extract_ego(frame_num, timestamp, output_path, input_path):
     ''' Extracts ego data from an argoverse frame and puts it in the lct file system
@@ -143,7 +155,7 @@ def extract_bounding(annotations, frame_num, timestamp, output_path):
     dataformat_utils.create_frame_bounding_directory(output_path, frame_num, origins, sizes, rotations, annotation_names, confidences, ids, internal_pts)
 
 # Main method for converting datasets
-def convert_dataset(input_path, output_path):
+def convert_dataset(input_path, output_path, binary_points=False, build_lod=False):
     int_df = pd.read_feather(input_path + "calibration/intrinsics.feather")
     ext_df = pd.read_feather(input_path + "calibration/egovehicle_SE3_sensor.feather")
     int_df.set_index("sensor_name", inplace=True, drop=True)
@@ -186,7 +198,7 @@ def convert_dataset(input_path, output_path):
     # Loop through each frame
     for timestamp in timestamps:
         extract_rgb(frame_num, timestamp, output_path, input_path+"sensors/cameras/")
-        extract_lidar(frame_num, timestamp, output_path, input_path+"sensors/lidar/")
+        extract_lidar(frame_num, timestamp, output_path, input_path+"sensors/lidar/", binary_points)
         extract_ego(frame_num, timestamp, output_path, input_path)
         extract_bounding(annotations, frame_num, timestamp, output_path)
         frame_num += 1
@@ -194,9 +206,17 @@ def convert_dataset(input_path, output_path):
 
     # Store timestamps
     dataformat_utils.add_timestamps(output_path, timestamps)
+    dataformat_utils.create_box_store(output_path)
+    dataformat_utils.create_manifest(output_path)
+    dataformat_utils.create_frame_index(output_path)
+    # Argoverse timestamps are in nanoseconds
+    dataformat_utils.create_pose_table(output_path, [int(timestamp) // 1000 for timestamp in timestamps])
+    dataformat_utils.create_image_cache(output_path)
+    if build_lod:
+        dataformat_utils.create_lod(output_path)
 
 if __name__ == "__main__":
-    (input_path, output_path, scene_names) = parse_options()
+    (input_path, output_path, scene_names, binary_points, build_lod) = parse_options()
     print(f"Input path: {input_path}")
     print(f"Output path: {output_path}")
 
@@ -220,4 +240,4 @@ if __name__ == "__main__":
     
     # Convert all the scenes
     for scene_name in scene_names:
-        convert_dataset(input_path+scene_name+"/", output_path+scene_name+"/")
\ No newline at end of file
+        convert_dataset(input_path+scene_name+"/", output_path+scene_name+"/", binary_points, build_lod)
\ No newline at end of file
@@ -11,6 +11,8 @@ import re
 import sys
 from utils import dataformat_utils
 from utils import geometry_utils
+from utils import box_store
+from utils import pointcloud_utils
 import open3d as o3d
 import uuid
 
@@ -79,9 +81,9 @@ def export_annotations(input_path, output_path):
 
     frame_num = 0
     while os.path.exists(os.path.join(bounding_path, str(frame_num))):
-        annotations = json.load(open(os.path.join(bounding_path, str(frame_num), "boxes.json"), "r"))
+        annotations = box_store.load_frame_boxes(input_path, "bounding", frame_num)
         # load pointcloud points
-        pcd = o3d.io.read_point_cloud(input_path + "pointcloud/lidar/" + str(frame_num) + ".pcd").points
+        pcd = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "lidar", frame_num))
         for box in annotations["boxes"]:
             # assign a new random tracking id if one is not stored
             if box["id"] == "":
@@ -0,0 +1,80 @@
+"""
+detection-metrics.py
+
+Computes nuScenes-style detection metrics (per-class AP over distance thresholds, mAP and the
+translation, scale and orientation errors of the true positives) of the predictions of a scene
+and writes them to a JSON file. See utils/detection_metrics.py.
+"""
+import getopt
+import json
+import sys
+import time
+from utils import detection_metrics
+from utils import testing
+
+
+def parse_options():
+    """Read in user command line input
+    Args:
+        None
+    Returns:
+        lct_path: path to the LCT directory or scene pack to evaluate
+        output_path: path of the JSON report, or "" to only print the metrics
+        thresholds: BEV centre distance thresholds in meters
+        """
+    lct_path = ""
+    output_path = ""
+    thresholds = detection_metrics.DISTANCE_THRESHOLDS
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:t:", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("REQUIRED: -f to specify the LCT directory or scene pack to evaluate")
+            print("OPTIONAL: -o to specify the path of the JSON report")
+            print("OPTIONAL: -t to specify a comma separated list of distance thresholds in meters (default " +
+                  ",".join(str(threshold) for threshold in detection_metrics.DISTANCE_THRESHOLDS) + ")")
+            sys.exit(2)
+        elif opt == "-f":
+            lct_path = arg
+        elif opt == "-o":
+            output_path = arg
+        elif opt == "-t":
+            thresholds = [float(value) for value in arg.split(",") if value]
+        else:
+            print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+            sys.exit(2)
+
+    if lct_path == "" or len(thresholds) == 0:
+        print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+        sys.exit(2)
+    if not testing.is_lct_directory(lct_path):
+        print(lct_path, "is not a valid LCT directory or scene pack")
+        sys.exit(2)
+
+    return (lct_path, output_path, thresholds)
+
+
+def print_metrics(metrics):
+    """Prints the metrics as a table, one row per class"""
+    print("%-24s %7s %7s %7s %7s %7s %7s" % ("class", "GT", "pred", "AP", "ATE", "ASE", "AOE"))
+    for (name, result) in metrics['classes'].items():
+        print("%-24s %7d %7d %7.3f %7.3f %7.3f %7.3f" % (name, result['num_gt'], result['num_pred'], result['mean_ap'],
+                                                        result['trans_err'], result['scale_err'], result['orient_err']))
+    print("mAP %.4f  mATE %.4f  mASE %.4f  mAOE %.4f" % (metrics['mAP'], metrics['mtrans_err'], metrics['mscale_err'], metrics['morient_err']))
+
+
+if __name__ == "__main__":
+    (lct_path, output_path, thresholds) = parse_options()
+    start = time.perf_counter()
+    metrics = detection_metrics.evaluate(lct_path, thresholds)
+    print("Evaluated %d frames in %.1f s" % (metrics['num_frames'], time.perf_counter() - start))
+    print_metrics(metrics)
+    if output_path != "":
+        with open(output_path, "w") as f:
+            json.dump(metrics, f, indent=2)
+        print("Wrote", output_path)
@@ -0,0 +1,150 @@
+"""
+error-scan.py
+
+Runs the viewer's "Scan For Errors" over a whole scene without opening the viewer and writes a
+report, as CSV if the output path ends in .csv and JSON otherwise. See utils/error_scan.py.
+"""
+import getopt
+import sys
+import time
+from utils import box_store
+from utils import error_scan
+from utils import manifest
+from utils import matching
+from utils import testing
+
+ERROR_KIND_FLAGS = {'u': error_scan.UNMATCHED_GT, 'f': error_scan.FALSE_POSITIVES, 'i': error_scan.INCORRECT_ANNOTATIONS}
+
+
+def parse_options():
+    """Read in user command line input
+    Args:
+        None
+    Returns:
+        lct_path: path to the LCT directory or scene pack to scan
+        output_path: path of the report
+        gt_classes: selected GT annotation names, None for every GT class of the scene
+        pred_classes: selected predicted annotation names, None for every predicted class of the scene
+        min_confidence: minimum confidence of the predicted boxes
+        kinds: list of error kinds to look for
+        workers: number of worker processes
+        criterion: matching.MatchCriterion object
+        use_cache: False to match every frame without reading or writing the scan cache
+        """
+    lct_path = ""
+    output_path = ""
+    gt_classes = None
+    pred_classes = None
+    min_confidence = 0
+    kinds = error_scan.ERROR_KINDS
+    workers = error_scan.SCAN_WORKERS
+    use_cache = True
+    match_mode = matching.CENTER_DISTANCE
+    threshold = None
+    class_thresholds = {}
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:g:p:c:k:w:nm:t:T:", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("REQUIRED: -f to specify the LCT directory or scene pack to scan")
+            print("REQUIRED: -o to specify the path of the report, written as CSV if it ends in .csv and JSON otherwise")
+            print("OPTIONAL: -g to specify a comma separated list of GT classes (default every GT class of the scene)")
+            print("OPTIONAL: -p to specify a comma separated list of predicted classes (default every predicted class of the scene)")
+            print("OPTIONAL: -c to specify the minimum confidence of predicted boxes (default 0)")
+            print("OPTIONAL: -k to specify the kinds of errors to look for, any of u (unmatched GT), f (false positives) and i (incorrect annotations) (default ufi)")
+            print("OPTIONAL: -w to specify the number of worker processes (default the number of CPUs)")
+            print("OPTIONAL: -n to match every frame without reading or writing the scan cache")
+            print("OPTIONAL: -m to specify how predictions are matched to GT boxes, one of " + ", ".join(matching.MATCH_MODES) + " (default " + matching.CENTER_DISTANCE + ")")
+            print("OPTIONAL: -t to specify the matching threshold, a centre distance in meters or a minimum IoU (default " + str(matching.MATCH_DISTANCE) + " m or " + str(matching.MATCH_IOU) + " IoU)")
+            print("OPTIONAL: -T to specify per-class matching thresholds as GT_CLASS=VALUE,GT_CLASS=VALUE")
+            sys.exit(2)
+        elif opt == "-f":
+            lct_path = arg
+        elif opt == "-o":
+            output_path = arg
+        elif opt == "-g":
+            gt_classes = [name for name in arg.split(",") if name]
+        elif opt == "-p":
+            pred_classes = [name for name in arg.split(",") if name]
+        elif opt == "-c":
+            min_confidence = float(arg)
+        elif opt == "-k":
+            if not arg or any(flag not in ERROR_KIND_FLAGS for flag in arg):
+                print("Invalid kinds of errors entered. Please refer to -h flag for more information.")
+                sys.exit(2)
+            kinds = [ERROR_KIND_FLAGS[flag] for flag in arg]
+        elif opt == "-w":
+            workers = max(1, int(arg))
+        elif opt == "-n":
+            use_cache = False
+        elif opt == "-m":
+            if arg not in matching.MATCH_MODES:
+                print("Invalid matching mode entered. Please refer to -h flag for more information.")
+                sys.exit(2)
+            match_mode = arg
+        elif opt == "-t":
+            threshold = float(arg)
+        elif opt == "-T":
+            try:
+                class_thresholds = matching.parse_class_thresholds(arg)
+            except ValueError:
+                print("Invalid per-class thresholds entered. Please refer to -h flag for more information.")
+                sys.exit(2)
+        else:
+            print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+            sys.exit(2)
+
+    if lct_path == "" or output_path == "":
+        print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+        sys.exit(2)
+    if not testing.is_lct_directory(lct_path):
+        print(lct_path, "is not a valid LCT directory or scene pack")
+        sys.exit(2)
+
+    criterion = matching.MatchCriterion(match_mode, threshold, class_thresholds)
+    return (lct_path, output_path, gt_classes, pred_classes, min_confidence, kinds, workers, criterion, use_cache)
+
+
+def scene_classes(lct_path, kind, num_frames):
+    """Returns the annotation names of one kind of boxes in a scene, from the manifest when there is one"""
+    meta = manifest.load_manifest(lct_path)
+    if meta is not None:
+        return list(meta.gt_classes if kind == "bounding" else meta.pred_classes)
+    names = []
+    for frame_num in range(num_frames):
+        for name in box_store.load_frame_arrays(lct_path, kind, frame_num).annotations:
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def print_progress(done, total):
+    print("\rScanned %d/%d frames" % (done, total), end="", flush=True)
+
+
+if __name__ == "__main__":
+    (lct_path, output_path, gt_classes, pred_classes, min_confidence, kinds, workers, criterion, use_cache) = parse_options()
+    num_frames = box_store.count_frames(lct_path, "bounding")
+    if gt_classes is None:
+        gt_classes = scene_classes(lct_path, "bounding", num_frames)
+    if pred_classes is None:
+        pred_classes = scene_classes(lct_path, "pred_bounding", num_frames)
+    settings = error_scan.ScanSettings(gt_classes, pred_classes, min_confidence, kinds, criterion)
+
+    start = time.perf_counter()
+    try:
+        (found, cached_frames) = error_scan.run_scan(lct_path, num_frames, settings, workers, on_progress=print_progress, use_cache=use_cache)
+    except FileNotFoundError as err:
+        print("\nError reading predicted data:", err)
+        sys.exit(1)
+    print("\nFound errors in %d of %d frames in %.1f s, %d frames from the scan cache" % (len(found), num_frames, time.perf_counter() - start, cached_frames))
+    for (kind, counts) in error_scan.totals(found).items():
+        for (name, count) in counts.items():
+            print("  %s: %s %d" % (kind, name, count))
+    error_scan.write_report(output_path, lct_path, num_frames, settings, found)
+    print("Wrote", output_path)
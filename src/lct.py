@@ -5,32 +5,35 @@ Conversion tool to bring nuscenes dataset into LVT.
 """
 
 import getopt
-import matplotlib.colors
-import matplotlib.pyplot as plt
 from PIL import Image
 import sys
 import functools
-import random
 import numpy as np
 import open3d.visualization.gui as gui
-from PIL import Image
 import open3d as o3d
 import open3d.visualization.rendering as rendering
-import json
 import os
-import cv2
-from nuscenes.utils.data_classes import Box
-from pyquaternion import Quaternion
-from nuscenes.utils.geometry_utils import view_points, box_in_image, BoxVisibility
 
-from utils import geometry_utils
 from utils import testing
-from operator import itemgetter
-import annotation_editing as edit
+from utils import box_store
+from utils import pointcloud_utils
+from utils import scene_loader
+from utils import manifest
+from utils import matching
+from utils import pose_table
+from utils import image_utils
+from utils import prefetch
+from utils import frame_cache
+from utils import render_utils
+from utils import point_grid
 import platform
-
-# local import
-import annotation_editing as edit
+import threading
+import time
+# annotation_editing (and matplotlib with it) is imported when the editor is opened, see on_annotation_start
+# The frame index, error scan, detection metrics, precision/recall and LOD modules are imported by the actions that use them
+# cv2 (and projection_utils, which needs it) is imported by draw_boxes_on_image and the video export
+# prefetch, frame_cache and render_utils stay above, the window needs them to show the first frame,
+# and so does point_grid, which only imports NumPy, for its default point budget
 
 OS_STRING = platform.system()
 ORIGIN = 0
@@ -40,6 +43,32 @@ ANNOTATION = 3
 CONFIDENCE = 4
 COLOR = 5
 
+# Search modes of the Previous/Next frame buttons
+SEARCH_GT = "Selected GT Boxes"
+SEARCH_FALSE_POSITIVES = "False Positives"
+SEARCH_UNMATCHED = "Unmatched GT Boxes"
+SEARCH_TRACK = "Track ID"
+SEARCH_MODES = [SEARCH_GT, SEARCH_FALSE_POSITIVES, SEARCH_UNMATCHED, SEARCH_TRACK]
+
+# How predictions are matched to GT boxes when highlighting faults, see utils/matching.py
+MATCH_MODE_NAMES = {"Centre Distance": matching.CENTER_DISTANCE, "BEV IoU": matching.BEV_IOU, "3D IoU": matching.IOU_3D}
+# Largest centre distance that can be entered, in meters
+MAX_MATCH_DISTANCE = 10
+
+# Inputs of the window, so update() only re-runs the stages that depend on what changed
+DIRTY_FRAME = 1
+DIRTY_CAMERA = 2
+DIRTY_FILTERS = 4
+DIRTY_COLORS = 8
+DIRTY_SCORE = 16
+DIRTY_ALL = DIRTY_FRAME | DIRTY_CAMERA | DIRTY_FILTERS | DIRTY_COLORS | DIRTY_SCORE
+
+# Seconds a frame has to stay on screen before its finer point cloud levels are loaded
+LOD_SETTLE_TIME = 0.3
+
+# Color of the boxes of classes that are not in the filter lists yet, while the class catalog loads
+PENDING_COLOR = (200, 200, 200)
+
 #Taken from http://phrogz.net/tmp/24colors.html
 colorlist = [(255,0,0), (255,255,0), (0,234,255), (170,0,255), (255,127,0), (191,255,0), (0,149,255), (255,0,170), (255,212,0), (106,255,0), (0,64,255), (185,237,224), (143,35,35), (35,98,143), (107,35,143), (79,143,35), (140, 102, 37), (10, 104, 22), (243, 177, 250)]
 # Parse CLI args and validate input
@@ -60,7 +89,7 @@ def parse_options():
     # make sure that options which need an argument (namely -f for the input file path) have them
     for opt, arg in opts:
         if opt in ("-h", "--help"):
-            print("use -f to specify the directory of LVT dataset")
+            print("use -f to specify the directory of LVT dataset, or a packed scene (.lctpack) file")
             sys.exit(2)
         elif opt == "-f": # and len(opts) == 2:
             input_path = arg
@@ -85,7 +114,29 @@ class Window:
         # In the future, these values should not be set hard coded directly. Sensible default values should
         # be extracted from the LVT Directory
         self.lct_path = lct_dir
-        self.camera_sensors, self.lidar_sensors = self.get_cams_and_pointclouds(self.lct_path)
+        # Every read of scene data goes through this, so packed scenes work like LCT directories
+        self.scene = scene_loader.open_scene(self.lct_path)
+        # The manifest written at conversion time lets us start without reading every frame
+        self.manifest = manifest.load_manifest(self.lct_path)
+        # Inverted index used by the frame search, opened by the first search, see get_frame_index
+        self.frame_index = None
+        self.match_criterion = matching.MatchCriterion()
+        self.poses = pose_table.load_pose_table(self.lct_path)
+        # Incremented every time a frame's point cloud is shown, so stale LOD refinements can be dropped
+        self.pointcloud_generation = 0
+        # Writes the pyramids of frames viewed without one, created by the first write, see write_frame_lod
+        self.lod_writer = None
+        # Point budget mode draws a frustum culled, distance thinned subset of the points, see point_grid
+        self.point_budget_enabled = False
+        self.point_budget = point_grid.DEFAULT_BUDGET
+        self.point_grid = None
+        self.shown_points = None
+        self.point_budget_pending = False
+        if self.manifest is not None:
+            self.camera_sensors = list(self.manifest.camera_sensors)
+            self.lidar_sensors = list(self.manifest.lidar_sensors)
+        else:
+            self.camera_sensors, self.lidar_sensors = self.get_cams_and_pointclouds(self.lct_path)
         self.box_data_name = ["bounding"]
         self.min_confidence = 50
         self.highlight_faults = False
@@ -96,6 +147,7 @@ class Window:
         #the below 5 variables involved in selecting and adjusting annotations
         self.boxes_in_scene = []
         self.box_indices = []
+        self.box_table = None
         self.volumes_rendered = []
         self.box_selected = None
         self.previous_index = -1
@@ -111,16 +163,9 @@ class Window:
         self.compare_bounding = False
         self.color_map = {}
         self.pred_color_map = {}
-        self.pcd_path = os.path.join(self.lct_path, "pointcloud", self.lidar_sensor_name, "0.pcd")
+        self.pcd_path = self.scene.points_path(self.lidar_sensor_name, 0)
         self.pcd_paths = []
-        self.image_path = os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, "0.jpg")
-        # We extract the first image from LCT in order to get the needed data to create our plt figure
-        self.image = Image.open(self.image_path)
-        self.image_w = self.image.width
-        self.image_h = self.image.height
-        self.image = np.asarray(self.image)
-        self.fig, self.ax = plt.subplots(figsize=plt.figaspect(self.image))
-        self.fig.subplots_adjust(0,0,1,1)
+        self.image_path = "cameras/" + self.rgb_sensor_name + "/0.jpg"
 
         # image widget used to draw an image onto our image window
         self.image_widget = gui.ImageWidget()
@@ -128,18 +173,23 @@ class Window:
         self.frame_num = frame_num
         # dictionary that stores the imported JSON file that respresents the annotations in the current frame
         self.path_string = os.path.join(self.lct_path ,"bounding", str(self.frame_num), "boxes.json")
-        self.boxes = json.load(open(self.path_string))
+        # Boxes of the current frame, read by update_bounding along with the rest of the frame
+        self.boxes = {'boxes': []}
+        self.pred_boxes = {'boxes': []}
         # num of frames available to display
-        frames_available = [entry for entry in os.scandir(os.path.join(self.lct_path, "bounding")) if entry.name != ".DS_Store"] # ignore .DS_Store (MacOS)
-        self.num_frames = len(frames_available)
+        if self.manifest is not None:
+            self.num_frames = self.manifest.num_frames
+        else:
+            frames_available = [entry for entry in self.scene.listdir("bounding") if entry != ".DS_Store"] # ignore .DS_Store (MacOS)
+            self.num_frames = len(frames_available)
         # List to store bounding boxes as NuScenes Box Objects
         self.n_boxes = []
 
 
         #Import the annotation map if it exists
         self.annotation_map = {}
-        if os.path.exists(os.path.join(self.lct_path, "pred_bounding", "annotation_map.json")):
-            self.annotation_map = json.load(open(os.path.join(self.lct_path, "pred_bounding", "annotation_map.json")))
+        if self.scene.exists("pred_bounding/annotation_map.json"):
+            self.annotation_map = self.scene.read_json("pred_bounding/annotation_map.json")
 
         # Aliases for easier referencing
         cw = self.controls
@@ -155,10 +205,17 @@ class Window:
         self.widget3d = gui.SceneWidget()
         self.widget3d.scene = rendering.Open3DScene(pw.renderer)
         self.widget3d.scene.set_background([0,0,0,255])
+        self.widget3d.set_on_mouse(self.on_pointcloud_mouse)
         self.mat = rendering.MaterialRecord()
         self.mat.shader = "defaultUnlit"
         self.mat.point_size = 2
         #self.mat.base_color = [255,255,255,255]
+        self.line_mat = rendering.MaterialRecord()
+        self.line_mat.shader = "unlitLine"
+        self.line_mat.line_width = .25
+        # The point cloud and the RGB camera line stay in the scene, frame switches only update them
+        self.pointcloud_slot = render_utils.PointCloudSlot(self.widget3d.scene, "Point Cloud", self.mat)
+        self.rgb_line_slot = render_utils.PosedSlot(self.widget3d.scene, "RGB Line", render_utils.camera_line(), self.line_mat)
 
         margin = gui.Margins(0.5 * em, 0.25 * em, 0.25 * em, 0.25 * em)
         self.view = gui.CollapsableVert("View", .25 * em, margin)
@@ -171,57 +228,16 @@ class Window:
             sensor_select.add_item(cam)
         sensor_select.set_on_selection_changed(self.on_sensor_select)
 
-        # Set up checkboxes for selecting ground truth annotations
-        # Have to go through each frame to have all possible annotations available
+        # Checkboxes for selecting ground truth and predicted annotations are added by populate_class_filters
+        # once the class catalog is loaded, so the first frame does not wait for it
         self.check_horiz = []
-        color_counter = 0
-        for i in range(0, self.num_frames):
-            boxes = json.load(open(os.path.join(self.lct_path ,"bounding", str(i), "boxes.json")))
-            for box in boxes['boxes']:
-                if box['annotation'] not in self.color_map:
-                    horiz = gui.Horiz()
-                    check = gui.Checkbox("")
-                    check.set_on_checked(self.make_on_check(box['annotation'], self.on_filter_check))
-                    self.color_map[box['annotation']] = colorlist[color_counter % len(colorlist)]
-                    color_counter += 1
-                    # Color Picker
-                    color = gui.ColorEdit()
-                    (r,g,b) = self.color_map[box['annotation']]
-                    color.color_value = gui.Color(r/255,g/255,b/255)
-                    color.set_on_value_changed(self.on_color_toggle)
-                    horiz.add_child(check)
-                    horiz.add_child(gui.Label(box['annotation']))
-                    horiz.add_child(color)
-                    horiz.add_child(gui.Label("Count: 0"))
-                    self.check_horiz.append(horiz)
-
-
-        # Set up checkboxes for selecting predicted annotations
-        frames_available = [entry for entry in os.scandir(os.path.join(self.lct_path, "bounding"))]
-        self.pred_frames = len(frames_available) - 1
         self.pred_check_horiz = []
         self.all_pred_annotations = []
-        for i in range(0, self.pred_frames):
-            boxes = json.load(open(os.path.join(self.lct_path,"pred_bounding", str(i), "boxes.json")))
-            for box in boxes['boxes']:
-                if box['annotation'] not in self.pred_color_map:
-                    self.all_pred_annotations.append(box['annotation'])
-                    horiz = gui.Horiz()
-                    check = gui.Checkbox("")
-                    check.set_on_checked(self.make_on_check(box['annotation'], self.on_pred_filter_check))
-                    self.pred_color_map[box['annotation']] = colorlist[color_counter % len(colorlist)]
-                    color_counter += 1
-                    color = gui.ColorEdit()
-                    (r,g,b) = self.pred_color_map[box['annotation']]
-                    color.color_value = gui.Color(r/255,g/255,b/255)
-                    color.set_on_value_changed(self.on_color_toggle)
-                    horiz.add_child(check)
-                    horiz.add_child(gui.Label(box['annotation']))
-                    horiz.add_child(color)
-                    horiz.add_child(gui.Label("Count: 0"))
-                    self.pred_check_horiz.append(horiz)
-        if self.pred_frames > 0:
-            self.pred_boxes = json.load(open(os.path.join(self.lct_path ,"pred_bounding", str(self.frame_num), "boxes.json")))
+        if self.manifest is not None:
+            self.pred_frames = self.num_frames - 1
+        else:
+            frames_available = self.scene.listdir("bounding")
+            self.pred_frames = len(frames_available) - 1
 
         # Horizontal widget where we will insert our drop down menu
         sensor_switch_layout = gui.Horiz()
@@ -229,17 +245,12 @@ class Window:
         sensor_switch_layout.add_child(sensor_select)
         
         # Vertical widget for inserting checkboxes
-        checkbox_layout = gui.CollapsableVert("Ground Truth Filters", .25 * em, gui.Margins(0.5 * em, 0.5 * em, 0.5 * em,
+        self.checkbox_layout = gui.CollapsableVert("Ground Truth Filters", .25 * em, gui.Margins(0.5 * em, 0.5 * em, 0.5 * em,
                                          0.5 * em) )
 
-        for horiz_widget in self.check_horiz:
-            checkbox_layout.add_child(horiz_widget)
-
         # Vertical widget for inserting predicted checkboxes
-        pred_checkbox_layout = gui.CollapsableVert("Predicted Filters", .25 * em, gui.Margins(0.5 * em, 0.5 * em, 0.5 * em,
+        self.pred_checkbox_layout = gui.CollapsableVert("Predicted Filters", .25 * em, gui.Margins(0.5 * em, 0.5 * em, 0.5 * em,
                                          0.5 * em))
-        for horiz_widget in self.pred_check_horiz:
-            pred_checkbox_layout.add_child(horiz_widget)
 
         # Set up a widget to switch between frames
         self.frame_select = gui.NumberEdit(gui.NumberEdit.INT)
@@ -263,6 +274,28 @@ class Window:
         confidence_select_layout.add_child(gui.Label("Specify Confidence Threshold"))
         confidence_select_layout.add_child(confidence_select)
 
+        # Precision and recall of the whole scene at the confidence threshold, for the selected classes
+        self.precision_recall_label = gui.Label("")
+        self.precision_recall_image = gui.ImageWidget()
+
+        # Matching used to find unmatched GT boxes, false positives and incorrect annotations
+        match_select = gui.Combobox()
+        for name in MATCH_MODE_NAMES:
+            match_select.add_item(name)
+        match_select.set_on_selection_changed(self.on_match_mode_select)
+        self.match_threshold_select = gui.NumberEdit(gui.NumberEdit.DOUBLE)
+        self.match_threshold_select.set_limits(0, MAX_MATCH_DISTANCE)
+        self.match_threshold_select.set_value(self.match_criterion.threshold)
+        self.match_threshold_select.set_on_value_changed(self.on_match_threshold_switch)
+        class_threshold_edit = gui.TextEdit()
+        class_threshold_edit.placeholder_text = "Per-class thresholds, eg: car=0.7,bus=0.6"
+        class_threshold_edit.set_on_value_changed(self.on_class_thresholds_switch)
+
+        match_layout = gui.Horiz()
+        match_layout.add_child(gui.Label("Match By"))
+        match_layout.add_child(match_select)
+        match_layout.add_child(self.match_threshold_select)
+
         # Add combobox to switch between predicted and ground truth
         self.bounding_toggle = gui.Combobox()
         self.bounding_toggle.add_item("Ground Truth")
@@ -281,6 +314,17 @@ class Window:
         #center_horiz.add_child(gui.Label("Center Pointcloud View on Vehicle"))
         center_horiz.add_child(center_view_button)
 
+        # Point budget mode, for scenes with more points than the renderer keeps up with
+        budget_horiz = gui.Horiz()
+        budget_check = gui.Checkbox("Point Budget")
+        budget_check.set_on_checked(self.toggle_point_budget)
+        budget_select = gui.NumberEdit(gui.NumberEdit.INT)
+        budget_select.set_limits(10000, 10000000)
+        budget_select.set_value(self.point_budget)
+        budget_select.set_on_value_changed(self.on_point_budget_switch)
+        budget_horiz.add_child(budget_check)
+        budget_horiz.add_child(budget_select)
+
         #Collapsable vertical widget that will hold comparison controls
         comparison_controls = gui.CollapsableVert("Compare Predicted Data")
         toggle_comparison = gui.Checkbox("Display Predicted and GT")
@@ -308,10 +352,22 @@ class Window:
         prev_button.set_on_clicked(self.jump_prev_frame)
         next_button = gui.Button("Next")
         next_button.set_on_clicked(self.jump_next_frame)
-        jump_frame_horiz.add_child(gui.Label("Search Frames for Selected GT Boxes"))
+        jump_frame_horiz.add_child(gui.Label("Search Frames for"))
         jump_frame_horiz.add_child(prev_button)
         jump_frame_horiz.add_child(next_button)
 
+        # What the Previous/Next buttons search for
+        self.search_mode = SEARCH_GT
+        search_select = gui.Combobox()
+        for mode in SEARCH_MODES:
+            search_select.add_item(mode)
+        search_select.set_on_selection_changed(self.on_search_select)
+        self.track_id_edit = gui.TextEdit()
+        self.track_id_edit.placeholder_text = "Track ID"
+        search_mode_vert = gui.Vert()
+        search_mode_vert.add_child(search_select)
+        search_mode_vert.add_child(self.track_id_edit)
+
 
         #comparison_controls.add_child(jump_frame_horiz)
 
@@ -327,6 +383,7 @@ class Window:
         
         # Newly added Add/Edit menu
         tools_menu.add_item("Add/Edit Annotations",4)
+        tools_menu.add_item("Detection Metrics",6)
     	
         menu = gui.Menu()
         menu.add_menu("File", file_menu)
@@ -340,19 +397,25 @@ class Window:
 
         self.view.add_child(frame_switch_layout)
         self.view.add_child(center_horiz)
+        self.view.add_child(budget_horiz)
 
         self.scene_nav.add_child(sensor_switch_layout)
         self.scene_nav.add_child(jump_frame_horiz)
+        self.scene_nav.add_child(search_mode_vert)
 
         #self.anno_control.add_child(bounding_toggle_layout)
         self.anno_control.add_child(confidence_select_layout)
+        self.anno_control.add_child(self.precision_recall_label)
+        self.anno_control.add_child(self.precision_recall_image)
         self.anno_control.add_child(toggle_show_gt)
         self.anno_control.add_child(toggle_highlight)
         self.anno_control.add_child(toggle_false_positive)
         self.anno_control.add_child(toggle_incorrect_annotations)
+        self.anno_control.add_child(match_layout)
+        self.anno_control.add_child(class_threshold_edit)
         self.anno_control.add_child(toggle_score)
-        self.anno_control.add_child(checkbox_layout)
-        self.anno_control.add_child(pred_checkbox_layout)
+        self.anno_control.add_child(self.checkbox_layout)
+        self.anno_control.add_child(self.pred_checkbox_layout)
 
         #layout.add_child(sensor_switch_layout)
         #layout.add_child(frame_switch_layout)
@@ -378,6 +441,7 @@ class Window:
         cw.set_on_menu_item_activated(3, self.on_error_scan)
         cw.set_on_menu_item_activated(4, self.on_annotation_start)
         cw.set_on_menu_item_activated(5, self.on_menu_export_video_lidar)
+        cw.set_on_menu_item_activated(6, self.on_detection_metrics)
 	
 
         iw.set_on_menu_item_activated(0, self.on_menu_export_rgb)
@@ -387,6 +451,7 @@ class Window:
         iw.set_on_menu_item_activated(3, self.on_error_scan)
         iw.set_on_menu_item_activated(4, self.on_annotation_start)
         iw.set_on_menu_item_activated(5, self.on_menu_export_video_lidar)
+        iw.set_on_menu_item_activated(6, self.on_detection_metrics)
 
 
         pw.set_on_menu_item_activated(0, self.on_menu_export_rgb)
@@ -396,10 +461,24 @@ class Window:
         pw.set_on_menu_item_activated(3, self.on_error_scan)
         pw.set_on_menu_item_activated(4, self.on_annotation_start)
         pw.set_on_menu_item_activated(5, self.on_menu_export_video_lidar)
+        pw.set_on_menu_item_activated(6, self.on_detection_metrics)
     
 
+        # Frames around the current one are loaded in the background, see prefetch.py
+        self.frame_data = None
+        self.pending_frame = None
+        self.prefetcher = prefetch.FramePrefetcher(self.load_frame_data, self.on_frame_loaded)
+
+        # Matching of the current frame at every confidence threshold, so moving the threshold does not rematch it
+        self.match_sweep = None
+        self.match_sweep_key = None
+        # Scene precision/recall, created once classes are selected, see update_precision_recall
+        self.precision_recall = None
+
         # Call update function to draw all initial data
         self.update()
+        self.prefetcher.request(self.frame_num, self.num_frames)
+        threading.Thread(target=self.load_class_catalog, daemon=True).start()
 
         # This 'bounds' variable has nothing to do with the bounding boxes, it represents the box surrounding
         # all of our lidar points and is used to set up the camera for the scene
@@ -411,61 +490,58 @@ class Window:
         eye[2] = 150.0
         self.widget3d.scene.camera.look_at(self.frame_extrinsic['translation'], eye, [1, 0, 0])
         self.pointcloud_window.post_redraw()
+    def load_frame_data(self, frame_num, load_lod=True):
+        """Loads everything shown for one frame, called on prefetch worker threads
+            Args:
+                self: window object
+                frame_num: frame number
+                load_lod: False to leave the point cloud to update_pointcloud
+            Returns:
+                prefetch.FrameData object
+                """
+        return prefetch.load_frame(self.lct_path, frame_num, self.rgb_sensor_name, self.lidar_sensors,
+                                   self.pred_frames > 0, load_lod)
+
+    def on_frame_loaded(self, frame_num):
+        """Called on a prefetch worker thread once a frame is loaded, hands it over to the GUI thread"""
+        gui.Application.instance.post_to_main_thread(self.controls, functools.partial(self.show_loaded_frame, frame_num))
+
+    def show_loaded_frame(self, frame_num):
+        """Shows a frame the user switched to while it was being prefetched"""
+        if self.pending_frame == frame_num and self.frame_num == frame_num:
+            self.pending_frame = None
+            self.update(DIRTY_FRAME)
+
+    def fetch_frame_data(self):
+        """Returns the data of the current frame, loading it on the GUI thread only if it was not prefetched
+            Args:
+                self: window object
+            Returns:
+                prefetch.FrameData object
+                """
+        data = self.prefetcher.get(self.frame_num)
+        if data is not None and data.camera == self.rgb_sensor_name:
+            return data
+        if self.frame_data is not None and self.frame_data.frame_num == self.frame_num and self.frame_data.camera == self.rgb_sensor_name:
+            return self.frame_data
+        # The point cloud is left to update_pointcloud, so this stays fast
+        return self.load_frame_data(self.frame_num, load_lod=False)
+
     def update_image(self):
         """Fetches new image from LVT Directory, and draws it onto a plt figure
-           Uses nuScenes API to project 3D bounding boxes onto that plt figure
-           Finally, extracts raw image data from plt figure and updates our image widget
+           Projects 3D bounding boxes onto that image with projection_utils
+           Finally, updates our image widget
             Args:
                 self: window object
             Returns:
                 None
                 """
-        # Extract new image from file
-        self.image = np.asarray(Image.open(self.image_path))
-        for b in self.boxes_to_render:
-            box = Box(b[ORIGIN], b[SIZE], Quaternion(b[ROTATION]), name=b[ANNOTATION], score=b[CONFIDENCE], velocity=(0,0,0))
-            color = b[COLOR]
-
-            # Box is stored in vehicle frame, so transform it to RGB sensor frame
-            box.translate(-np.array(self.image_extrinsic['translation']))
-            box.rotate(Quaternion(self.image_extrinsic['rotation']).inverse)
-            
-            #Thank you to Oscar Beijbom for providing this box rendering algorithm at https://github.com/nutonomy/nuscenes-devkit/blob/master/python-sdk/nuscenes/utils/data_classes.py
-            if box_in_image(box, np.asarray(self.image_intrinsic['matrix']), (self.image_w, self.image_h), BoxVisibility.ANY):
-                # If the box is in view, then render it onto the PLT frame
-                corners = view_points(box.corners(), np.asarray(self.image_intrinsic['matrix']), normalize=True)[:2, :]
-
-                def draw_rect(selected_corners, c):
-                    prev = selected_corners[-1]
-                    for corner in selected_corners:
-                        cv2.line(self.image,
-                                (int(prev[0]), int(prev[1])),
-                                (int(corner[0]), int(corner[1])),
-                                c, 2)
-                        prev = corner
-
-                # Draw the sides
-                for i in range(4):
-                    cv2.line(self.image,
-                            (int(corners.T[i][0]), int(corners.T[i][1])),
-                            (int(corners.T[i + 4][0]), int(corners.T[i + 4][1])),
-                            color, 2)
-
-                # Draw front (first 4 corners) and rear (last 4 corners) rectangles(3d)/lines(2d)
-                draw_rect(corners.T[:4], color)
-                draw_rect(corners.T[4:], color)
-
-                # Draw line indicating the front
-                center_bottom_forward = np.mean(corners.T[2:4], axis=0)
-                center_bottom = np.mean(corners.T[[2, 3, 7, 6]], axis=0)
-                cv2.line(self.image,
-                        (int(center_bottom[0]), int(center_bottom[1])),
-                        (int(center_bottom_forward[0]), int(center_bottom_forward[1])),
-                        color, 2)
-
-                #Only render confidence if this isnt at GT box        
-                if b[CONFIDENCE] <= 100 and self.show_score:
-                    cv2.putText(self.image, str(b[CONFIDENCE]), (int(corners.T[0][0]), int(corners.T[1][1])), cv2.FONT_HERSHEY_SIMPLEX ,1, (255,0,0), 2)
+        # Extract new image from file, decoded at the size of the image window
+        # Full resolution is only needed when exporting
+        # Copied so the boxes are not drawn onto the loaded frame
+        self.image = self.frame_data.image.copy()
+        (self.image_w, self.image_h) = self.frame_data.image_size
+        self.draw_boxes_on_image(self.image, image_utils.scale_intrinsics(self.image_intrinsic['matrix'], self.frame_data.image_scale))
 
         new_image = o3d.geometry.Image(self.image)
         self.image_widget.update_image(new_image)
@@ -475,6 +551,28 @@ class Window:
         if OS_STRING != "Windows":
             self.image_window.post_redraw()
 
+    def draw_boxes_on_image(self, image, intrinsic):
+        """Projects the boxes in boxes_to_render onto an image of the current RGB sensor
+            Args:
+                self: window object
+                image: [h, w, 3] image array, drawn on in place
+                intrinsic: 3x3 intrinsic matrix matching the resolution of image
+            Returns:
+                None
+                """
+        import cv2
+        from utils import projection_utils
+        # Every box is projected at once, and every color drawn with one polylines call
+        projection = projection_utils.project_boxes(self.boxes_to_render, intrinsic, self.image_extrinsic, (image.shape[1], image.shape[0]))
+        projection_utils.draw_projected_boxes(image, projection, [b[COLOR] for b in self.boxes_to_render])
+
+        #Only render confidence if this isnt at GT box
+        if self.show_score:
+            for i in np.flatnonzero(projection.visible):
+                if self.boxes_to_render[i][CONFIDENCE] <= 100:
+                    corners = projection.corners[i]
+                    cv2.putText(image, str(self.boxes_to_render[i][CONFIDENCE]), (int(corners[0][0]), int(corners[1][1])), cv2.FONT_HERSHEY_SIMPLEX ,1, (255,0,0), 2)
+
     def update_bounding(self):
         """Updates bounding box information when switching frames
             Args:
@@ -487,34 +585,28 @@ class Window:
         self.boxes_to_render = []
 
         #
-        self.boxes = json.load(open(os.path.join(self.lct_path , "bounding", str(self.frame_num), "boxes.json")))
+        self.boxes = self.frame_data.boxes
         #Update the counters for the gt boxes
+        gt_counts = self.count_classes("bounding", self.boxes, 0)
         for horiz_widget in self.check_horiz:
             children = horiz_widget.get_children()
             label_widget = children[1]
             color_widget = children[2]
             count_widget = children[3]
             self.color_map[label_widget.text] = (int(color_widget.color_value.red * 255), int(color_widget.color_value.green * 255), int(color_widget.color_value.blue * 255))
-            count_num = 0
-            for box in self.boxes['boxes']:
-                if box['annotation'] == label_widget.text:
-                    count_num += 1
-            count_widget.text = "Count: " + str(count_num)
+            count_widget.text = "Count: " + str(gt_counts.get(label_widget.text, 0))
         
         if self.pred_frames > 0:
-            self.pred_boxes = json.load(open(os.path.join(self.lct_path ,"pred_bounding", str(self.frame_num), "boxes.json")))
+            self.pred_boxes = self.frame_data.pred_boxes
             #Update the counters for predicted boxes
+            pred_counts = self.count_classes("pred_bounding", self.pred_boxes, self.min_confidence)
             for horiz_widget in self.pred_check_horiz:
                 children = horiz_widget.get_children()
                 label_widget = children[1]
                 color_widget = children[2]
                 count_widget = children[3]
                 self.pred_color_map[label_widget.text] = (int(color_widget.color_value.red * 255), int(color_widget.color_value.green * 255), int(color_widget.color_value.blue * 255))
-                count_num = 0
-                for box in self.pred_boxes['boxes']:
-                    if box['annotation'] == label_widget.text and box['confidence'] >= self.min_confidence:
-                        count_num += 1
-                count_widget.text = "Count: " + str(count_num)
+                count_widget.text = "Count: " + str(pred_counts.get(label_widget.text, 0))
 
 
         #If highlight_faults is False, then we just filter boxes
@@ -525,7 +617,7 @@ class Window:
                     if ((len(self.filter_arr) == 0 and len(self.pred_filter_arr) == 0) or box[
                         'annotation'] in self.filter_arr) and box['confidence'] >= self.min_confidence:
                         bounding_box = [box['origin'], box['size'], box['rotation'], box['annotation'],
-                                        box['confidence'], self.color_map[box['annotation']]]
+                                        box['confidence'], self.color_map.get(box['annotation'], PENDING_COLOR)]
                         if len(self.filter_arr) == 0 or bounding_box[ANNOTATION] in self.filter_arr:
                             self.boxes_to_render.append(bounding_box)
 
@@ -533,144 +625,247 @@ class Window:
             if self.pred_frames > 0:
                 for box in self.pred_boxes['boxes']:
                     if ((len(self.pred_filter_arr) == 0 and len(self.filter_arr) == 0) or box['annotation'] in self.pred_filter_arr) and box['confidence'] >= self.min_confidence:
-                        bounding_box = [box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.pred_color_map[box['annotation']]]
+                        bounding_box = [box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.pred_color_map.get(box['annotation'], PENDING_COLOR)]
                         if len(self.pred_filter_arr) == 0 or bounding_box[ANNOTATION] in self.pred_filter_arr:
                             self.boxes_to_render.append(bounding_box)
         
         #Otherwise, the user is trying to highlight faults, so the selected annotations define an equivalancy between annotations
-        if self.show_false_positive or self.highlight_faults:
-            #For each gt box, only render it if it overlaps with a predicted box
-            min_dist = .5 #minimum distance should be half a meter
-            #Reverse Sort predicted boxes based on confidence
-            sorted_list = sorted(self.pred_boxes['boxes'], key=itemgetter('confidence'), reverse=True)
-            sorted_list = [box for box in sorted_list if box['annotation'] in self.pred_filter_arr and box['confidence'] >= self.min_confidence]
-            pred_matched = [False] * len(sorted_list)
-            
-            
-            #Get rid of GT boxes that have do not match the annotation
-            gt_list = [box for box in self.boxes['boxes'] if box['annotation'] in self.filter_arr]
-            gt_matched = [False] * len(gt_list)
-
-            #match each predicted box to a gt box
-            for (pred_idx,pred_box) in enumerate(sorted_list):
-                dist = float('inf')
-                for (i, gt_box) in enumerate(gt_list):
-                    temp_dist = geometry_utils.box_dist(pred_box, gt_box)
-                    if not gt_matched[i]:
-                        if temp_dist < dist:
-                            dist = temp_dist
-                            match_index = i
-                #We found a valid match
-                if dist <= min_dist:
-                    #TODO Assume that the closet annotation is the correct one? And compare the name of the annotation
-                    gt_matched[match_index] = True
-                    pred_matched[pred_idx] = True
+        if self.show_false_positive or self.highlight_faults or self.show_incorrect_annotations:
+            #Greedily match predicted boxes to GT boxes, most confident first, once for every confidence threshold
+            key = (self.frame_data, tuple(self.filter_arr), tuple(self.pred_filter_arr), self.match_criterion)
+            if key != self.match_sweep_key:
+                self.match_sweep = matching.sweep_frame_boxes(self.boxes, self.pred_boxes, self.filter_arr, self.pred_filter_arr,
+                                                              self.match_criterion)
+                self.match_sweep_key = key
+            sweep = self.match_sweep
+            gt_list = self.boxes['boxes']
+            pred_list = self.pred_boxes['boxes']
 
             #Add false positive predicted boxes to render list
             if self.show_false_positive:
-                for (i, box) in enumerate(sorted_list):
-                    if pred_matched[i] == False:
-                        self.boxes_to_render.append([box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.pred_color_map[box['annotation']]])
+                for i in sweep.false_positives(self.min_confidence):
+                    box = pred_list[i]
+                    self.boxes_to_render.append([box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.pred_color_map.get(box['annotation'], PENDING_COLOR)])
 
             #Add unmatched gt boxes to render list
             if self.highlight_faults:
-                for (i, box) in enumerate(gt_list):
-                    if gt_matched[i] == False:
-                        self.boxes_to_render.append([box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.color_map[box['annotation']]])
-        
-        #The user is trying to see if any GT boxes were categorized by mistake
-        if self.show_incorrect_annotations:
-            gt_list = [box for box in self.boxes['boxes'] if box['annotation'] in self.filter_arr]
-            pred_list = [box for box in self.pred_boxes['boxes'] if box['confidence'] >= self.min_confidence]
-            min_dist = .5
-            for pred_box in pred_list:
-                for gt_box in gt_list:
-                    dist = geometry_utils.box_dist(pred_box, gt_box)
-                    #if the box is within the distance cuttoff, but has the wrong annotation, we render both the gt box and predicted box
-                    if dist <= min_dist and pred_box['annotation'] not in self.pred_filter_arr:
-                        self.boxes_to_render.append([pred_box['origin'], pred_box['size'], pred_box['rotation'], pred_box['annotation'], pred_box['confidence'], self.pred_color_map[pred_box['annotation']]])
-                        self.boxes_to_render.append([gt_box['origin'], gt_box['size'], gt_box['rotation'], gt_box['annotation'], gt_box['confidence'], self.color_map[gt_box['annotation']]])
+                for i in sweep.unmatched_gt(self.min_confidence):
+                    box = gt_list[i]
+                    self.boxes_to_render.append([box['origin'], box['size'], box['rotation'], box['annotation'], box['confidence'], self.color_map.get(box['annotation'], PENDING_COLOR)])
+
+            #The user is trying to see if any GT boxes were categorized by mistake
+            #If a predicted box is within the distance cuttoff, but has the wrong annotation, we render both the gt box and predicted box
+            if self.show_incorrect_annotations:
+                for (pred_idx, gt_idx) in sweep.class_mismatches(self.min_confidence):
+                    pred_box = pred_list[pred_idx]
+                    gt_box = gt_list[gt_idx]
+                    self.boxes_to_render.append([pred_box['origin'], pred_box['size'], pred_box['rotation'], pred_box['annotation'], pred_box['confidence'], self.pred_color_map.get(pred_box['annotation'], PENDING_COLOR)])
+                    self.boxes_to_render.append([gt_box['origin'], gt_box['size'], gt_box['rotation'], gt_box['annotation'], gt_box['confidence'], self.color_map.get(gt_box['annotation'], PENDING_COLOR)])
+        self.update_precision_recall()
         #Post Redraw calls seem to crash the app on windows. Temporary workaround
         if OS_STRING != "Windows":
             self.controls.post_redraw()
 
+    def update_precision_recall(self):
+        """Shows the precision and recall of the whole scene at the confidence threshold, with its curve
+           The scene is matched on a background thread when the selected classes or the matching change,
+           after that a new threshold only takes two binary searches, see utils/precision_recall.py
+            Args:
+                self: window object
+            Returns:
+                None
+                """
+        if self.pred_frames <= 0 or len(self.filter_arr) == 0 or len(self.pred_filter_arr) == 0:
+            self.precision_recall_label.text = "Select GT and predicted classes for the scene precision/recall"
+            return
+        from utils import precision_recall
+        if self.precision_recall is None:
+            self.precision_recall = precision_recall.PrecisionRecallLoader(self.lct_path, self.num_frames, self.on_precision_recall_ready)
+        result = self.precision_recall.request(self.filter_arr, self.pred_filter_arr, self.match_criterion)
+        if result is None:
+            self.precision_recall_label.text = "Computing the scene precision/recall..."
+            return
+        (precision, recall) = result.at(self.min_confidence)
+        self.precision_recall_label.text = "Scene precision: %.3f  recall: %.3f" % (precision, recall)
+        curve = precision_recall.draw_curve(result, self.min_confidence)
+        self.precision_recall_image.update_image(o3d.geometry.Image(curve))
+
+    def on_precision_recall_ready(self, result):
+        """Called from the background thread once the scene precision/recall is computed"""
+        gui.Application.instance.post_to_main_thread(self.controls, self.update_precision_recall)
+
+    def load_frame_points(self, frame_num):
+        """Returns the full resolution point cloud of every lidar sensor of one frame, merged in the ego frame"""
+        return frame_cache.load_points(self.lct_path, self.lidar_sensors, frame_num)
+
+    def write_frame_lod(self, frame_num, points=None, lod=None):
+        """Queues writing the LOD pyramid of a frame that was viewed without one, see lod_utils.LodWriter
+            Args:
+                self: window object
+                frame_num: frame number
+                points: merged point cloud of the frame, used when lod is None
+                lod: FrameLod object built in memory
+            Returns:
+                None
+                """
+        from utils import lod_utils
+        if self.lod_writer is None:
+            self.lod_writer = lod_utils.LodWriter(self.lct_path)
+        self.lod_writer.request(frame_num, points, lod)
+
+    def refine_pointcloud(self, generation, lod, frame_num, frame_extrinsic):
+        """Streams the finer LOD levels and then the full resolution cloud of a frame, run on a background thread
+           Stops as soon as the user moves to another frame
+            Args:
+                self: window object
+                generation: value of pointcloud_generation when the frame was shown
+                lod: FrameLod object of the frame
+                frame_num: frame number
+                frame_extrinsic: ego pose of the frame
+            Returns:
+                None
+                """
+        time.sleep(LOD_SETTLE_TIME)
+        for level in range(1, lod.num_levels + 1):
+            if generation != self.pointcloud_generation:
+                return
+            if level < lod.num_levels:
+                points = lod.level_points(level)
+            else:
+                points = self.load_frame_points(frame_num)
+            points = pointcloud_utils.transform_points(points, frame_extrinsic)
+            gui.Application.instance.post_to_main_thread(self.pointcloud_window,
+                                                         functools.partial(self.show_refined_pointcloud, generation, points))
+
+    def show_refined_pointcloud(self, generation, points):
+        """Replaces the point cloud in the 3D widget with a finer one, if the frame is still being shown"""
+        if generation != self.pointcloud_generation:
+            return
+        self.show_points(points)
+
     def update_pointcloud(self):
-        """Takes new pointcloud data and converts it to global frame, 
-           then renders the bounding boxes (Assuming the boxes are vehicle frame
+        """Takes new pointcloud data and converts it to global frame
             Args:
                 self: window object
             Returns:
                 None
                 """
-        self.widget3d.scene.clear_geometry()
-        self.boxes_in_scene = []
-        self.box_indices = []
-        # Add Pointcloud
-        temp_points = np.empty((0,3))
+        # Frames with a LOD pyramid show its coarsest level right away, so scrubbing stays interactive
+        # The finer levels and the full resolution cloud are only loaded once the user settles on the frame
+        self.pointcloud_generation += 1
+        lod = self.frame_data.lod
+        if lod is None:
+            from utils import lod_utils
+            lod = lod_utils.load_frame_lod(self.lct_path, self.frame_num)
+        if lod is not None and lod.num_levels > 0:
+            # Prefetched frames carry their pyramid, built in memory when the scene has none for them
+            points = lod.level_points(0)
+            threading.Thread(target=self.refine_pointcloud, daemon=True,
+                             args=(self.pointcloud_generation, lod, self.frame_num, self.frame_extrinsic)).start()
+            if not lod.saved and not self.scene.packed:
+                self.write_frame_lod(self.frame_num, lod=lod)
+        else:
+            points = self.load_frame_points(self.frame_num)
+            if not self.scene.packed:
+                # Build the pyramid on first view, so coming back to this frame is fast
+                self.write_frame_lod(self.frame_num, points)
+
+        # Transform lidar points straight into the buffer of the point cloud slot, which updates the
+        # GPU buffer in place when the number of points did not change
+        self.show_points(points, self.frame_extrinsic)
+        self.widget3d.scene.show_axes(True)
+
+    def show_points(self, points, extrinsic=None):
+        """Shows a point cloud in the 3D widget, within the point budget when it is enabled
+            Args:
+                self: window object
+                points: [n, 3] point array
+                extrinsic: optional ego pose dictionary, for points in the ego frame
+            Returns:
+                None
+                """
+        self.shown_points = (points, extrinsic)
+        if not self.point_budget_enabled:
+            self.point_grid = None
+            self.pointcloud = self.pointcloud_slot.update(points, extrinsic)
+            return
+        if extrinsic is not None:
+            points = pointcloud_utils.transform_points(points, extrinsic)
+        # Built once per frame, camera moves only select from it
+        self.point_grid = point_grid.PointGrid(points)
+        self.update_point_budget()
+
+    def update_point_budget(self):
+        """Shows the points of the point grid the current camera should draw, within the point budget
+            Args:
+                self: window object
+            Returns:
+                None
+                """
+        self.point_budget_pending = False
+        if self.point_grid is None:
+            return
+        camera = self.widget3d.scene.camera
+        indices = self.point_grid.select(camera.get_view_matrix(), camera.get_projection_matrix(), self.point_budget)
+        self.pointcloud = self.pointcloud_slot.update(self.point_grid.points[indices])
+        self.widget3d.force_redraw()
+
+    def on_pointcloud_mouse(self, event):
+        """Selects the points to draw again once the camera moved, the event itself is left to the camera controls
+            Args:
+                self: window object
+                event: gui.MouseEvent
+            Returns:
+                gui.Widget.EventCallbackResult.IGNORED
+                """
+        camera_moved = event.type in (gui.MouseEvent.Type.DRAG, gui.MouseEvent.Type.WHEEL, gui.MouseEvent.Type.BUTTON_UP)
+        if self.point_budget_enabled and camera_moved and not self.point_budget_pending:
+            self.point_budget_pending = True
+            # Queued, so it runs after the widget has moved the camera, and at most once per redraw
+            gui.Application.instance.post_to_main_thread(self.pointcloud_window, self.update_point_budget)
+        return gui.Widget.EventCallbackResult.IGNORED
+
+    def toggle_point_budget(self, checked):
+        self.point_budget_enabled = checked
+        if self.shown_points is not None:
+            self.show_points(*self.shown_points)
+
+    def on_point_budget_switch(self, new_val):
+        if int(new_val) > 0:
+            self.point_budget = int(new_val)
+            self.update_point_budget()
+
+    def update_box_geometry(self):
+        """Renders the bounding boxes (assuming the boxes are vehicle frame), their scores and the RGB camera line
+           Only the box geometry is replaced, the point cloud stays in the scene
+            Args:
+                self: window object
+            Returns:
+                None
+                """
+        # Line sets cannot be updated in place, but all boxes are a single small one
+        if self.widget3d.scene.has_geometry("Boxes"):
+            self.widget3d.scene.remove_geometry("Boxes")
         for label in self.label_list:
             self.widget3d.remove_3d_label(label)
 
         self.label_list = []
 
-        for i, pcd_path in enumerate(self.pcd_paths):
-            temp_cloud = o3d.io.read_point_cloud(pcd_path)
-            ego_rotation_matrix = Quaternion(self.frame_extrinsic['rotation']).rotation_matrix
-
-            # Transform lidar points into global frame
-            temp_cloud.rotate(ego_rotation_matrix, [0,0,0])
-            temp_cloud.translate(np.array(self.frame_extrinsic['translation']))
-            temp_points = np.concatenate((temp_points, np.asarray(temp_cloud.points)))
- 
-        self.pointcloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(temp_points)))
-        # Add new global frame pointcloud to our 3D widget
-        self.widget3d.scene.add_geometry("Point Cloud", self.pointcloud, self.mat)
-        self.widget3d.scene.show_axes(True)
-        i = 0
-        mat = rendering.MaterialRecord()
-        mat.shader = "unlitLine"
-        mat.line_width = .25
-
-        for box in self.boxes_to_render:
-            size = [0,0,0]
-            # Open3D wants sizes in L,W,H
-            size[0] = box[SIZE][1]
-            size[1] = box[SIZE][0]
-            size[2] = box[SIZE][2]
-            color = box[COLOR]
-            bounding_box = o3d.geometry.OrientedBoundingBox(box[ORIGIN], Quaternion(box[ROTATION]).rotation_matrix, size)
-            bounding_box.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-            bounding_box.translate(np.array(self.frame_extrinsic['translation']))
-            hex = '#%02x%02x%02x' % color # bounding_box.color needs to be a tuple of floats (color is a tuple of ints)
-            bounding_box.color = matplotlib.colors.to_rgb(hex)
-
-            self.box_indices.append(box[ANNOTATION] + str(i)) #used to reference specific boxes in scene
-            self.boxes_in_scene.append(bounding_box)
-            if box[CONFIDENCE] <= 100 and self.show_score:
-                label = self.widget3d.add_3d_label(bounding_box.center, str(box[CONFIDENCE]))
+        # Every box goes into one LineSet, the side table keeps track of which lines belong to which box
+        lineset, self.box_table = render_utils.box_lineset(self.boxes_to_render, self.frame_extrinsic)
+        self.box_indices = list(self.box_table.names) #used to reference specific boxes in scene
+        if len(self.box_table) > 0:
+            self.widget3d.scene.add_geometry("Boxes", lineset, self.line_mat)
+
+        if self.show_score:
+            for i in np.flatnonzero(self.box_table.confidences <= 100):
+                label = self.widget3d.add_3d_label(self.box_table.centers[i], str(self.boxes_to_render[i][CONFIDENCE]))
                 label.color = gui.Color(1.0,0.0,0.0)
                 self.label_list.append(label)
 
-            self.widget3d.scene.add_geometry(box[ANNOTATION] + str(i), bounding_box, mat)
-            i += 1
-        
-
 
-        #Add Line that indicates current RGB Camera View
-        line = o3d.geometry.LineSet()
-        line.points = o3d.utility.Vector3dVector([[0,0,0], [0,0,2]])
-        line.lines =  o3d.utility.Vector2iVector([[0,1]])
-        line.colors = o3d.utility.Vector3dVector([[1.0,0,0]])
-
-        
-        line.rotate(Quaternion(self.image_extrinsic['rotation']).rotation_matrix, [0,0,0])
-        line.translate(self.image_extrinsic['translation'])
-        
-        
-        line.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-        line.translate(self.frame_extrinsic['translation'])
-        
-
-        self.widget3d.scene.add_geometry("RGB Line",line, mat)
+        #Move the line that indicates current RGB Camera View
+        self.rgb_line_slot.update(render_utils.pose_transform(self.frame_extrinsic, self.image_extrinsic))
 
         
         # Force our widgets to update
@@ -687,9 +882,9 @@ class Window:
                 None
                 """
         # Pulling intrinsic and extrinsic data from LVT directory based on current selected frame and sensor       
-        self.image_intrinsic = json.load(open(os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, "intrinsics.json")))
-        self.image_extrinsic = json.load(open(os.path.join(self.lct_path, "cameras" , self.rgb_sensor_name, "extrinsics.json")))
-        self.frame_extrinsic = json.load(open(os.path.join(self.lct_path, "ego", str(self.frame_num) + ".json")))
+        self.image_intrinsic = self.scene.read_json("cameras/" + self.rgb_sensor_name + "/intrinsics.json")
+        self.image_extrinsic = self.scene.read_json("cameras/" + self.rgb_sensor_name + "/extrinsics.json")
+        self.frame_extrinsic = self.frame_data.pose
     def on_sensor_select(self, new_val, new_idx):
         """This updates the name of the selected rgb sensor after user input
            Updates the window with the new information 
@@ -701,7 +896,10 @@ class Window:
                 None
                 """
         self.rgb_sensor_name = new_val
-        self.update()
+        # Prefetched frames hold the image of the previous sensor
+        self.prefetcher.clear()
+        self.update(DIRTY_CAMERA)
+        self.prefetcher.request(self.frame_num, self.num_frames)
 
     # This creates a new function for every annotation value, so the annotation name can be 
     # passed through
@@ -736,7 +934,7 @@ class Window:
             self.filter_arr.append(annotation)
         else:
             self.filter_arr.remove(annotation)
-        self.update()
+        self.update(DIRTY_FILTERS)
 
     def on_pred_filter_check(self, annotation, checked):
         """This updates the pred_filter (array of predicted annotations to display) based on new user input
@@ -754,19 +952,20 @@ class Window:
             self.pred_filter_arr.append(annotation)
         else:
             self.pred_filter_arr.remove(annotation)
-        self.update()
+        self.update(DIRTY_FILTERS)
 
     def update_image_path(self):
-        """This updates the image path based on current rgb sensor name and frame number
+        """This updates the image path (relative to the scene) based on current rgb sensor name and frame number
             Args:
                 self: window object
             Returns:
                 None
                 """
-        self.image_path = os.path.join(self.lct_path, "cameras", self.rgb_sensor_name, str(self.frame_num) +".jpg")
+        self.image_path = "cameras/" + self.rgb_sensor_name + "/" + str(self.frame_num) + ".jpg"
     
     def update_pcd_path(self):
         """This clears the current pcd_paths stored and updates it with the sensors currently stored in lidar_sensors
+           Paths are relative to the scene
             Args:
                 self: window object
             Returns:
@@ -774,7 +973,7 @@ class Window:
                 """
         self.pcd_paths.clear()
         for sensor in self.lidar_sensors:
-            self.pcd_paths.append(os.path.join(self.lct_path, "pointcloud", sensor, str(self.frame_num) + ".pcd"))
+            self.pcd_paths.append(self.scene.points_path(sensor, self.frame_num))
 
     
     def on_frame_switch(self, new_val):
@@ -787,10 +986,17 @@ class Window:
                 None
                 """
         if int(new_val) >= 0 and int(new_val) < self.num_frames:
+            direction = int(new_val) - self.frame_num
             # Set new frame value
             self.frame_num = int(new_val)
+            self.prefetcher.request(self.frame_num, self.num_frames, direction)
+            if self.prefetcher.is_loading(self.frame_num):
+                # Shown by show_loaded_frame once the background load finishes, instead of loading it twice
+                self.pending_frame = self.frame_num
+                return
+            self.pending_frame = None
             # Update Bounding Box List
-            self.update()
+            self.update(DIRTY_FRAME)
 
     def on_confidence_switch(self, new_val):
         """This updates the minimum confidence after the user changed it.
@@ -804,13 +1010,57 @@ class Window:
                 """
         if int(new_val) >= 0 and int(new_val) <= 100:
             self.min_confidence = int(new_val)
-            self.update()
+            self.update(DIRTY_FILTERS)
+
+    def on_match_mode_select(self, new_val, new_idx):
+        """Switches between matching by centre distance and by IoU, with the default threshold of the new mode
+            Args:
+                self: window object
+                new_val: name of the matching mode
+                new_idx: index of the matching mode
+            Returns:
+                None
+                """
+        mode = MATCH_MODE_NAMES[new_val]
+        self.match_criterion = matching.MatchCriterion(mode, None, self.match_criterion.class_thresholds)
+        self.match_threshold_select.set_limits(0, MAX_MATCH_DISTANCE if mode == matching.CENTER_DISTANCE else 1)
+        self.match_threshold_select.set_value(self.match_criterion.threshold)
+        self.update(DIRTY_FILTERS)
+
+    def on_match_threshold_switch(self, new_val):
+        """Updates the matching threshold, a centre distance in meters or a minimum IoU
+            Args:
+                self: window object
+                new_val: new threshold
+            Returns:
+                None
+                """
+        criterion = self.match_criterion
+        self.match_criterion = matching.MatchCriterion(criterion.mode, new_val, criterion.class_thresholds)
+        self.update(DIRTY_FILTERS)
+
+    def on_class_thresholds_switch(self, new_val):
+        """Updates the per-class matching thresholds, entered as "name=value,name=value"
+           Text that cannot be parsed is ignored
+            Args:
+                self: window object
+                new_val: text of the per-class thresholds
+            Returns:
+                None
+                """
+        try:
+            class_thresholds = matching.parse_class_thresholds(new_val)
+        except ValueError:
+            return
+        criterion = self.match_criterion
+        self.match_criterion = matching.MatchCriterion(criterion.mode, criterion.threshold, class_thresholds)
+        self.update(DIRTY_FILTERS)
 
     def on_menu_quit(self):
         gui.Application.instance.quit()
 
     def on_color_toggle(self, new_color):
-        self.update()
+        self.update(DIRTY_COLORS)
 
     def toggle_bounding(self, new_val, new_idx):
         """This updates the bounding box on the window to reflect either bounding or predicted bounding
@@ -826,10 +1076,10 @@ class Window:
         if self.box_data_name != ["pred_bounding", "bounding"]:
             if new_val == "Predicted" and self.pred_frames > 0:
                 self.box_data_name = ["pred_bounding"]
-                self.update()
+                self.update(DIRTY_FILTERS)
             else: # switched to ground truth boxes
                 self.box_data_name = ["bounding"]
-                self.update()
+                self.update(DIRTY_FILTERS)
     
     def toggle_box_comparison(self, checked):
         if self.pred_frames > 0:
@@ -842,7 +1092,7 @@ class Window:
                 else:
                     self.box_data_name = ["pred_bounding"]
                 self.compare_bounding = False
-            self.update()
+            self.update(DIRTY_FILTERS)
 
     def toggle_gt(self, checked):
         if self.pred_frames > 0:
@@ -850,7 +1100,7 @@ class Window:
                 self.show_gt = True
             else:
                 self.show_gt = False
-            self.update()
+            self.update(DIRTY_FILTERS)
 
     def toggle_highlights(self, checked):
         if self.pred_frames > 0:
@@ -858,7 +1108,7 @@ class Window:
                 self.highlight_faults = True
             else:
                 self.highlight_faults = False
-            self.update()
+            self.update(DIRTY_FILTERS)
     
     def toggle_false_positive(self, checked):
         if self.pred_frames > 0:
@@ -866,57 +1116,106 @@ class Window:
                 self.show_false_positive = True
             else:
                 self.show_false_positive = False
-            self.update()
+            self.update(DIRTY_FILTERS)
     def toggle_incorrect_annotations(self, checked):
         if self.pred_frames > 0:
             if checked:
                 self.show_incorrect_annotations = True
             else:
                 self.show_incorrect_annotations = False
-            self.update()
+            self.update(DIRTY_FILTERS)
 
     def toggle_score(self, checked):
         if checked:
             self.show_score = True
         else:
             self.show_score = False
-        self.update()
+        self.update(DIRTY_SCORE)
     def jump_next_frame(self):
-        found = False
-        current_frame = self.frame_num
-        while not found:
-            #If the user has not selected any ground truth boxes, then dont try to search anything
-            if len(self.filter_arr) == 0:
-                return
-            current_frame = (current_frame + 1) % self.num_frames
-            current_box_list = json.load(open(os.path.join(self.lct_path , "bounding", str(current_frame), "boxes.json")))
-            for box in current_box_list['boxes']:
-                if box['annotation'] in self.filter_arr:
-                    found = True
-                    self.frame_num = current_frame
-                    break
-        self.frame_select.set_value(current_frame)
-        self.update()
-
+        from utils import frame_index
+        self.jump_frame(frame_index.next_frame, 1)
 
     def jump_prev_frame(self):
-        found = False
+        from utils import frame_index
+        self.jump_frame(frame_index.prev_frame, -1)
+
+    def jump_frame(self, find_frame, step):
+        """Moves to the next (or previous) frame containing what the search mode is looking for
+            Args:
+                self: window object
+                find_frame: frame_index.next_frame or frame_index.prev_frame
+                step: 1 or -1, direction used when scanning frames without an index
+            Returns:
+                None
+                """
+        frames = self.search_frames()
+        if frames is not None:
+            target = find_frame(frames, self.frame_num)
+        elif self.search_mode == SEARCH_GT:
+            target = self.scan_for_gt_frame(step)
+        else:
+            # The index is still being built, or the error frames matched, in the background
+            return
+        if target is None:
+            return
+        self.frame_select.set_value(target)
+        self.on_frame_switch(target)
+
+    def search_frames(self):
+        """Returns the sorted frames matching the current search mode and selection, or None while they are not ready
+            Args:
+                self: window object
+            Returns:
+                sorted array of frame numbers, or None
+                """
+        from utils import frame_index
+        if self.frame_index is None:
+            # Built in the background if the scene does not have one
+            self.frame_index = frame_index.FrameIndexLoader(self.lct_path)
+        index = self.frame_index.get()
+        if index is None:
+            return None
+        if self.search_mode == SEARCH_GT:
+            return index.frames_with_classes("bounding", self.filter_arr)
+        if self.search_mode == SEARCH_TRACK:
+            return index.frames_with_track(self.track_id_edit.text_value.strip())
+
+        # Matched on the loader's background thread, None until they are ready
+        mode = frame_index.FALSE_POSITIVES if self.search_mode == SEARCH_FALSE_POSITIVES else frame_index.UNMATCHED_GT
+        return self.frame_index.error_frames(mode, self.filter_arr, self.pred_filter_arr, self.min_confidence, self.match_criterion)
+
+    def scan_for_gt_frame(self, step):
+        """Reads frames one at a time until one contains a selected GT annotation, used until the index is ready
+            Args:
+                self: window object
+                step: 1 or -1
+            Returns:
+                the frame number, or None if no frame has a selected annotation
+                """
+        #If the user has not selected any ground truth boxes, then dont try to search anything
+        if len(self.filter_arr) == 0:
+            return None
         current_frame = self.frame_num
-        
-        while not found:
-            #If the user has not selected any ground truth boxes, then dont try to search anything
-            if len(self.filter_arr) == 0:
-                return
-            current_frame = (current_frame - 1) % self.num_frames
-            current_box_list = json.load(open(os.path.join(self.lct_path , "bounding", str(current_frame), "boxes.json")))
+        # Visit every frame at most once, so a selection without matches cannot loop forever
+        for _ in range(self.num_frames):
+            current_frame = (current_frame + step) % self.num_frames
+            current_box_list = box_store.load_frame_boxes(self.lct_path, "bounding", current_frame)
             for box in current_box_list['boxes']:
                 if box['annotation'] in self.filter_arr:
-                    found = True
-                    self.frame_num = current_frame
-                    break
-        self.frame_select.set_value(current_frame)
-        self.update()
-    
+                    return current_frame
+        return None
+
+    def on_search_select(self, new_val, new_idx):
+        """Changes what the Previous/Next frame search looks for
+            Args:
+                self: window object
+                new_val: name of the search mode
+                new_idx: index of the search mode
+            Returns:
+                None
+                """
+        self.search_mode = new_val
+
     def jump_to_vehicle(self):
         bounds = self.widget3d.scene.bounding_box
         self.widget3d.setup_camera(10, bounds, self.frame_extrinsic['translation'])
@@ -946,7 +1245,10 @@ class Window:
     
     def on_export_rgb_dialog_done(self, filename):
         self.controls.close_dialog()
-        image = Image.fromarray(self.image)
+        # Exports use the full resolution image, not the one shown in the image window
+        full_image = image_utils.load_full_image(self.lct_path, self.rgb_sensor_name, self.frame_num)
+        self.draw_boxes_on_image(full_image, np.asarray(self.image_intrinsic['matrix']))
+        image = Image.fromarray(full_image)
         image.save(filename)
         self.update()
 
@@ -968,7 +1270,7 @@ class Window:
     def on_export_video_lidar_dialog_done(self, filename):
         self.controls.close_dialog()
         middle_frame = self.num_frames // 2
-        middle_extrinsics = json.load(open(os.path.join(self.lct_path, "ego", str(middle_frame) + ".json")))
+        middle_extrinsics = self.poses.pose(middle_frame)
         eye = [0,0,0]
         eye[0] = middle_extrinsics['translation'][0]
         eye[1] = middle_extrinsics['translation'][1]
@@ -976,9 +1278,12 @@ class Window:
         image_folder = filename + '_temp'
         os.mkdir(image_folder)
         self.off_renderer = o3d.visualization.rendering.OffscreenRenderer(width=1600, height=1200)
+        self.create_export_slots()
         for cur_frame in range(0, self.num_frames):
             self.export_lidar_frame(filename, cur_frame, middle_extrinsics, eye)
+        self.off_renderer.scene.clear_geometry()
         
+        import cv2
         video_name = filename + '.mp4'
         _fourcc = cv2.VideoWriter_fourcc(*'mp4v')
         images = []
@@ -1010,81 +1315,54 @@ class Window:
         self.update()
 
 
+    def create_export_slots(self):
+        """Creates the geometry slots of the video export, with the point cloud slot sized for the largest frame
+            Args:
+                self: window object
+            Returns:
+                None
+                """
+        mat = rendering.MaterialRecord()
+        mat.shader = "defaultUnlit"
+        mat.point_size = 1.5
+        self.export_pointcloud_slot = render_utils.PointCloudSlot(self.off_renderer.scene, "Point Cloud", mat)
+        # Point counts come from the file headers, so every frame reuses one GPU buffer
+        self.export_pointcloud_slot.reserve(max(sum(self.scene.count_points(sensor, frame) for sensor in self.lidar_sensors)
+                                                for frame in range(self.num_frames)))
+
+        self.export_line_mat = rendering.MaterialRecord()
+        self.export_line_mat.shader = "unlitLine"
+        self.export_line_mat.line_width = 1.5
+        self.export_rgb_line_slot = render_utils.PosedSlot(self.off_renderer.scene, "RGB Line", render_utils.camera_line(), self.export_line_mat)
+
     def export_lidar_frame(self, filename, cur_frame, middle_extrinsics, eye):
         # get extrinsics of current frame
-        cur_frame_extrinsic = json.load(open(os.path.join(self.lct_path, "ego", str(cur_frame) + ".json")))
+        cur_frame_extrinsic = self.poses.pose(cur_frame)
         self.off_renderer.scene.set_view_size(1600, 1200)
         
-        paths_pcd = []
-        for sensor in self.lidar_sensors:
-            paths_pcd.append(os.path.join(self.lct_path, "pointcloud", sensor, str(cur_frame) + ".pcd"))
-        print(paths_pcd)
-        temp_points = np.empty((0,3))
-        # get pointcloud of current frame:
-        for i, path in enumerate(paths_pcd):
-            temp_cloud = o3d.io.read_point_cloud(path)
-            ego_rotation_matrix = Quaternion(cur_frame_extrinsic['rotation']).rotation_matrix
-            # Transform lidar points into global frame
-            print('here')
-            temp_cloud.rotate(ego_rotation_matrix, [0,0,0])
-            temp_cloud.translate(np.array(cur_frame_extrinsic['translation']))
-            temp_points = np.concatenate((temp_points, np.asarray(temp_cloud.points)))
- 
-        pointcloud = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(temp_points)))
-        # Add new global frame pointcloud to our 3D widget
-        mat = rendering.MaterialRecord()
-        mat.shader = "defaultUnlit"
-        mat.point_size = 1.5
-        self.off_renderer.scene.add_geometry("Point Cloud", pointcloud, mat)
+        # get pointcloud of current frame, and transform it into the global frame while it is copied into the slot
+        # Read outside the frame cache, so exporting every frame does not evict the frames being viewed
+        temp_points = pointcloud_utils.assemble_points(self.scene, self.lidar_sensors, cur_frame).points
+        self.export_pointcloud_slot.update(temp_points, cur_frame_extrinsic)
 
         #Array that will hold list of boxes that will eventually be rendered
         gt_boxes = []
         
-        boxes = json.load(open(os.path.join(self.lct_path , "bounding", str(cur_frame), "boxes.json")))
+        boxes = box_store.load_frame_boxes(self.lct_path, "bounding", cur_frame)
         for box in boxes['boxes']:
             bounding_box = [box['origin'], box['size'], box['rotation'], box['annotation'],
-                            box['confidence'], self.color_map[box['annotation']]]
+                            box['confidence'], self.color_map.get(box['annotation'], PENDING_COLOR)]
             gt_boxes.append(bounding_box)
 
-        i = 0
-        mat = rendering.MaterialRecord()
-        mat.shader = "unlitLine"
-        mat.line_width = 1.5
-
-        for box in gt_boxes:
-            size = [0,0,0]
-            # Open3D wants sizes in L,W,H
-            size[0] = box[SIZE][1]
-            size[1] = box[SIZE][0]
-            size[2] = box[SIZE][2]
-            color = box[COLOR]
-            bounding_box = o3d.geometry.OrientedBoundingBox(box[ORIGIN], Quaternion(box[ROTATION]).rotation_matrix, size)
-            bounding_box.rotate(Quaternion(cur_frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-            bounding_box.translate(np.array(cur_frame_extrinsic['translation']))
-            hex = '#%02x%02x%02x' % color # bounding_box.color needs to be a tuple of floats (color is a tuple of ints)
-            bounding_box.color = matplotlib.colors.to_rgb(hex)
-
-            self.box_indices.append(box[ANNOTATION] + str(i)) #used to reference specific boxes in scene
-            self.boxes_in_scene.append(bounding_box)
-
-            self.off_renderer.scene.add_geometry(box[ANNOTATION] + str(i), bounding_box, mat)
-            i += 1
-
-        #Add Line that indicates current RGB Camera View
-        line = o3d.geometry.LineSet()
-        line.points = o3d.utility.Vector3dVector([[0,0,0], [0,0,2]])
-        line.lines =  o3d.utility.Vector2iVector([[0,1]])
-        line.colors = o3d.utility.Vector3dVector([[1.0,0,0]])
-     
-        line.rotate(Quaternion(self.image_extrinsic['rotation']).rotation_matrix, [0,0,0])
-        line.translate(self.image_extrinsic['translation'])      
-        
-        line.rotate(Quaternion(self.frame_extrinsic['rotation']).rotation_matrix, [0,0,0])
-        line.translate(self.frame_extrinsic['translation'])
-        
-        self.off_renderer.scene.add_geometry("RGB Line",line, mat)
+        if self.off_renderer.scene.has_geometry("Boxes"):
+            self.off_renderer.scene.remove_geometry("Boxes")
+        lineset, _ = render_utils.box_lineset(gt_boxes, cur_frame_extrinsic)
+        if len(gt_boxes) > 0:
+            self.off_renderer.scene.add_geometry("Boxes", lineset, self.export_line_mat)
+
+        #Move the line that indicates current RGB Camera View
+        self.export_rgb_line_slot.update(render_utils.pose_transform(self.frame_extrinsic, self.image_extrinsic))
 
-        # off_renderer.scene.scene.update_geometry()
         self.off_renderer.scene.set_background([0,0,0,255])
         # Set camera position
         self.off_renderer.scene.camera.look_at(middle_extrinsics['translation'], eye, [1, 0, 0])
@@ -1093,120 +1371,158 @@ class Window:
         rendered_image = self.off_renderer.render_to_image()
         o3d.io.write_image(filename + f'_temp/{cur_frame:03d}.png', rendered_image)
         
-        self.off_renderer.scene.clear_geometry()
         print("Done exporting image", cur_frame)    
 
 
     def on_error_scan(self):
-
+        """Opens the "Errors" window and scans every frame for the kinds of errors currently highlighted
+           The scan runs on a process pool, frames with errors are added to the window as their results come in"""
+        from utils import error_scan
         window = gui.Application.instance.create_window("Errors", 400, 800)
 
-        
-
         em = self.controls.theme.font_size
         margin = gui.Margins(0.50 * em, 0.25 * em, 0.50 * em, 0.25 * em)
         layout = gui.Vert(0, margin)
-        
-        error_count = 0
+        status = gui.Label("Scanning " + str(self.num_frames) + " frames")
+        progress = gui.ProgressBar()
+        cancel_button = gui.Button("Cancel")
+        layout.add_child(status)
+        layout.add_child(progress)
+        layout.add_child(cancel_button)
+        window.add_child(layout)
 
-        for j in range(0, self.num_frames):
-            boxes = json.load(open(os.path.join(self.lct_path , "bounding", str(j), "boxes.json")))
-            try:
-                pred_boxes = json.load(open(os.path.join(self.lct_path , "pred_bounding", str(j), "boxes.json")))
-            except FileNotFoundError:
+        kinds = []
+        if self.highlight_faults:
+            kinds.append(error_scan.UNMATCHED_GT)
+        if self.show_false_positive:
+            kinds.append(error_scan.FALSE_POSITIVES)
+        if self.show_incorrect_annotations:
+            kinds.append(error_scan.INCORRECT_ANNOTATIONS)
+        settings = error_scan.ScanSettings(self.filter_arr, self.pred_filter_arr, self.min_confidence, kinds, self.match_criterion)
+        error_count = [0]
+        closed = threading.Event()
+
+        def show_results(results, done, total):
+            for (frame_num, errors) in results:
+                if error_scan.has_errors(errors):
+                    layout.add_child(self.make_error_frame(frame_num, errors, em, margin))
+                    error_count[0] += 1
+            progress.value = done / total
+            status.text = "Scanned " + str(done) + "/" + str(total) + " frames, " + str(error_count[0]) + " with errors"
+            window.set_needs_layout()
+
+        def show_done(error):
+            cancel_button.enabled = False
+            if isinstance(error, FileNotFoundError):
                 layout.add_child(gui.Label("Error reading predicted data"))
-                window.add_child(layout)
-                return
-            unmatched_map = {}
-            false_positive_map = {}
-            incorrect_annotation_map = {}
-            
-            ####################
-
-            if self.show_false_positive or self.highlight_faults:
-                #For each gt box, only render it if it overlaps with a predicted box
-                min_dist = .5 #minimum distance should be half a meter
-                #Reverse Sort predicted boxes based on confidence
-                sorted_list = sorted(pred_boxes['boxes'], key=itemgetter('confidence'), reverse=True)
-                sorted_list = [box for box in sorted_list if box['annotation'] in self.pred_filter_arr and box['confidence'] >= self.min_confidence]
-                pred_matched = [False] * len(sorted_list)
-                
-                
-                #Get rid of GT boxes that have do not match the annotation
-                gt_list = [box for box in boxes['boxes'] if box['annotation'] in self.filter_arr]
-                gt_matched = [False] * len(gt_list)
-
-                #match each predicted box to a gt box
-                for (pred_idx,pred_box) in enumerate(sorted_list):
-                    dist = float('inf')
-                    for (i, gt_box) in enumerate(gt_list):
-                        temp_dist = geometry_utils.box_dist(pred_box, gt_box)
-                        if not gt_matched[i]:
-                            if temp_dist < dist:
-                                dist = temp_dist
-                                match_index = i
-                    #We found a valid match
-                    if dist <= min_dist:
-                        gt_matched[match_index] = True
-                        pred_matched[pred_idx] = True
-
-                #Add false positive predicted boxes to render list
-                if self.show_false_positive:
-                    for (i, box) in enumerate(sorted_list):
-                        if pred_matched[i] == False:
-                            false_positive_map[box['annotation']] = false_positive_map.get(box['annotation'], 0) + 1
-                #Add unmatched gt boxes to render list
-                if self.highlight_faults:
-                    for (i, box) in enumerate(gt_list):
-                        if gt_matched[i] == False:
-                            unmatched_map[box['annotation']] = unmatched_map.get(box['annotation'], 0) + 1
-        
-            #The user is trying to see if any GT boxes were categorized by mistake
-            if self.show_incorrect_annotations:
-                gt_list = [box for box in boxes['boxes'] if box['annotation'] in self.filter_arr]
-                pred_list = [box for box in pred_boxes['boxes'] if box['confidence'] >= self.min_confidence]
-                min_dist = .5
-                for pred_box in pred_list:
-                    for gt_box in gt_list:
-                        dist = geometry_utils.box_dist(pred_box, gt_box)
-                        #if the box is within the distance cuttoff, but has the wrong annotation, we render both the gt box and predicted box
-                        if dist <= min_dist and pred_box['annotation'] not in self.pred_filter_arr:
-                            incorrect_annotation_map[gt_box['annotation']] = incorrect_annotation_map.get(gt_box['annotation'], 0) + 1
-
-            ####################
-
-
-
-
-            #If we found any specified incorrect annotations then we create a collapsable widget for this frame
-            if unmatched_map or false_positive_map or incorrect_annotation_map:
-                frame_vert = gui.CollapsableVert("Frame " + str(j), .25 * em, margin)
-                frame_vert.set_is_open(False)
-                for key in unmatched_map.keys():
-                    message = gui.Label(str(unmatched_map[key]) + " Unmatched Boxes for GT Label: " + str(key))
-                    frame_vert.add_child(message)
-
-                for key in false_positive_map.keys():
-                    message = gui.Label(str(false_positive_map[key]) + " False Positives for Pred Label: " + str(key))
-                    frame_vert.add_child(message)
-
-                for key in incorrect_annotation_map.keys():
-                    message = gui.Label(str(incorrect_annotation_map[key]) + " Incorrect Annotations for GT Label: " + str(key))
-                    frame_vert.add_child(message)
-                error_count += 1
-                layout.add_child(frame_vert)
-            
-                
-
-        if error_count == 0:
-            message = gui.Label("No Errors Found")
-            layout.add_child(message)
+            elif error is not None:
+                layout.add_child(gui.Label("Scan failed: " + str(error)))
+            elif scan.cancelled.is_set():
+                status.text += ", cancelled"
+            if scan.cached_frames > 0:
+                status.text += ", " + str(scan.cached_frames) + " from the cache"
+            if error is None and not scan.cancelled.is_set() and error_count[0] == 0:
+                layout.add_child(gui.Label("No Errors Found"))
+            window.set_needs_layout()
+
+        def on_results(results, done, total):
+            if not closed.is_set():
+                gui.Application.instance.post_to_main_thread(window, functools.partial(show_results, results, done, total))
+
+        def on_done(error):
+            if not closed.is_set():
+                gui.Application.instance.post_to_main_thread(window, functools.partial(show_done, error))
+
+        def on_close():
+            closed.set()
+            scan.cancel()
+            return True
+
+        scan = error_scan.ErrorScan(self.lct_path, self.num_frames if kinds else 0, settings, on_results, on_done)
+        cancel_button.set_on_clicked(scan.cancel)
+        window.set_on_close(on_close)
+        scan.start()
+
+    def on_detection_metrics(self):
+        """Opens the "Detection Metrics" window and evaluates the predictions of the whole scene
+           The evaluation runs on a background thread, see utils/detection_metrics.py"""
+        from utils import detection_metrics
+        window = gui.Application.instance.create_window("Detection Metrics", 500, 600)
+
+        em = self.controls.theme.font_size
+        margin = gui.Margins(0.50 * em, 0.25 * em, 0.50 * em, 0.25 * em)
+        layout = gui.Vert(0, margin)
+        status = gui.Label("Evaluating " + str(self.num_frames) + " frames")
+        layout.add_child(status)
         window.add_child(layout)
-    
+        closed = threading.Event()
+
+        def show_metrics(metrics, error):
+            if error is not None:
+                status.text = "Evaluation failed: " + str(error)
+                window.set_needs_layout()
+                return
+            status.text = "Evaluated " + str(metrics['num_frames']) + " frames"
+            layout.add_child(gui.Label("mAP: %.4f" % metrics['mAP']))
+            layout.add_child(gui.Label("mATE: %.4f  mASE: %.4f  mAOE: %.4f" % (metrics['mtrans_err'], metrics['mscale_err'], metrics['morient_err'])))
+            for (name, result) in metrics['classes'].items():
+                class_vert = gui.CollapsableVert(name, .25 * em, margin)
+                class_vert.add_child(gui.Label(str(result['num_gt']) + " GT boxes, " + str(result['num_pred']) + " predicted boxes"))
+                class_vert.add_child(gui.Label("AP: %.4f" % result['mean_ap']))
+                for (threshold, ap) in result['ap'].items():
+                    class_vert.add_child(gui.Label("    AP @ " + threshold + " m: %.4f" % ap))
+                class_vert.add_child(gui.Label("ATE: %.4f  ASE: %.4f  AOE: %.4f" % (result['trans_err'], result['scale_err'], result['orient_err'])))
+                layout.add_child(class_vert)
+            window.set_needs_layout()
+
+        def evaluate():
+            try:
+                metrics = (detection_metrics.evaluate(self.lct_path), None)
+            except (OSError, ValueError) as error:
+                metrics = (None, error)
+            if not closed.is_set():
+                gui.Application.instance.post_to_main_thread(window, functools.partial(show_metrics, *metrics))
+
+        def on_close():
+            closed.set()
+            return True
+
+        window.set_on_close(on_close)
+        threading.Thread(target=evaluate, daemon=True).start()
+
+    def make_error_frame(self, frame_num, errors, em, margin):
+        """Creates the collapsable widget listing the errors found in one frame
+            Args:
+                self: window object
+                frame_num: frame number
+                errors: result of error_scan.scan_frame for the frame
+                em: font size of the window
+                margin: margins of the widget
+            Returns:
+                gui.CollapsableVert holding one label per error kind and annotation
+                """
+        from utils import error_scan
+        messages = {error_scan.UNMATCHED_GT: " Unmatched Boxes for GT Label: ",
+                    error_scan.FALSE_POSITIVES: " False Positives for Pred Label: ",
+                    error_scan.INCORRECT_ANNOTATIONS: " Incorrect Annotations for GT Label: "}
+        frame_vert = gui.CollapsableVert("Frame " + str(frame_num), .25 * em, margin)
+        frame_vert.set_is_open(False)
+        for (kind, counts) in errors.items():
+            for (key, count) in counts.items():
+                frame_vert.add_child(gui.Label(str(count) + messages[kind] + str(key)))
+        return frame_vert
+
     # Sets program to annotation editing mode, see annotation_editing.py
     def on_annotation_start(self):
+        # The editor writes boxes, so prefetched frames would be stale. A new window is created when it exits
+        self.prefetcher.shutdown()
+        if self.precision_recall is not None:
+            self.precision_recall.cancel()
+        if self.frame_index is not None:
+            self.frame_index.cancel()
         self.controls.close()
         #self.image_window.close()
+        import annotation_editing as edit
         annotation_object = edit.Annotation(self.widget3d, self.pointcloud_window, self.frame_extrinsic, self.boxes, self.pred_boxes,
                                             self.boxes_to_render, self.boxes_in_scene, self.box_indices,
                                             self.all_pred_annotations, self.path_string, self.color_map, self.pred_color_map,
@@ -1217,20 +1533,97 @@ class Window:
     def close_dialog(self):
         self.controls.close_dialog()
     
-    def update(self):
+    def update(self, dirty=DIRTY_ALL):
         """ This updates the window object to reflect the current state
+            Only the stages that depend on the changed inputs are run, eg: a colour change does not
+            reload the frame or the point cloud
         Args:
             self: window object
+            dirty: DIRTY_* flags of the inputs that changed
         Returns:
             None
             """
-        self.update_image_path()
-        self.update_pcd_path()
-        self.update_poses()
-        self.update_bounding()
+        if dirty & (DIRTY_FRAME | DIRTY_CAMERA):
+            self.frame_data = self.fetch_frame_data()
+            self.update_image_path()
+            self.update_pcd_path()
+            self.update_poses()
+        if dirty & (DIRTY_FRAME | DIRTY_FILTERS | DIRTY_COLORS):
+            self.update_bounding()
+        # Every input shows up in the image overlay, which is drawn onto the already decoded image
         self.update_image()
-        self.update_pointcloud()
+        if dirty & DIRTY_FRAME:
+            self.update_pointcloud()
+        self.update_box_geometry()
 	    
+    def class_catalog(self):
+        """Returns the annotation names of the scene, reading every frame when there is no manifest
+            Args:
+                self: window object
+            Returns:
+                a tuple of lists [GT annotation names, predicted annotation names]
+                """
+        if self.manifest is not None:
+            # Includes the classes added in the editor since the scene was converted
+            return (self.manifest.classes("bounding"), self.manifest.classes("pred_bounding"))
+        return (self.scan_classes("bounding", self.num_frames), self.scan_classes("pred_bounding", self.pred_frames))
+
+    def load_class_catalog(self):
+        """Loads the class catalog on a background thread, then hands it over to the GUI thread"""
+        gt_classes, pred_classes = self.class_catalog()
+        gui.Application.instance.post_to_main_thread(self.controls, functools.partial(self.populate_class_filters, gt_classes, pred_classes))
+
+    def make_class_filter(self, annotation, color_map, color, on_check):
+        """Creates the checkbox, color picker and counter of one annotation name
+            Args:
+                self: window object
+                annotation: annotation name
+                color_map: dictionary the initial color of the annotation is stored in
+                color: initial color of the annotation
+                on_check: function called with the annotation and the state of the checkbox
+            Returns:
+                gui.Horiz holding the widgets
+                """
+        horiz = gui.Horiz()
+        check = gui.Checkbox("")
+        check.set_on_checked(self.make_on_check(annotation, on_check))
+        color_map[annotation] = color
+        # Color Picker
+        color_edit = gui.ColorEdit()
+        (r,g,b) = color
+        color_edit.color_value = gui.Color(r/255,g/255,b/255)
+        color_edit.set_on_value_changed(self.on_color_toggle)
+        horiz.add_child(check)
+        horiz.add_child(gui.Label(annotation))
+        horiz.add_child(color_edit)
+        horiz.add_child(gui.Label("Count: 0"))
+        return horiz
+
+    def populate_class_filters(self, gt_classes, pred_classes):
+        """Adds the filter checkboxes of every annotation name once the class catalog is loaded
+           Boxes drawn before that in PENDING_COLOR get their class colors
+            Args:
+                self: window object
+                gt_classes: GT annotation names
+                pred_classes: predicted annotation names
+            Returns:
+                None
+                """
+        color_counter = 0
+        for annotation in gt_classes:
+            horiz = self.make_class_filter(annotation, self.color_map, colorlist[color_counter % len(colorlist)], self.on_filter_check)
+            color_counter += 1
+            self.check_horiz.append(horiz)
+            self.checkbox_layout.add_child(horiz)
+        for annotation in pred_classes:
+            self.all_pred_annotations.append(annotation)
+            horiz = self.make_class_filter(annotation, self.pred_color_map, colorlist[color_counter % len(colorlist)], self.on_pred_filter_check)
+            color_counter += 1
+            self.pred_check_horiz.append(horiz)
+            self.pred_checkbox_layout.add_child(horiz)
+        self.controls.set_needs_layout()
+        self.update(DIRTY_COLORS)
+
     def get_cams_and_pointclouds(self, path):
         """This gets the names of the cameras and lidar sensors
             Args:
@@ -1243,16 +1636,53 @@ class Window:
         camera_sensors = []
         lidar_sensors = []
 
+        scene = scene_loader.open_scene(path)
+
         # Adds cameras to the GUI
-        for camera_name in os.listdir(os.path.join(path, "cameras")):
+        for camera_name in scene.listdir("cameras"):
             camera_sensors.append(camera_name)
 
         # Adds lidar to the GUI
-        for lidar_name in os.listdir(os.path.join(path, "pointcloud")):
+        for lidar_name in scene.listdir("pointcloud"):
             lidar_sensors.append(lidar_name)
 
         return (camera_sensors, lidar_sensors)
 
+    def scan_classes(self, kind, num_frames):
+        """Reads every frame to find the annotation names used in a scene without a manifest
+            Args:
+                self: window object
+                kind: 'bounding' or 'pred_bounding'
+                num_frames: number of frames to read
+            Returns:
+                list of annotation names in order of first appearance
+                """
+        classes = []
+        for i in range(0, num_frames):
+            boxes = box_store.load_frame_boxes(self.lct_path, kind, i)
+            for box in boxes['boxes']:
+                if box['annotation'] not in classes:
+                    classes.append(box['annotation'])
+        return classes
+
+    def count_classes(self, kind, boxes, min_confidence):
+        """Counts the boxes of each annotation in the current frame, using the manifest histograms when available
+            Args:
+                self: window object
+                kind: 'bounding' or 'pred_bounding'
+                boxes: the loaded boxes of the current frame, counted directly when there is no manifest
+                min_confidence: only count boxes with at least this confidence
+            Returns:
+                dictionary from annotation name to box count
+                """
+        if self.manifest is not None:
+            return self.manifest.class_counts(kind, self.frame_num, min_confidence)
+        counts = {}
+        for box in boxes['boxes']:
+            if box['confidence'] >= min_confidence:
+                counts[box['annotation']] = counts.get(box['annotation'], 0) + 1
+        return counts
+
 if __name__ == "__main__":
     lct_dir = parse_options()
 
@@ -25,6 +25,8 @@ def parse_options():
         output_path: Path where user wants LVT to generate generic data format used in program
         scene_name: Name of the scene in NuScenes
         pred_path: Path to data based on a model's predictions
+        binary_points: True if point clouds should be stored as .bin files instead of .pcd files
+        build_lod: True if a level-of-detail pyramid should be built for the point clouds
         """
     input_path = ""
     output_path = ""
@@ -32,6 +34,8 @@ def parse_options():
     scene_names = []
     pred_path = ""
     ver_name = ""
+    binary_points = False
+    build_lod = False
     # Read in flags passed in with command line argument
     # Make sure that options which need an argument (namely -f for input file path and -o for output file path) have them
     # User is able to specify -h, -f, -o, -s, and -r options
@@ -40,7 +44,7 @@ def parse_options():
     # corresponds to a directory containing all the .tfrecord files you'd like to read in
     # -o is used to specify the path to the directory where the LVT format will go.
     try:
-        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:s:p:rv:", "help")
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:s:p:rv:bl", "help")
     except getopt.GetoptError as err:
         print(err)
         sys.exit(2)
@@ -51,6 +55,8 @@ def parse_options():
             print("REQUIRED: -o to specify the path where the LVT dataset will go")
             print("OPTIONAL: -p to specify a path to projected data")
             print("REQUIRED: -v to specify the version of this dataset eg: v1.0-mini")
+            print("OPTIONAL: -b to store point clouds in the float32 .bin format instead of .pcd")
+            print("OPTIONAL: -l to build a level-of-detail pyramid so the viewer can stream point clouds coarse to fine")
             sys.exit(2)
         elif opt == "-f":
             input_path = arg
@@ -64,12 +70,16 @@ def parse_options():
             pred_path = arg
         elif opt == "-v":
             ver_name = arg
+        elif opt == "-b":
+            binary_points = True
+        elif opt == "-l":
+            build_lod = True
 
         else:
             print("Invalid set of arguments entered. Please refer to -h flag for more information.")
             sys.exit(2)
 
-    return (input_path, output_path, scene_names, pred_path, ver_name)
+    return (input_path, output_path, scene_names, pred_path, ver_name, binary_points, build_lod)
 
 # Used to check if file is valid nuScenes file
 def validate_input_path(input_path, ver_name):
@@ -230,13 +240,14 @@ def extract_rgb(nusc, sample, frame_num, target_path):
         (path, _, _) = nusc.get_sample_data(sample['data'][camera])
         dataformat_utils.add_rgb_frame_from_jpg(target_path, camera, frame_num, path)
 
-def extract_lidar(nusc, sample, frame_num, target_path):
+def extract_lidar(nusc, sample, frame_num, target_path, binary_points=False):
     """Used to extract the LIDAR pointcloud information from the nuScenes dataset
     Args:
         nusc: NuScenes api object for getting info related to LiDAR data
         sample: All the sensor information
         frame_num: Frame number
         target_path: Output directory path where data will be written to
+        binary_points: True to write a .bin file (with intensities) instead of a .pcd file
     Returns:
         None
         """
@@ -255,9 +266,10 @@ def extract_lidar(nusc, sample, frame_num, target_path):
     points.translate(translation)
     
     # Reshape points
+    intensity = points.points[3, :]
     points = np.transpose(points.points[:3, :])
 
-    dataformat_utils.add_lidar_frame(target_path, "LIDAR_TOP", frame_num, points)
+    dataformat_utils.add_lidar_frame(target_path, "LIDAR_TOP", frame_num, points, intensity, binary_points)
 
 def count_frames(nusc, sample):
     """Counts frames to use for progress bar
@@ -305,7 +317,7 @@ def setup_annotation_map(target_path):
     dataformat_utils.create_annotation_map(target_path, annotation_map)
 
 
-def convert_dataset(output_path, scene_name, pred_data):
+def convert_dataset(output_path, scene_name, pred_data, binary_points=False, build_lod=False):
     # Validate the scene name passed in
     try:
         scene_token = nusc.field2token('scene', 'name', scene_name)[0]
@@ -341,18 +353,27 @@ def convert_dataset(output_path, scene_name, pred_data):
 
     # Extract sample data from scene
     timestamps = []
+    pose_timestamps = []
     while sample['next'] != '':
         # Extract all the relevant data from the nuScenes dataset for our scene. The variable 'sample' is the frame
         # Note: This is NOT multithreaded for nuScenes data because each scene is small enough that this runs relatively quickly.
         extract_ego(nusc, sample, frame_num, output_path)
         extract_bounding(nusc, sample, frame_num, output_path)
         extract_rgb(nusc, sample, frame_num, output_path)
-        extract_lidar(nusc, sample, frame_num, output_path)
+        extract_lidar(nusc, sample, frame_num, output_path, binary_points)
         timestamps.append(sample['token'])
+        pose_timestamps.append(sample['timestamp'])
         frame_num += 1
         sample = nusc.get('sample', sample['next'])
         dataformat_utils.print_progress_bar(frame_num, frame_count)
     dataformat_utils.add_timestamps(output_path, timestamps)
+    dataformat_utils.create_box_store(output_path)
+    dataformat_utils.create_manifest(output_path)
+    dataformat_utils.create_frame_index(output_path)
+    dataformat_utils.create_pose_table(output_path, pose_timestamps)
+    dataformat_utils.create_image_cache(output_path)
+    if build_lod:
+        dataformat_utils.create_lod(output_path)
 
     # Store metadata
     dataformat_utils.add_metadata(output_path, 'nuScenes', ['timestamps.json'])
@@ -361,7 +382,7 @@ def convert_dataset(output_path, scene_name, pred_data):
 if __name__ == "__main__":
 
     # Read in input database and output directory paths
-    (input_path, output_path, scene_names, pred_path,ver_name) = parse_options()
+    (input_path, output_path, scene_names, pred_path, ver_name, binary_points, build_lod) = parse_options()
     
     # Validate whether the database path passed in is valid and if the output directory path is valid
     # If the output directory exists, then use that directory. Otherwise, create a new directory at the
@@ -400,4 +421,4 @@ if __name__ == "__main__":
     
 
     for scene_name in scene_names:
-        convert_dataset(output_path + scene_name, scene_name, pred_data)
\ No newline at end of file
+        convert_dataset(output_path + scene_name, scene_name, pred_data, binary_points, build_lod)
\ No newline at end of file
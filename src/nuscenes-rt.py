@@ -10,6 +10,9 @@ from nuscenes.utils.data_classes import Box
 from secrets import token_hex
 from utils import dataformat_utils
 from utils import geometry_utils
+from utils import box_store
+from utils import pointcloud_utils
+from utils import pose_table
 
 def parse_options():
     ''' Read in user command line input to get directory paths which will be used for input and output.
@@ -76,11 +79,9 @@ def extract_frame(frame_num, input_path):
     '''
 
     # Necessary files from generic data format
-    with open(input_path + "/bounding/" + str(frame_num) + "/boxes.json") as f:
-            bounding = json.load(f)
-    with open(input_path + "/ego/" + str(frame_num) + ".json") as f:
-            ego = json.load(f)
-    pcd = o3d.io.read_point_cloud(input_path + "pointcloud/LIDAR_TOP/" + str(frame_num) + ".pcd").points
+    bounding = box_store.load_frame_boxes(input_path, "bounding", frame_num)
+    ego = pose_table.load_pose_table(input_path).pose(frame_num)
+    pcd = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "LIDAR_TOP", frame_num))
 
     for i in range(len(bounding["boxes"])):
         # Reverting bounding box
@@ -161,8 +162,7 @@ def extract_frame(frame_num, input_path):
             prev_ann_token[instance_token] = ann_token
     
     try:
-        with open(input_path + "/pred_bounding/" + str(frame_num) + "/boxes.json") as f:
-            pred_bounding = json.load(f)
+        pred_bounding = box_store.load_frame_boxes(input_path, "pred_bounding", frame_num)
     except FileNotFoundError:
         return
     except:
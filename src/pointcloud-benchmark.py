@@ -0,0 +1,102 @@
+"""
+pointcloud-benchmark.py
+
+Compares load latency and disk size of the .pcd and .bin point cloud formats.
+Points are either taken from an existing LCT directory or generated randomly.
+"""
+import getopt
+import os
+import sys
+import tempfile
+import time
+import numpy as np
+import open3d as o3d
+from utils import pointcloud_utils
+
+
+def parse_options():
+    """Parses the command line options
+    Args:
+        None
+    Returns:
+        lct_path: path to an LCT directory to take points from, or "" to generate points
+        num_points: number of random points to generate
+        repeats: number of times each file is loaded
+        """
+    lct_path = ""
+    num_points = 200000
+    repeats = 20
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:n:r:", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("OPTIONAL: -f to specify an LCT directory whose point clouds are used for the benchmark")
+            print("OPTIONAL: -n to specify the number of random points to generate when -f is not given (default 200000)")
+            print("OPTIONAL: -r to specify how many times each file is loaded (default 20)")
+            sys.exit(2)
+        elif opt == "-f":
+            lct_path = arg
+        elif opt == "-n":
+            num_points = int(arg)
+        elif opt == "-r":
+            repeats = int(arg)
+        else:
+            sys.exit(2)
+
+    return (lct_path, num_points, repeats)
+
+
+def sample_points(lct_path, num_points):
+    """Returns the points used for the benchmark
+    Args:
+        lct_path: path to an LCT directory, or "" to generate points
+        num_points: number of random points to generate
+    Returns:
+        [n, 3] array of points
+        """
+    if lct_path == "":
+        rng = np.random.default_rng(0)
+        return rng.uniform(-80, 80, (num_points, 3))
+
+    sensor = sorted(os.listdir(os.path.join(lct_path, "pointcloud")))[0]
+    return pointcloud_utils.load_points(pointcloud_utils.points_path(lct_path, sensor, 0))
+
+
+def time_loads(path, repeats):
+    """Loads a point cloud file repeatedly and touches every point
+    Args:
+        path: point cloud file
+        repeats: number of loads
+    Returns:
+        median load time in milliseconds
+        """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        points = pointcloud_utils.load_points(path)
+        # Summing forces memory mapped pages to actually be read
+        np.sum(points)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+if __name__ == "__main__":
+    (lct_path, num_points, repeats) = parse_options()
+    points = sample_points(lct_path, num_points)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        pcd_path = os.path.join(tmp_dir, "0.pcd")
+        bin_path = os.path.join(tmp_dir, "0.bin")
+        o3d.io.write_point_cloud(pcd_path, o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(points, dtype=np.float64))))
+        pointcloud_utils.write_bin(bin_path, points)
+
+        print(str(len(points)) + " points, " + str(repeats) + " loads per format")
+        print("format   size (KB)   median load (ms)")
+        for name, path in ((".pcd", pcd_path), (".bin", bin_path)):
+            size = os.path.getsize(path) / 1024
+            print(f"{name:<8} {size:>9.1f}   {time_loads(path, repeats):>16.2f}")
@@ -0,0 +1,136 @@
+"""
+projection-benchmark.py
+
+Compares the time taken to project and draw bounding boxes onto a camera image, one nuScenes Box
+and 13 cv2.line calls per box against the batched projection of projection_utils.
+Boxes are generated randomly around a front facing camera.
+"""
+import getopt
+import sys
+import time
+import cv2
+import numpy as np
+from nuscenes.utils.data_classes import Box
+from nuscenes.utils.geometry_utils import view_points, box_in_image, BoxVisibility
+from pyquaternion import Quaternion
+from utils import image_utils
+from utils import projection_utils
+
+# Front camera of a nuScenes vehicle, x forward in the ego frame is z forward in the camera frame
+CAMERA_EXTRINSIC = {'rotation': [0.5, -0.5, 0.5, -0.5], 'translation': [1.7, 0.0, 1.5]}
+CAMERA_INTRINSIC = [[1266.4, 0.0, 816.3], [0.0, 1266.4, 491.5], [0.0, 0.0, 1.0]]
+CAMERA_SIZE = (1600, 900)
+COLORS = [[255, 0, 0], [0, 255, 0], [0, 0, 255], [255, 255, 0], [0, 255, 255]]
+
+
+def parse_options():
+    """Parses the command line options
+    Args:
+        None
+    Returns:
+        box_counts: list of numbers of boxes to benchmark
+        repeats: number of times each image is drawn
+        """
+    box_counts = [10, 100, 1000]
+    repeats = 20
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hn:r:", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("OPTIONAL: -n to specify comma separated numbers of boxes (default 10,100,1000)")
+            print("OPTIONAL: -r to specify how many times each image is drawn (default 20)")
+            sys.exit(2)
+        elif opt == "-n":
+            box_counts = [int(count) for count in arg.split(",")]
+        elif opt == "-r":
+            repeats = int(arg)
+        else:
+            sys.exit(2)
+
+    return (box_counts, repeats)
+
+
+def random_boxes(num_boxes, rng):
+    """Returns a render list of boxes scattered around the vehicle, most of them in front of it
+    Args:
+        num_boxes: number of boxes
+        rng: numpy random generator
+    Returns:
+        list of [origin, size, rotation, annotation, confidence, color] entries
+        """
+    boxes = []
+    for _ in range(num_boxes):
+        origin = rng.uniform([-20, -40, -1], [80, 40, 1]).tolist()
+        size = rng.uniform([1.5, 3.5, 1.4], [2.5, 6.0, 2.5]).tolist()
+        rotation = list(Quaternion(axis=[0, 0, 1], angle=rng.uniform(0, 2 * np.pi)).elements)
+        color = COLORS[rng.integers(len(COLORS))]
+        boxes.append([origin, size, rotation, "car", 101, color])
+    return boxes
+
+
+def draw_per_box(image, boxes, intrinsic):
+    """Draws boxes the way the viewer did before projection_utils, one nuScenes Box at a time"""
+    image_size = (image.shape[1], image.shape[0])
+    for b in boxes:
+        box = Box(b[0], b[1], Quaternion(b[2]), name=b[3], score=b[4], velocity=(0, 0, 0))
+        color = b[5]
+        box.translate(-np.array(CAMERA_EXTRINSIC['translation']))
+        box.rotate(Quaternion(CAMERA_EXTRINSIC['rotation']).inverse)
+        if box_in_image(box, intrinsic, image_size, BoxVisibility.ANY):
+            corners = view_points(box.corners(), intrinsic, normalize=True)[:2, :].T
+            for i in range(4):
+                cv2.line(image, (int(corners[i][0]), int(corners[i][1])),
+                         (int(corners[i + 4][0]), int(corners[i + 4][1])), color, 2)
+            for rect in (corners[:4], corners[4:]):
+                prev = rect[-1]
+                for corner in rect:
+                    cv2.line(image, (int(prev[0]), int(prev[1])), (int(corner[0]), int(corner[1])), color, 2)
+                    prev = corner
+            center_bottom_forward = np.mean(corners[2:4], axis=0)
+            center_bottom = np.mean(corners[[2, 3, 7, 6]], axis=0)
+            cv2.line(image, (int(center_bottom[0]), int(center_bottom[1])),
+                     (int(center_bottom_forward[0]), int(center_bottom_forward[1])), color, 2)
+
+
+def draw_batched(image, boxes, intrinsic):
+    """Draws boxes with projection_utils"""
+    projection = projection_utils.project_boxes(boxes, intrinsic, CAMERA_EXTRINSIC, (image.shape[1], image.shape[0]))
+    projection_utils.draw_projected_boxes(image, projection, [b[5] for b in boxes])
+
+
+def time_draws(draw, boxes, intrinsic, image_size, repeats):
+    """Draws boxes onto a blank image repeatedly
+    Returns:
+        median time in milliseconds
+        """
+    times = []
+    for _ in range(repeats):
+        image = np.zeros((image_size[1], image_size[0], 3), dtype=np.uint8)
+        start = time.perf_counter()
+        draw(image, boxes, intrinsic)
+        times.append((time.perf_counter() - start) * 1000)
+    return float(np.median(times))
+
+
+if __name__ == "__main__":
+    (box_counts, repeats) = parse_options()
+    rng = np.random.default_rng(0)
+
+    # Boxes are drawn onto images of the size shown in the image window
+    image_size = image_utils.fit_size(CAMERA_SIZE, image_utils.DISPLAY_SIZE)
+    scale = (image_size[0] / CAMERA_SIZE[0], image_size[1] / CAMERA_SIZE[1])
+    intrinsic = image_utils.scale_intrinsics(CAMERA_INTRINSIC, scale)
+
+    print(str(image_size[0]) + "x" + str(image_size[1]) + " image, " + str(repeats) + " draws per method")
+    print("boxes   visible   per box (ms)   batched (ms)   speedup")
+    for num_boxes in box_counts:
+        boxes = random_boxes(num_boxes, rng)
+        visible = int(np.sum(projection_utils.project_boxes(boxes, intrinsic, CAMERA_EXTRINSIC, image_size).visible))
+        per_box = time_draws(draw_per_box, boxes, intrinsic, image_size, repeats)
+        batched = time_draws(draw_batched, boxes, intrinsic, image_size, repeats)
+        print(f"{num_boxes:<7} {visible:>7}   {per_box:>12.2f}   {batched:>12.2f}   {per_box / batched:>6.1f}x")
@@ -0,0 +1,58 @@
+"""
+scene-pack.py
+
+Packs an LCT directory into a single .lctpack file, or unpacks a .lctpack file back into an LCT directory.
+The viewer opens both forms with -f.
+"""
+import getopt
+import sys
+from utils import dataformat_utils
+
+
+def parse_options():
+    """Parses the command line options
+    Args:
+        None
+    Returns:
+        input_path: LCT directory to pack, or pack file to unpack
+        output_path: pack file or LCT directory to create
+        unpack: True to unpack instead of pack
+        """
+    input_path = ""
+    output_path = ""
+    unpack = False
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:o:u", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("REQUIRED: -f to specify the LCT directory to pack (or the .lctpack file to unpack)")
+            print("REQUIRED: -o to specify the .lctpack file to create (or the LCT directory to create)")
+            print("OPTIONAL: -u to unpack instead of pack")
+            sys.exit(2)
+        elif opt == "-f":
+            input_path = arg
+        elif opt == "-o":
+            output_path = arg
+        elif opt == "-u":
+            unpack = True
+        else:
+            sys.exit(2)
+
+    if input_path == "" or output_path == "":
+        print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+        sys.exit(2)
+
+    return (input_path, output_path, unpack)
+
+
+if __name__ == "__main__":
+    (input_path, output_path, unpack) = parse_options()
+    if unpack:
+        dataformat_utils.unpack_scene(input_path, output_path)
+    else:
+        dataformat_utils.pack_scene(input_path, output_path)
@@ -0,0 +1,78 @@
+"""
+synthetic-ct.py
+
+Writes a synthetic LCT directory, for trying out the viewer and running the benchmarks and tests
+without a downloaded dataset. See utils/synthetic_scene.py for what the scene contains.
+"""
+import getopt
+import sys
+from utils import synthetic_scene
+
+
+def parse_options():
+    """Read in user command line input
+    Args:
+        None
+    Returns:
+        output_path: path of the LCT directory to create
+        options: dictionary of keyword arguments for synthetic_scene.generate_scene
+        """
+    output_path = ""
+    options = {'verbose': True}
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "ho:n:c:s:p:g:d:i:r:bl", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("REQUIRED: -o to specify the path where the LVT dataset will go")
+            print("OPTIONAL: -n to specify the number of frames (default 40)")
+            print("OPTIONAL: -c to specify the number of cameras (default 6)")
+            print("OPTIONAL: -s to specify the number of lidar sensors (default 1)")
+            print("OPTIONAL: -p to specify the number of points per lidar sweep (default 30000)")
+            print("OPTIONAL: -g to specify the mean number of ground truth boxes per frame (default 30)")
+            print("OPTIONAL: -d to specify the mean number of predicted boxes per frame (default 35)")
+            print("OPTIONAL: -i to specify the image size as WIDTHxHEIGHT (default 1600x900)")
+            print("OPTIONAL: -r to specify the random seed (default 0)")
+            print("OPTIONAL: -b to store point clouds in the float32 .bin format instead of .pcd")
+            print("OPTIONAL: -l to build a level-of-detail pyramid so the viewer can stream point clouds coarse to fine")
+            sys.exit(2)
+        elif opt == "-o":
+            output_path = arg
+        elif opt == "-n":
+            options['num_frames'] = int(arg)
+        elif opt == "-c":
+            options['num_cameras'] = int(arg)
+        elif opt == "-s":
+            options['num_lidars'] = int(arg)
+        elif opt == "-p":
+            options['points_per_sweep'] = int(arg)
+        elif opt == "-g":
+            options['gt_boxes'] = int(arg)
+        elif opt == "-d":
+            options['pred_boxes'] = int(arg)
+        elif opt == "-i":
+            options['image_size'] = tuple(int(value) for value in arg.lower().split("x"))
+        elif opt == "-r":
+            options['seed'] = int(arg)
+        elif opt == "-b":
+            options['binary_points'] = True
+        elif opt == "-l":
+            options['build_lod'] = True
+        else:
+            print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+            sys.exit(2)
+
+    if output_path == "":
+        print("Invalid set of arguments entered. Please refer to -h flag for more information.")
+        sys.exit(2)
+
+    return (output_path, options)
+
+
+if __name__ == "__main__":
+    (output_path, options) = parse_options()
+    synthetic_scene.generate_scene(output_path, **options)
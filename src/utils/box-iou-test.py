@@ -0,0 +1,115 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+# Run from anywhere, eg: python utils/box-iou-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import box_iou
+
+SIZE = [2.0, 4.5, 1.6]
+NUM_SAMPLES = 400000
+
+
+def yaw_quaternion(yaw):
+    return [np.cos(yaw / 2), 0.0, 0.0, np.sin(yaw / 2)]
+
+
+def pair_iou(a_origin, b_origin, a_yaw=0.0, b_yaw=0.0, mode=box_iou.BEV, a_size=SIZE, b_size=SIZE):
+    return box_iou.iou_matrix([a_origin], [a_size], [yaw_quaternion(a_yaw)],
+                              [b_origin], [b_size], [yaw_quaternion(b_yaw)], mode)[0, 0]
+
+
+def inside(points, origin, size, yaw):
+    """Returns True where the BEV points lie in the box, the length along the heading like bev_corners"""
+    offsets = points - np.asarray(origin)[:2]
+    along = offsets[:, 0] * np.cos(yaw) + offsets[:, 1] * np.sin(yaw)
+    across = -offsets[:, 0] * np.sin(yaw) + offsets[:, 1] * np.cos(yaw)
+    return (np.abs(along) <= size[1] / 2) & (np.abs(across) <= size[0] / 2)
+
+
+def monte_carlo_iou(rng, a_origin, a_yaw, b_origin, b_yaw):
+    """Estimates the BEV IoU of two boxes of SIZE from uniform samples of a square around both"""
+    radius = np.hypot(SIZE[0], SIZE[1]) / 2
+    low = np.minimum(a_origin[:2], b_origin[:2]) - radius
+    high = np.maximum(a_origin[:2], b_origin[:2]) + radius
+    points = rng.uniform(low, high, (NUM_SAMPLES, 2))
+    in_a = inside(points, a_origin, SIZE, a_yaw)
+    in_b = inside(points, b_origin, SIZE, b_yaw)
+    return (in_a & in_b).sum() / (in_a | in_b).sum()
+
+
+# tests BEV IoUs that can be worked out by hand
+class TestKnownOverlaps(unittest.TestCase):
+    def test_identical(self):
+        self.assertAlmostEqual(pair_iou([1.0, 2.0, 0.0], [1.0, 2.0, 0.0], 0.7, 0.7), 1.0)
+
+    def test_offset_along_length(self):
+        # Half the area of each box overlaps: 4.5 / (9 + 9 - 4.5)
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [2.25, 0.0, 0.0]), 1 / 3)
+
+    def test_offset_along_both_axes(self):
+        # A quarter of the area of each box overlaps: 2.25 / (9 + 9 - 2.25)
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [2.25, 1.0, 0.0]), 1 / 7)
+
+    def test_offset_rotated(self):
+        # The same offset along the length of boxes heading 45 degrees
+        yaw = np.pi / 4
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [2.25 * np.cos(yaw), 2.25 * np.sin(yaw), 0.0], yaw, yaw), 1 / 3)
+
+    def test_apart(self):
+        self.assertEqual(pair_iou([0.0, 0.0, 0.0], [4.6, 0.0, 0.0]), 0.0)
+
+    def test_contained(self):
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [0.0, 0.0, 0.0], b_size=[1.0, 2.25, 1.6]), 1 / 4)
+
+    def test_empty(self):
+        ious = box_iou.iou_matrix(np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 4)),
+                                  [[0.0, 0.0, 0.0]], [SIZE], [yaw_quaternion(0)])
+        self.assertEqual(ious.shape, (0, 1))
+
+
+# tests that 3D IoUs multiply the BEV overlap by the overlap of the heights
+class Test3D(unittest.TestCase):
+    def test_identical(self):
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 1.0], [0.0, 0.0, 1.0], mode=box_iou.IOU_3D), 1.0)
+
+    def test_height_offset(self):
+        # Half the height of each box overlaps, the BEV IoU is unchanged
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [0.0, 0.0, 0.8], mode=box_iou.IOU_3D), 1 / 3)
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [0.0, 0.0, 0.8]), 1.0)
+
+    def test_both_offsets(self):
+        self.assertAlmostEqual(pair_iou([0.0, 0.0, 0.0], [2.25, 0.0, 0.8], mode=box_iou.IOU_3D), 1 / 7)
+
+    def test_stacked(self):
+        self.assertEqual(pair_iou([0.0, 0.0, 0.0], [0.0, 0.0, 1.6], mode=box_iou.IOU_3D), 0.0)
+
+
+# tests rotated boxes against a Monte Carlo estimate of their overlap
+class TestMonteCarlo(unittest.TestCase):
+    def test_random_pairs(self):
+        rng = np.random.default_rng(0)
+        for _ in range(20):
+            a_origin = np.zeros(3)
+            b_origin = np.append(rng.uniform(-3, 3, 2), 0.0)
+            (a_yaw, b_yaw) = rng.uniform(-np.pi, np.pi, 2)
+            expected = monte_carlo_iou(rng, a_origin, a_yaw, b_origin, b_yaw)
+            self.assertAlmostEqual(pair_iou(a_origin, b_origin, a_yaw, b_yaw), expected, delta=0.01)
+
+    def test_matrix(self):
+        # Every entry of a matrix is the IoU of its pair on its own
+        rng = np.random.default_rng(1)
+        a_origins = np.append(rng.uniform(-4, 4, (6, 2)), np.zeros((6, 1)), axis=1)
+        b_origins = np.append(rng.uniform(-4, 4, (5, 2)), np.zeros((5, 1)), axis=1)
+        a_yaws = rng.uniform(-np.pi, np.pi, 6)
+        b_yaws = rng.uniform(-np.pi, np.pi, 5)
+        ious = box_iou.iou_matrix(a_origins, [SIZE] * 6, [yaw_quaternion(yaw) for yaw in a_yaws],
+                                  b_origins, [SIZE] * 5, [yaw_quaternion(yaw) for yaw in b_yaws])
+        for i in range(6):
+            for j in range(5):
+                self.assertAlmostEqual(ious[i, j], pair_iou(a_origins[i], b_origins[j], a_yaws[i], b_yaws[j]))
+
+
+if __name__ == '__main__':
+    unittest.main()
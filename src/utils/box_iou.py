@@ -0,0 +1,142 @@
+"""
+box_iou.py
+
+Vectorized intersection over union of rotated boxes, in bird's eye view (BEV) and in 3D.
+
+Boxes are taken to be upright, only their heading (the rotation about z) is used, which is how the
+datasets the converters support store them. The BEV intersection of two boxes is the convex polygon
+whose vertices are the corners of either rectangle inside the other and the crossings of their edges.
+Sorted by angle around their mean, its area follows from the shoelace formula. This is done for many
+pairs at once with fixed size arrays. The 3D intersection multiplies the BEV area by the overlap of
+the height ranges. Pairs whose circumscribed circles are apart are not computed, so a full
+predictions x GT matrix costs about as much as the number of boxes that actually overlap.
+"""
+import numpy as np
+
+BEV = "bev"
+IOU_3D = "3d"
+
+# Tolerance for corners lying on an edge of the other rectangle, in meters
+EDGE_TOLERANCE = 1e-9
+
+
+def headings(rotations):
+    """Returns the rotations about z of [n, 4] (w,x,y,z) quaternions, in radians"""
+    q = np.asarray(rotations, dtype=np.float64).reshape(-1, 4)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    return np.arctan2(2 * (w * z + x * y), 1 - 2 * (y * y + z * z))
+
+
+def bev_corners(origins, sizes, rotations):
+    """Returns the BEV corners of boxes in counterclockwise order
+    Args:
+        origins: [n, 3] box centres
+        sizes: [n, 3] (width, length, height), the length lies along the heading like in geometry_utils.compute_vertices
+        rotations: [n, 4] (w,x,y,z) quaternions
+    Returns:
+        [n, 4, 2] array
+        """
+    origins = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    sizes = np.asarray(sizes, dtype=np.float64).reshape(-1, 3)
+    yaws = headings(rotations)
+    half_length = sizes[:, 1, None] / 2 * np.array([1, -1, -1, 1])
+    half_width = sizes[:, 0, None] / 2 * np.array([1, 1, -1, -1])
+    cos = np.cos(yaws)[:, None]
+    sin = np.sin(yaws)[:, None]
+    x = origins[:, 0, None] + cos * half_length - sin * half_width
+    y = origins[:, 1, None] + sin * half_length + cos * half_width
+    return np.stack((x, y), axis=2)
+
+
+def _cross(a, b):
+    return a[..., 0] * b[..., 1] - a[..., 1] * b[..., 0]
+
+
+def _inside(points, polygons):
+    """Returns [k, m] True where one of m points lies inside (or on) the counterclockwise polygon [k, 4, 2] of its row"""
+    edges = np.roll(polygons, -1, axis=1) - polygons
+    offsets = points[:, :, None, :] - polygons[:, None, :, :]
+    return (_cross(edges[:, None, :, :], offsets) >= -EDGE_TOLERANCE).all(axis=2)
+
+
+def intersection_areas(a, b):
+    """Returns the areas of the intersections of pairs of convex quadrilaterals
+    Args:
+        a: [k, 4, 2] corners in counterclockwise order
+        b: [k, 4, 2] corners in counterclockwise order
+    Returns:
+        [k] array
+        """
+    k = len(a)
+    # Crossings of every edge of a with every edge of b: a_i + t * r_i = b_j + u * s_j
+    r = np.roll(a, -1, axis=1) - a
+    s = np.roll(b, -1, axis=1) - b
+    offsets = b[:, None, :, :] - a[:, :, None, :]
+    denominator = _cross(r[:, :, None, :], s[:, None, :, :])
+    parallel = np.abs(denominator) < 1e-12
+    denominator = np.where(parallel, 1.0, denominator)
+    t = _cross(offsets, s[:, None, :, :]) / denominator
+    u = _cross(offsets, r[:, :, None, :]) / denominator
+    crossing = ~parallel & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+    crossings = a[:, :, None, :] + t[..., None] * r[:, :, None, :]
+
+    points = np.concatenate((a, b, crossings.reshape(k, 16, 2)), axis=1)
+    valid = np.concatenate((_inside(a, b), _inside(b, a), crossing.reshape(k, 16)), axis=1)
+    counts = valid.sum(axis=1)
+
+    # Invalid points are sorted last and replaced by the first point, so they add nothing to the area
+    centres = (points * valid[..., None]).sum(axis=1) / np.maximum(counts, 1)[:, None]
+    angles = np.arctan2(points[..., 1] - centres[:, 1, None], points[..., 0] - centres[:, 0, None])
+    angles = np.where(valid, angles, np.inf)
+    order = np.argsort(angles, axis=1)
+    points = np.take_along_axis(points, order[..., None], axis=1)
+    valid = np.take_along_axis(valid, order, axis=1)
+    points = np.where(valid[..., None], points, points[:, :1, :])
+    areas = np.abs(_cross(points, np.roll(points, -1, axis=1)).sum(axis=1)) / 2
+    return np.where(counts >= 3, areas, 0.0)
+
+
+def iou_matrix(a_origins, a_sizes, a_rotations, b_origins, b_sizes, b_rotations, mode=BEV):
+    """Computes the IoU of every pair of boxes of two sets
+    Args:
+        a_origins, a_sizes, a_rotations: [n, 3], [n, 3] and [n, 4] arrays of the first set, eg: predictions
+        b_origins, b_sizes, b_rotations: [m, 3], [m, 3] and [m, 4] arrays of the second set, eg: GT boxes
+        mode: BEV or IOU_3D
+    Returns:
+        [n, m] array of IoUs
+        """
+    a_origins = np.asarray(a_origins, dtype=np.float64).reshape(-1, 3)
+    b_origins = np.asarray(b_origins, dtype=np.float64).reshape(-1, 3)
+    a_sizes = np.asarray(a_sizes, dtype=np.float64).reshape(-1, 3)
+    b_sizes = np.asarray(b_sizes, dtype=np.float64).reshape(-1, 3)
+    ious = np.zeros((len(a_origins), len(b_origins)))
+    if ious.size == 0:
+        return ious
+
+    # Only pairs whose circumscribed circles overlap (and height ranges, in 3D) can intersect
+    radii_a = np.hypot(a_sizes[:, 0], a_sizes[:, 1]) / 2
+    radii_b = np.hypot(b_sizes[:, 0], b_sizes[:, 1]) / 2
+    d = a_origins[:, None, :2] - b_origins[None, :, :2]
+    close = d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] <= (radii_a[:, None] + radii_b[None, :]) ** 2
+    if mode == IOU_3D:
+        top = np.minimum(a_origins[:, None, 2] + a_sizes[:, None, 2] / 2, b_origins[None, :, 2] + b_sizes[None, :, 2] / 2)
+        bottom = np.maximum(a_origins[:, None, 2] - a_sizes[:, None, 2] / 2, b_origins[None, :, 2] - b_sizes[None, :, 2] / 2)
+        heights = np.maximum(top - bottom, 0)
+        close &= heights > 0
+    (i, j) = np.nonzero(close)
+    if len(i) == 0:
+        return ious
+
+    corners_a = bev_corners(a_origins, a_sizes, a_rotations)
+    corners_b = bev_corners(b_origins, b_sizes, b_rotations)
+    intersections = intersection_areas(corners_a[i], corners_b[j])
+    if mode == IOU_3D:
+        intersections = intersections * heights[i, j]
+        volumes_a = a_sizes.prod(axis=1)
+        volumes_b = b_sizes.prod(axis=1)
+    else:
+        volumes_a = a_sizes[:, 0] * a_sizes[:, 1]
+        volumes_b = b_sizes[:, 0] * b_sizes[:, 1]
+    unions = volumes_a[i] + volumes_b[j] - intersections
+    ious[i, j] = np.divide(intersections, unions, out=np.zeros_like(unions), where=unions > 0)
+    return ious
@@ -0,0 +1,450 @@
+"""
+box_store.py
+
+Scene-level columnar store for bounding box data.
+
+Every frame in bounding/ or pred_bounding/ is packed into one set of .npy arrays under
+store/<kind>/ that can be memory mapped, so switching frames does not have to open and parse
+a boxes.json file. The legacy JSON layout is still read and written through the same API.
+Everything is read through scene_loader, so the same calls work on loose directories and packs.
+"""
+import os
+import json
+import numpy as np
+from utils import scene_loader
+
+STORE_DIR = "store"
+BOX_KINDS = ["bounding", "pred_bounding"]
+STORE_VERSION = 1
+
+# Sentinels used by the integer string-table columns
+MISSING = -1
+NULL = -2
+
+# Arrays that make up one store on disk
+ARRAY_NAMES = ["origins", "sizes", "rotations", "class_ids", "confidences", "ids", "internal_pts",
+               "frame_offsets", "frame_present", "strings"]
+
+# Number of frames saved through save_frame_boxes() by kind, so caches notice every edit
+EDITS_PATH = STORE_DIR + "/edits.json"
+
+# Open stores, keyed by (scene path, kind)
+_open_stores = {}
+
+
+class FrameBoxes:
+    """Column view of the boxes in a single frame. Every array has one row per box."""
+    def __init__(self, origins, sizes, rotations, class_ids, confidences, ids, internal_pts, classes, string):
+        self.origins = origins
+        self.sizes = sizes
+        self.rotations = rotations
+        self.class_ids = class_ids
+        self.confidences = confidences
+        self.ids = ids
+        self.internal_pts = internal_pts
+        self.classes = classes
+        self.string = string
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    @property
+    def annotations(self):
+        """List of the annotation names of the boxes in this frame"""
+        return [self.classes[c] for c in self.class_ids]
+
+    @property
+    def track_ids(self):
+        """List of the tracking ids of the boxes in this frame, None where a box has no id"""
+        return [self.string(i) if i >= 0 else None for i in self.ids]
+
+
+class BoxStore:
+    """Reader for one columnar box store (one of bounding/ or pred_bounding/ of a scene)"""
+    def __init__(self, source, kind):
+        self.source = source
+        self.lct_path = source.path
+        self.kind = kind
+        self.path = STORE_DIR + "/" + kind
+        self.meta = source.read_json(self.path + "/meta.json")
+
+        # Every array is memory mapped, so opening a store costs the same for 10 or 100k frames
+        for name in ARRAY_NAMES:
+            setattr(self, name, source.load_npy(self.path + "/" + name + ".npy"))
+        self.data_columns = [source.load_npy(self.path + "/data_%d.npy" % i)
+                             for i in range(len(self.meta["data_keys"]))]
+
+        self.classes = list(self.meta["classes"])
+        self.class_lookup = {name: i for i, name in enumerate(self.classes)}
+
+        # Frames saved through save_frame_boxes() after the store was built are read from JSON
+        self.dirty = set()
+        if source.exists(self.path + "/dirty.json"):
+            self.dirty = set(source.read_json(self.path + "/dirty.json"))
+
+    @property
+    def num_frames(self):
+        return len(self.frame_present)
+
+    def has_frame(self, frame_num):
+        return 0 <= frame_num < self.num_frames and bool(self.frame_present[frame_num])
+
+    def frame_range(self, frame_num):
+        """Returns the [start, stop) row range of one frame"""
+        return int(self.frame_offsets[frame_num]), int(self.frame_offsets[frame_num + 1])
+
+    def string(self, index):
+        return self.strings[index].decode("utf-8")
+
+    def frame(self, frame_num):
+        """Returns a FrameBoxes view of one frame
+        Args:
+            frame_num: frame number
+        Returns:
+            FrameBoxes object whose arrays are views into the memory mapped store
+            """
+        if frame_num in self.dirty:
+            return frame_from_dict(_read_frame_json(self.lct_path, self.kind, frame_num), self.classes)
+        if not self.has_frame(frame_num):
+            raise FileNotFoundError(_frame_json_path(self.lct_path, self.kind, frame_num))
+
+        start, stop = self.frame_range(frame_num)
+        return FrameBoxes(self.origins[start:stop], self.sizes[start:stop], self.rotations[start:stop],
+                          self.class_ids[start:stop], self.confidences[start:stop], self.ids[start:stop],
+                          self.internal_pts[start:stop], self.classes, self.string)
+
+    def frame_dict(self, frame_num):
+        """Returns one frame in the legacy boxes.json layout
+        Args:
+            frame_num: frame number
+        Returns:
+            dictionary with a 'boxes' list, identical to the parsed boxes.json
+            """
+        if frame_num in self.dirty:
+            return _read_frame_json(self.lct_path, self.kind, frame_num)
+        if not self.has_frame(frame_num):
+            raise FileNotFoundError(_frame_json_path(self.lct_path, self.kind, frame_num))
+
+        start, stop = self.frame_range(frame_num)
+        confidence_integer = self.meta["confidence_integer"]
+        boxes = []
+        for row in range(start, stop):
+            box = {}
+            box['origin'] = self.origins[row].tolist()
+            box['size'] = self.sizes[row].tolist()
+            box['rotation'] = self.rotations[row].tolist()
+            box['annotation'] = self.classes[self.class_ids[row]]
+            confidence = float(self.confidences[row])
+            box['confidence'] = int(confidence) if confidence_integer else confidence
+            if self.ids[row] != MISSING:
+                box['id'] = None if self.ids[row] == NULL else self.string(self.ids[row])
+            if self.internal_pts[row] != MISSING:
+                box['internal_pts'] = int(self.internal_pts[row])
+            box['data'] = self._row_data(row)
+            boxes.append(box)
+        return {'boxes': boxes}
+
+    def _row_data(self, row):
+        data = {}
+        for key, column in zip(self.meta["data_keys"], self.data_columns):
+            value = column[row]
+            if key["type"] == "number":
+                if np.isnan(value):
+                    continue
+                data[key["name"]] = int(value) if key["integer"] else float(value)
+            elif value != MISSING:
+                data[key["name"]] = json.loads(self.string(value))
+        return data
+
+    def mark_dirty(self, frame_num):
+        """Records that a frame now lives in its boxes.json and not in the store"""
+        if frame_num in self.dirty:
+            return
+        self.dirty.add(frame_num)
+        with open(store_path(self.lct_path, self.kind) + os.sep + "dirty.json", "w") as f:
+            json.dump(sorted(self.dirty), f)
+
+
+def frame_from_dict(frame, classes):
+    """Builds a FrameBoxes object from a frame in the legacy boxes.json layout
+    Args:
+        frame: dictionary with a 'boxes' list
+        classes: list of class names, new names are appended to it
+    Returns:
+        FrameBoxes object
+        """
+    boxes = frame['boxes']
+    class_ids = []
+    strings = []
+    ids = []
+    for box in boxes:
+        if box['annotation'] not in classes:
+            classes.append(box['annotation'])
+        class_ids.append(classes.index(box['annotation']))
+        if box.get('id') is None:
+            ids.append(MISSING if 'id' not in box else NULL)
+        else:
+            ids.append(len(strings))
+            strings.append(str(box['id']))
+
+    return FrameBoxes(np.array([box['origin'] for box in boxes], dtype=np.float64).reshape(-1, 3),
+                      np.array([box['size'] for box in boxes], dtype=np.float64).reshape(-1, 3),
+                      np.array([box['rotation'] for box in boxes], dtype=np.float64).reshape(-1, 4),
+                      np.array(class_ids, dtype=np.int32),
+                      np.array([box['confidence'] for box in boxes], dtype=np.float64),
+                      np.array(ids, dtype=np.int32),
+                      np.array([box.get('internal_pts', MISSING) for box in boxes], dtype=np.int64),
+                      classes, strings.__getitem__)
+
+
+def store_path(lct_path, kind):
+    """Returns the path of the store for one kind of box data
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+    Returns:
+        path to the store directory
+        """
+    return os.path.join(lct_path, STORE_DIR, kind)
+
+
+def has_box_store(lct_path, kind):
+    return scene_loader.open_scene(lct_path).exists(STORE_DIR + "/" + kind + "/meta.json")
+
+
+def open_box_store(lct_path, kind):
+    """Opens the store for one kind of box data, reusing an already open store when possible
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+    Returns:
+        BoxStore object, or None if the scene has no store for this kind
+        """
+    source = scene_loader.open_scene(lct_path)
+    meta_path = STORE_DIR + "/" + kind + "/meta.json"
+    if not source.exists(meta_path):
+        return None
+
+    # Reopen the store if it was rebuilt since we last opened it
+    mtime = source.mtime(meta_path)
+    key = (os.path.abspath(lct_path), kind)
+    cached = _open_stores.get(key)
+    if cached is None or cached[0] != mtime or cached[1].source is not source:
+        cached = (mtime, BoxStore(source, kind))
+        _open_stores[key] = cached
+    return cached[1]
+
+
+def _frame_json_path(lct_path, kind, frame_num):
+    return os.path.join(lct_path, kind, str(frame_num), "boxes.json")
+
+
+def _read_frame_json(lct_path, kind, frame_num):
+    return scene_loader.open_scene(lct_path).read_json(kind + "/" + str(frame_num) + "/boxes.json")
+
+
+def load_frame_boxes(lct_path, kind, frame_num):
+    """Loads the boxes of one frame in the legacy boxes.json layout
+       Uses the columnar store when the scene has one, and the boxes.json file otherwise
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+        frame_num: frame number
+    Returns:
+        dictionary with a 'boxes' list
+    Raises:
+        FileNotFoundError if the frame does not exist
+        """
+    store = open_box_store(lct_path, kind)
+    if store is not None:
+        return store.frame_dict(frame_num)
+    return _read_frame_json(lct_path, kind, frame_num)
+
+
+def load_frame_arrays(lct_path, kind, frame_num):
+    """Loads the boxes of one frame as a FrameBoxes column view
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+        frame_num: frame number
+    Returns:
+        FrameBoxes object
+    Raises:
+        FileNotFoundError if the frame does not exist
+        """
+    store = open_box_store(lct_path, kind)
+    if store is not None:
+        return store.frame(frame_num)
+    return frame_from_dict(_read_frame_json(lct_path, kind, frame_num), [])
+
+
+def save_frame_boxes(lct_path, kind, frame_num, boxes):
+    """Writes the boxes of one frame in the legacy layout, and marks the frame as changed in the store
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+        frame_num: frame number
+        boxes: dictionary with a 'boxes' list
+    Returns:
+        None
+    Raises:
+        ValueError if the scene is a read-only scene pack
+        """
+    if scene_loader.is_pack(lct_path):
+        raise ValueError("Scene packs are read-only, unpack " + lct_path + " to edit it")
+    full_path = os.path.join(lct_path, kind, str(frame_num))
+    os.makedirs(full_path, exist_ok=True)
+    with open(os.path.join(full_path, 'description.json'), 'w') as f:
+        json.dump({'num_boxes': len(boxes['boxes'])}, f)
+    with open(os.path.join(full_path, 'boxes.json'), 'w') as f:
+        f.write(json.dumps(boxes))
+
+    store = open_box_store(lct_path, kind)
+    if store is not None:
+        store.mark_dirty(frame_num)
+
+    # Counted even when the frame was saved before, the dirty set alone does not change then
+    edits = edit_counts(lct_path)
+    edits[kind] = edits.get(kind, 0) + 1
+    os.makedirs(os.path.join(lct_path, STORE_DIR), exist_ok=True)
+    with open(os.path.join(lct_path, *EDITS_PATH.split("/")), "w") as f:
+        json.dump(edits, f)
+
+
+def edit_counts(lct_path):
+    """Returns the number of frames saved through save_frame_boxes() so far
+    Args:
+        lct_path: path to LCT directory or scene pack
+    Returns:
+        dictionary of kind -> number of saves, it changes with every save
+        """
+    source = scene_loader.open_scene(lct_path)
+    edits = {kind: 0 for kind in BOX_KINDS}
+    if source.exists(EDITS_PATH):
+        edits.update(source.read_json(EDITS_PATH))
+    return edits
+
+
+def count_frames(lct_path, kind):
+    """Returns one more than the highest frame number in a bounding directory"""
+    source = scene_loader.open_scene(lct_path)
+    if not source.exists(kind):
+        return 0
+    frames = [int(name) for name in source.listdir(kind) if name.isdigit()]
+    return max(frames) + 1 if frames else 0
+
+
+def build_box_store(lct_path, kind):
+    """Reads every boxes.json of one kind and writes the columnar store for it
+    Args:
+        lct_path: path to LCT directory
+        kind: 'bounding' or 'pred_bounding'
+    Returns:
+        None
+        """
+    frames = []
+    for frame_num in range(count_frames(lct_path, kind)):
+        try:
+            frames.append(_read_frame_json(lct_path, kind, frame_num))
+        except FileNotFoundError:
+            frames.append(None)
+    write_box_store(store_path(lct_path, kind), frames)
+
+
+def write_box_store(path, frames):
+    """Writes a columnar store from a list of frames in the legacy layout
+    Args:
+        path: path of the store directory
+        frames: list with one dictionary per frame (or None for a missing frame)
+    Returns:
+        None
+        """
+    os.makedirs(path, exist_ok=True)
+
+    classes = []
+    class_lookup = {}
+    strings = []
+    string_lookup = {}
+    data_keys = []
+    data_key_lookup = {}
+
+    def encode(string):
+        if string not in string_lookup:
+            string_lookup[string] = len(strings)
+            strings.append(string)
+        return string_lookup[string]
+
+    boxes = [box for frame in frames if frame is not None for box in frame['boxes']]
+    num_boxes = len(boxes)
+
+    frame_offsets = np.zeros(len(frames) + 1, dtype=np.int64)
+    frame_present = np.zeros(len(frames), dtype=bool)
+    for i, frame in enumerate(frames):
+        frame_present[i] = frame is not None
+        frame_offsets[i + 1] = frame_offsets[i] + (len(frame['boxes']) if frame is not None else 0)
+
+    class_ids = np.zeros(num_boxes, dtype=np.int32)
+    ids = np.full(num_boxes, MISSING, dtype=np.int32)
+    internal_pts = np.full(num_boxes, MISSING, dtype=np.int64)
+    confidences = np.zeros(num_boxes, dtype=np.float64)
+    data_values = []
+
+    for row, box in enumerate(boxes):
+        if box['annotation'] not in class_lookup:
+            class_lookup[box['annotation']] = len(classes)
+            classes.append(box['annotation'])
+        class_ids[row] = class_lookup[box['annotation']]
+        confidences[row] = box['confidence']
+        if 'id' in box:
+            ids[row] = NULL if box['id'] is None else encode(str(box['id']))
+        if 'internal_pts' in box:
+            internal_pts[row] = box['internal_pts']
+        for key, value in box.get('data', {}).items():
+            if key not in data_key_lookup:
+                data_key_lookup[key] = len(data_keys)
+                data_keys.append({"name": key, "type": "number", "integer": True})
+                data_values.append({})
+            data_values[data_key_lookup[key]][row] = value
+
+    # Plain numbers get a float column, everything else is JSON encoded into the string table
+    data_columns = []
+    for key, values in zip(data_keys, data_values):
+        is_number = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values.values())
+        if is_number:
+            column = np.full(num_boxes, np.nan, dtype=np.float64)
+            key["integer"] = all(isinstance(v, int) for v in values.values())
+        else:
+            column = np.full(num_boxes, MISSING, dtype=np.int32)
+            key["type"] = "json"
+            key["integer"] = False
+        for row, value in values.items():
+            column[row] = value if is_number else encode(json.dumps(value))
+        data_columns.append(column)
+
+    np.save(os.path.join(path, "origins.npy"), np.array([box['origin'] for box in boxes], dtype=np.float64).reshape(-1, 3))
+    np.save(os.path.join(path, "sizes.npy"), np.array([box['size'] for box in boxes], dtype=np.float64).reshape(-1, 3))
+    np.save(os.path.join(path, "rotations.npy"), np.array([box['rotation'] for box in boxes], dtype=np.float64).reshape(-1, 4))
+    np.save(os.path.join(path, "class_ids.npy"), class_ids)
+    np.save(os.path.join(path, "confidences.npy"), confidences)
+    np.save(os.path.join(path, "ids.npy"), ids)
+    np.save(os.path.join(path, "internal_pts.npy"), internal_pts)
+    np.save(os.path.join(path, "frame_offsets.npy"), frame_offsets)
+    np.save(os.path.join(path, "frame_present.npy"), frame_present)
+    np.save(os.path.join(path, "strings.npy"), np.array([s.encode("utf-8") for s in strings], dtype=bytes))
+    for i, column in enumerate(data_columns):
+        np.save(os.path.join(path, "data_%d.npy" % i), column)
+
+    # A rebuilt store contains every saved edit, so nothing is dirty anymore
+    dirty_path = os.path.join(path, "dirty.json")
+    if os.path.exists(dirty_path):
+        os.remove(dirty_path)
+
+    # meta.json is written last, its presence marks the store as complete
+    meta = {}
+    meta['version'] = STORE_VERSION
+    meta['num_boxes'] = num_boxes
+    meta['classes'] = classes
+    meta['data_keys'] = data_keys
+    meta['confidence_integer'] = all(isinstance(box['confidence'], int) for box in boxes)
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
@@ -11,6 +11,14 @@ import PIL
 from shutil import copyfile
 import open3d as o3d
 import numpy as np
+from utils import box_store
+from utils import manifest
+from utils import frame_index
+from utils import pose_table
+from utils import image_utils
+from utils import lod_utils
+from utils import pointcloud_utils
+from utils import scene_loader
 
 ORIGIN = 0
 SIZE = 1
@@ -110,16 +118,23 @@ def create_lidar_sensor_directory(path, name):
     full_path = os.path.join(path, 'pointcloud', name)
     os.makedirs(full_path, exist_ok=True)
 
-def add_lidar_frame(path, name, frame_num, points):
+def add_lidar_frame(path, name, frame_num, points, intensity=None, binary=False):
     """Adds one lidar sensor directory inside pointcloud directory
     Args:
         path: path to LCT directory
         name: name of LiDAR sensor
         frame_num: frame number
         points: [n, 3] list of (x,y,z) tuples representing x,y,z coordinates
+        intensity: Optional list of n intensity values, only stored in the binary format
+        binary: Optional argument that stores the points as a float32 .bin file instead of a .pcd
     Returns:
         None
         """
+    if binary:
+        full_path = os.path.join(path, 'pointcloud', name, str(frame_num) + pointcloud_utils.BIN_EXTENSION)
+        pointcloud_utils.write_bin(full_path, points, intensity)
+        return
+
     full_path = os.path.join(path, 'pointcloud', name, str(frame_num) + '.pcd')
     pc = o3d.geometry.PointCloud(o3d.utility.Vector3dVector(np.asarray(points)))
     o3d.io.write_point_cloud(full_path, pc)
@@ -215,6 +230,88 @@ def create_annotation_map(path, annotation_map):
     with open(json_path, 'w') as f:
         json.dump(annotation_map, f)
 
+def create_box_store(path):
+    """Packs the boxes of every frame into the scene-level columnar store (see box_store.py)
+       Should be called once all frames of bounding and pred_bounding have been written
+    Args:
+        path: path to LCT dir
+    Returns:
+        None
+        """
+    for kind in box_store.BOX_KINDS:
+        box_store.build_box_store(path, kind)
+
+def create_manifest(path):
+    """Writes the scene manifest: frame count, sensors, image sizes, class catalog and per-frame class histograms (see manifest.py)
+       Should be called after create_box_store, once every frame has been written
+    Args:
+        path: path to LCT dir
+    Returns:
+        None
+        """
+    manifest.build_manifest(path)
+
+def create_pose_table(path, timestamps=None):
+    """Collects the ego data of every frame into the scene-level pose table (see pose_table.py)
+       Should be called once create_ego_directory has been called for every frame
+    Args:
+        path: path to LCT dir
+        timestamps: optional list with one timestamp in microseconds per frame, used for pose interpolation
+    Returns:
+        None
+        """
+    pose_table.build_pose_table(path, timestamps)
+
+def create_image_cache(path):
+    """Writes reduced-resolution copies of the camera images, decoded by the viewer instead of the full images (see image_utils.py)
+       Should be called once every frame has been written
+    Args:
+        path: path to LCT dir
+    Returns:
+        None
+        """
+    image_utils.build_image_cache(path)
+
+def create_lod(path):
+    """Writes the level-of-detail pyramid of the point clouds of every frame (see lod_utils.py)
+       Should be called once every frame has been written
+    Args:
+        path: path to LCT dir
+    Returns:
+        None
+        """
+    lod_utils.build_lod(path)
+
+def create_frame_index(path):
+    """Writes the inverted class/track id -> frames index used by the viewer's frame search (see frame_index.py)
+       Should be called after create_box_store, once every frame has been written
+    Args:
+        path: path to LCT dir
+    Returns:
+        None
+        """
+    frame_index.write_frame_index(path)
+
+def pack_scene(path, pack_path):
+    """Packs a finished LCT directory into a single scene pack file (see scene_loader.py)
+    Args:
+        path: path to LCT dir
+        pack_path: path of the pack file to create, conventionally ending in .lctpack
+    Returns:
+        None
+        """
+    scene_loader.write_pack(path, pack_path)
+
+def unpack_scene(pack_path, path):
+    """Recreates an LCT directory from a scene pack file
+       Point clouds come back in the .bin format
+    Args:
+        pack_path: path to the pack file
+        path: path of the LCT dir to create
+    Returns:
+        None
+        """
+    scene_loader.read_pack(pack_path, path)
         
 def create_ego_directory(path, frame, translation, rotation):
     """Adds ego data for one frame
@@ -0,0 +1,282 @@
+"""
+detection_metrics.py
+
+Scene-wide 3D detection metrics in the style of the nuScenes detection benchmark.
+
+Predictions are evaluated per detection class, the predicted annotation names. The GT boxes of a
+class are those whose annotation maps to it in pred_bounding/annotation_map.json (or share its name,
+for scenes without a map). For every distance threshold, predictions of the whole scene are matched
+greedily in order of decreasing confidence to the closest unmatched GT box of their frame and class
+whose BEV centre is closer than the threshold. AP is the area under the interpolated precision/recall
+curve above MIN_RECALL and MIN_PRECISION, and mAP its mean over classes and thresholds. The matches at
+TP_THRESHOLD give the translation, scale and orientation errors of the true positives, averaged over
+the recall range. Velocity and attribute errors are not computed, LCT boxes do not store them, and
+no range or point count filter is applied to the boxes.
+
+The whole scene is read as column arrays and matched in one pass: boxes of different frames or
+classes are moved far apart along a third axis, so one KD-tree query at the largest threshold finds
+the candidate pairs of every threshold.
+"""
+import numpy as np
+from scipy.spatial import cKDTree
+from utils import box_iou
+from utils import box_store
+from utils import scene_loader
+
+DISTANCE_THRESHOLDS = [0.5, 1.0, 2.0, 4.0]
+TP_THRESHOLD = 2.0
+MIN_RECALL = 0.1
+MIN_PRECISION = 0.1
+RECALL_POINTS = 101
+TP_ERRORS = ["trans_err", "scale_err", "orient_err"]
+
+
+class SceneBoxes:
+    """Column view of every box of one kind in a scene, one row per box"""
+    def __init__(self, frames, origins, sizes, rotations, class_ids, confidences, classes):
+        self.frames = frames
+        self.origins = origins
+        self.sizes = sizes
+        self.rotations = rotations
+        self.class_ids = class_ids
+        self.confidences = confidences
+        self.classes = classes
+
+    def __len__(self):
+        return len(self.frames)
+
+
+def load_scene_boxes(lct_path, kind, num_frames):
+    """Reads every box of one kind in a scene, from the box store when the scene has one
+    Args:
+        lct_path: path to LCT directory or scene pack
+        kind: 'bounding' or 'pred_bounding'
+        num_frames: number of frames of the scene
+    Returns:
+        SceneBoxes object
+        """
+    parts = []
+    classes = []
+    store = box_store.open_box_store(lct_path, kind)
+    if store is not None:
+        # Rows of the store, except frames edited since it was built, which are read from JSON below
+        counts = np.diff(np.asarray(store.frame_offsets))
+        frames = np.repeat(np.arange(len(counts)), counts)
+        keep = ~np.isin(frames, sorted(store.dirty))
+        classes = list(store.classes)
+        parts.append((frames[keep], np.asarray(store.origins)[keep], np.asarray(store.sizes)[keep],
+                      np.asarray(store.rotations)[keep], np.asarray(store.class_ids)[keep], np.asarray(store.confidences)[keep]))
+        json_frames = sorted(frame_num for frame_num in store.dirty if frame_num < num_frames)
+    else:
+        json_frames = range(num_frames)
+
+    for frame_num in json_frames:
+        try:
+            boxes = box_store.load_frame_arrays(lct_path, kind, frame_num)
+        except FileNotFoundError:
+            continue
+        class_ids = []
+        for name in boxes.annotations:
+            if name not in classes:
+                classes.append(name)
+            class_ids.append(classes.index(name))
+        parts.append((np.full(len(boxes), frame_num), boxes.origins, boxes.sizes, boxes.rotations, class_ids, boxes.confidences))
+
+    if len(parts) == 0:
+        return SceneBoxes(np.zeros(0, dtype=np.int64), np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 4)),
+                          np.zeros(0, dtype=np.int64), np.zeros(0), classes)
+    columns = [np.concatenate([np.asarray(part[i]) for part in parts]) for i in range(6)]
+    return SceneBoxes(columns[0].astype(np.int64), columns[1].astype(np.float64).reshape(-1, 3),
+                      columns[2].astype(np.float64).reshape(-1, 3), columns[3].astype(np.float64).reshape(-1, 4),
+                      columns[4].astype(np.int64), columns[5].astype(np.float64), classes)
+
+
+def load_annotation_map(lct_path):
+    """Returns the GT annotation name -> [predicted names] map of a scene, or None if it has none"""
+    source = scene_loader.open_scene(lct_path)
+    if not source.exists("pred_bounding/annotation_map.json"):
+        return None
+    return source.read_json("pred_bounding/annotation_map.json")
+
+
+def detection_classes(annotation_map, gt_classes, pred_classes):
+    """Returns the detection classes of a scene and the GT annotation names that belong to each
+    Args:
+        annotation_map: GT annotation name -> [predicted names] map, or None to pair equal names
+        gt_classes: GT annotation names of the scene
+        pred_classes: predicted annotation names of the scene
+    Returns:
+        dictionary of predicted name -> list of GT annotation names
+        """
+    classes = {}
+    if annotation_map is None:
+        annotation_map = {name: [name] for name in gt_classes if name in pred_classes}
+    for (gt_name, pred_names) in annotation_map.items():
+        for pred_name in pred_names:
+            classes.setdefault(pred_name, []).append(gt_name)
+    return classes
+
+
+def candidate_pairs(gt_keys, gt_xy, pred_keys, pred_xy, threshold):
+    """Finds every (prediction, GT) pair with the same key whose BEV centres are closer than threshold
+    Args:
+        gt_keys: [g] frame and class key of every GT box
+        gt_xy: [g, 2] BEV centres of the GT boxes
+        pred_keys: [p] frame and class key of every prediction
+        pred_xy: [p, 2] BEV centres of the predictions
+        threshold: largest distance threshold, in meters
+    Returns:
+        pred: [k] prediction index of every pair
+        gt: [k] GT index of every pair
+        dist: [k] distance of every pair
+        """
+    if len(gt_keys) == 0 or len(pred_keys) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    # Different keys are at least 10 thresholds apart along the third axis, so they are never paired
+    separation = 10 * threshold
+    gt_tree = cKDTree(np.column_stack((gt_xy, gt_keys * separation)))
+    pred_tree = cKDTree(np.column_stack((pred_xy, pred_keys * separation)))
+    pairs = pred_tree.sparse_distance_matrix(gt_tree, threshold, output_type="ndarray")
+    (pred, gt) = (pairs["i"].astype(np.int64), pairs["j"].astype(np.int64))
+    dist = np.hypot(*(pred_xy[pred] - gt_xy[gt]).T)
+    keep = (dist < threshold) & (gt_keys[gt] == pred_keys[pred])
+    return pred[keep], gt[keep], dist[keep]
+
+
+def greedy_match(pairs, num_gt, num_pred, threshold):
+    """Matches predictions to GT boxes, most confident prediction first, each to the closest unmatched GT box
+    Args:
+        pairs: result of candidate_pairs, predictions indexed in decreasing confidence
+        num_gt: number of GT boxes
+        num_pred: number of predictions
+        threshold: a prediction only matches GT boxes closer than this, in meters
+    Returns:
+        [num_pred] index of the GT box every prediction is matched to, -1 if none
+        """
+    (pred, gt, dist) = pairs
+    close = dist < threshold
+    (pred, gt, dist) = (pred[close], gt[close], dist[close])
+    order = np.lexsort((gt, dist, pred))
+    matches = [-1] * num_pred
+    gt_matched = [False] * num_gt
+    for (p, g) in zip(pred[order].tolist(), gt[order].tolist()):
+        if matches[p] < 0 and not gt_matched[g]:
+            matches[p] = g
+            gt_matched[g] = True
+    return np.array(matches, dtype=np.int64)
+
+
+def average_precision(tp, num_gt):
+    """Returns the nuScenes AP of one class and threshold
+    Args:
+        tp: [p] True for the true positives, predictions in decreasing confidence
+        num_gt: number of GT boxes of the class
+    Returns:
+        AP in [0, 1]
+        """
+    if len(tp) == 0:
+        return 0.0
+    tp_sum = np.cumsum(tp)
+    precision = tp_sum / np.arange(1, len(tp) + 1)
+    recall = tp_sum / num_gt
+    grid = np.linspace(0, 1, RECALL_POINTS)
+    precision = np.interp(grid, recall, precision, right=0)
+    precision = precision[round((RECALL_POINTS - 1) * MIN_RECALL) + 1:] - MIN_PRECISION
+    return float(np.maximum(precision, 0).mean() / (1 - MIN_PRECISION))
+
+
+def tp_error(tp, errors, num_gt):
+    """Returns one TP error of a class: the mean error of the true positives above each recall, averaged over recall
+    Args:
+        tp: [p] True for the true positives, predictions in decreasing confidence
+        errors: [number of true positives] errors of the true positives, in the same order
+        num_gt: number of GT boxes of the class
+    Returns:
+        the error, 1 if the recall never reaches MIN_RECALL
+        """
+    recall = np.cumsum(tp)[tp] / num_gt
+    first = round((RECALL_POINTS - 1) * MIN_RECALL) + 1
+    last = int(np.floor(recall[-1] * (RECALL_POINTS - 1) + 1e-9)) if len(recall) else -1
+    if last < first:
+        return 1.0
+    grid = np.linspace(0, 1, RECALL_POINTS)
+    cumulative_mean = np.cumsum(errors) / np.arange(1, len(errors) + 1)
+    return float(np.interp(grid[first:last + 1], recall, cumulative_mean).mean())
+
+
+def tp_errors(gt, gt_rows, pred, pred_rows):
+    """Returns the translation, scale and orientation errors of matched (prediction, GT) rows"""
+    trans = np.hypot(*(pred.origins[pred_rows, :2] - gt.origins[gt_rows, :2]).T)
+    pred_sizes = pred.sizes[pred_rows]
+    gt_sizes = gt.sizes[gt_rows]
+    intersection = np.minimum(pred_sizes, gt_sizes).prod(axis=1)
+    union = pred_sizes.prod(axis=1) + gt_sizes.prod(axis=1) - intersection
+    scale = 1 - np.divide(intersection, union, out=np.zeros_like(union), where=union > 0)
+    yaw = np.abs(box_iou.headings(pred.rotations[pred_rows]) - box_iou.headings(gt.rotations[gt_rows])) % (2 * np.pi)
+    orient = np.minimum(yaw, 2 * np.pi - yaw)
+    return {"trans_err": trans, "scale_err": scale, "orient_err": orient}
+
+
+def evaluate(lct_path, thresholds=DISTANCE_THRESHOLDS, annotation_map=None):
+    """Computes the detection metrics of a scene
+    Args:
+        lct_path: path to LCT directory or scene pack
+        thresholds: BEV centre distance thresholds in meters
+        annotation_map: GT annotation name -> [predicted names] map, default the scene's annotation_map.json
+    Returns:
+        JSON serializable dictionary with the mean AP and TP errors over classes, and per class its
+        AP at every threshold, mean AP, TP errors and box counts
+        """
+    num_frames = box_store.count_frames(lct_path, "bounding")
+    gt = load_scene_boxes(lct_path, "bounding", num_frames)
+    pred = load_scene_boxes(lct_path, "pred_bounding", num_frames)
+    if annotation_map is None:
+        annotation_map = load_annotation_map(lct_path)
+    classes = detection_classes(annotation_map, gt.classes, pred.classes)
+    names = sorted(classes)
+
+    # Rows of every detection class, a GT box mapped to several classes appears once per class
+    gt_names = np.array(gt.classes, dtype=object)[gt.class_ids]
+    pred_names = np.array(pred.classes, dtype=object)[pred.class_ids]
+    gt_rows = [np.flatnonzero(np.isin(gt_names, classes[name])) for name in names]
+    pred_rows = [np.flatnonzero(pred_names == name) for name in names]
+    gt_class = np.repeat(np.arange(len(names)), [len(rows) for rows in gt_rows])
+    pred_class = np.repeat(np.arange(len(names)), [len(rows) for rows in pred_rows])
+    gt_rows = np.concatenate(gt_rows + [np.zeros(0, dtype=np.int64)])
+    pred_rows = np.concatenate(pred_rows + [np.zeros(0, dtype=np.int64)])
+    # Predictions in decreasing confidence, stable so equal confidences keep their order
+    order = np.argsort(-pred.confidences[pred_rows], kind="stable")
+    (pred_rows, pred_class) = (pred_rows[order], pred_class[order])
+
+    gt_keys = gt_class * (num_frames + 1) + gt.frames[gt_rows]
+    pred_keys = pred_class * (num_frames + 1) + pred.frames[pred_rows]
+    gt_xy = gt.origins[gt_rows, :2]
+    pred_xy = pred.origins[pred_rows, :2]
+    all_thresholds = sorted(set(thresholds) | {TP_THRESHOLD})
+    pairs = candidate_pairs(gt_keys, gt_xy, pred_keys, pred_xy, all_thresholds[-1])
+    matches = {threshold: greedy_match(pairs, len(gt_rows), len(pred_rows), threshold) for threshold in all_thresholds}
+
+    tp_matches = matches[TP_THRESHOLD]
+    matched = tp_matches >= 0
+    errors = tp_errors(gt, gt_rows[tp_matches[matched]], pred, pred_rows[matched])
+
+    results = {}
+    for (c, name) in enumerate(names):
+        num_gt = int((gt_class == c).sum())
+        in_class = pred_class == c
+        if num_gt == 0:
+            continue
+        ap = {str(threshold): average_precision(matches[threshold][in_class] >= 0, num_gt) for threshold in thresholds}
+        result = {'num_gt': num_gt, 'num_pred': int(in_class.sum()), 'ap': ap, 'mean_ap': float(np.mean(list(ap.values())))}
+        tp = tp_matches[in_class] >= 0
+        for metric in TP_ERRORS:
+            result[metric] = tp_error(tp, errors[metric][in_class[matched]], num_gt)
+        results[name] = result
+
+    summary = {'lct_path': lct_path, 'num_frames': num_frames, 'thresholds': list(thresholds),
+               'tp_threshold': TP_THRESHOLD, 'classes': results}
+    summary['mAP'] = float(np.mean([r['mean_ap'] for r in results.values()])) if results else 0.0
+    for metric in TP_ERRORS:
+        summary['m' + metric] = float(np.mean([r[metric] for r in results.values()])) if results else 1.0
+    return summary
@@ -0,0 +1,269 @@
+"""
+error_scan.py
+
+Whole-scene scan for unmatched GT boxes, false positives and incorrect annotations.
+
+Frames are matched independently, so the scan is split into chunks of consecutive frames that run
+on a process pool. Results come back chunk by chunk in frame order through a callback, which runs
+on the thread driving the scan; the viewer forwards them to the GUI thread with post_to_main_thread
+so the "Errors" window fills in while the scan is running. The scan can be cancelled between chunks.
+Results are kept in the scan cache (see scan_cache.py), so only frames whose boxes changed since
+the last scan with the same settings are matched again.
+error-scan.py runs the same scan without the viewer and writes a JSON or CSV report.
+"""
+import concurrent.futures
+import csv
+import json
+import os
+import threading
+from utils import box_store
+from utils import frame_index
+from utils import matching
+from utils import scan_cache
+
+UNMATCHED_GT = frame_index.UNMATCHED_GT
+FALSE_POSITIVES = frame_index.FALSE_POSITIVES
+INCORRECT_ANNOTATIONS = "incorrect_annotations"
+ERROR_KINDS = [UNMATCHED_GT, FALSE_POSITIVES, INCORRECT_ANNOTATIONS]
+
+# Frames matched by one task, large enough to amortize the inter-process overhead
+SCAN_CHUNK = 16
+SCAN_WORKERS = os.cpu_count() or 1
+
+
+class ScanSettings:
+    """Class selection and kinds of errors a scan looks for, the same settings the viewer filters with"""
+    def __init__(self, gt_classes, pred_classes, min_confidence, kinds=ERROR_KINDS, criterion=None):
+        """
+        Args:
+            gt_classes: selected GT annotation names
+            pred_classes: selected predicted annotation names
+            min_confidence: predictions below this confidence are ignored
+            kinds: list of error kinds to look for, a subset of ERROR_KINDS
+            criterion: matching.MatchCriterion object, default centre distance within matching.MATCH_DISTANCE
+            """
+        self.gt_classes = list(gt_classes)
+        self.pred_classes = list(pred_classes)
+        self.min_confidence = min_confidence
+        self.kinds = [kind for kind in ERROR_KINDS if kind in kinds]
+        self.criterion = criterion if criterion is not None else matching.MatchCriterion()
+
+    def to_dict(self):
+        """Returns the settings as a JSON serializable dictionary"""
+        return {'gt_classes': self.gt_classes, 'pred_classes': self.pred_classes, 'min_confidence': self.min_confidence,
+                'kinds': self.kinds, 'criterion': self.criterion.to_dict()}
+
+
+def count_labels(names, indices):
+    """Returns a dictionary of annotation name -> number of times it appears in names at indices, in order of appearance"""
+    counts = {}
+    for i in indices:
+        counts[names[i]] = counts.get(names[i], 0) + 1
+    return counts
+
+
+def scan_frame(lct_path, frame_num, settings):
+    """Finds the errors of one frame
+    Args:
+        lct_path: path to LCT directory or scene pack
+        frame_num: frame number
+        settings: ScanSettings object
+    Returns:
+        dictionary of error kind -> {annotation name: count}, with a (possibly empty) entry for every kind in settings
+    Raises:
+        FileNotFoundError if the frame has no GT or predicted boxes
+        """
+    gt = box_store.load_frame_arrays(lct_path, "bounding", frame_num)
+    pred = box_store.load_frame_arrays(lct_path, "pred_bounding", frame_num)
+    match = matching.match_frame_boxes(gt, pred, settings.gt_classes, settings.pred_classes,
+                                       settings.min_confidence, settings.criterion)
+    errors = {}
+    if UNMATCHED_GT in settings.kinds:
+        errors[UNMATCHED_GT] = count_labels(gt.annotations, match.unmatched_gt)
+    if FALSE_POSITIVES in settings.kinds:
+        errors[FALSE_POSITIVES] = count_labels(pred.annotations, match.false_positives)
+    if INCORRECT_ANNOTATIONS in settings.kinds:
+        errors[INCORRECT_ANNOTATIONS] = count_labels(gt.annotations, match.mismatches[:, 1])
+    return errors
+
+
+def has_errors(errors):
+    """Returns True if a result of scan_frame holds any error"""
+    return any(len(counts) > 0 for counts in errors.values())
+
+
+def scan_frames(lct_path, frames, settings):
+    """Runs scan_frame over a chunk of frames, the task run by the workers of the pool
+    Returns:
+        list of (frame number, errors) tuples
+        """
+    return [(frame_num, scan_frame(lct_path, frame_num, settings)) for frame_num in frames]
+
+
+class ErrorScan:
+    """Scans the frames of a scene on a process pool, reporting the results chunk by chunk
+       Frames whose results are in the scan cache are reported without being matched again"""
+    def __init__(self, lct_path, num_frames, settings, on_results, on_done, workers=SCAN_WORKERS, chunk_size=SCAN_CHUNK, use_cache=True):
+        """
+        Args:
+            lct_path: path to LCT directory or scene pack
+            num_frames: number of frames to scan, starting at frame 0
+            settings: ScanSettings object
+            on_results: function called with (list of (frame number, errors) tuples, frames done, total frames)
+            on_done: function called with None when the scan finished or was cancelled, or the exception that stopped it
+            workers: number of worker processes
+            chunk_size: number of frames per task
+            use_cache: False to match every frame and leave the scan cache untouched
+            """
+        self.lct_path = lct_path
+        self.num_frames = num_frames
+        self.settings = settings
+        self.on_results = on_results
+        self.on_done = on_done
+        self.workers = max(1, workers)
+        self.chunk_size = chunk_size
+        self.use_cache = use_cache
+        self.cached_frames = 0
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        """Starts the scan in the background"""
+        self.thread.start()
+
+    def cancel(self):
+        """Stops the scan, chunks already running are finished but not reported"""
+        self.cancelled.set()
+
+    def _run(self):
+        cache = None
+        executor = None
+        futures = []
+        error = None
+        # Everything runs in the try, so any failure (eg: a scene that cannot be read, or a pool that
+        # cannot be started) still reaches on_done and the GUI does not wait forever
+        try:
+            cache = scan_cache.ScanCache(self.lct_path, self.settings) if self.use_cache else None
+            # Versions are read before matching, so boxes saved during the scan are matched again next time
+            versions = {}
+            cached = {}
+            stale = []
+            for frame_num in range(self.num_frames):
+                errors = None
+                if cache is not None:
+                    versions[frame_num] = scan_cache.frame_version(self.lct_path, frame_num)
+                    errors = cache.get(frame_num, versions[frame_num])
+                if errors is None:
+                    stale.append(frame_num)
+                else:
+                    cached[frame_num] = errors
+            self.cached_frames = len(cached)
+
+            chunks = [stale[start:start + self.chunk_size] for start in range(0, len(stale), self.chunk_size)]
+            executor = concurrent.futures.ProcessPoolExecutor(min(self.workers, len(chunks))) if chunks else None
+            for chunk in chunks:
+                futures.append(executor.submit(scan_frames, self.lct_path, chunk, self.settings))
+            done = 0
+            next_frame = 0
+            # Waiting in submission order keeps the results in frame order, the pool works through them in that order anyway
+            for (chunk, future) in zip(chunks, futures):
+                while not self.cancelled.is_set():
+                    (finished, _) = concurrent.futures.wait([future], timeout=0.1)
+                    if finished:
+                        break
+                if self.cancelled.is_set():
+                    break
+                matched = future.result()
+                if cache is not None:
+                    for (frame_num, errors) in matched:
+                        cache.put(frame_num, versions[frame_num], errors)
+                # Cached frames up to the end of the chunk go out with it
+                results = sorted(matched + [(frame_num, cached[frame_num]) for frame_num in range(next_frame, chunk[-1] + 1) if frame_num in cached])
+                next_frame = chunk[-1] + 1
+                done += len(results)
+                self.on_results(results, done, self.num_frames)
+            if not self.cancelled.is_set() and next_frame < self.num_frames:
+                results = [(frame_num, cached[frame_num]) for frame_num in range(next_frame, self.num_frames)]
+                done += len(results)
+                self.on_results(results, done, self.num_frames)
+        except Exception as err:
+            error = err
+        finally:
+            for future in futures:
+                future.cancel()
+            if executor is not None:
+                executor.shutdown(wait=False)
+            # Also keeps the chunks matched before a cancel
+            if cache is not None:
+                cache.save()
+        self.on_done(error)
+
+
+def run_scan(lct_path, num_frames, settings, workers=SCAN_WORKERS, chunk_size=SCAN_CHUNK, on_progress=None, use_cache=True):
+    """Scans the frames of a scene and waits for the result
+    Args:
+        lct_path: path to LCT directory or scene pack
+        num_frames: number of frames to scan, starting at frame 0
+        settings: ScanSettings object
+        workers: number of worker processes
+        chunk_size: number of frames per task
+        on_progress: optional function called with (frames done, total frames)
+        use_cache: False to match every frame and leave the scan cache untouched
+    Returns:
+        list of (frame number, errors) tuples of the frames with errors, in frame order
+        number of frames whose results came from the scan cache
+        """
+    found = []
+    failure = []
+
+    def on_results(results, done, total):
+        found.extend((frame_num, errors) for (frame_num, errors) in results if has_errors(errors))
+        if on_progress is not None:
+            on_progress(done, total)
+
+    scan = ErrorScan(lct_path, num_frames, settings, on_results, failure.append, workers, chunk_size, use_cache)
+    scan.start()
+    scan.thread.join()
+    if failure[0] is not None:
+        raise failure[0]
+    return (found, scan.cached_frames)
+
+
+def totals(found):
+    """Returns a dictionary of error kind -> {annotation name: count} summed over the frames of a scan"""
+    summed = {}
+    for (_, errors) in found:
+        for (kind, counts) in errors.items():
+            kind_totals = summed.setdefault(kind, {})
+            for (name, count) in counts.items():
+                kind_totals[name] = kind_totals.get(name, 0) + count
+    return summed
+
+
+def write_report(path, lct_path, num_frames, settings, found):
+    """Writes the result of a scan, as CSV if path ends in .csv and JSON otherwise
+       The CSV file has one row per (frame, kind, annotation name)
+    Args:
+        path: report path
+        lct_path: path of the scanned scene
+        num_frames: number of frames scanned
+        settings: ScanSettings object
+        found: list of (frame number, errors) tuples of the frames with errors, see run_scan
+    Returns:
+        None
+        """
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["frame", "kind", "annotation", "count"])
+            for (frame_num, errors) in found:
+                for (kind, counts) in errors.items():
+                    for (name, count) in counts.items():
+                        writer.writerow([frame_num, kind, name, count])
+        return
+
+    report = {'lct_path': lct_path, 'num_frames': num_frames, 'settings': settings.to_dict(),
+              'error_frames': len(found), 'totals': totals(found),
+              'frames': [dict(frame=frame_num, **errors) for (frame_num, errors) in found]}
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
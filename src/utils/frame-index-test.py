@@ -0,0 +1,137 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Run from anywhere, eg: python utils/frame-index-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import box_store
+from utils import frame_index
+from utils import matching
+from utils import synthetic_scene
+
+# These tests run offline on a scene written by synthetic_scene, every test edits its own copy
+
+NUM_FRAMES = 8
+EDITED_FRAME = 3
+NEW_CLASS = "brand_new_class"
+
+scene_dir = tempfile.TemporaryDirectory()
+scene_path = os.path.join(scene_dir.name, "synthetic")
+
+
+def setUpModule():
+    synthetic_scene.generate_scene(scene_path, num_frames=NUM_FRAMES, num_cameras=1, num_lidars=1,
+                                   points_per_sweep=1000, image_size=(64, 36))
+
+
+def tearDownModule():
+    scene_dir.cleanup()
+
+
+def add_box(lct_path, frame_num, annotation):
+    """Saves a frame of GT boxes with one more box of the given class, like the editor does"""
+    boxes = box_store.load_frame_boxes(lct_path, "bounding", frame_num)
+    box = dict(boxes['boxes'][0])
+    box['annotation'] = annotation
+    boxes['boxes'].append(box)
+    box_store.save_frame_boxes(lct_path, "bounding", frame_num, boxes)
+
+
+# tests that saving boxes makes the index written at conversion time out of date
+class TestEdits(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.lct_path = os.path.join(self.work_dir.name, "synthetic")
+        shutil.copytree(scene_path, self.lct_path)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def test_index_is_current(self):
+        index = frame_index.load_frame_index(self.lct_path)
+        self.assertIsNotNone(index)
+        self.assertEqual(index.num_frames, NUM_FRAMES)
+
+    def test_first_edit(self):
+        add_box(self.lct_path, EDITED_FRAME, NEW_CLASS)
+        self.assertIsNone(frame_index.load_frame_index(self.lct_path))
+        index = frame_index.write_frame_index(self.lct_path)
+        self.assertEqual(list(index.frames_with_classes("bounding", [NEW_CLASS])), [EDITED_FRAME])
+
+    def test_edit_of_dirty_frame(self):
+        # The frame is already dirty after the first save, so only the second save changes its classes
+        add_box(self.lct_path, EDITED_FRAME, "first_class")
+        frame_index.write_frame_index(self.lct_path)
+        self.assertIsNotNone(frame_index.load_frame_index(self.lct_path))
+        add_box(self.lct_path, EDITED_FRAME, NEW_CLASS)
+        self.assertIsNone(frame_index.load_frame_index(self.lct_path))
+        index = frame_index.build_frame_index(self.lct_path)
+        self.assertIn(NEW_CLASS, index.gt_classes)
+        self.assertEqual(list(index.frames_with_classes("bounding", [NEW_CLASS])), [EDITED_FRAME])
+
+    def test_edit_without_box_store(self):
+        # Scenes converted without a box store have no dirty frames at all
+        shutil.rmtree(os.path.join(self.lct_path, box_store.STORE_DIR, "bounding"))
+        shutil.rmtree(os.path.join(self.lct_path, box_store.STORE_DIR, "pred_bounding"))
+        frame_index.write_frame_index(self.lct_path)
+        add_box(self.lct_path, EDITED_FRAME, NEW_CLASS)
+        self.assertIsNone(frame_index.load_frame_index(self.lct_path))
+
+    def test_loader_rebuilds(self):
+        loader = frame_index.FrameIndexLoader(self.lct_path)
+        self.assertIsNotNone(loader.get())
+        add_box(self.lct_path, EDITED_FRAME, NEW_CLASS)
+        self.assertIsNone(loader.get())
+        loader.thread.join()
+        self.assertEqual(list(loader.get().frames_with_classes("bounding", [NEW_CLASS])), [EDITED_FRAME])
+
+
+# tests that the frames with false positives or unmatched GT boxes are matched off the calling thread
+class TestErrorFrames(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.lct_path = os.path.join(self.work_dir.name, "synthetic")
+        shutil.copytree(scene_path, self.lct_path)
+        self.gt_classes = sorted(synthetic_scene.CLASSES)
+        self.pred_classes = sorted({pred_name for (pred_name, _, _, _) in synthetic_scene.CLASSES.values()})
+        self.criterion = matching.MatchCriterion()
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def request(self, loader, mode):
+        """Returns the loader's error frames once its background thread is done"""
+        self.assertIsNone(loader.error_frames(mode, self.gt_classes, self.pred_classes, 0, self.criterion))
+        loader.error_thread.join()
+        return loader.error_frames(mode, self.gt_classes, self.pred_classes, 0, self.criterion)
+
+    def test_same_as_matching_now(self):
+        loader = frame_index.FrameIndexLoader(self.lct_path)
+        for mode in (frame_index.FALSE_POSITIVES, frame_index.UNMATCHED_GT):
+            expected = frame_index.error_frames(self.lct_path, loader.get(), mode, self.gt_classes, self.pred_classes, 0, self.criterion)
+            self.assertEqual(list(self.request(loader, mode)), list(expected))
+
+    def test_edit_rematches(self):
+        # A frame without predictions has no false positives
+        loader = frame_index.FrameIndexLoader(self.lct_path)
+        self.assertIn(EDITED_FRAME, self.request(loader, frame_index.FALSE_POSITIVES))
+        boxes = box_store.load_frame_boxes(self.lct_path, "pred_bounding", EDITED_FRAME)
+        boxes['boxes'] = []
+        box_store.save_frame_boxes(self.lct_path, "pred_bounding", EDITED_FRAME, boxes)
+        self.assertIsNone(loader.error_frames(frame_index.FALSE_POSITIVES, self.gt_classes, self.pred_classes, 0, self.criterion))
+        loader.thread.join()
+        self.assertNotIn(EDITED_FRAME, self.request(loader, frame_index.FALSE_POSITIVES))
+
+    def test_cancelled(self):
+        index = frame_index.build_frame_index(self.lct_path)
+        cancelled = threading.Event()
+        cancelled.set()
+        self.assertIsNone(frame_index.error_frames(self.lct_path, index, frame_index.FALSE_POSITIVES, self.gt_classes,
+                                                   self.pred_classes, 0, self.criterion, cancelled))
+
+
+if __name__ == '__main__':
+    unittest.main()
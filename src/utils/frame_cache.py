@@ -0,0 +1,182 @@
+"""
+frame_cache.py
+
+Process-wide cache of decoded frame data, shared by the viewer, the annotation editor and the prefetcher.
+
+Entries are point clouds (merged over the lidar sensors), display-resolution camera images and box
+tables, kept in least-recently-used order within a byte budget. Every entry remembers the
+modification time of the files it was decoded from, and is reloaded when any of them changed, so
+boxes saved by the editor show up in the viewer. Poses are not cached here, the pose table already
+keeps every pose of a scene in memory.
+
+Cached values are shared: callers that modify them (eg: the editor's box lists) ask for a copy.
+"""
+import collections
+import copy
+import os
+import threading
+from utils import box_store
+from utils import image_utils
+from utils import pointcloud_utils
+from utils import scene_loader
+
+# Default budget, overridden with the LCT_FRAME_CACHE_MB environment variable
+DEFAULT_BUDGET = int(os.environ.get("LCT_FRAME_CACHE_MB", 1024)) * 1024 * 1024
+
+# Rough size of one Python object, used to estimate the size of box tables
+OBJECT_BYTES = 64
+
+
+def nbytes(value):
+    """Estimates the memory held by a cached value"""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+    if isinstance(value, dict):
+        return OBJECT_BYTES + sum(nbytes(key) + nbytes(item) for key, item in value.items())
+    if isinstance(value, (list, tuple)):
+        return OBJECT_BYTES + sum(nbytes(item) for item in value)
+    if isinstance(value, (str, bytes)):
+        return OBJECT_BYTES + len(value)
+    return OBJECT_BYTES
+
+
+class FrameCache:
+    """Least-recently-used cache with a byte budget and file modification time validation"""
+    def __init__(self, budget=DEFAULT_BUDGET):
+        self.budget = budget
+        self.entries = collections.OrderedDict()
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def _mtimes(self, source, paths):
+        mtimes = []
+        for path in paths:
+            try:
+                mtimes.append(source.mtime(path))
+            except (OSError, KeyError):
+                mtimes.append(None)
+        return tuple(mtimes)
+
+    def get(self, lct_path, key, paths, load):
+        """Returns a cached value, loading it if it is missing or if one of its files changed
+        Args:
+            lct_path: path to LCT directory or scene pack
+            key: tuple identifying the value within the scene
+            paths: paths (relative to the scene) of the files the value is decoded from
+            load: function without arguments returning the value
+        Returns:
+            the cached value, which must not be modified
+            """
+        source = scene_loader.open_scene(lct_path)
+        full_key = (os.path.abspath(lct_path),) + tuple(key)
+        mtimes = self._mtimes(source, paths)
+        with self.lock:
+            entry = self.entries.get(full_key)
+            if entry is not None:
+                if entry[0] == mtimes:
+                    self.entries.move_to_end(full_key)
+                    self.hits += 1
+                    return entry[1]
+                self._remove(full_key)
+                self.invalidations += 1
+            self.misses += 1
+
+        # Loaded outside the lock, so workers decode frames in parallel
+        value = load()
+        size = nbytes(value)
+        with self.lock:
+            if full_key in self.entries:
+                self._remove(full_key)
+            if size <= self.budget:
+                self.entries[full_key] = (mtimes, value, size)
+                self.size += size
+                self._evict()
+        return value
+
+    def _remove(self, full_key):
+        self.size -= self.entries.pop(full_key)[2]
+
+    def _evict(self):
+        while self.size > self.budget and len(self.entries) > 0:
+            self._remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def set_budget(self, budget):
+        """Changes the byte budget, evicting entries if the cache no longer fits"""
+        with self.lock:
+            self.budget = budget
+            self._evict()
+
+    def invalidate(self, lct_path=None):
+        """Drops every entry, or every entry of one scene"""
+        with self.lock:
+            for full_key in list(self.entries):
+                if lct_path is None or full_key[0] == os.path.abspath(lct_path):
+                    self._remove(full_key)
+
+    def stats(self):
+        """Returns the hit/miss counters and the current size"""
+        with self.lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'invalidations': self.invalidations, 'entries': len(self.entries),
+                    'bytes': self.size, 'budget': self.budget}
+
+
+_cache = FrameCache()
+
+
+def get_cache():
+    """Returns the process-wide frame cache"""
+    return _cache
+
+
+def load_point_assembly(lct_path, lidar_sensors, frame_num):
+    """Returns the point clouds of one frame assembled over lidar_sensors, in the ego frame
+    Returns:
+        pointcloud_utils.PointAssembly, whose buffer must not be modified
+        """
+    source = scene_loader.open_scene(lct_path)
+    paths = [source.points_path(sensor, frame_num) for sensor in lidar_sensors]
+    # Copied out of the file mappings into one buffer, so the cache holds the decoded points
+    return _cache.get(lct_path, ("points", tuple(lidar_sensors), frame_num), paths,
+                      lambda: pointcloud_utils.assemble_points(source, lidar_sensors, frame_num))
+
+
+def load_points(lct_path, lidar_sensors, frame_num):
+    """Returns the point clouds of one frame merged over lidar_sensors, in the ego frame
+    Returns:
+        [n, 3] float32 array, which must not be modified
+        """
+    return load_point_assembly(lct_path, lidar_sensors, frame_num).points
+
+
+def load_image(lct_path, camera, frame_num):
+    """Returns a camera image at display resolution, see image_utils.load_display_image
+    Returns:
+        (image, scale, full_size) tuple, the image must be copied before drawing on it
+        """
+    path = "cameras/" + camera + "/" + str(frame_num) + ".jpg"
+    return _cache.get(lct_path, ("image", camera, frame_num), [path],
+                      lambda: image_utils.load_display_image(lct_path, camera, frame_num))
+
+
+def load_boxes(lct_path, kind, frame_num, copy_boxes=False):
+    """Returns the boxes of one frame, see box_store.load_frame_boxes
+    Args:
+        lct_path: path to LCT directory or scene pack
+        kind: 'bounding' or 'pred_bounding'
+        frame_num: frame number
+        copy_boxes: True to get a copy that can be modified
+    Returns:
+        dictionary with a 'boxes' list
+    Raises:
+        FileNotFoundError if the frame has no boxes
+        """
+    path = kind + "/" + str(frame_num) + "/boxes.json"
+    boxes = _cache.get(lct_path, ("boxes", kind, frame_num), [path],
+                       lambda: box_store.load_frame_boxes(lct_path, kind, frame_num))
+    return copy.deepcopy(boxes) if copy_boxes else boxes
@@ -0,0 +1,334 @@
+"""
+frame_index.py
+
+Scene-level inverted index from box properties to the sorted array of frames that contain them.
+
+For every GT class, every predicted class and every track id the index holds a sorted frame array,
+stored in CSR form (one offsets array and one concatenated frames array). Predicted classes also keep
+the highest confidence per (class, frame), so frames with a prediction above a confidence threshold
+are a mask away. Finding the next or previous frame is then a binary search.
+
+The index is written to store/frame_index/ at conversion time. For scenes converted without it,
+FrameIndexLoader builds it on a background thread.
+"""
+import json
+import os
+import threading
+import numpy as np
+from utils import box_store
+from utils import matching
+from utils import scene_loader
+
+INDEX_DIR = box_store.STORE_DIR + "/frame_index"
+INDEX_VERSION = 2
+INDEX_ARRAYS = ["gt_offsets", "gt_frames", "pred_offsets", "pred_frames", "pred_max_confidence", "track_offsets", "track_frames"]
+
+FALSE_POSITIVES = "false_positives"
+UNMATCHED_GT = "unmatched_gt"
+
+
+class FrameIndex:
+    """Inverted class -> frames, confidence -> frames and track id -> frames index of one scene"""
+    def __init__(self, meta, arrays):
+        self.meta = meta
+        self.num_frames = meta["num_frames"]
+        self.gt_classes = meta["gt_classes"]
+        self.pred_classes = meta["pred_classes"]
+        self.track_ids = meta["track_ids"]
+        self.gt_lookup = {name: i for i, name in enumerate(self.gt_classes)}
+        self.pred_lookup = {name: i for i, name in enumerate(self.pred_classes)}
+        self.track_lookup = {name: i for i, name in enumerate(self.track_ids)}
+        for name in INDEX_ARRAYS:
+            setattr(self, name, arrays[name])
+
+    def frames_with_classes(self, kind, classes, min_confidence=0):
+        """Returns the sorted frames containing at least one box of any of the given classes
+        Args:
+            kind: 'bounding' or 'pred_bounding'
+            classes: list of annotation names
+            min_confidence: for predicted boxes, only frames with a box of at least this confidence
+        Returns:
+            sorted array of frame numbers
+            """
+        lookup = self.gt_lookup if kind == "bounding" else self.pred_lookup
+        offsets = self.gt_offsets if kind == "bounding" else self.pred_offsets
+        frames = self.gt_frames if kind == "bounding" else self.pred_frames
+
+        parts = []
+        for name in classes:
+            if name not in lookup:
+                continue
+            start, stop = int(offsets[lookup[name]]), int(offsets[lookup[name] + 1])
+            class_frames = frames[start:stop]
+            if kind != "bounding":
+                class_frames = class_frames[self.pred_max_confidence[start:stop] >= min_confidence]
+            parts.append(class_frames)
+        if len(parts) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.unique(np.concatenate(parts))
+
+    def frames_with_track(self, track_id):
+        """Returns the sorted frames containing a GT or predicted box with the given track id"""
+        if track_id not in self.track_lookup:
+            return np.zeros(0, dtype=np.int64)
+        i = self.track_lookup[track_id]
+        return np.asarray(self.track_frames[int(self.track_offsets[i]):int(self.track_offsets[i + 1])])
+
+
+def next_frame(frames, frame_num):
+    """Returns the first frame in a sorted frame array after frame_num, wrapping around, or None if it is empty"""
+    if len(frames) == 0:
+        return None
+    i = int(np.searchsorted(frames, frame_num, side="right"))
+    return int(frames[i % len(frames)])
+
+
+def prev_frame(frames, frame_num):
+    """Returns the last frame in a sorted frame array before frame_num, wrapping around, or None if it is empty"""
+    if len(frames) == 0:
+        return None
+    i = int(np.searchsorted(frames, frame_num, side="left")) - 1
+    return int(frames[i % len(frames)])
+
+
+def _csr(keys, frames, num_keys):
+    """Groups (key, frame) pairs into CSR form with unique, sorted frames per key
+    Returns:
+        offsets: [num_keys + 1] array
+        frames: concatenated frame arrays
+        order: sort order of the input pairs
+        starts: positions in the sorted pairs where each unique (key, frame) pair starts, for reducing values per pair
+        """
+    order = np.lexsort((frames, keys))
+    keys = keys[order]
+    frames = frames[order]
+    first = np.ones(len(keys), dtype=bool)
+    first[1:] = (keys[1:] != keys[:-1]) | (frames[1:] != frames[:-1])
+    starts = np.flatnonzero(first)
+    offsets = np.zeros(num_keys + 1, dtype=np.int64)
+    np.add.at(offsets, keys[starts] + 1, 1)
+    return np.cumsum(offsets), frames[starts].astype(np.int64), order, starts
+
+
+def _gather(lct_path, kind, num_frames):
+    """Returns (frame numbers, class names per row, class ids, confidences, track ids) of every box of one kind"""
+    store = box_store.open_box_store(lct_path, kind)
+    if store is not None and len(store.dirty) == 0:
+        counts = np.diff(np.asarray(store.frame_offsets))
+        frames = np.repeat(np.arange(len(counts)), counts)
+        ids = np.asarray(store.ids)
+        tracks = [store.string(i) if i >= 0 else None for i in ids]
+        return frames, list(store.classes), np.asarray(store.class_ids), np.asarray(store.confidences), tracks
+
+    frames = []
+    classes = []
+    class_ids = []
+    confidences = []
+    tracks = []
+    for frame_num in range(num_frames):
+        try:
+            boxes = box_store.load_frame_arrays(lct_path, kind, frame_num)
+        except FileNotFoundError:
+            continue
+        frames += [frame_num] * len(boxes)
+        for name in boxes.annotations:
+            if name not in classes:
+                classes.append(name)
+            class_ids.append(classes.index(name))
+        confidences += list(boxes.confidences)
+        tracks += boxes.track_ids
+    return (np.array(frames, dtype=np.int64), classes, np.array(class_ids, dtype=np.int64),
+            np.array(confidences, dtype=np.float64), tracks)
+
+
+def build_frame_index(lct_path):
+    """Builds the frame index of a scene in memory
+    Args:
+        lct_path: path to LCT directory or scene pack
+    Returns:
+        FrameIndex object
+        """
+    num_frames = box_store.count_frames(lct_path, "bounding")
+    gt_rows, gt_classes, gt_ids, _, gt_tracks = _gather(lct_path, "bounding", num_frames)
+    pred_rows, pred_classes, pred_ids, pred_conf, pred_tracks = _gather(lct_path, "pred_bounding", num_frames)
+
+    arrays = {}
+    arrays["gt_offsets"], arrays["gt_frames"], _, _ = _csr(np.asarray(gt_ids, dtype=np.int64), gt_rows, len(gt_classes))
+
+    pred_offsets, pred_frames, order, starts = _csr(np.asarray(pred_ids, dtype=np.int64), pred_rows, len(pred_classes))
+    arrays["pred_offsets"] = pred_offsets
+    arrays["pred_frames"] = pred_frames
+    if len(starts) > 0:
+        arrays["pred_max_confidence"] = np.maximum.reduceat(pred_conf[order], starts)
+    else:
+        arrays["pred_max_confidence"] = np.zeros(0, dtype=np.float64)
+
+    # GT and predicted boxes share one track id table
+    track_ids = []
+    track_lookup = {}
+    track_keys = []
+    track_rows = []
+    for rows, tracks in ((gt_rows, gt_tracks), (pred_rows, pred_tracks)):
+        for frame_num, track in zip(rows, tracks):
+            if track is None:
+                continue
+            if track not in track_lookup:
+                track_lookup[track] = len(track_ids)
+                track_ids.append(track)
+            track_keys.append(track_lookup[track])
+            track_rows.append(frame_num)
+    arrays["track_offsets"], arrays["track_frames"], _, _ = _csr(np.array(track_keys, dtype=np.int64),
+                                                                 np.array(track_rows, dtype=np.int64), len(track_ids))
+
+    meta = {}
+    meta["version"] = INDEX_VERSION
+    meta["num_frames"] = num_frames
+    meta["gt_classes"] = gt_classes
+    meta["pred_classes"] = pred_classes
+    meta["track_ids"] = track_ids
+    # Every save changes the edit counts, so the index notices that it is out of date
+    meta["edits"] = box_store.edit_counts(lct_path)
+    return FrameIndex(meta, arrays)
+
+
+def write_frame_index(lct_path):
+    """Builds the frame index of an LCT directory and writes it to store/frame_index/
+    Args:
+        lct_path: path to LCT directory
+    Returns:
+        FrameIndex object
+        """
+    index = build_frame_index(lct_path)
+    path = os.path.join(lct_path, *INDEX_DIR.split("/"))
+    os.makedirs(path, exist_ok=True)
+    for name in INDEX_ARRAYS:
+        np.save(os.path.join(path, name + ".npy"), getattr(index, name))
+    # meta.json is written last, its presence marks the index as complete
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(index.meta, f)
+    return index
+
+
+def load_frame_index(lct_path):
+    """Loads the frame index written at conversion time
+    Args:
+        lct_path: path to LCT directory or scene pack
+    Returns:
+        FrameIndex object, or None if the scene has no index or boxes were edited since it was built
+        """
+    source = scene_loader.open_scene(lct_path)
+    if not source.exists(INDEX_DIR + "/meta.json"):
+        return None
+    meta = source.read_json(INDEX_DIR + "/meta.json")
+    if meta.get("version") != INDEX_VERSION or meta.get("edits") != box_store.edit_counts(lct_path):
+        return None
+    arrays = {name: source.load_npy(INDEX_DIR + "/" + name + ".npy") for name in INDEX_ARRAYS}
+    return FrameIndex(meta, arrays)
+
+
+class FrameIndexLoader:
+    """Loads the frame index of a scene, building it on a background thread when it is missing or out of date
+       The frames with false positives or unmatched GT boxes are matched on a background thread too"""
+    def __init__(self, lct_path):
+        self.lct_path = lct_path
+        self.index = load_frame_index(lct_path)
+        self.thread = None
+        self.error_key = None
+        self.error_result = None
+        self.error_thread = None
+        self.error_cancelled = threading.Event()
+        if self.index is None:
+            self.rebuild()
+
+    def rebuild(self):
+        """Starts building the index in the background, dropping the error frames matched with the old one"""
+        self.index = None
+        self.cancel()
+        self.thread = threading.Thread(target=self._build, daemon=True)
+        self.thread.start()
+
+    def _build(self):
+        index = build_frame_index(self.lct_path)
+        # Cache it on disk when we can, packs are read-only
+        if not scene_loader.is_pack(self.lct_path):
+            try:
+                index = write_frame_index(self.lct_path)
+            except OSError:
+                pass
+        self.index = index
+
+    def get(self):
+        """Returns the index, or None while it is still being built
+           Boxes saved by the editor make the index out of date, which starts a rebuild"""
+        index = self.index
+        if index is not None and index.meta["edits"] != box_store.edit_counts(self.lct_path):
+            self.rebuild()
+            return None
+        return index
+
+    def error_frames(self, mode, gt_classes, pred_classes, min_confidence, criterion=None):
+        """Returns the frames of error_frames for these settings, or None while the index is built or they are matched
+           Starts matching them if the settings or the boxes changed since the last request"""
+        index = self.get()
+        if index is None:
+            return None
+        # The edit counts change with every save, unlike the identity of the index object
+        key = (mode, tuple(sorted(gt_classes)), tuple(sorted(pred_classes)), min_confidence, criterion,
+               tuple(sorted(index.meta["edits"].items())))
+        if key == self.error_key:
+            return self.error_result
+        self.cancel()
+        self.error_key = key
+        self.error_thread = threading.Thread(target=self._match, args=(key, index, mode, list(gt_classes), list(pred_classes),
+                                                                       min_confidence, criterion, self.error_cancelled),
+                                             daemon=True)
+        self.error_thread.start()
+        return None
+
+    def _match(self, key, index, mode, gt_classes, pred_classes, min_confidence, criterion, cancelled):
+        frames = error_frames(self.lct_path, index, mode, gt_classes, pred_classes, min_confidence, criterion, cancelled)
+        if frames is None or cancelled.is_set() or key != self.error_key:
+            return
+        self.error_result = frames
+
+    def cancel(self):
+        """Stops matching error frames and forgets the last result"""
+        self.error_cancelled.set()
+        self.error_cancelled = threading.Event()
+        self.error_key = None
+        self.error_result = None
+
+
+def error_frames(lct_path, index, mode, gt_classes, pred_classes, min_confidence, criterion=None, cancelled=None):
+    """Returns the sorted frames that have false positives or unmatched GT boxes for a class selection
+       Only frames the index says contain the selected classes are matched
+    Args:
+        lct_path: path to LCT directory or scene pack
+        index: FrameIndex of the scene
+        mode: FALSE_POSITIVES or UNMATCHED_GT
+        gt_classes: selected GT annotation names
+        pred_classes: selected predicted annotation names
+        min_confidence: minimum confidence of the predicted boxes
+        criterion: matching.MatchCriterion object, default centre distance within matching.MATCH_DISTANCE
+        cancelled: optional threading.Event, the frames are not finished once it is set
+    Returns:
+        sorted array of frame numbers, or None if cancelled
+        """
+    if mode == FALSE_POSITIVES:
+        candidates = index.frames_with_classes("pred_bounding", pred_classes, min_confidence)
+    else:
+        candidates = index.frames_with_classes("bounding", gt_classes)
+
+    frames = []
+    for frame_num in candidates:
+        if cancelled is not None and cancelled.is_set():
+            return None
+        try:
+            gt = box_store.load_frame_arrays(lct_path, "bounding", int(frame_num))
+            pred = box_store.load_frame_arrays(lct_path, "pred_bounding", int(frame_num))
+        except FileNotFoundError:
+            continue
+        match = matching.match_frame_boxes(gt, pred, gt_classes, pred_classes, min_confidence, criterion)
+        if (mode == FALSE_POSITIVES and len(match.false_positives)) or (mode == UNMATCHED_GT and len(match.unmatched_gt)):
+            frames.append(int(frame_num))
+    return np.array(frames, dtype=np.int64)
@@ -0,0 +1,122 @@
+"""
+image_utils.py
+
+Loading camera images at the resolution they are displayed at.
+
+The image windows are much smaller than the camera images, so decoding full resolution JPEGs on
+every update is wasted work. Converters write a reduced-resolution copy of every image to
+store/cameras/<camera>/<n>.jpg. When a scene has no cache, JPEGs are decoded with DCT scaling
+(PIL's draft mode), which skips most of the decoding work for 1/2, 1/4 and 1/8 sizes.
+
+Boxes drawn onto a reduced image must be projected with intrinsics scaled by the same factors,
+see scale_intrinsics().
+"""
+import json
+import os
+import numpy as np
+from PIL import Image
+from utils import box_store
+from utils import scene_loader
+
+CACHE_DIR = box_store.STORE_DIR + "/cameras"
+CACHE_QUALITY = 90
+
+# Size of the image windows
+DISPLAY_SIZE = (640, 480)
+
+
+def fit_size(full_size, display_size):
+    """Returns the largest size with the aspect ratio of full_size that fits in display_size, never upscaling"""
+    scale = min(display_size[0] / full_size[0], display_size[1] / full_size[1], 1.0)
+    return (max(1, int(round(full_size[0] * scale))), max(1, int(round(full_size[1] * scale))))
+
+
+def scale_intrinsics(matrix, scale):
+    """Scales a 3x3 camera intrinsic matrix to a resized image
+    Args:
+        matrix: 3x3 intrinsic matrix of the full resolution image
+        scale: (x, y) ratio of the resized image size to the full image size
+    Returns:
+        3x3 numpy array
+        """
+    return np.diag([scale[0], scale[1], 1.0]) @ np.asarray(matrix, dtype=np.float64)
+
+
+def _cache_path(camera):
+    return CACHE_DIR + "/" + camera
+
+
+def load_display_image(lct_path, camera, frame_num, display_size=DISPLAY_SIZE):
+    """Loads a camera image at (about) the display resolution
+       Uses the reduced-resolution cache when it is large enough, and DCT-scaled decoding otherwise
+    Args:
+        lct_path: path to LCT directory or scene pack
+        camera: camera sensor name
+        frame_num: frame number
+        display_size: (width, height) the image is shown at
+    Returns:
+        image: writable [h, w, 3] uint8 array, so boxes can be drawn onto it
+        scale: (x, y) ratio of the returned image size to the full image size
+        full_size: (width, height) of the full resolution image
+        """
+    source = scene_loader.open_scene(lct_path)
+    cache = _cache_path(camera)
+    if source.exists(cache + "/meta.json"):
+        meta = source.read_json(cache + "/meta.json")
+        cached_path = cache + "/" + str(frame_num) + ".jpg"
+        if meta["size"][0] >= fit_size(meta["full_size"], display_size)[0] and source.exists(cached_path):
+            image = np.array(source.read_image(cached_path).convert("RGB"))
+            full_size = tuple(meta["full_size"])
+            return image, (image.shape[1] / full_size[0], image.shape[0] / full_size[1]), full_size
+
+    image = source.read_image("cameras/" + camera + "/" + str(frame_num) + ".jpg")
+    full_size = image.size
+    # draft() only applies to JPEGs, and picks the smallest DCT scale that is still >= the requested size
+    image.draft("RGB", fit_size(full_size, display_size))
+    image = np.array(image.convert("RGB"))
+    return image, (image.shape[1] / full_size[0], image.shape[0] / full_size[1]), full_size
+
+
+def load_full_image(lct_path, camera, frame_num):
+    """Loads a camera image at full resolution, eg: for exporting
+    Returns:
+        writable [h, w, 3] uint8 array
+        """
+    source = scene_loader.open_scene(lct_path)
+    return np.array(source.read_image("cameras/" + camera + "/" + str(frame_num) + ".jpg").convert("RGB"))
+
+
+def build_image_cache(lct_path, display_size=DISPLAY_SIZE):
+    """Writes the reduced-resolution copy of every camera image of an LCT directory to store/cameras/
+    Args:
+        lct_path: path to LCT directory
+        display_size: (width, height) the cached images should fit in
+    Returns:
+        None
+        """
+    cameras_path = os.path.join(lct_path, "cameras")
+    for camera in sorted(os.listdir(cameras_path)):
+        camera_path = os.path.join(cameras_path, camera)
+        if not os.path.isdir(camera_path):
+            continue
+        cache_path = os.path.join(lct_path, *_cache_path(camera).split("/"))
+        os.makedirs(cache_path, exist_ok=True)
+
+        full_size = None
+        size = None
+        for name in sorted(os.listdir(camera_path)):
+            stem, extension = os.path.splitext(name)
+            if extension != ".jpg" or not stem.isdigit():
+                continue
+            image = Image.open(os.path.join(camera_path, name))
+            full_size = image.size
+            size = fit_size(full_size, display_size)
+            image.draft("RGB", size)
+            image = image.convert("RGB").resize(size, Image.BILINEAR)
+            image.save(os.path.join(cache_path, name), quality=CACHE_QUALITY)
+
+        if full_size is None:
+            continue
+        # meta.json is written last, its presence marks the cache as complete
+        with open(os.path.join(cache_path, "meta.json"), "w") as f:
+            json.dump({"full_size": list(full_size), "size": list(size)}, f)
@@ -0,0 +1,272 @@
+"""
+lod_utils.py
+
+Level-of-detail pyramid for the point clouds of a scene.
+
+Every frame gets a pyramid of voxel-downsampled levels of its merged point cloud (all lidar
+sensors, ego frame), stored under store/lod/:
+
+    <n>.bin     points of every level in the .bin layout of pointcloud_utils, ordered by level, then tile
+    <n>.json    voxel size, point range and tiles of every level
+
+The levels are nested: voxel sizes halve from one level to the next, and each voxel keeps the first
+of its points, so every level only stores the points it adds to the level above it. Showing level k
+means showing points [0, levels[k]['end']) of the file, and refining never replaces points.
+Within a level, points are grouped into square XY tiles, each with its axis-aligned bounding volume.
+
+The full resolution cloud is not part of the pyramid, it is read from the sensor files. Frames
+viewed without a pyramid get one written by LodWriter, one frame at a time on a background thread.
+"""
+import json
+import os
+import queue
+import threading
+import numpy as np
+from utils import box_store
+from utils import pointcloud_utils
+from utils import scene_loader
+
+LOD_DIR = box_store.STORE_DIR + "/lod"
+LOD_VERSION = 1
+
+# Voxel size of every level in meters, coarse to fine. Each size must be half of the one before
+VOXEL_SIZES = (1.6, 0.8, 0.4, 0.2)
+TILE_SIZE = 32.0
+
+
+def _voxel_keys(points, size):
+    """Returns one integer key per point, equal for points in the same voxel"""
+    cells = np.floor(points / size).astype(np.int64)
+    cells -= cells.min(axis=0)
+    return np.ravel_multi_index(cells.T, cells.max(axis=0) + 1)
+
+
+def point_levels(points, voxel_sizes=VOXEL_SIZES):
+    """Assigns every point to the coarsest level it is part of
+    Args:
+        points: [n, 3] point array
+        voxel_sizes: voxel size of every level, coarse to fine
+    Returns:
+        [n] int array of level numbers, len(voxel_sizes) for points only in the full resolution cloud
+        """
+    levels = np.full(len(points), len(voxel_sizes), dtype=np.int64)
+    if len(points) == 0:
+        return levels
+    for level, size in enumerate(voxel_sizes):
+        # First point of every voxel, which is also the first point of its voxel on every finer level
+        _, first = np.unique(_voxel_keys(points, size), return_index=True)
+        levels[first] = np.minimum(levels[first], level)
+    return levels
+
+
+def build_frame_lod(points, voxel_sizes=VOXEL_SIZES, tile_size=TILE_SIZE):
+    """Builds the pyramid of one point cloud
+    Args:
+        points: [n, 3] point array
+        voxel_sizes: voxel size of every level, coarse to fine
+        tile_size: edge length of the XY tiles in meters
+    Returns:
+        lod_points: [m, 3] float32 array of the points of every level, ordered by level, then tile
+        meta: dictionary describing the levels and tiles
+        """
+    points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+    levels = point_levels(points, voxel_sizes)
+    keep = levels < len(voxel_sizes)
+    points = points[keep]
+    levels = levels[keep]
+
+    tiles = np.floor(points[:, :2] / tile_size).astype(np.int64)
+    order = np.lexsort((tiles[:, 1], tiles[:, 0], levels))
+    points = np.ascontiguousarray(points[order])
+    levels = levels[order]
+    tiles = tiles[order]
+
+    meta = {'version': LOD_VERSION, 'tile_size': tile_size, 'levels': []}
+    start = 0
+    for level, size in enumerate(voxel_sizes):
+        end = int(np.searchsorted(levels, level, side="right"))
+        # A new tile starts wherever the tile cell changes within the level
+        changes = np.flatnonzero(np.any(np.diff(tiles[start:end], axis=0) != 0, axis=1)) + 1
+        tile_starts = np.concatenate(([0], changes)) + start if end > start else np.zeros(0, dtype=np.int64)
+        tile_ends = np.append(tile_starts[1:], end)
+        level_tiles = []
+        if len(tile_starts) > 0:
+            mins = np.minimum.reduceat(points[start:end], tile_starts - start)
+            maxs = np.maximum.reduceat(points[start:end], tile_starts - start)
+            for i in range(len(tile_starts)):
+                level_tiles.append({'start': int(tile_starts[i]), 'end': int(tile_ends[i]),
+                                    'min': mins[i].tolist(), 'max': maxs[i].tolist()})
+        meta['levels'].append({'voxel_size': size, 'start': start, 'end': end, 'tiles': level_tiles})
+        start = end
+    return points, meta
+
+
+def lod_path(lct_path, frame_num):
+    """Returns the path of the pyramid file of one frame, without extension"""
+    return os.path.join(lct_path, *LOD_DIR.split("/"), str(frame_num))
+
+
+def save_frame_lod(lct_path, frame_num, lod):
+    """Writes a pyramid built in memory
+    Args:
+        lct_path: path to LCT directory
+        frame_num: frame number
+        lod: FrameLod object
+    Returns:
+        None
+        """
+    path = lod_path(lct_path, frame_num)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Both files are written under a temporary name and renamed into place, so readers never see them
+    # partially written. The .json file comes last, its presence marks the pyramid as complete
+    pointcloud_utils.write_bin(path + pointcloud_utils.BIN_EXTENSION + ".tmp", lod.points)
+    os.replace(path + pointcloud_utils.BIN_EXTENSION + ".tmp", path + pointcloud_utils.BIN_EXTENSION)
+    with open(path + ".json.tmp", "w") as f:
+        json.dump(lod.meta, f)
+    os.replace(path + ".json.tmp", path + ".json")
+
+
+def write_frame_lod(lct_path, frame_num, points, voxel_sizes=VOXEL_SIZES):
+    """Builds and writes the pyramid of one frame
+    Args:
+        lct_path: path to LCT directory
+        frame_num: frame number
+        points: [n, 3] merged point cloud of the frame, in the ego frame
+        voxel_sizes: voxel size of every level, coarse to fine
+    Returns:
+        None
+        """
+    save_frame_lod(lct_path, frame_num, FrameLod(*build_frame_lod(points, voxel_sizes)))
+
+
+def build_lod(lct_path, voxel_sizes=VOXEL_SIZES):
+    """Writes the pyramid of every frame of an LCT directory
+    Args:
+        lct_path: path to LCT directory
+        voxel_sizes: voxel size of every level, coarse to fine
+    Returns:
+        number of frames written
+        """
+    source = scene_loader.open_scene(lct_path)
+    sensors = sorted(source.listdir("pointcloud"))
+    frames = set()
+    for sensor in sensors:
+        for name in source.listdir("pointcloud/" + sensor):
+            stem, extension = os.path.splitext(name)
+            if stem.isdigit() and extension in pointcloud_utils.POINTCLOUD_EXTENSIONS:
+                frames.add(int(stem))
+
+    for frame_num in sorted(frames):
+        points = [source.read_points(sensor, frame_num) for sensor in sensors]
+        write_frame_lod(lct_path, frame_num, np.concatenate(points) if points else np.zeros((0, 3)), voxel_sizes)
+    return len(frames)
+
+
+class FrameLod:
+    """Pyramid of one frame"""
+    def __init__(self, points, meta, saved=True):
+        """
+        Args:
+            points: [m, 3] float32 array of the points of every level
+            meta: dictionary describing the levels and tiles, see build_frame_lod
+            saved: False for pyramids built in memory that are not written to the scene yet
+            """
+        self.points = points
+        self.meta = meta
+        self.levels = meta['levels']
+        self.saved = saved
+
+    @property
+    def num_levels(self):
+        return len(self.levels)
+
+    def level_points(self, level):
+        """Returns the points of levels [0, level], without copying them
+        Args:
+            level: finest level to include
+        Returns:
+            [n, 3] float32 array
+            """
+        return self.points[:self.levels[level]['end']]
+
+    def added_points(self, level):
+        """Returns only the points that level adds to the level above it"""
+        return self.points[self.levels[level]['start']:self.levels[level]['end']]
+
+    def tiles(self, level):
+        """Returns the tiles of the points added by one level
+        Returns:
+            list of dictionaries with 'start' and 'end' (point range) and 'min' and 'max' (bounding volume)
+            """
+        return self.levels[level]['tiles']
+
+
+def has_lod(lct_path, frame_num):
+    return scene_loader.open_scene(lct_path).exists(LOD_DIR + "/" + str(frame_num) + ".json")
+
+
+def load_frame_lod(lct_path, frame_num):
+    """Opens the pyramid of one frame
+    Args:
+        lct_path: path to LCT directory or scene pack
+        frame_num: frame number
+    Returns:
+        FrameLod object, or None if the frame has no pyramid
+        """
+    source = scene_loader.open_scene(lct_path)
+    path = LOD_DIR + "/" + str(frame_num)
+    if not source.exists(path + ".json"):
+        return None
+    meta = source.read_json(path + ".json")
+    if meta.get('version') != LOD_VERSION:
+        return None
+    points, _ = source.read_bin(path + pointcloud_utils.BIN_EXTENSION)
+    return FrameLod(points, meta)
+
+
+def lod_from_points(points, voxel_sizes=VOXEL_SIZES):
+    """Builds the pyramid of a frame that has none in memory, see LodWriter to write it"""
+    return FrameLod(*build_frame_lod(points, voxel_sizes), saved=False)
+
+
+class LodWriter:
+    """Writes the pyramids of frames viewed without one, one at a time on a single background thread"""
+    def __init__(self, lct_path):
+        self.lct_path = lct_path
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        # Frames queued or being written, each is written once however often it is viewed
+        self.pending = set()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def request(self, frame_num, points=None, lod=None):
+        """Queues writing the pyramid of a frame, unless it is already queued
+        Args:
+            frame_num: frame number
+            points: [n, 3] merged point cloud of the frame, used when lod is None
+            lod: FrameLod object already built in memory
+        Returns:
+            None
+            """
+        with self.lock:
+            if frame_num in self.pending:
+                return
+            self.pending.add(frame_num)
+        self.queue.put((frame_num, points, lod))
+
+    def _run(self):
+        while True:
+            (frame_num, points, lod) = self.queue.get()
+            try:
+                if not has_lod(self.lct_path, frame_num):
+                    if lod is None:
+                        lod = FrameLod(*build_frame_lod(points))
+                    save_frame_lod(self.lct_path, frame_num, lod)
+            except OSError:
+                # Read-only scenes are still viewable, just without the pyramid
+                pass
+            finally:
+                with self.lock:
+                    self.pending.discard(frame_num)
+                self.queue.task_done()
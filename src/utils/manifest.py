@@ -0,0 +1,204 @@
+"""
+manifest.py
+
+Scene manifest written at conversion time.
+
+manifest.json in the scene root holds the frame count, the sensors, the image size of every
+camera and the class catalog of the GT and predicted boxes. Per-frame class histograms are
+stored next to the box store as .npy arrays:
+
+    store/manifest/gt_histogram.npy     [frames, gt classes] box counts
+    store/manifest/pred_histogram.npy   [frames, pred classes, 101] counts of boxes with confidence >= t
+
+so the viewer can start and fill its per-class counters without reading every frame. Frames saved
+by the editor after conversion are read from their boxes.json instead, for both the class catalog
+and the counters.
+"""
+import json
+import os
+import numpy as np
+from utils import box_store
+from utils import scene_loader
+
+MANIFEST_NAME = "manifest.json"
+MANIFEST_DIR = box_store.STORE_DIR + "/manifest"
+MANIFEST_VERSION = 1
+
+# Predicted confidences are integers in [0, 100], one histogram bucket per value
+NUM_CONFIDENCE_BUCKETS = 101
+
+
+class Manifest:
+    """Reader for the manifest of one scene"""
+    def __init__(self, source, meta):
+        self.source = source
+        self.lct_path = source.path
+        self.meta = meta
+        self.num_frames = meta["num_frames"]
+        self.camera_sensors = meta["camera_sensors"]
+        self.lidar_sensors = meta["lidar_sensors"]
+        self.image_sizes = meta["image_sizes"]
+        self.gt_classes = meta["gt_classes"]
+        self.pred_classes = meta["pred_classes"]
+        self.gt_histogram = source.load_npy(MANIFEST_DIR + "/gt_histogram.npy")
+        self.pred_histogram = source.load_npy(MANIFEST_DIR + "/pred_histogram.npy")
+
+    def classes(self, kind):
+        """Returns the class catalog of one kind of boxes, with the classes added by the editor since conversion
+        Args:
+            kind: 'bounding' or 'pred_bounding'
+        Returns:
+            list of annotation names, those written at conversion time first
+            """
+        classes = list(self.gt_classes if kind == "bounding" else self.pred_classes)
+        store = box_store.open_box_store(self.lct_path, kind)
+        if store is not None:
+            edited = sorted(store.dirty)
+        elif box_store.edit_counts(self.lct_path)[kind] > 0:
+            # Without a box store there is no record of which frames were saved, so every frame is read
+            edited = range(self.num_frames)
+        else:
+            edited = []
+        for frame_num in edited:
+            try:
+                boxes = box_store.load_frame_boxes(self.lct_path, kind, frame_num)['boxes']
+            except FileNotFoundError:
+                continue
+            for box in boxes:
+                if box['annotation'] not in classes:
+                    classes.append(box['annotation'])
+        return classes
+
+    def class_counts(self, kind, frame_num, min_confidence=0):
+        """Returns the number of boxes of each class in one frame
+        Args:
+            kind: 'bounding' or 'pred_bounding'
+            frame_num: frame number
+            min_confidence: only count boxes with at least this confidence
+        Returns:
+            dictionary from annotation name to box count
+            """
+        # Frames edited after conversion are counted from their boxes.json
+        store = box_store.open_box_store(self.lct_path, kind)
+        if store is not None and frame_num in store.dirty:
+            counts = {}
+            for box in box_store.load_frame_boxes(self.lct_path, kind, frame_num)['boxes']:
+                if box['confidence'] >= min_confidence:
+                    counts[box['annotation']] = counts.get(box['annotation'], 0) + 1
+            return counts
+
+        if kind == "bounding":
+            classes = self.gt_classes
+            row = self.gt_histogram[frame_num]
+        else:
+            classes = self.pred_classes
+            bucket = int(np.clip(np.ceil(min_confidence), 0, NUM_CONFIDENCE_BUCKETS - 1))
+            row = self.pred_histogram[frame_num, :, bucket]
+        return {name: int(count) for name, count in zip(classes, row)}
+
+
+def has_manifest(lct_path):
+    return scene_loader.open_scene(lct_path).exists(MANIFEST_NAME)
+
+
+def load_manifest(lct_path):
+    """Loads the manifest of a scene
+    Args:
+        lct_path: path to LCT directory or scene pack
+    Returns:
+        Manifest object, or None if the scene was converted without one
+        """
+    source = scene_loader.open_scene(lct_path)
+    if not source.exists(MANIFEST_NAME):
+        return None
+    meta = source.read_json(MANIFEST_NAME)
+    if meta.get("version") != MANIFEST_VERSION:
+        return None
+    return Manifest(source, meta)
+
+
+def _frame_boxes(lct_path, kind, num_frames):
+    """Returns (frame numbers, annotations, confidences) of every box of one kind"""
+    frames = []
+    annotations = []
+    confidences = []
+    for frame_num in range(num_frames):
+        try:
+            boxes = box_store.load_frame_boxes(lct_path, kind, frame_num)['boxes']
+        except FileNotFoundError:
+            continue
+        for box in boxes:
+            frames.append(frame_num)
+            annotations.append(box['annotation'])
+            confidences.append(box['confidence'])
+    return np.array(frames, dtype=np.int64), annotations, np.array(confidences, dtype=np.float64)
+
+
+def _histogram_inputs(lct_path, kind, num_frames):
+    """Returns (frame numbers, class ids, confidences, class catalog) of every box of one kind"""
+    store = box_store.open_box_store(lct_path, kind)
+    if store is not None and len(store.dirty) == 0:
+        # Straight from the columnar store, without building a dictionary per box
+        counts = np.diff(np.asarray(store.frame_offsets))
+        frames = np.repeat(np.arange(len(counts)), counts)
+        keep = frames < num_frames
+        return frames[keep], np.asarray(store.class_ids)[keep], np.asarray(store.confidences)[keep], list(store.classes)
+
+    frames, annotations, confidences = _frame_boxes(lct_path, kind, num_frames)
+    classes = []
+    lookup = {}
+    for annotation in annotations:
+        if annotation not in lookup:
+            lookup[annotation] = len(classes)
+            classes.append(annotation)
+    class_ids = np.array([lookup[annotation] for annotation in annotations], dtype=np.int64)
+    return frames, class_ids, confidences, classes
+
+
+def build_manifest(lct_path):
+    """Scans a converted scene and writes its manifest
+    Args:
+        lct_path: path to LCT directory
+    Returns:
+        None
+        """
+    source = scene_loader.open_scene(lct_path)
+    num_frames = len([name for name in source.listdir("bounding") if name.isdigit()])
+    camera_sensors = sorted(source.listdir("cameras"))
+    lidar_sensors = sorted(source.listdir("pointcloud"))
+
+    # Only the image header is read to get the size
+    image_sizes = {}
+    for camera in camera_sensors:
+        images = sorted((name for name in source.listdir("cameras/" + camera) if name.endswith(".jpg")),
+                        key=lambda name: int(os.path.splitext(name)[0]) if os.path.splitext(name)[0].isdigit() else -1)
+        if len(images) > 0:
+            with source.read_image("cameras/" + camera + "/" + images[0]) as image:
+                image_sizes[camera] = list(image.size)
+
+    frames, class_ids, _, gt_classes = _histogram_inputs(lct_path, "bounding", num_frames)
+    gt_histogram = np.zeros((num_frames, len(gt_classes)), dtype=np.int32)
+    np.add.at(gt_histogram, (frames, class_ids), 1)
+
+    frames, class_ids, confidences, pred_classes = _histogram_inputs(lct_path, "pred_bounding", num_frames)
+    buckets = np.clip(np.floor(confidences), 0, NUM_CONFIDENCE_BUCKETS - 1).astype(np.int64)
+    pred_histogram = np.zeros((num_frames, len(pred_classes), NUM_CONFIDENCE_BUCKETS), dtype=np.int32)
+    np.add.at(pred_histogram, (frames, class_ids, buckets), 1)
+    # Turn per-bucket counts into counts of boxes with confidence >= bucket
+    pred_histogram = np.ascontiguousarray(np.flip(np.cumsum(np.flip(pred_histogram, axis=2), axis=2), axis=2))
+
+    histogram_path = os.path.join(lct_path, *MANIFEST_DIR.split("/"))
+    os.makedirs(histogram_path, exist_ok=True)
+    np.save(os.path.join(histogram_path, "gt_histogram.npy"), gt_histogram)
+    np.save(os.path.join(histogram_path, "pred_histogram.npy"), pred_histogram)
+
+    meta = {}
+    meta['version'] = MANIFEST_VERSION
+    meta['num_frames'] = num_frames
+    meta['camera_sensors'] = camera_sensors
+    meta['lidar_sensors'] = lidar_sensors
+    meta['image_sizes'] = image_sizes
+    meta['gt_classes'] = gt_classes
+    meta['pred_classes'] = pred_classes
+    with open(os.path.join(lct_path, MANIFEST_NAME), "w") as f:
+        json.dump(meta, f)
@@ -0,0 +1,182 @@
+import unittest
+import os
+import sys
+import numpy as np
+
+# Run from anywhere, eg: python utils/matching-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import geometry_utils
+from utils import matching
+from utils import precision_recall
+
+GT_CLASSES = ["car", "truck", "pedestrian"]
+PRED_CLASSES = ["car_pred", "truck_pred", "pedestrian_pred"]
+NUM_FRAMES = 300
+
+
+def random_frame(rng):
+    """Returns GT and predicted boxes in the boxes.json layout, with predictions near the GT boxes,
+       some of them of the wrong class, and false positives"""
+    num_gt = int(rng.integers(0, 25))
+    gt = []
+    for _ in range(num_gt):
+        gt.append({'origin': rng.uniform(-6, 6, 3).tolist(), 'size': [2.0, 4.5, 1.6], 'rotation': [1.0, 0.0, 0.0, 0.0],
+                   'annotation': GT_CLASSES[int(rng.integers(len(GT_CLASSES)))], 'confidence': 101})
+    pred = []
+    for box in gt:
+        if rng.uniform() < 0.8:
+            origin = (np.array(box['origin']) + rng.normal(0, 0.3, 3)).tolist()
+            pred.append({'origin': origin, 'size': [2.0, 4.5, 1.6], 'rotation': [1.0, 0.0, 0.0, 0.0],
+                         'annotation': PRED_CLASSES[int(rng.integers(len(PRED_CLASSES)))],
+                         'confidence': int(rng.integers(0, 101))})
+    for _ in range(int(rng.integers(0, 8))):
+        pred.append({'origin': rng.uniform(-6, 6, 3).tolist(), 'size': [2.0, 4.5, 1.6], 'rotation': [1.0, 0.0, 0.0, 0.0],
+                     'annotation': PRED_CLASSES[int(rng.integers(len(PRED_CLASSES)))], 'confidence': int(rng.integers(0, 101))})
+    return {'boxes': gt}, {'boxes': pred}
+
+
+def baseline_match(gt, pred, gt_classes, pred_classes, min_confidence, min_dist=matching.MATCH_DISTANCE):
+    """The greedy loops update_bounding ran before matching.py, returning the unmatched GT and
+       predicted boxes and the mismatched pairs as indices into the frame's box lists"""
+    order = sorted(range(len(pred['boxes'])), key=lambda i: pred['boxes'][i]['confidence'], reverse=True)
+    sorted_list = [i for i in order if pred['boxes'][i]['annotation'] in pred_classes and pred['boxes'][i]['confidence'] >= min_confidence]
+    pred_matched = [False] * len(sorted_list)
+    gt_list = [i for i, box in enumerate(gt['boxes']) if box['annotation'] in gt_classes]
+    gt_matched = [False] * len(gt_list)
+    for (pred_idx, p) in enumerate(sorted_list):
+        dist = float('inf')
+        for (i, g) in enumerate(gt_list):
+            temp_dist = geometry_utils.box_dist(pred['boxes'][p], gt['boxes'][g])
+            if not gt_matched[i]:
+                if temp_dist < dist:
+                    dist = temp_dist
+                    match_index = i
+        if dist <= min_dist:
+            gt_matched[match_index] = True
+            pred_matched[pred_idx] = True
+
+    false_positives = [p for (p, matched) in zip(sorted_list, pred_matched) if not matched]
+    unmatched_gt = [g for (g, matched) in zip(gt_list, gt_matched) if not matched]
+    mismatches = []
+    for p, pred_box in enumerate(pred['boxes']):
+        if pred_box['confidence'] < min_confidence:
+            continue
+        for g in gt_list:
+            if geometry_utils.box_dist(pred_box, gt['boxes'][g]) <= min_dist and pred_box['annotation'] not in pred_classes:
+                mismatches.append((p, g))
+    return false_positives, unmatched_gt, mismatches
+
+
+# tests that the vectorized matcher gives the same results as the loops it replaced
+class TestBaseline(unittest.TestCase):
+    def check_frames(self, seed):
+        rng = np.random.default_rng(seed)
+        for _ in range(NUM_FRAMES):
+            gt, pred = random_frame(rng)
+            gt_classes = list(rng.choice(GT_CLASSES, int(rng.integers(1, 4)), replace=False))
+            pred_classes = list(rng.choice(PRED_CLASSES, int(rng.integers(1, 4)), replace=False))
+            min_confidence = int(rng.integers(0, 101))
+            match = matching.match_frame_boxes(gt, pred, gt_classes, pred_classes, min_confidence)
+            (false_positives, unmatched_gt, mismatches) = baseline_match(gt, pred, gt_classes, pred_classes, min_confidence)
+            self.assertEqual(list(match.false_positives), false_positives)
+            self.assertEqual(list(match.unmatched_gt), unmatched_gt)
+            self.assertEqual([tuple(pair) for pair in match.mismatches.tolist()], mismatches)
+
+    def test_distance_matrix(self):
+        self.check_frames(0)
+
+    def test_kdtree(self):
+        # Every frame finds its close pairs with the KD-tree instead of the dense distance matrix
+        kdtree_min_pairs = matching.KDTREE_MIN_PAIRS
+        matching.KDTREE_MIN_PAIRS = 0
+        try:
+            self.check_frames(1)
+        finally:
+            matching.KDTREE_MIN_PAIRS = kdtree_min_pairs
+
+
+# tests thresholds that differ by GT class
+class TestCriterion(unittest.TestCase):
+    def setUp(self):
+        box = {'size': [2.0, 4.5, 1.6], 'rotation': [1.0, 0.0, 0.0, 0.0], 'confidence': 101}
+        self.gt = {'boxes': [dict(box, origin=[0.0, 0.0, 0.0], annotation="car"),
+                             dict(box, origin=[20.0, 0.0, 0.0], annotation="truck")]}
+        self.pred = {'boxes': [dict(box, origin=[0.8, 0.0, 0.0], annotation="car_pred", confidence=90),
+                               dict(box, origin=[20.8, 0.0, 0.0], annotation="truck_pred", confidence=80)]}
+
+    def test_default_threshold(self):
+        match = matching.match_frame_boxes(self.gt, self.pred, GT_CLASSES, PRED_CLASSES, 0)
+        self.assertEqual(list(match.false_positives), [0, 1])
+
+    def test_class_thresholds(self):
+        criterion = matching.MatchCriterion(matching.CENTER_DISTANCE, 0.5, {"truck": 1.0})
+        match = matching.match_frame_boxes(self.gt, self.pred, GT_CLASSES, PRED_CLASSES, 0, criterion)
+        self.assertEqual(list(match.false_positives), [0])
+        self.assertEqual(list(match.unmatched_gt), [0])
+
+    def test_iou(self):
+        # Boxes offset by 0.8 m along their 4.5 m length overlap by 3.7 / 5.3 in BEV
+        criterion = matching.MatchCriterion(matching.BEV_IOU, 0.6)
+        match = matching.match_frame_boxes(self.gt, self.pred, GT_CLASSES, PRED_CLASSES, 0, criterion)
+        self.assertEqual(len(match.false_positives), 0)
+        criterion = matching.MatchCriterion(matching.BEV_IOU, 0.8)
+        match = matching.match_frame_boxes(self.gt, self.pred, GT_CLASSES, PRED_CLASSES, 0, criterion)
+        self.assertEqual(list(match.false_positives), [0, 1])
+
+    def test_parse_class_thresholds(self):
+        self.assertEqual(matching.parse_class_thresholds("car=0.7, bus = 0.6,"), {"car": 0.7, "bus": 0.6})
+        with self.assertRaises(ValueError):
+            matching.parse_class_thresholds("car")
+        with self.assertRaises(ValueError):
+            matching.MatchCriterion("nearest")
+
+
+# tests that the matches sliced from one sweep are those of matching again at every threshold
+class TestSweep(unittest.TestCase):
+    def check_frames(self, seed, criterion=None):
+        rng = np.random.default_rng(seed)
+        for _ in range(NUM_FRAMES // 3):
+            gt, pred = random_frame(rng)
+            gt_classes = list(rng.choice(GT_CLASSES, int(rng.integers(1, 4)), replace=False))
+            pred_classes = list(rng.choice(PRED_CLASSES, int(rng.integers(1, 4)), replace=False))
+            sweep = matching.sweep_frame_boxes(gt, pred, gt_classes, pred_classes, criterion)
+            for min_confidence in range(0, 102):
+                match = matching.match_frame_boxes(gt, pred, gt_classes, pred_classes, min_confidence, criterion)
+                self.assertEqual(list(sweep.predictions(min_confidence)), list(match.pred_order))
+                self.assertEqual(list(sweep.false_positives(min_confidence)), list(match.false_positives))
+                self.assertEqual(sorted(sweep.unmatched_gt(min_confidence)), sorted(match.unmatched_gt))
+                self.assertEqual(sorted(map(tuple, sweep.class_mismatches(min_confidence).tolist())),
+                                 sorted(map(tuple, match.mismatches.tolist())))
+                self.assertEqual(sweep.num_true_positives(min_confidence), len(match.pred_order) - len(match.false_positives))
+
+    def test_distance(self):
+        self.check_frames(2)
+
+    def test_iou(self):
+        self.check_frames(3, matching.MatchCriterion(matching.BEV_IOU, 0.3))
+
+    def test_precision_recall(self):
+        # The scene totals of the sweeps give the precision and recall of matching every frame again
+        rng = np.random.default_rng(4)
+        frames = [random_frame(rng) for _ in range(30)]
+        sweeps = [matching.sweep_frame_boxes(gt, pred, GT_CLASSES, PRED_CLASSES) for (gt, pred) in frames]
+        pred_confidences = []
+        tp_confidences = []
+        for (gt, pred), sweep in zip(frames, sweeps):
+            predictions = sweep.predictions(-np.inf)
+            matched = np.setdiff1d(predictions, sweep.false_positives(-np.inf))
+            pred_confidences += [pred['boxes'][p]['confidence'] for p in predictions]
+            tp_confidences += [pred['boxes'][p]['confidence'] for p in matched]
+        curve = precision_recall.PrecisionRecall(pred_confidences, tp_confidences, sum(sweep.num_gt for sweep in sweeps))
+        for min_confidence in range(0, 102, 5):
+            matches = [matching.match_frame_boxes(gt, pred, GT_CLASSES, PRED_CLASSES, min_confidence) for (gt, pred) in frames]
+            num_pred = sum(len(match.pred_order) for match in matches)
+            num_tp = num_pred - sum(len(match.false_positives) for match in matches)
+            num_gt = sum(len(match.gt_selected) for match in matches)
+            (precision, recall) = curve.at(min_confidence)
+            self.assertAlmostEqual(precision, num_tp / num_pred if num_pred > 0 else 1.0)
+            self.assertAlmostEqual(recall, num_tp / num_gt)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,323 @@
+"""
+matching.py
+
+Matching of predicted boxes to GT boxes, shared by the viewer, the error scan and the frame search.
+
+Predictions are matched greedily in order of decreasing confidence: every prediction takes the
+closest GT box that is still unmatched and within the threshold of its class. Closeness is given by
+a MatchCriterion, either the distance between the box centres (within MATCH_DISTANCE by default) or
+the BEV or 3D IoU of the rotated boxes (see box_iou.py), with an optional threshold per GT class.
+Only pairs within the threshold can ever match, so they are found first, from a NumPy distance
+matrix or, for large frames, a KD-tree (for IoU, the overlapping pairs of box_iou.iou_matrix), and
+the greedy assignment only walks over those pairs. The same pairs give the class mismatches,
+predictions of an unselected class sitting on a selected GT box.
+
+A prediction's match only depends on the more confident predictions, so raising the confidence
+threshold just drops the least confident ones and leaves the other matches as they are. A
+ConfidenceSweep matches a frame once, with every prediction, and keeps the predictions, the false
+positives and the mismatches by decreasing confidence and the GT boxes by the confidence of their
+match. Their boxes at any threshold are then slices found by binary search.
+"""
+import numpy as np
+from utils import box_iou
+from utils import box_store
+
+# Maximum distance between the centres of a prediction and the GT box it matches, in meters
+MATCH_DISTANCE = 0.5
+# Minimum IoU of a prediction and the GT box it matches
+MATCH_IOU = 0.5
+# Frames with more (prediction, GT) pairs than this find the close pairs with a KD-tree
+KDTREE_MIN_PAIRS = 250000
+
+CENTER_DISTANCE = "distance"
+BEV_IOU = "bev_iou"
+IOU_3D = "iou_3d"
+MATCH_MODES = [CENTER_DISTANCE, BEV_IOU, IOU_3D]
+
+
+class MatchCriterion:
+    """How close a prediction has to be to a GT box to match it"""
+    def __init__(self, mode=CENTER_DISTANCE, threshold=None, class_thresholds=None):
+        """
+        Args:
+            mode: CENTER_DISTANCE, BEV_IOU or IOU_3D
+            threshold: maximum centre distance in meters, or minimum IoU, default MATCH_DISTANCE or MATCH_IOU
+            class_thresholds: optional dictionary of GT annotation name -> threshold used instead for that class
+            """
+        if mode not in MATCH_MODES:
+            raise ValueError("Unknown matching mode " + str(mode))
+        self.mode = mode
+        if threshold is None:
+            threshold = MATCH_DISTANCE if mode == CENTER_DISTANCE else MATCH_IOU
+        self.threshold = float(threshold)
+        self.class_thresholds = {name: float(value) for (name, value) in (class_thresholds or {}).items()}
+
+    def thresholds(self, names):
+        """Returns a [len(names)] array with the threshold of every GT annotation name"""
+        return np.array([self.class_thresholds.get(name, self.threshold) for name in names], dtype=np.float64)
+
+    def to_dict(self):
+        """Returns the criterion as a JSON serializable dictionary"""
+        return {'mode': self.mode, 'threshold': self.threshold, 'class_thresholds': dict(sorted(self.class_thresholds.items()))}
+
+
+def parse_class_thresholds(text):
+    """Parses per-class thresholds written as "name=value,name=value"
+    Returns:
+        dictionary of annotation name -> threshold
+    Raises:
+        ValueError if text is not in that form
+        """
+    thresholds = {}
+    for item in text.split(","):
+        if item.strip() == "":
+            continue
+        (name, value) = item.rsplit("=", 1)
+        thresholds[name.strip()] = float(value)
+    return thresholds
+
+
+class FrameMatch:
+    """Result of matching the boxes of one frame, every index refers to the frame's box lists"""
+    def __init__(self, pred_order, pred_matches, gt_matches, gt_selected, mismatches):
+        """
+        Args:
+            pred_order: indices of the selected predictions above the minimum confidence, by decreasing confidence
+            pred_matches: [num predictions] index of the GT box every prediction is matched to, -1 if none
+            gt_matches: [num GT] index of the prediction every GT box is matched to, -1 if none
+            gt_selected: indices of the selected GT boxes
+            mismatches: [k, 2] (prediction, GT) pairs of predictions of an unselected class within the
+                        cutoff of a selected GT box, in prediction then GT order
+            """
+        self.pred_order = pred_order
+        self.pred_matches = pred_matches
+        self.gt_matches = gt_matches
+        self.gt_selected = gt_selected
+        self.mismatches = mismatches
+
+    @property
+    def false_positives(self):
+        """Indices of the selected predictions without a match, by decreasing confidence"""
+        return self.pred_order[self.pred_matches[self.pred_order] < 0]
+
+    @property
+    def unmatched_gt(self):
+        """Indices of the selected GT boxes without a match"""
+        return self.gt_selected[self.gt_matches[self.gt_selected] < 0]
+
+
+def distances(a, b):
+    """Returns the distances between the rows of two [n, 3] arrays, computed like geometry_utils.box_dist"""
+    d = a - b
+    return np.sqrt(d[..., 0] * d[..., 0] + d[..., 1] * d[..., 1] + d[..., 2] * d[..., 2])
+
+
+def close_pairs(pred_origins, gt_origins, max_distance=MATCH_DISTANCE):
+    """Finds every (prediction, GT) pair whose centres are within max_distance
+    Args:
+        pred_origins: [p, 3] centres of the predictions
+        gt_origins: [g, 3] centres of the GT boxes
+        max_distance: cutoff in meters
+    Returns:
+        pred: [k] prediction index of every pair
+        gt: [k] GT index of every pair
+        dist: [k] distance of every pair
+        """
+    if len(pred_origins) == 0 or len(gt_origins) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    if len(pred_origins) * len(gt_origins) <= KDTREE_MIN_PAIRS:
+        dist = distances(pred_origins[:, None, :], gt_origins[None, :, :])
+        pred, gt = np.nonzero(dist <= max_distance)
+        return pred, gt, dist[pred, gt]
+
+    # scipy is only imported by frames this large, so opening the viewer does not load it
+    from scipy.spatial import cKDTree
+    # The tree is queried with a slightly larger radius, the cutoff is applied to the exact distances
+    pairs = cKDTree(pred_origins).query_ball_tree(cKDTree(gt_origins), max_distance * (1 + 1e-9) + 1e-12)
+    counts = np.array([len(gts) for gts in pairs], dtype=np.int64)
+    pred = np.repeat(np.arange(len(pred_origins)), counts)
+    gt = np.array([g for gts in pairs for g in gts], dtype=np.int64)
+    dist = distances(pred_origins[pred], gt_origins[gt])
+    keep = dist <= max_distance
+    return pred[keep], gt[keep], dist[keep]
+
+
+def candidate_pairs(gt, gt_indices, pred, pred_indices, criterion):
+    """Finds every (prediction, GT) pair that is close enough to match
+    Args:
+        gt: FrameBoxes of the GT boxes
+        gt_indices: indices of the GT boxes to consider
+        pred: FrameBoxes of the predictions
+        pred_indices: indices of the predictions to consider
+        criterion: MatchCriterion object
+    Returns:
+        pred: [k] prediction index of every pair
+        gt: [k] GT index of every pair
+        cost: [k] distance, or negated IoU, of every pair, lower is closer
+        """
+    if len(gt_indices) == 0 or len(pred_indices) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0)
+    thresholds = criterion.thresholds([gt.classes[c] for c in np.asarray(gt.class_ids)[gt_indices]])
+    gt_origins = np.asarray(gt.origins, dtype=np.float64)[gt_indices]
+    pred_origins = np.asarray(pred.origins, dtype=np.float64)[pred_indices]
+    if criterion.mode == CENTER_DISTANCE:
+        (p, g, cost) = close_pairs(pred_origins, gt_origins, thresholds.max())
+        keep = cost <= thresholds[g]
+        return pred_indices[p[keep]], gt_indices[g[keep]], cost[keep]
+
+    ious = box_iou.iou_matrix(pred_origins, np.asarray(pred.sizes)[pred_indices], np.asarray(pred.rotations)[pred_indices],
+                              gt_origins, np.asarray(gt.sizes)[gt_indices], np.asarray(gt.rotations)[gt_indices],
+                              box_iou.BEV if criterion.mode == BEV_IOU else box_iou.IOU_3D)
+    (p, g) = np.nonzero((ious > 0) & (ious >= thresholds[None, :]))
+    return pred_indices[p], gt_indices[g], -ious[p, g]
+
+
+def match_boxes(gt, gt_selected, pred, pred_selected, min_confidence, criterion=None):
+    """Matches the predictions of one frame to its GT boxes
+    Args:
+        gt: FrameBoxes of the GT boxes
+        gt_selected: [g] bool array, True for the GT boxes of the selected classes
+        pred: FrameBoxes of the predictions
+        pred_selected: [p] bool array, True for the predictions of the selected classes
+        min_confidence: predictions below this confidence are ignored
+        criterion: MatchCriterion object, default centre distance within MATCH_DISTANCE
+    Returns:
+        FrameMatch object
+        """
+    if criterion is None:
+        criterion = MatchCriterion()
+    pred_confidences = np.asarray(pred.confidences, dtype=np.float64)
+    gt_selected = np.flatnonzero(gt_selected)
+    candidates = np.flatnonzero(pred_confidences >= min_confidence)
+    pred_selected = np.asarray(pred_selected, dtype=bool)
+
+    # Stable, so equally confident predictions keep their order like sorted(reverse=True) does
+    pred_order = candidates[pred_selected[candidates]]
+    pred_order = pred_order[np.argsort(-pred_confidences[pred_order], kind="stable")]
+
+    # Pairs of every confident prediction with every selected GT box
+    (pred_pairs, gt_pairs, cost) = candidate_pairs(gt, gt_selected, pred, candidates, criterion)
+
+    mismatched = ~pred_selected[pred_pairs]
+    order = np.lexsort((gt_pairs[mismatched], pred_pairs[mismatched]))
+    mismatches = np.stack((pred_pairs[mismatched][order], gt_pairs[mismatched][order]), axis=1).reshape(-1, 2)
+
+    # Pairs of every prediction in confidence order, closest GT first, the lowest GT index on ties
+    (pred_pairs, gt_pairs, cost) = (pred_pairs[~mismatched], gt_pairs[~mismatched], cost[~mismatched])
+    rank = np.empty(len(pred_confidences), dtype=np.int64)
+    rank[pred_order] = np.arange(len(pred_order))
+    order = np.lexsort((gt_pairs, cost, rank[pred_pairs]))
+    pred_matches = np.full(len(pred_confidences), -1, dtype=np.int64)
+    gt_matches = np.full(len(gt.class_ids), -1, dtype=np.int64)
+    for p, g in zip(pred_pairs[order].tolist(), gt_pairs[order].tolist()):
+        if pred_matches[p] < 0 and gt_matches[g] < 0:
+            pred_matches[p] = g
+            gt_matches[g] = p
+    return FrameMatch(pred_order, pred_matches, gt_matches, gt_selected, mismatches)
+
+
+def select(frame, classes):
+    """Returns a [num boxes] bool array, True for the boxes of a FrameBoxes object whose annotation is in classes"""
+    classes = set(classes)
+    class_ids = [i for i, name in enumerate(frame.classes) if name in classes]
+    return np.isin(frame.class_ids, class_ids)
+
+
+def match_frame_boxes(gt, pred, gt_classes, pred_classes, min_confidence, criterion=None):
+    """Matches the boxes of one frame
+    Args:
+        gt: FrameBoxes of the GT boxes, or a dictionary with a 'boxes' list
+        pred: FrameBoxes of the predictions, or a dictionary with a 'boxes' list
+        gt_classes: selected GT annotation names
+        pred_classes: selected predicted annotation names
+        min_confidence: predictions below this confidence are ignored
+        criterion: MatchCriterion object, default centre distance within MATCH_DISTANCE
+    Returns:
+        FrameMatch object
+        """
+    if isinstance(gt, dict):
+        gt = box_store.frame_from_dict(gt, [])
+    if isinstance(pred, dict):
+        pred = box_store.frame_from_dict(pred, [])
+    return match_boxes(gt, select(gt, gt_classes), pred, select(pred, pred_classes), min_confidence, criterion)
+
+
+class ConfidenceSweep:
+    """Matching of one frame at every confidence threshold, see the module docstring"""
+    def __init__(self, match, pred_confidences):
+        """
+        Args:
+            match: FrameMatch of the frame with every prediction
+            pred_confidences: [num predictions] confidences
+            """
+        pred_confidences = np.asarray(pred_confidences, dtype=np.float64)
+        self.pred_order = match.pred_order
+        # Negated, so the searches run over ascending arrays
+        self.pred_keys = -pred_confidences[self.pred_order]
+        matched = match.pred_matches[self.pred_order] >= 0
+        self.fp_order = self.pred_order[~matched]
+        self.fp_keys = self.pred_keys[~matched]
+        self.tp_keys = self.pred_keys[matched]
+
+        # GT boxes by decreasing confidence of the prediction they are matched to, never matched ones last
+        gt_selected = match.gt_selected
+        gt_keys = np.full(len(gt_selected), np.inf)
+        gt_matches = match.gt_matches[gt_selected]
+        gt_keys[gt_matches >= 0] = -pred_confidences[gt_matches[gt_matches >= 0]]
+        order = np.argsort(gt_keys, kind="stable")
+        self.gt_order = gt_selected[order]
+        self.gt_keys = gt_keys[order]
+
+        mismatch_keys = -pred_confidences[match.mismatches[:, 0]]
+        order = np.argsort(mismatch_keys, kind="stable")
+        self.mismatches = match.mismatches[order]
+        self.mismatch_keys = mismatch_keys[order]
+
+    @property
+    def num_gt(self):
+        return len(self.gt_order)
+
+    def num_predictions(self, min_confidence):
+        """Returns the number of selected predictions of at least min_confidence"""
+        return int(np.searchsorted(self.pred_keys, -min_confidence, side="right"))
+
+    def num_true_positives(self, min_confidence):
+        """Returns the number of matched predictions of at least min_confidence"""
+        return int(np.searchsorted(self.tp_keys, -min_confidence, side="right"))
+
+    def predictions(self, min_confidence):
+        """Indices of the selected predictions of at least min_confidence, by decreasing confidence"""
+        return self.pred_order[:self.num_predictions(min_confidence)]
+
+    def false_positives(self, min_confidence):
+        """Indices of the unmatched predictions of at least min_confidence, by decreasing confidence"""
+        return self.fp_order[:int(np.searchsorted(self.fp_keys, -min_confidence, side="right"))]
+
+    def unmatched_gt(self, min_confidence):
+        """Indices of the selected GT boxes without a match among the predictions of at least min_confidence"""
+        return self.gt_order[int(np.searchsorted(self.gt_keys, -min_confidence, side="right")):]
+
+    def class_mismatches(self, min_confidence):
+        """[k, 2] (prediction, GT) mismatches of the predictions of at least min_confidence, by decreasing confidence"""
+        return self.mismatches[:int(np.searchsorted(self.mismatch_keys, -min_confidence, side="right"))]
+
+
+def sweep_frame_boxes(gt, pred, gt_classes, pred_classes, criterion=None):
+    """Matches the boxes of one frame for every confidence threshold at once
+    Args:
+        gt: FrameBoxes of the GT boxes, or a dictionary with a 'boxes' list
+        pred: FrameBoxes of the predictions, or a dictionary with a 'boxes' list
+        gt_classes: selected GT annotation names
+        pred_classes: selected predicted annotation names
+        criterion: MatchCriterion object, default centre distance within MATCH_DISTANCE
+    Returns:
+        ConfidenceSweep object
+        """
+    if isinstance(gt, dict):
+        gt = box_store.frame_from_dict(gt, [])
+    if isinstance(pred, dict):
+        pred = box_store.frame_from_dict(pred, [])
+    match = match_boxes(gt, select(gt, gt_classes), pred, select(pred, pred_classes), -np.inf, criterion)
+    return ConfidenceSweep(match, pred.confidences)
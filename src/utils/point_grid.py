@@ -0,0 +1,176 @@
+"""
+point_grid.py
+
+Spatial grid over the point cloud of one frame, used to draw it within a point budget and to pick
+points under the mouse.
+
+The points are bucketed into cubic cells once per frame, each cell with the bounding volume of its
+points. Within a cell the points are in random order, so the first k points of a cell are a uniform
+sample of it. Drawing within a budget culls the cells outside the view frustum, then keeps a
+fraction of every visible cell that falls off with the square of its distance to the camera (about
+the rate its size on screen falls off). Cells close to the camera, ie: the region being inspected,
+keep all of their points and distant cells are thinned until the total fits in the budget.
+"""
+import numpy as np
+
+CELL_SIZE = 4.0
+DEFAULT_BUDGET = 300000
+# Distance from a ray within which a point is picked, in meters
+PICK_RADIUS = 0.25
+BISECTION_STEPS = 32
+SHUFFLE_BITS = 16
+
+
+def _ranges(starts, lengths):
+    """Returns the concatenation of arange(start, start + length) for every (start, length) pair"""
+    lengths = np.asarray(lengths, dtype=np.int64)
+    total = int(lengths.sum())
+    offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.arange(total, dtype=np.int64) - offsets + np.repeat(np.asarray(starts, dtype=np.int64), lengths)
+
+
+def frustum_planes(view_matrix, projection_matrix):
+    """Returns the 6 planes of a camera's view frustum
+    Args:
+        view_matrix: 4x4 world to camera matrix (OpenGL convention, column vectors)
+        projection_matrix: 4x4 projection matrix
+    Returns:
+        [6, 4] array of (a, b, c, d) planes, points inside have a*x + b*y + c*z + d >= 0 for all of them
+        """
+    clip = np.asarray(projection_matrix, dtype=np.float64) @ np.asarray(view_matrix, dtype=np.float64)
+    return np.stack((clip[3] + clip[0], clip[3] - clip[0],
+                     clip[3] + clip[1], clip[3] - clip[1],
+                     clip[3] + clip[2], clip[3] - clip[2]))
+
+
+def camera_position(view_matrix):
+    """Returns the position of a camera in the world from its 4x4 world to camera matrix"""
+    return np.linalg.inv(np.asarray(view_matrix, dtype=np.float64))[:3, 3]
+
+
+class PointGrid:
+    """Points of one frame bucketed into cubic cells"""
+    def __init__(self, points, cell_size=CELL_SIZE, seed=0):
+        """
+        Args:
+            points: [n, 3] point array, in the frame the camera looks at them in
+            cell_size: edge length of the cells in meters
+            seed: seed of the shuffle within every cell, so the same frame is always sampled the same way
+            """
+        points = np.asarray(points, dtype=np.float32).reshape(-1, 3)
+        self.cell_size = cell_size
+        if len(points) == 0:
+            self.points = points
+            self.starts = np.zeros(0, dtype=np.int64)
+            self.counts = np.zeros(0, dtype=np.int64)
+            self.mins = np.zeros((0, 3), dtype=np.float32)
+            self.maxs = np.zeros((0, 3), dtype=np.float32)
+            return
+
+        cells = np.floor(points / cell_size).astype(np.int64)
+        cells -= cells.min(axis=0)
+        dims = cells.max(axis=0) + 1
+        keys = (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+        # Random low bits below the cell key shuffle the points within every cell
+        shuffled = (keys << SHUFFLE_BITS) | np.random.default_rng(seed).integers(0, 1 << SHUFFLE_BITS, len(keys))
+        order = np.argsort(shuffled)
+        self.points = np.ascontiguousarray(points[order])
+        keys = keys[order]
+
+        self.starts = np.concatenate(([0], np.flatnonzero(np.diff(keys)) + 1)).astype(np.int64)
+        self.counts = np.diff(np.append(self.starts, len(keys)))
+        self.mins = np.minimum.reduceat(self.points, self.starts)
+        self.maxs = np.maximum.reduceat(self.points, self.starts)
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def num_cells(self):
+        return len(self.starts)
+
+    def visible_cells(self, planes):
+        """Returns a bool array, True for the cells that intersect a view frustum
+        Args:
+            planes: [6, 4] frustum planes, see frustum_planes()
+        Returns:
+            [num_cells] bool array
+            """
+        normals = planes[:, :3]
+        # Corner of every cell that is furthest along every plane normal
+        corners = np.where(normals[None, :, :] >= 0, self.maxs[:, None, :], self.mins[:, None, :])
+        distances = np.einsum('cpj,pj->cp', corners, normals) + planes[None, :, 3]
+        return np.all(distances >= 0, axis=1)
+
+    def cell_distances(self, position):
+        """Returns the distance from a position to the bounding volume of every cell, 0 for cells containing it"""
+        outside = np.maximum(np.maximum(self.mins - position, position - self.maxs), 0)
+        return np.linalg.norm(outside, axis=1)
+
+    def select(self, view_matrix, projection_matrix, budget=DEFAULT_BUDGET):
+        """Chooses the points to draw for a camera
+        Args:
+            view_matrix: 4x4 world to camera matrix of the camera
+            projection_matrix: 4x4 projection matrix of the camera
+            budget: maximum number of points to draw
+        Returns:
+            [m] int array of indices into self.points, m <= budget
+            """
+        visible = np.flatnonzero(self.visible_cells(frustum_planes(view_matrix, projection_matrix)))
+        counts = self.counts[visible]
+        if counts.sum() <= budget:
+            return _ranges(self.starts[visible], counts)
+
+        distances = self.cell_distances(camera_position(view_matrix))[visible]
+
+        def kept(scale):
+            # Cells within scale meters of the camera keep every point
+            fractions = np.where(distances <= scale, 1.0, (scale / np.maximum(distances, 1e-6)) ** 2)
+            return np.floor(fractions * counts).astype(np.int64)
+
+        # Largest full density distance that still fits in the budget
+        low, high = 0.0, float(distances.max()) + self.cell_size
+        for _ in range(BISECTION_STEPS):
+            middle = (low + high) / 2
+            if kept(middle).sum() <= budget:
+                low = middle
+            else:
+                high = middle
+        keep = kept(low)
+        if keep.sum() > budget:
+            # The camera is inside cells that do not fit in the budget on their own
+            keep = np.floor(keep * (budget / keep.sum())).astype(np.int64)
+        return _ranges(self.starts[visible], keep)
+
+    def pick(self, origin, direction, radius=PICK_RADIUS):
+        """Finds the first point along a ray, eg: the one under the mouse
+        Args:
+            origin: start of the ray
+            direction: direction of the ray, does not need to be normalized
+            radius: maximum distance between the ray and a picked point
+        Returns:
+            [3] array of the picked point, or None if no point is close enough to the ray
+            """
+        origin = np.asarray(origin, dtype=np.float64)
+        direction = np.asarray(direction, dtype=np.float64)
+        direction = direction / np.linalg.norm(direction)
+        if self.num_cells == 0:
+            return None
+
+        # Slab test of the ray against every cell, grown by the pick radius
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (self.mins - radius - origin) / direction
+            t2 = (self.maxs + radius - origin) / direction
+        t_enter = np.nanmax(np.minimum(t1, t2), axis=1)
+        t_exit = np.nanmin(np.maximum(t1, t2), axis=1)
+        hit = t_exit >= np.maximum(t_enter, 0)
+        if not np.any(hit):
+            return None
+
+        candidates = self.points[_ranges(self.starts[hit], self.counts[hit])] - origin
+        along = candidates @ direction
+        across = np.linalg.norm(candidates - along[:, None] * direction, axis=1)
+        close = np.flatnonzero((along > 0) & (across <= radius))
+        if len(close) == 0:
+            return None
+        return candidates[close[np.argmin(along[close])]] + origin
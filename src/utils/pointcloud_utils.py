@@ -0,0 +1,261 @@
+"""
+pointcloud_utils.py
+
+Reading and writing of the point cloud files stored in the pointcloud/ directory.
+
+Besides .pcd files, a sensor directory can hold .bin files: a fixed 32 byte header followed by
+float32 xyz coordinates and optional float32 intensities. These can be memory mapped, so loading
+a frame does not copy or convert the points.
+"""
+import os
+import numpy as np
+import open3d as o3d
+from pyquaternion import Quaternion
+
+PCD_EXTENSION = ".pcd"
+BIN_EXTENSION = ".bin"
+POINTCLOUD_EXTENSIONS = [PCD_EXTENSION, BIN_EXTENSION]
+
+BIN_MAGIC = b"LCTPTS01"
+BIN_VERSION = 1
+FLAG_INTENSITY = 1
+
+# magic, version, flags, number of points, reserved
+BIN_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("flags", "<u4"), ("num_points", "<u8"), ("reserved", "<u8")])
+
+
+def bin_bytes(points, intensity=None):
+    """Encodes points in the .bin layout
+    Args:
+        points: [n, 3] array of (x,y,z) coordinates
+        intensity: optional list of n intensity values
+    Returns:
+        bytes of a complete .bin file
+        """
+    points = np.ascontiguousarray(np.asarray(points, dtype=np.float32).reshape(-1, 3))
+
+    header = np.zeros(1, dtype=BIN_HEADER)
+    header["magic"] = BIN_MAGIC
+    header["version"] = BIN_VERSION
+    header["num_points"] = len(points)
+    if intensity is not None:
+        header["flags"] = FLAG_INTENSITY
+
+    blobs = [header.tobytes(), points.tobytes()]
+    if intensity is not None:
+        blobs.append(np.ascontiguousarray(intensity, dtype=np.float32).tobytes())
+    return b"".join(blobs)
+
+
+def write_bin(path, points, intensity=None):
+    """Writes points to a .bin file
+    Args:
+        path: path of the file to write
+        points: [n, 3] array of (x,y,z) coordinates
+        intensity: optional list of n intensity values
+    Returns:
+        None
+        """
+    with open(path, "wb") as f:
+        f.write(bin_bytes(points, intensity))
+
+
+def _parse_header(header, name):
+    if len(header) == 0 or header["magic"][0] != BIN_MAGIC:
+        raise ValueError(name + " is not an LCT point cloud file")
+    return int(header["num_points"][0]), bool(header["flags"][0] & FLAG_INTENSITY)
+
+
+def bin_from_buffer(buffer, offset=0):
+    """Reads a .bin file held in a buffer without copying it
+    Args:
+        buffer: object supporting the buffer protocol, such as an mmap
+        offset: byte offset of the .bin data in the buffer
+    Returns:
+        points: [n, 3] float32 array backed by the buffer
+        intensity: [n] float32 array backed by the buffer, or None if there are no intensities
+        """
+    header = np.frombuffer(buffer, dtype=BIN_HEADER, count=1, offset=offset)
+    num_points, has_intensity = _parse_header(header, "buffer")
+
+    offset += BIN_HEADER.itemsize
+    points = np.frombuffer(buffer, dtype=np.float32, count=num_points * 3, offset=offset).reshape(num_points, 3)
+    intensity = None
+    if has_intensity:
+        intensity = np.frombuffer(buffer, dtype=np.float32, count=num_points, offset=offset + points.nbytes)
+    return points, intensity
+
+
+def read_bin(path):
+    """Memory maps a .bin file
+    Args:
+        path: path to .bin file
+    Returns:
+        points: [n, 3] float32 array backed by the file
+        intensity: [n] float32 array backed by the file, or None if the file has no intensities
+        """
+    header = np.fromfile(path, dtype=BIN_HEADER, count=1)
+    num_points, has_intensity = _parse_header(header, path)
+    if num_points == 0:
+        return np.zeros((0, 3), dtype=np.float32), None
+
+    # Copy-on-write mapping, so callers can hand the array to APIs that want a writable buffer
+    points = np.memmap(path, dtype=np.float32, mode="c", offset=BIN_HEADER.itemsize, shape=(num_points, 3))
+    intensity = None
+    if has_intensity:
+        intensity = np.memmap(path, dtype=np.float32, mode="c", offset=BIN_HEADER.itemsize + points.nbytes,
+                              shape=(num_points,))
+    return points, intensity
+
+
+def points_path(lct_path, sensor, frame_num):
+    """Returns the path of the point cloud file of one sensor and frame, preferring .bin over .pcd
+    Args:
+        lct_path: path to LCT directory
+        sensor: name of LiDAR sensor
+        frame_num: frame number
+    Returns:
+        path to the point cloud file
+        """
+    base = os.path.join(lct_path, "pointcloud", sensor, str(frame_num))
+    if os.path.exists(base + BIN_EXTENSION):
+        return base + BIN_EXTENSION
+    return base + PCD_EXTENSION
+
+
+def load_points(path):
+    """Loads the points of a point cloud file
+    Args:
+        path: path to a .pcd or .bin file
+    Returns:
+        [n, 3] array of points, float32 and memory mapped for .bin files
+        """
+    if path.endswith(BIN_EXTENSION):
+        return read_bin(path)[0]
+    return np.asarray(o3d.io.read_point_cloud(path).points)
+
+
+def count_points(path):
+    """Returns the number of points of a point cloud file, reading only its header
+    Args:
+        path: path to a .pcd or .bin file
+    Returns:
+        number of points
+        """
+    if path.endswith(BIN_EXTENSION):
+        return _parse_header(np.fromfile(path, dtype=BIN_HEADER, count=1), path)[0]
+
+    # .pcd headers are text lines, ending with the DATA line
+    with open(path, "rb") as f:
+        for line in f:
+            fields = line.split()
+            if len(fields) == 2 and fields[0] == b"POINTS":
+                return int(fields[1])
+            if len(fields) > 0 and fields[0] == b"DATA":
+                break
+    return len(load_points(path))
+
+
+def pose_matrix(extrinsic):
+    """Returns the float32 (3x3 rotation, translation) of a pose dictionary with 'rotation' (w,x,y,z) and 'translation'"""
+    return (Quaternion(extrinsic['rotation']).rotation_matrix.astype(np.float32),
+            np.asarray(extrinsic['translation'], dtype=np.float32))
+
+
+def transform_points(points, extrinsic, out=None):
+    """Transforms points from the ego frame into the global frame in float32
+    Args:
+        points: [n, 3] point array
+        extrinsic: ego pose dictionary with 'translation' and 'rotation' (w,x,y,z) entries
+        out: optional [n, 3] float32 array the result is written to
+    Returns:
+        [n, 3] float32 array, out if it was given
+        """
+    rotation, translation = pose_matrix(extrinsic)
+    if out is None:
+        out = np.empty((len(points), 3), dtype=np.float32)
+    # The matmul writes straight into out and the translation is added in place, no temporaries
+    np.matmul(points, rotation.T, out=out, casting="same_kind")
+    out += translation
+    return out
+
+
+class PointAssembly:
+    """Point clouds of several sensors assembled into one float32 buffer"""
+    def __init__(self, points, slices):
+        self.points = points
+        # Sensor name -> (start, stop) rows of the buffer
+        self.slices = slices
+
+    @property
+    def nbytes(self):
+        return self.points.nbytes
+
+    def sensor_points(self, sensor):
+        """Returns the points of one sensor, without copying them"""
+        start, stop = self.slices[sensor]
+        return self.points[start:stop]
+
+    def select(self, sensors):
+        """Returns the points of a subset of the sensors, eg: when sensors are toggled off
+           Copies only if the selected sensors are not next to each other in the buffer
+            """
+        ranges = sorted(self.slices[sensor] for sensor in sensors)
+        if len(ranges) == 0:
+            return self.points[:0]
+        if all(ranges[i][1] == ranges[i + 1][0] for i in range(len(ranges) - 1)):
+            return self.points[ranges[0][0]:ranges[-1][1]]
+        return np.concatenate([self.points[start:stop] for start, stop in ranges])
+
+
+def assemble_points(source, sensors, frame_num, extrinsic=None):
+    """Reads the point clouds of several sensors into a single preallocated float32 buffer
+    Args:
+        source: scene source (see scene_loader.py)
+        sensors: lidar sensor names
+        frame_num: frame number
+        extrinsic: optional ego pose, to transform the points into the global frame while copying them
+    Returns:
+        PointAssembly object
+        """
+    # The sizes come from the file headers, so the buffer is allocated once
+    counts = [source.count_points(sensor, frame_num) for sensor in sensors]
+    points = np.empty((sum(counts), 3), dtype=np.float32)
+    slices = {}
+    start = 0
+    for sensor, count in zip(sensors, counts):
+        stop = start + count
+        sensor_points = source.read_points(sensor, frame_num)
+        if extrinsic is not None:
+            transform_points(sensor_points, extrinsic, out=points[start:stop])
+        else:
+            points[start:stop] = sensor_points
+        slices[sensor] = (start, stop)
+        start = stop
+    return PointAssembly(points, slices)
+
+
+def to_global_frame(points, extrinsic):
+    """Concatenates the point clouds of one frame and transforms them into the global frame
+    Args:
+        points: list of [n, 3] point arrays in the ego frame
+        extrinsic: ego pose dictionary with 'translation' and 'rotation' (w,x,y,z) entries
+    Returns:
+        [n, 3] float32 array of all points in the global frame
+        """
+    out = np.empty((sum(len(cloud) for cloud in points), 3), dtype=np.float32)
+    start = 0
+    for cloud in points:
+        transform_points(cloud, extrinsic, out=out[start:start + len(cloud)])
+        start += len(cloud)
+    return out
+
+
+def to_open3d(points):
+    """Wraps a float32 point buffer in an Open3D point cloud without copying it
+    Args:
+        points: [n, 3] C-contiguous float32 array, which must outlive the point cloud
+    Returns:
+        o3d.t.geometry.PointCloud
+        """
+    return o3d.t.geometry.PointCloud(o3d.core.Tensor.from_numpy(np.ascontiguousarray(points, dtype=np.float32)))
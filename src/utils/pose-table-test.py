@@ -0,0 +1,98 @@
+import unittest
+import os
+import sys
+import numpy as np
+from pyquaternion import Quaternion
+
+# Run from anywhere, eg: python utils/pose-table-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import pose_table
+
+
+def yaw_quaternion(yaw):
+    return [np.cos(yaw / 2), 0.0, 0.0, np.sin(yaw / 2)]
+
+
+def same_rotation(q0, q1):
+    """q and -q are the same rotation"""
+    return np.allclose(q0, q1, atol=1e-9) or np.allclose(q0, -np.asarray(q1), atol=1e-9)
+
+
+# tests the batched slerp against pyquaternion
+class TestSlerp(unittest.TestCase):
+    def test_end_points(self):
+        q0 = [yaw_quaternion(0.3)]
+        q1 = [yaw_quaternion(1.2)]
+        self.assertTrue(same_rotation(pose_table.slerp(q0, q1, [0])[0], q0[0]))
+        self.assertTrue(same_rotation(pose_table.slerp(q0, q1, [1])[0], q1[0]))
+
+    def test_halfway(self):
+        result = pose_table.slerp([yaw_quaternion(0)], [yaw_quaternion(np.pi / 2)], [0.5])[0]
+        self.assertTrue(same_rotation(result, yaw_quaternion(np.pi / 4)))
+
+    def test_short_way_around(self):
+        # -q1 is the same rotation as q1, the result must not swing the long way
+        q1 = -np.array(yaw_quaternion(np.pi / 2))
+        result = pose_table.slerp([yaw_quaternion(0)], [q1], [0.5])[0]
+        self.assertTrue(same_rotation(result, yaw_quaternion(np.pi / 4)))
+
+    def test_nearly_parallel(self):
+        q0 = yaw_quaternion(0.5)
+        q1 = yaw_quaternion(0.5 + 1e-9)
+        result = pose_table.slerp([q0], [q1], [0.5])[0]
+        self.assertTrue(np.all(np.isfinite(result)))
+        self.assertTrue(same_rotation(result, q0))
+
+    def test_random_against_pyquaternion(self):
+        rng = np.random.default_rng(0)
+        q0 = rng.normal(size=(200, 4))
+        q1 = rng.normal(size=(200, 4))
+        t = rng.uniform(size=200)
+        results = pose_table.slerp(q0, q1, t)
+        for a, b, amount, result in zip(q0, q1, t, results):
+            expected = Quaternion.slerp(Quaternion(a).normalised, Quaternion(b).normalised, amount)
+            self.assertTrue(same_rotation(result, expected.elements))
+            self.assertAlmostEqual(np.linalg.norm(result), 1.0)
+
+
+# tests interpolation of a small table, with a frame missing its pose
+class TestInterpolate(unittest.TestCase):
+    def setUp(self):
+        poses = np.zeros((4, 7))
+        poses[:, 0] = [0.0, 10.0, 99.0, 30.0]
+        poses[:, 3:] = [yaw_quaternion(0), yaw_quaternion(np.pi / 2), yaw_quaternion(3.0), yaw_quaternion(np.pi / 2)]
+        self.table = pose_table.PoseTable(poses, np.array([0, 100, 200, 300], dtype=np.int64), np.array([True, True, False, True]))
+
+    def test_known_timestamps(self):
+        result = self.table.interpolate([0, 100, 300])
+        self.assertTrue(np.allclose(result[:, 0], [0.0, 10.0, 30.0]))
+        self.assertTrue(same_rotation(result[1, 3:], yaw_quaternion(np.pi / 2)))
+
+    def test_between_frames(self):
+        result = self.table.interpolate([50])[0]
+        self.assertAlmostEqual(result[0], 5.0)
+        self.assertTrue(same_rotation(result[3:], yaw_quaternion(np.pi / 4)))
+
+    def test_missing_frame_is_skipped(self):
+        # Frame 2 has no pose, so 200 lies between frames 1 and 3
+        result = self.table.interpolate([200])[0]
+        self.assertAlmostEqual(result[0], 20.0)
+        self.assertTrue(same_rotation(result[3:], yaw_quaternion(np.pi / 2)))
+
+    def test_clamped(self):
+        result = self.table.interpolate([-50, 1000])
+        self.assertTrue(np.allclose(result[:, 0], [0.0, 30.0]))
+
+    def test_transforms(self):
+        transforms = self.table.interpolate_transforms([50])
+        self.assertTrue(np.allclose(transforms[0][:3, :3], Quaternion(yaw_quaternion(np.pi / 4)).rotation_matrix))
+        self.assertTrue(np.allclose(transforms[0][:3, 3], [5.0, 0.0, 0.0]))
+
+    def test_no_poses(self):
+        table = pose_table.PoseTable(np.zeros((2, 7)), np.arange(2), np.zeros(2, dtype=bool))
+        with self.assertRaises(ValueError):
+            table.interpolate([0])
+
+
+if __name__ == '__main__':
+    unittest.main()
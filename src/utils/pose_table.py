@@ -0,0 +1,236 @@
+"""
+pose_table.py
+
+Scene-level table of ego poses.
+
+The ego/<n>.json files of a scene are collected into store/ego/:
+
+    poses.npy       [frames, 7] float64 rows of (x, y, z, qw, qx, qy, qz)
+    timestamps.npy  [frames] int64 timestamps in microseconds (frame numbers when the source has none)
+    present.npy     [frames] bool, False for frames without an ego file
+
+The table gives batched 4x4 transforms for frame ranges and interpolates poses at arbitrary
+timestamps (linear for translation, slerp for rotation).
+"""
+import json
+import os
+import numpy as np
+from utils import box_store
+from utils import scene_loader
+
+POSE_DIR = box_store.STORE_DIR + "/ego"
+POSE_VERSION = 1
+
+# Open tables, keyed by scene path
+_open_tables = {}
+
+
+def quaternions_to_matrices(quaternions):
+    """Converts (w,x,y,z) quaternions to rotation matrices
+    Args:
+        quaternions: [n, 4] array, does not need to be normalized
+    Returns:
+        [n, 3, 3] array of rotation matrices
+        """
+    q = np.asarray(quaternions, dtype=np.float64).reshape(-1, 4)
+    q = q / np.linalg.norm(q, axis=1, keepdims=True)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+    matrices = np.empty((len(q), 3, 3))
+    matrices[:, 0, 0] = 1 - 2 * (y * y + z * z)
+    matrices[:, 0, 1] = 2 * (x * y - z * w)
+    matrices[:, 0, 2] = 2 * (x * z + y * w)
+    matrices[:, 1, 0] = 2 * (x * y + z * w)
+    matrices[:, 1, 1] = 1 - 2 * (x * x + z * z)
+    matrices[:, 1, 2] = 2 * (y * z - x * w)
+    matrices[:, 2, 0] = 2 * (x * z - y * w)
+    matrices[:, 2, 1] = 2 * (y * z + x * w)
+    matrices[:, 2, 2] = 1 - 2 * (x * x + y * y)
+    return matrices
+
+
+def poses_to_transforms(poses):
+    """Converts (x, y, z, qw, qx, qy, qz) rows to 4x4 ego -> global transforms
+    Args:
+        poses: [n, 7] array
+    Returns:
+        [n, 4, 4] array
+        """
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 7)
+    transforms = np.zeros((len(poses), 4, 4))
+    transforms[:, :3, :3] = quaternions_to_matrices(poses[:, 3:])
+    transforms[:, :3, 3] = poses[:, :3]
+    transforms[:, 3, 3] = 1
+    return transforms
+
+
+def slerp(q0, q1, t):
+    """Spherical linear interpolation between two sets of (w,x,y,z) quaternions
+    Args:
+        q0: [n, 4] start quaternions
+        q1: [n, 4] end quaternions
+        t: [n] interpolation factors in [0, 1]
+    Returns:
+        [n, 4] array of unit quaternions
+        """
+    q0 = np.asarray(q0, dtype=np.float64).reshape(-1, 4)
+    q1 = np.asarray(q1, dtype=np.float64).reshape(-1, 4)
+    q0 = q0 / np.linalg.norm(q0, axis=1, keepdims=True)
+    q1 = q1 / np.linalg.norm(q1, axis=1, keepdims=True)
+    t = np.asarray(t, dtype=np.float64).reshape(-1, 1)
+
+    # Take the short way around
+    dot = np.sum(q0 * q1, axis=1, keepdims=True)
+    q1 = np.where(dot < 0, -q1, q1)
+    dot = np.abs(dot)
+
+    # Nearly parallel quaternions fall back to normalized lerp to avoid dividing by sin(0)
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_theta = np.sin(theta)
+    near = sin_theta < 1e-6
+    safe_sin = np.where(near, 1.0, sin_theta)
+    w0 = np.where(near, 1 - t, np.sin((1 - t) * theta) / safe_sin)
+    w1 = np.where(near, t, np.sin(t * theta) / safe_sin)
+    result = w0 * q0 + w1 * q1
+    return result / np.linalg.norm(result, axis=1, keepdims=True)
+
+
+class PoseTable:
+    """Ego poses of every frame of a scene"""
+    def __init__(self, poses, timestamps, present, lct_path=""):
+        self.poses = poses
+        self.timestamps = timestamps
+        self.present = present
+        self.lct_path = lct_path
+
+    @property
+    def num_frames(self):
+        return len(self.poses)
+
+    def _check(self, frame_num):
+        if not (0 <= frame_num < self.num_frames) or not self.present[frame_num]:
+            raise FileNotFoundError(os.path.join(self.lct_path, "ego", str(frame_num) + ".json"))
+
+    def pose(self, frame_num):
+        """Returns the pose of one frame in the ego/<n>.json layout
+        Args:
+            frame_num: frame number
+        Returns:
+            dictionary with 'translation' [x,y,z] and 'rotation' [w,x,y,z]
+        Raises:
+            FileNotFoundError if the frame has no pose
+            """
+        self._check(frame_num)
+        row = self.poses[frame_num]
+        return {'translation': row[:3].tolist(), 'rotation': row[3:].tolist()}
+
+    def transform(self, frame_num):
+        """Returns the 4x4 ego -> global transform of one frame"""
+        self._check(frame_num)
+        return poses_to_transforms(self.poses[frame_num])[0]
+
+    def transforms(self, start, stop):
+        """Returns the 4x4 ego -> global transforms of the frames in [start, stop)
+        Args:
+            start: first frame
+            stop: one past the last frame
+        Returns:
+            [stop - start, 4, 4] array, identity for frames without a pose
+            """
+        transforms = poses_to_transforms(self.poses[start:stop])
+        transforms[~np.asarray(self.present[start:stop])] = np.eye(4)
+        return transforms
+
+    def interpolate(self, timestamps):
+        """Interpolates poses at arbitrary timestamps, clamping to the first and last frame
+        Args:
+            timestamps: list of timestamps, in the same unit as the table
+        Returns:
+            [n, 7] array of (x, y, z, qw, qx, qy, qz) rows
+            """
+        frames = np.flatnonzero(self.present)
+        known = np.asarray(self.timestamps)[frames]
+        poses = np.asarray(self.poses)[frames]
+        timestamps = np.asarray(timestamps, dtype=np.float64).reshape(-1)
+
+        if len(known) == 0:
+            raise ValueError("Scene has no ego poses to interpolate")
+
+        # Bracketing frames of every timestamp, both equal to the end frame outside the table
+        upper = np.clip(np.searchsorted(known, timestamps, side="right"), 0, len(known) - 1)
+        lower = np.clip(upper - 1, 0, len(known) - 1)
+        span = (known[upper] - known[lower]).astype(np.float64)
+        t = np.divide(timestamps - known[lower], span, out=np.zeros(len(timestamps)), where=span != 0)
+        t = np.clip(t, 0, 1)
+
+        result = np.empty((len(timestamps), 7))
+        result[:, :3] = poses[lower, :3] + t[:, None] * (poses[upper, :3] - poses[lower, :3])
+        result[:, 3:] = slerp(poses[lower, 3:], poses[upper, 3:], t)
+        return result
+
+    def interpolate_transforms(self, timestamps):
+        """Interpolates poses at arbitrary timestamps and returns them as [n, 4, 4] transforms"""
+        return poses_to_transforms(self.interpolate(timestamps))
+
+
+def _read_ego_files(lct_path):
+    """Reads every ego/<n>.json file of a scene into (poses, present) arrays"""
+    source = scene_loader.open_scene(lct_path)
+    frames = [int(os.path.splitext(name)[0]) for name in source.listdir("ego") if os.path.splitext(name)[0].isdigit()]
+    num_frames = max(frames) + 1 if frames else 0
+    poses = np.zeros((num_frames, 7))
+    poses[:, 3] = 1
+    present = np.zeros(num_frames, dtype=bool)
+    for frame_num in frames:
+        ego = source.read_json("ego/" + str(frame_num) + ".json")
+        poses[frame_num, :3] = ego['translation']
+        poses[frame_num, 3:] = ego['rotation']
+        present[frame_num] = True
+    return poses, present
+
+
+def build_pose_table(lct_path, timestamps=None):
+    """Collects the ego files of an LCT directory into the pose table under store/ego/
+    Args:
+        lct_path: path to LCT directory
+        timestamps: optional list with one timestamp in microseconds per frame
+    Returns:
+        PoseTable object
+        """
+    poses, present = _read_ego_files(lct_path)
+    has_timestamps = timestamps is not None and len(timestamps) >= len(poses)
+    if has_timestamps:
+        timestamps = np.array([int(t) for t in timestamps[:len(poses)]], dtype=np.int64)
+    else:
+        timestamps = np.arange(len(poses), dtype=np.int64)
+
+    path = os.path.join(lct_path, *POSE_DIR.split("/"))
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "poses.npy"), poses)
+    np.save(os.path.join(path, "timestamps.npy"), timestamps)
+    np.save(os.path.join(path, "present.npy"), present)
+    # meta.json is written last, its presence marks the table as complete
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump({'version': POSE_VERSION, 'num_frames': len(poses), 'has_timestamps': has_timestamps}, f)
+    return PoseTable(poses, timestamps, present, lct_path)
+
+
+def load_pose_table(lct_path):
+    """Opens the pose table of a scene, reading the ego files once if the scene has no table
+    Args:
+        lct_path: path to LCT directory or scene pack
+    Returns:
+        PoseTable object
+        """
+    key = os.path.abspath(lct_path)
+    if key in _open_tables:
+        return _open_tables[key]
+
+    source = scene_loader.open_scene(lct_path)
+    if source.exists(POSE_DIR + "/meta.json"):
+        table = PoseTable(source.load_npy(POSE_DIR + "/poses.npy"), source.load_npy(POSE_DIR + "/timestamps.npy"),
+                          source.load_npy(POSE_DIR + "/present.npy"), lct_path)
+    else:
+        poses, present = _read_ego_files(lct_path)
+        table = PoseTable(poses, np.arange(len(poses), dtype=np.int64), present, lct_path)
+    _open_tables[key] = table
+    return table
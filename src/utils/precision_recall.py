@@ -0,0 +1,170 @@
+"""
+precision_recall.py
+
+Precision and recall of the predictions of a whole scene at every confidence threshold.
+
+Every frame is matched once with all of its predictions (see matching.ConfidenceSweep). Since the
+matches do not change with the threshold, the scene only keeps the confidences of its selected
+predictions and of those that are matched, both sorted. The number of predictions and of true
+positives above a threshold are then two binary searches, so precision and recall follow the
+threshold as it is dragged, and the whole curve takes two vectorized searches.
+"""
+import threading
+import cv2
+import numpy as np
+from utils import box_store
+from utils import matching
+
+CURVE_WIDTH = 240
+CURVE_HEIGHT = 160
+
+
+class PrecisionRecall:
+    """Confidences of the selected and of the matched predictions of a scene, with its number of GT boxes"""
+    def __init__(self, pred_confidences, tp_confidences, num_gt):
+        """
+        Args:
+            pred_confidences: confidences of every selected prediction
+            tp_confidences: confidences of the predictions matched to a GT box
+            num_gt: number of selected GT boxes
+            """
+        # Negated and sorted, so the most confident predictions come first
+        self.pred_keys = np.sort(-np.asarray(pred_confidences, dtype=np.float64))
+        self.tp_keys = np.sort(-np.asarray(tp_confidences, dtype=np.float64))
+        self.num_gt = num_gt
+        self._curve = None
+
+    def at(self, min_confidence):
+        """Returns the precision and recall of the predictions of at least min_confidence
+        Returns:
+            precision: fraction of the predictions that are matched, 1 when there are none
+            recall: fraction of the GT boxes that are matched, 1 when there are none
+            """
+        num_pred = int(np.searchsorted(self.pred_keys, -min_confidence, side="right"))
+        num_tp = int(np.searchsorted(self.tp_keys, -min_confidence, side="right"))
+        precision = num_tp / num_pred if num_pred > 0 else 1.0
+        recall = num_tp / self.num_gt if self.num_gt > 0 else 1.0
+        return precision, recall
+
+    def curve(self):
+        """Returns the precision/recall curve, one point per prediction by decreasing confidence
+        Returns:
+            confidences: [n] threshold of every point
+            precision: [n] array
+            recall: [n] array
+            """
+        if self._curve is not None:
+            return self._curve
+        confidences = -self.pred_keys
+        num_tp = np.searchsorted(self.tp_keys, self.pred_keys, side="right")
+        # Equally confident predictions are kept or dropped together, so each point counts all of them
+        num_pred = np.searchsorted(self.pred_keys, self.pred_keys, side="right")
+        precision = num_tp / np.maximum(num_pred, 1)
+        recall = num_tp / self.num_gt if self.num_gt > 0 else np.ones(len(confidences))
+        self._curve = (confidences, precision, recall)
+        return self._curve
+
+
+def scene_precision_recall(lct_path, num_frames, gt_classes, pred_classes, criterion=None, cancelled=None):
+    """Matches every frame of a scene and collects the confidences of its predictions
+    Args:
+        lct_path: path to LCT directory or scene pack
+        num_frames: number of frames of the scene
+        gt_classes: selected GT annotation names
+        pred_classes: selected predicted annotation names
+        criterion: matching.MatchCriterion object, default centre distance within matching.MATCH_DISTANCE
+        cancelled: optional threading.Event, the scene is not finished once it is set
+    Returns:
+        PrecisionRecall object, or None if cancelled
+        """
+    pred_confidences = []
+    tp_confidences = []
+    num_gt = 0
+    for frame_num in range(num_frames):
+        if cancelled is not None and cancelled.is_set():
+            return None
+        try:
+            gt = box_store.load_frame_arrays(lct_path, "bounding", frame_num)
+            pred = box_store.load_frame_arrays(lct_path, "pred_bounding", frame_num)
+        except FileNotFoundError:
+            continue
+        sweep = matching.sweep_frame_boxes(gt, pred, gt_classes, pred_classes, criterion)
+        pred_confidences.append(-sweep.pred_keys)
+        tp_confidences.append(-sweep.tp_keys)
+        num_gt += sweep.num_gt
+    if len(pred_confidences) == 0:
+        return PrecisionRecall(np.zeros(0), np.zeros(0), num_gt)
+    return PrecisionRecall(np.concatenate(pred_confidences), np.concatenate(tp_confidences), num_gt)
+
+
+def draw_curve(precision_recall, min_confidence, width=CURVE_WIDTH, height=CURVE_HEIGHT):
+    """Draws the precision/recall curve of a scene, with the point of the current threshold marked
+    Args:
+        precision_recall: PrecisionRecall object
+        min_confidence: current confidence threshold
+        width: width of the image in pixels
+        height: height of the image in pixels
+    Returns:
+        [height, width, 3] uint8 RGB image, recall on the x axis and precision on the y axis
+        """
+    image = np.full((height, width, 3), 255, dtype=np.uint8)
+    margin = 4
+    scale = np.array([width - 2 * margin - 1, height - 2 * margin - 1], dtype=np.float64)
+    cv2.rectangle(image, (margin, margin), (width - margin - 1, height - margin - 1), (160, 160, 160), 1)
+
+    def to_pixels(recall, precision):
+        points = np.stack((np.asarray(recall), 1 - np.asarray(precision)), axis=-1) * scale + margin
+        return np.round(points).astype(np.int32)
+
+    (_, precision, recall) = precision_recall.curve()
+    if len(precision) > 0:
+        points = to_pixels(recall, precision)
+        # Long scenes have many more points than pixels, only those that move the line are drawn
+        keep = np.ones(len(points), dtype=bool)
+        keep[1:] = (points[1:] != points[:-1]).any(axis=1)
+        cv2.polylines(image, [points[keep].reshape(-1, 1, 2)], False, (0, 0, 200), 1, cv2.LINE_AA)
+    (precision, recall) = precision_recall.at(min_confidence)
+    cv2.circle(image, tuple(int(v) for v in to_pixels(recall, precision)), 4, (200, 0, 0), -1, cv2.LINE_AA)
+    return image
+
+
+class PrecisionRecallLoader:
+    """Computes the precision/recall of a scene on a background thread, restarted whenever the settings change"""
+    def __init__(self, lct_path, num_frames, on_done):
+        """
+        Args:
+            lct_path: path to LCT directory or scene pack
+            num_frames: number of frames of the scene
+            on_done: called from the background thread with the PrecisionRecall object once it is ready
+            """
+        self.lct_path = lct_path
+        self.num_frames = num_frames
+        self.on_done = on_done
+        self.key = None
+        self.result = None
+        self.cancelled = threading.Event()
+
+    def request(self, gt_classes, pred_classes, criterion):
+        """Returns the precision/recall for these settings, or None while it is computed
+           Starts computing it if the settings changed since the last request"""
+        key = (tuple(sorted(gt_classes)), tuple(sorted(pred_classes)), criterion)
+        if key == self.key:
+            return self.result
+        self.cancelled.set()
+        self.cancelled = threading.Event()
+        self.key = key
+        self.result = None
+        thread = threading.Thread(target=self._compute, args=(key, list(gt_classes), list(pred_classes), criterion, self.cancelled),
+                                  daemon=True)
+        thread.start()
+        return None
+
+    def _compute(self, key, gt_classes, pred_classes, criterion, cancelled):
+        result = scene_precision_recall(self.lct_path, self.num_frames, gt_classes, pred_classes, criterion, cancelled)
+        if result is None or cancelled.is_set() or key != self.key:
+            return
+        self.result = result
+        self.on_done(result)
+
+    def cancel(self):
+        self.cancelled.set()
@@ -0,0 +1,166 @@
+"""
+prefetch.py
+
+Background loading of the frames around the one being viewed.
+
+The viewer asks the prefetcher for the frames ahead of (and just behind) the current frame in the
+direction the user is moving. They are loaded and decoded on a thread pool, so switching to them
+does not touch the disk on the GUI thread. Requests for frames that are no longer wanted, eg:
+after a jump, are cancelled. Callers are told when a frame is ready through a callback, which runs
+on a worker thread; the viewer forwards it to the GUI thread with post_to_main_thread.
+"""
+import concurrent.futures
+import os
+import threading
+from utils import frame_cache
+from utils import pose_table
+
+# Frames loaded ahead of the current frame in the direction of travel, and behind it
+PREFETCH_AHEAD = 4
+PREFETCH_BEHIND = 1
+PREFETCH_WORKERS = min(4, os.cpu_count() or 1)
+
+
+class FrameData:
+    """Everything the viewer reads from disk for one frame, shared with the frame cache so it must not be modified"""
+    def __init__(self, frame_num, camera, lod, image, image_scale, image_size, pose, boxes, pred_boxes):
+        self.frame_num = frame_num
+        self.camera = camera
+        self.lod = lod
+        self.image = image
+        self.image_scale = image_scale
+        self.image_size = image_size
+        self.pose = pose
+        self.boxes = boxes
+        self.pred_boxes = pred_boxes
+
+
+def load_frame(lct_path, frame_num, camera, lidar_sensors, load_pred=True, load_lod=True):
+    """Loads and decodes one frame
+    Args:
+        lct_path: path to LCT directory or scene pack
+        frame_num: frame number
+        camera: camera sensor whose image is loaded
+        lidar_sensors: lidar sensors whose point clouds are merged
+        load_pred: True to load the predicted boxes
+        load_lod: True to open the LOD pyramid of the point cloud, otherwise FrameData.lod is None
+    Returns:
+        FrameData object
+        """
+    # Only the pyramid is kept, the full resolution cloud is left for the frame the user settles on.
+    # Frames without one get it built in memory, so even their first view only shows the coarsest level
+    lod = None
+    if load_lod:
+        from utils import lod_utils
+        lod = lod_utils.load_frame_lod(lct_path, frame_num)
+        if lod is None:
+            lod = lod_utils.lod_from_points(frame_cache.load_points(lct_path, lidar_sensors, frame_num))
+    # Everything goes through the process-wide frame cache, so frames the editor or an earlier
+    # prefetch already decoded are not read again
+    image, image_scale, image_size = frame_cache.load_image(lct_path, camera, frame_num)
+    pose = pose_table.load_pose_table(lct_path).pose(frame_num)
+    boxes = frame_cache.load_boxes(lct_path, "bounding", frame_num)
+    pred_boxes = frame_cache.load_boxes(lct_path, "pred_bounding", frame_num) if load_pred else None
+    return FrameData(frame_num, camera, lod, image, image_scale, image_size, pose, boxes, pred_boxes)
+
+
+class FramePrefetcher:
+    """Loads the frames around the current frame on a thread pool"""
+    def __init__(self, load, on_ready=None, ahead=PREFETCH_AHEAD, behind=PREFETCH_BEHIND, workers=PREFETCH_WORKERS):
+        """
+        Args:
+            load: function taking a frame number and returning its data, called on worker threads
+            on_ready: optional function called with the frame number once a frame is loaded, on a worker thread
+            ahead: number of frames loaded in the direction of travel
+            behind: number of frames loaded in the opposite direction
+            workers: number of worker threads
+            """
+        self.load = load
+        self.on_ready = on_ready
+        self.ahead = ahead
+        self.behind = behind
+        self.executor = concurrent.futures.ThreadPoolExecutor(workers)
+        self.lock = threading.Lock()
+        self.futures = {}
+        self.wanted = set()
+
+    def wanted_frames(self, frame_num, num_frames, direction):
+        """Returns the frames to prefetch around frame_num, nearest first"""
+        step = 1 if direction >= 0 else -1
+        frames = [frame_num + step * i for i in range(1, self.ahead + 1)]
+        frames += [frame_num - step * i for i in range(1, self.behind + 1)]
+        return [frame for frame in frames if 0 <= frame < num_frames]
+
+    def request(self, frame_num, num_frames, direction=1):
+        """Prefetches the frames around frame_num, cancelling requests for any other frame
+           The current frame is kept if it is already loaded or being loaded, but is not requested
+        Args:
+            frame_num: frame being viewed
+            num_frames: number of frames in the scene
+            direction: > 0 when moving forward, < 0 when moving backward
+        Returns:
+            None
+            """
+        frames = self.wanted_frames(frame_num, num_frames, direction)
+        with self.lock:
+            self.wanted = set(frames) | {frame_num}
+            for frame in list(self.futures):
+                if frame not in self.wanted:
+                    # Frames already being loaded finish, but their result is dropped
+                    self.futures.pop(frame).cancel()
+            for frame in frames:
+                if frame not in self.futures:
+                    future = self.executor.submit(self.load, frame)
+                    self.futures[frame] = future
+                    future.add_done_callback(lambda future, frame=frame: self._done(frame, future))
+
+    def _done(self, frame_num, future):
+        if future.cancelled():
+            return
+        with self.lock:
+            if self.futures.get(frame_num) is not future:
+                return
+            if future.exception() is not None:
+                # Frames that fail to load are read again (and raise) on the GUI thread
+                del self.futures[frame_num]
+        if self.on_ready is not None:
+            self.on_ready(frame_num)
+
+    def is_loading(self, frame_num):
+        """Returns True if frame_num has been requested but is not loaded yet"""
+        with self.lock:
+            future = self.futures.get(frame_num)
+            return future is not None and not future.done()
+
+    def get(self, frame_num):
+        """Returns the data of a loaded frame, or None if it is not loaded (yet)"""
+        with self.lock:
+            future = self.futures.get(frame_num)
+        if future is None or not future.done() or future.cancelled() or future.exception() is not None:
+            return None
+        return future.result()
+
+    def wait(self, frame_num, timeout=None):
+        """Blocks until a requested frame is loaded, eg: for scripted benchmarks without a GUI event loop
+        Returns:
+            the data of the frame, or None if it was not requested, was cancelled or failed to load
+            """
+        with self.lock:
+            future = self.futures.get(frame_num)
+        if future is None:
+            return None
+        concurrent.futures.wait([future], timeout)
+        return self.get(frame_num)
+
+    def clear(self):
+        """Drops every loaded frame and cancels every request, eg: when the selected sensors change"""
+        with self.lock:
+            for future in self.futures.values():
+                future.cancel()
+            self.futures = {}
+            self.wanted = set()
+
+    def shutdown(self):
+        """Stops the worker threads without waiting for frames being loaded"""
+        self.clear()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,140 @@
+"""
+projection_utils.py
+
+Batched projection of bounding boxes onto camera images.
+
+The corners of every box of a frame are moved to the camera frame and projected with a few NumPy
+operations, instead of building a nuScenes Box per box. A box is drawn when any of its corners is
+more than MIN_DEPTH in front of the camera and projects inside the image, like nuScenes'
+box_in_image with BoxVisibility.ANY. Edges are clipped against the near plane before projection,
+so parts of a box behind the camera are not drawn, and edges entirely outside the image are culled.
+All visible edges of one color and thickness are drawn with a single cv2.polylines call.
+"""
+import cv2
+import numpy as np
+from utils import render_utils
+
+# Depth a corner must exceed to make its box visible, and the near plane edges are clipped against
+MIN_DEPTH = 1.0
+NEAR_PLANE = 0.1
+
+# Corners of the line indicating the front of a box: the center of the bottom face and the
+# center of the bottom front edge, added after the 8 corners of every box
+FRONT_LINE_CORNERS = (np.array([2, 3, 7, 6]), np.array([2, 3]))
+# The 12 edges of render_utils.BOX_EDGES followed by the front line
+PROJECTED_EDGES = np.concatenate((render_utils.BOX_EDGES, [[8, 9]])).astype(np.int32)
+
+
+class ProjectedBoxes:
+    """Boxes of a render list projected onto one image"""
+    def __init__(self, visible, corners, segments, segment_boxes):
+        """
+        Args:
+            visible: [n] bool array, True for the boxes that are drawn
+            corners: [n, 8, 2] pixel coordinates of the corners, unreliable for corners behind the camera
+            segments: [m, 2, 2] pixel coordinates of the start and end of every edge left after clipping
+            segment_boxes: [m] index of the box every segment belongs to
+            """
+        self.visible = visible
+        self.corners = corners
+        self.segments = segments
+        self.segment_boxes = segment_boxes
+
+
+def _clip_near(starts, ends):
+    """Clips 3D segments against the near plane
+    Returns:
+        starts, ends: the clipped segments
+        keep: bool array, False for segments entirely behind the near plane
+        """
+    keep = (starts[:, 2] > NEAR_PLANE) | (ends[:, 2] > NEAR_PLANE)
+    starts, ends = starts[keep], ends[keep]
+    depth = ends[:, 2] - starts[:, 2]
+    # Only used for segments crossing the plane, whose depth is never 0
+    t = (NEAR_PLANE - starts[:, 2]) / np.where(depth == 0, 1.0, depth)
+    crossing = (starts[:, 2] <= NEAR_PLANE) | (ends[:, 2] <= NEAR_PLANE)
+    point = starts + t[:, None] * (ends - starts)
+    starts = np.where((crossing & (starts[:, 2] <= NEAR_PLANE))[:, None], point, starts)
+    ends = np.where((crossing & (ends[:, 2] <= NEAR_PLANE))[:, None], point, ends)
+    return starts, ends, keep
+
+
+def _cull_rect(starts, ends, image_size):
+    """Returns a bool array, False for 2D segments with both ends beyond the same border of the image
+       The remaining segments are clipped by OpenCV, which keeps them pixel-identical to cv2.line
+        """
+    size = np.asarray(image_size, dtype=np.float64)
+    outside = (((starts < 0) & (ends < 0)) | ((starts >= size) & (ends >= size)))
+    return ~np.any(outside, axis=1)
+
+
+def project_boxes(boxes, intrinsic, extrinsic, image_size):
+    """Projects every box of a render list onto a camera image
+    Args:
+        boxes: list of [origin, size, rotation, annotation, confidence, color] entries in the ego frame
+        intrinsic: 3x3 intrinsic matrix matching the resolution of the image
+        extrinsic: camera pose dictionary with 'rotation' (w,x,y,z) and 'translation', in the ego frame
+        image_size: (width, height) of the image
+    Returns:
+        ProjectedBoxes object
+        """
+    origins, sizes, rotations, _ = render_utils.box_arrays(boxes)
+    centers, matrices, extents = render_utils.box_frames(origins, sizes, rotations)
+    corners = render_utils.box_corners(centers, matrices, extents)
+    front = np.stack((corners[:, FRONT_LINE_CORNERS[0]].mean(axis=1),
+                      corners[:, FRONT_LINE_CORNERS[1]].mean(axis=1)), axis=1)
+    points = np.concatenate((corners, front), axis=1)
+
+    # Ego frame to camera frame: inverse rotation of (p - t), written as (p - t) @ R
+    rotation, translation = render_utils.pose_matrix(extrinsic)
+    points = (points - translation) @ rotation
+    intrinsic = np.asarray(intrinsic, dtype=np.float64)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pixels = points @ intrinsic.T
+        pixels = pixels[..., :2] / pixels[..., 2:3]
+    corner_pixels = pixels[:, :render_utils.CORNERS_PER_BOX]
+    corner_depths = points[:, :render_utils.CORNERS_PER_BOX, 2]
+    inside = ((corner_pixels[..., 0] > 0) & (corner_pixels[..., 0] < image_size[0]) &
+              (corner_pixels[..., 1] > 0) & (corner_pixels[..., 1] < image_size[1]) &
+              (corner_depths > MIN_DEPTH))
+    visible = np.any(inside, axis=1)
+
+    # Edges of the visible boxes, clipped against the near plane, then projected and culled against the image
+    box_indices = np.flatnonzero(visible)
+    edge_points = points[box_indices][:, PROJECTED_EDGES]
+    segment_boxes = np.repeat(box_indices, len(PROJECTED_EDGES))
+    starts, ends, keep = _clip_near(edge_points[:, :, 0].reshape(-1, 3), edge_points[:, :, 1].reshape(-1, 3))
+    segment_boxes = segment_boxes[keep]
+    starts = starts @ intrinsic.T
+    ends = ends @ intrinsic.T
+    starts = starts[:, :2] / starts[:, 2:3]
+    ends = ends[:, :2] / ends[:, 2:3]
+    keep = _cull_rect(starts, ends, image_size)
+    segments = np.stack((starts[keep], ends[keep]), axis=1)
+    return ProjectedBoxes(visible, corner_pixels, segments, segment_boxes[keep])
+
+
+def draw_projected_boxes(image, projection, colors, thicknesses=2):
+    """Draws projected boxes onto an image, one cv2.polylines call per color and thickness
+    Args:
+        image: [h, w, 3] image array, drawn on in place
+        projection: ProjectedBoxes of the image
+        colors: [n, 3] color of every box
+        thicknesses: line thickness shared by every box, or [n] array of thicknesses
+    Returns:
+        None
+        """
+    if len(projection.segments) == 0:
+        return
+    colors = np.asarray(colors, dtype=np.int64).reshape(-1, 3)
+    thicknesses = np.broadcast_to(np.asarray(thicknesses, dtype=np.int64), (len(colors),))
+    styles = np.concatenate((colors, thicknesses[:, None]), axis=1)[projection.segment_boxes]
+    # Truncated like int() did when boxes were drawn one line at a time. Near plane clipping keeps
+    # coordinates finite, the bound only guards against int32 overflow
+    segments = np.clip(projection.segments, -2 ** 30, 2 ** 30).astype(np.int32)
+    unique_styles, groups = np.unique(styles, axis=0, return_inverse=True)
+    groups = groups.reshape(-1)
+    for i, style in enumerate(unique_styles):
+        color = tuple(int(c) for c in style[:3])
+        cv2.polylines(image, list(segments[groups == i]), False, color, int(style[3]))
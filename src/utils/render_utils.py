@@ -0,0 +1,290 @@
+"""
+render_utils.py
+
+Batched geometry for drawing bounding boxes in the 3D widgets.
+
+All boxes of a frame are turned into corners and edges with NumPy and uploaded as a single LineSet,
+instead of one OrientedBoundingBox geometry per box. Box i owns points [8i, 8i + 8) and lines
+[12i, 12i + 12) of the LineSet; the BoxTable side table keeps the name, render list index and
+pose of every box so boxes can still be looked up for picking and editing.
+
+Geometry that is shown on every frame is kept in the scene in slots instead of being removed and
+added again. A PointCloudSlot owns a float32 buffer sized for the largest frame it has shown, and
+pushes frames with the same number of points into the existing GPU buffer with Scene.update_geometry.
+Only the points of the frame are ever drawn, so the geometry's bounding box is the frame's. A PosedSlot holds a
+geometry that only moves, eg: the RGB camera line, and is updated with set_geometry_transform.
+"""
+import numpy as np
+import open3d as o3d
+import open3d.visualization.rendering as rendering
+from utils import pointcloud_utils
+from utils import pose_table
+
+ORIGIN = 0
+SIZE = 1
+ROTATION = 2
+ANNOTATION = 3
+CONFIDENCE = 4
+COLOR = 5
+
+# Corner order of nuScenes' Box.corners(): the first four corners face forward (+x), the last four backward
+CORNER_SIGNS = np.array([[1, 1, 1], [1, -1, 1], [1, -1, -1], [1, 1, -1],
+                         [-1, 1, 1], [-1, -1, 1], [-1, -1, -1], [-1, 1, -1]], dtype=np.float64)
+# Front rectangle, rear rectangle, then the four sides
+BOX_EDGES = np.array([[0, 1], [1, 2], [2, 3], [3, 0],
+                      [4, 5], [5, 6], [6, 7], [7, 4],
+                      [0, 4], [1, 5], [2, 6], [3, 7]], dtype=np.int32)
+CORNERS_PER_BOX = len(CORNER_SIGNS)
+EDGES_PER_BOX = len(BOX_EDGES)
+
+
+def box_arrays(boxes):
+    """Splits a render list into arrays
+    Args:
+        boxes: list of [origin, size, rotation, annotation, confidence, color] entries
+    Returns:
+        origins: [n, 3] array
+        sizes: [n, 3] array of (w, l, h)
+        rotations: [n, 4] array of (w, x, y, z) quaternions
+        colors: [n, 3] array of 0-255 colors
+        """
+    if len(boxes) == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3)), np.zeros((0, 4)), np.zeros((0, 3))
+    origins = np.array([box[ORIGIN] for box in boxes], dtype=np.float64).reshape(-1, 3)
+    sizes = np.array([box[SIZE] for box in boxes], dtype=np.float64).reshape(-1, 3)
+    rotations = np.array([box[ROTATION] for box in boxes], dtype=np.float64).reshape(-1, 4)
+    colors = np.array([box[COLOR] for box in boxes], dtype=np.float64).reshape(-1, 3)
+    return origins, sizes, rotations, colors
+
+
+def pose_matrix(extrinsic):
+    """Returns the (3x3 rotation, translation) of a pose dictionary with 'rotation' (w,x,y,z) and 'translation'"""
+    return pose_table.quaternions_to_matrices(extrinsic['rotation'])[0], np.asarray(extrinsic['translation'], dtype=np.float64)
+
+
+def box_frames(origins, sizes, rotations, extrinsic=None):
+    """Returns the pose and extent of every box, optionally moved from the ego frame by an ego pose
+    Args:
+        origins: [n, 3] box centers
+        sizes: [n, 3] box sizes as (w, l, h)
+        rotations: [n, 4] (w, x, y, z) quaternions
+        extrinsic: optional pose dictionary applied to every box
+    Returns:
+        centers: [n, 3] array
+        matrices: [n, 3, 3] rotation matrices
+        extents: [n, 3] array of (l, w, h), the order Open3D expects
+        """
+    centers = np.asarray(origins, dtype=np.float64).reshape(-1, 3)
+    matrices = pose_table.quaternions_to_matrices(rotations) if len(centers) > 0 else np.zeros((0, 3, 3))
+    extents = np.asarray(sizes, dtype=np.float64).reshape(-1, 3)[:, [1, 0, 2]]
+    if extrinsic is not None:
+        rotation, translation = pose_matrix(extrinsic)
+        centers = centers @ rotation.T + translation
+        matrices = rotation @ matrices
+    return centers, matrices, extents
+
+
+def box_corners(centers, matrices, extents):
+    """Returns the 8 corners of every box
+    Args:
+        centers: [n, 3] box centers
+        matrices: [n, 3, 3] box rotation matrices
+        extents: [n, 3] box extents as (l, w, h)
+    Returns:
+        [n, 8, 3] array, corners ordered like nuScenes' Box.corners()
+        """
+    local = CORNER_SIGNS[None, :, :] * (np.asarray(extents)[:, None, :] / 2)
+    return np.einsum('nij,nkj->nki', matrices, local) + np.asarray(centers)[:, None, :]
+
+
+def box_lines(num_boxes):
+    """Returns the [12n, 2] line indices connecting the corners returned by box_corners"""
+    offsets = np.arange(num_boxes, dtype=np.int32)[:, None, None] * CORNERS_PER_BOX
+    return (BOX_EDGES[None, :, :] + offsets).reshape(-1, 2)
+
+
+class BoxTable:
+    """Side table of the boxes drawn in a batched LineSet"""
+    def __init__(self, names, render_indices, centers, matrices, extents, confidences):
+        self.names = names
+        self.render_indices = render_indices
+        self.centers = centers
+        self.matrices = matrices
+        self.extents = extents
+        self.confidences = confidences
+        self.lookup = {name: i for i, name in enumerate(names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def find(self, name):
+        """Returns the index of the box with a given name, or -1"""
+        return self.lookup.get(name, -1)
+
+    def box_of_line(self, line_index):
+        """Returns the index of the box a LineSet line belongs to"""
+        return line_index // EDGES_PER_BOX
+
+    def lines_of_box(self, box_index):
+        """Returns the (start, stop) range of the LineSet lines of one box"""
+        return box_index * EDGES_PER_BOX, (box_index + 1) * EDGES_PER_BOX
+
+    def oriented_box(self, box_index):
+        """Returns one box as an OrientedBoundingBox, eg: for editing"""
+        return o3d.geometry.OrientedBoundingBox(self.centers[box_index], self.matrices[box_index], self.extents[box_index])
+
+
+def box_table(boxes, extrinsic=None):
+    """Builds the side table of a render list
+    Args:
+        boxes: list of [origin, size, rotation, annotation, confidence, color] entries in the ego frame
+        extrinsic: optional ego pose dictionary, to move the boxes to the global frame
+    Returns:
+        BoxTable, box i is named annotation + str(i) like the per-box geometries are
+        """
+    origins, sizes, rotations, _ = box_arrays(boxes)
+    centers, matrices, extents = box_frames(origins, sizes, rotations, extrinsic)
+    names = [box[ANNOTATION] + str(i) for i, box in enumerate(boxes)]
+    confidences = np.array([box[CONFIDENCE] for box in boxes], dtype=np.float64)
+    return BoxTable(names, np.arange(len(boxes)), centers, matrices, extents, confidences)
+
+
+def box_lineset(boxes, extrinsic=None):
+    """Builds a single LineSet for every box of a render list
+    Args:
+        boxes: list of [origin, size, rotation, annotation, confidence, color] entries in the ego frame
+        extrinsic: optional ego pose dictionary, to draw the boxes in the global frame
+    Returns:
+        lineset: o3d.geometry.LineSet with one color per edge
+        table: BoxTable of the boxes
+        """
+    table = box_table(boxes, extrinsic)
+    colors = box_arrays(boxes)[3]
+    corners = box_corners(table.centers, table.matrices, table.extents)
+
+    lineset = o3d.geometry.LineSet()
+    lineset.points = o3d.utility.Vector3dVector(corners.reshape(-1, 3))
+    lineset.lines = o3d.utility.Vector2iVector(box_lines(len(boxes)))
+    lineset.colors = o3d.utility.Vector3dVector(np.repeat(colors / 255.0, EDGES_PER_BOX, axis=0))
+    return lineset, table
+
+
+# Point cloud slots grow to this many times the size of the frame that did not fit, so a
+# slightly larger frame later on does not reallocate the buffer again
+SLOT_GROWTH = 1.25
+
+
+class PointCloudSlot:
+    """Point cloud geometry that stays in a scene across frames
+       The points are copied into a preallocated buffer, and the GPU buffer is updated in place while
+       the number of points stays the same, eg: under a point budget. A different number of points
+       adds the geometry again, sized to the frame"""
+    def __init__(self, scene, name, material, growth=SLOT_GROWTH):
+        """
+        Args:
+            scene: rendering.Open3DScene the point cloud is shown in
+            name: geometry name in the scene
+            material: rendering.MaterialRecord of the point cloud
+            growth: factor the buffer is grown by when a frame does not fit
+            """
+        self.scene = scene
+        self.name = name
+        self.material = material
+        self.growth = growth
+        self.buffer = np.zeros((0, 3), dtype=np.float32)
+        self.count = 0
+
+    @property
+    def capacity(self):
+        return len(self.buffer)
+
+    def reserve(self, num_points):
+        """Makes sure frames of up to num_points points can be shown without reallocating"""
+        if num_points > self.capacity:
+            self.buffer = np.zeros((num_points, 3), dtype=np.float32)
+
+    def update(self, points, extrinsic=None):
+        """Shows a new point cloud in the slot
+        Args:
+            points: [n, 3] point array
+            extrinsic: optional ego pose dictionary, the points are moved to the global frame while they are copied
+        Returns:
+            [n, 3] float32 view of the slot buffer holding the shown points, only valid until the next update
+            """
+        count = len(points)
+        if count > self.capacity:
+            self.reserve(int(count * self.growth))
+        view = self.buffer[:count]
+        if extrinsic is not None:
+            pointcloud_utils.transform_points(points, extrinsic, out=view)
+        else:
+            view[...] = points
+
+        if count == 0:
+            self.remove()
+            return view
+        # Only the rows of this frame are drawn. The GPU buffer is sized when the geometry is added,
+        # so it can only be updated in place with the same number of points
+        cloud = o3d.t.geometry.PointCloud(o3d.core.Tensor.from_numpy(view))
+        if self.scene.has_geometry(self.name) and count == self.count:
+            self.scene.scene.update_geometry(self.name, cloud, rendering.Scene.UPDATE_POINTS_FLAG)
+        else:
+            self.remove()
+            # No downsampled copy, update_geometry would leave it showing the first frame
+            self.scene.add_geometry(self.name, cloud, self.material, False)
+        self.count = count
+        return view
+
+    def remove(self):
+        """Removes the point cloud from the scene, the next update adds it again"""
+        if self.scene.has_geometry(self.name):
+            self.scene.remove_geometry(self.name)
+        self.count = 0
+
+
+class PosedSlot:
+    """Geometry that stays in a scene across frames and is only moved"""
+    def __init__(self, scene, name, geometry, material):
+        """
+        Args:
+            scene: rendering.Open3DScene the geometry is shown in
+            name: geometry name in the scene
+            geometry: geometry in its own frame
+            material: rendering.MaterialRecord of the geometry
+            """
+        self.scene = scene
+        self.name = name
+        self.geometry = geometry
+        self.material = material
+
+    def update(self, transform):
+        """Moves the geometry, adding it to the scene if it is not there (anymore)
+        Args:
+            transform: 4x4 transform from the geometry frame to the global frame
+        Returns:
+            None
+            """
+        if not self.scene.has_geometry(self.name):
+            self.scene.add_geometry(self.name, self.geometry, self.material)
+        self.scene.set_geometry_transform(self.name, transform)
+
+
+def pose_transform(*extrinsics):
+    """Returns the 4x4 transform of a chain of pose dictionaries, outermost first
+       eg: pose_transform(frame_extrinsic, image_extrinsic) moves camera coordinates to the global frame
+        """
+    transform = np.eye(4)
+    for extrinsic in extrinsics:
+        pose = np.eye(4)
+        pose[:3, :3], pose[:3, 3] = pose_matrix(extrinsic)
+        transform = transform @ pose
+    return transform
+
+
+def camera_line():
+    """Returns the 2m line along the optical axis that indicates the RGB camera view, in the camera frame"""
+    line = o3d.geometry.LineSet()
+    line.points = o3d.utility.Vector3dVector([[0, 0, 0], [0, 0, 2]])
+    line.lines = o3d.utility.Vector2iVector([[0, 1]])
+    line.colors = o3d.utility.Vector3dVector([[1.0, 0, 0]])
+    return line
@@ -0,0 +1,143 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+from unittest import mock
+
+# Run from anywhere, eg: python utils/scan-cache-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import box_store
+from utils import error_scan
+from utils import scan_cache
+from utils import scene_loader
+from utils import synthetic_scene
+
+# These tests run offline on a scene written by synthetic_scene, every test scans its own copy
+
+NUM_FRAMES = 10
+EDITED_FRAME = 4
+
+scene_dir = tempfile.TemporaryDirectory()
+scene_path = os.path.join(scene_dir.name, "synthetic")
+
+
+def setUpModule():
+    synthetic_scene.generate_scene(scene_path, num_frames=NUM_FRAMES, num_cameras=1, num_lidars=1,
+                                   points_per_sweep=1000, image_size=(64, 36))
+
+
+def tearDownModule():
+    scene_dir.cleanup()
+
+
+def scene_settings(min_confidence=50):
+    """Settings selecting every class of the scene"""
+    gt_classes = sorted(synthetic_scene.CLASSES)
+    pred_classes = sorted({pred_name for (pred_name, _, _, _) in synthetic_scene.CLASSES.values()})
+    return error_scan.ScanSettings(gt_classes, pred_classes, min_confidence)
+
+
+def save_frame(lct_path, frame_num):
+    """Saves a frame without its first predicted box, like the editor does"""
+    boxes = box_store.load_frame_boxes(lct_path, "pred_bounding", frame_num)
+    boxes['boxes'] = boxes['boxes'][1:]
+    box_store.save_frame_boxes(lct_path, "pred_bounding", frame_num, boxes)
+
+
+# tests that a rescan only matches the frames whose boxes changed
+class TestRescan(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.lct_path = os.path.join(self.work_dir.name, "synthetic")
+        shutil.copytree(scene_path, self.lct_path)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def scan(self, settings):
+        return error_scan.run_scan(self.lct_path, NUM_FRAMES, settings, workers=1, chunk_size=3)
+
+    def test_cached_results_are_the_same(self):
+        settings = scene_settings()
+        (found, cached_frames) = self.scan(settings)
+        self.assertEqual(cached_frames, 0)
+        (cached_found, cached_frames) = self.scan(settings)
+        self.assertEqual(cached_frames, NUM_FRAMES)
+        self.assertEqual(cached_found, found)
+        self.assertEqual(error_scan.run_scan(self.lct_path, NUM_FRAMES, settings, workers=1, use_cache=False)[0], found)
+
+    def test_saved_frame_is_rescanned(self):
+        settings = scene_settings()
+        self.scan(settings)
+        save_frame(self.lct_path, EDITED_FRAME)
+        (found, cached_frames) = self.scan(settings)
+        self.assertEqual(cached_frames, NUM_FRAMES - 1)
+        self.assertEqual(found, error_scan.run_scan(self.lct_path, NUM_FRAMES, settings, workers=1, use_cache=False)[0])
+
+    def test_invalidate_frames(self):
+        # Both settings lose the saved frame, and only that frame
+        settings = [scene_settings(30), scene_settings(60)]
+        for scan_settings in settings:
+            self.scan(scan_settings)
+        scan_cache.invalidate_frames(self.lct_path, [EDITED_FRAME])
+        for scan_settings in settings:
+            cache = scan_cache.ScanCache(self.lct_path, scan_settings)
+            self.assertEqual(sorted(int(frame_num) for frame_num in cache.frames),
+                             [frame_num for frame_num in range(NUM_FRAMES) if frame_num != EDITED_FRAME])
+
+    def test_other_settings_are_not_reused(self):
+        self.scan(scene_settings(50))
+        self.assertEqual(self.scan(scene_settings(60))[1], 0)
+
+    def test_least_recently_used_settings_are_deleted(self):
+        for min_confidence in range(scan_cache.MAX_SETTINGS + 2):
+            self.scan(scene_settings(min_confidence))
+        directory = os.path.join(self.lct_path, *scan_cache.CACHE_DIR.split("/"))
+        self.assertEqual(len(os.listdir(directory)), scan_cache.MAX_SETTINGS)
+        self.assertFalse(os.path.exists(scan_cache.cache_path(self.lct_path, scan_cache.settings_key(scene_settings(0)))))
+
+
+# tests the cache keys
+class TestKeys(unittest.TestCase):
+    def test_class_order(self):
+        settings = scene_settings()
+        reordered = error_scan.ScanSettings(settings.gt_classes[::-1], settings.pred_classes[::-1], settings.min_confidence)
+        self.assertEqual(scan_cache.settings_key(settings), scan_cache.settings_key(reordered))
+
+    def test_frame_version_changes_on_save(self):
+        work_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(work_dir.cleanup)
+        lct_path = os.path.join(work_dir.name, "synthetic")
+        shutil.copytree(scene_path, lct_path)
+        before = scan_cache.frame_version(lct_path, EDITED_FRAME)
+        other = scan_cache.frame_version(lct_path, EDITED_FRAME + 1)
+        save_frame(lct_path, EDITED_FRAME)
+        self.assertNotEqual(scan_cache.frame_version(lct_path, EDITED_FRAME), before)
+        self.assertEqual(scan_cache.frame_version(lct_path, EDITED_FRAME + 1), other)
+
+    def test_pack_is_not_persisted(self):
+        pack_path = os.path.join(scene_dir.name, "synthetic" + scene_loader.PACK_EXTENSION)
+        scene_loader.write_pack(scene_path, pack_path)
+        settings = scene_settings()
+        cache = scan_cache.ScanCache(pack_path, settings)
+        cache.put(0, scan_cache.frame_version(pack_path, 0), {})
+        cache.save()
+        self.assertEqual(scan_cache.ScanCache(pack_path, settings).frames, {})
+
+
+# tests that a scan failing before it starts matching still reports how it ended
+class TestFailures(unittest.TestCase):
+    def test_unreadable_versions(self):
+        with mock.patch.object(scan_cache, "frame_version", side_effect=OSError("unreadable")):
+            with self.assertRaises(OSError):
+                error_scan.run_scan(scene_path, NUM_FRAMES, scene_settings(), workers=1)
+
+    def test_pool_not_started(self):
+        with mock.patch.object(error_scan.concurrent.futures, "ProcessPoolExecutor", side_effect=OSError("no processes")):
+            with self.assertRaises(OSError):
+                error_scan.run_scan(scene_path, NUM_FRAMES, scene_settings(), workers=1, use_cache=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+scan_cache.py
+
+On-disk cache of error scan results, so re-running a scan only matches the frames whose inputs changed.
+
+Results are kept per scan settings (class selection, confidence threshold, matching criterion, kinds
+of errors), one file per settings in store/error_scan/. Every frame's entry records the version of the
+box data it was computed from: the modification times of the frame's GT and predicted boxes.json
+and of the box stores. An entry is used only while all of them are unchanged, and the editor also
+drops the entries of the frames it saves. Scene packs are read-only, so their results are not kept.
+"""
+import hashlib
+import json
+import os
+from utils import box_store
+from utils import scene_loader
+
+CACHE_DIR = box_store.STORE_DIR + "/error_scan"
+# Bumped when the matching or the result layout changes, so older results are not reused
+CACHE_VERSION = 1
+# Settings whose results are kept, the least recently used ones are deleted
+MAX_SETTINGS = 16
+
+
+def settings_key(settings):
+    """Returns a short hash of the scan settings, the class lists are order independent"""
+    values = settings.to_dict()
+    values['gt_classes'] = sorted(values['gt_classes'])
+    values['pred_classes'] = sorted(values['pred_classes'])
+    values['version'] = CACHE_VERSION
+    return hashlib.sha1(json.dumps(values, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def _mtime(source, path):
+    try:
+        return source.mtime(path)
+    except (OSError, KeyError):
+        return None
+
+
+def frame_version(lct_path, frame_num):
+    """Returns the version of the box data of one frame, a list that changes whenever a file it is read from does"""
+    source = scene_loader.open_scene(lct_path)
+    version = []
+    for kind in box_store.BOX_KINDS:
+        version.append(_mtime(source, kind + "/" + str(frame_num) + "/boxes.json"))
+        version.append(_mtime(source, box_store.STORE_DIR + "/" + kind + "/meta.json"))
+    return version
+
+
+def cache_path(lct_path, key):
+    return os.path.join(lct_path, *CACHE_DIR.split("/"), key + ".json")
+
+
+class ScanCache:
+    """Cached results of one scene and one set of scan settings"""
+    def __init__(self, lct_path, settings):
+        self.lct_path = lct_path
+        self.persistent = not scene_loader.is_pack(lct_path)
+        self.path = cache_path(lct_path, settings_key(settings))
+        self.frames = {}
+        self.changed = False
+        if self.persistent and os.path.exists(self.path):
+            try:
+                with open(self.path) as f:
+                    self.frames = json.load(f)['frames']
+            except (OSError, ValueError, KeyError):
+                self.frames = {}
+
+    def get(self, frame_num, version):
+        """Returns the cached errors of a frame, or None if there are none for this version of its boxes"""
+        entry = self.frames.get(str(frame_num))
+        if entry is None or entry[0] != version:
+            return None
+        return entry[1]
+
+    def put(self, frame_num, version, errors):
+        self.frames[str(frame_num)] = [version, errors]
+        self.changed = True
+
+    def save(self):
+        """Writes the cache if it changed, then deletes the results of the least recently used settings"""
+        if not self.persistent:
+            return
+        try:
+            if not self.changed:
+                # Only marks the results as recently used
+                if os.path.exists(self.path):
+                    os.utime(self.path)
+                return
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            # Written next to the cache and renamed, so a scan running at the same time never reads half a file
+            temp_path = self.path + "." + str(os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump({'version': CACHE_VERSION, 'frames': self.frames}, f)
+            os.replace(temp_path, self.path)
+            self.changed = False
+            _prune(os.path.dirname(self.path))
+        except OSError:
+            # A scene we cannot write to is still scanned, just without the cache
+            pass
+
+
+def _prune(directory):
+    paths = [os.path.join(directory, name) for name in os.listdir(directory) if name.endswith(".json")]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[MAX_SETTINGS:]:
+        os.remove(path)
+
+
+def invalidate_frames(lct_path, frames):
+    """Drops the cached results of some frames for every scan settings, called when their boxes are saved
+    Args:
+        lct_path: path to LCT directory
+        frames: frame numbers whose boxes changed
+    Returns:
+        None
+        """
+    directory = os.path.join(lct_path, *CACHE_DIR.split("/"))
+    if scene_loader.is_pack(lct_path) or not os.path.isdir(directory):
+        return
+    keys = {str(frame_num) for frame_num in frames}
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            with open(path) as f:
+                cached = json.load(f)
+            if keys.isdisjoint(cached['frames']):
+                continue
+            for key in keys:
+                cached['frames'].pop(key, None)
+            temp_path = path + "." + str(os.getpid())
+            with open(temp_path, "w") as f:
+                json.dump(cached, f)
+            os.replace(temp_path, path)
+        except (ValueError, KeyError):
+            # Unreadable caches are not trusted
+            os.remove(path)
+        except OSError:
+            pass
@@ -0,0 +1,296 @@
+"""
+scene_loader.py
+
+Common read API for LCT scenes, whether they are stored as a loose directory tree or as a
+single packed file.
+
+A scene pack is one file holding every file of an LCT directory as a blob:
+
+    header (32 bytes): magic, version, reserved, index offset, index length
+    blobs, each aligned to BLOB_ALIGNMENT bytes
+    index: JSON list with one (path, kind, sensor, frame, offset, length) entry per blob
+
+The pack is memory mapped once, so reading a frame costs no open() or stat() calls. Point clouds
+and .npy arrays are returned as views into the mapping. Packs are read-only.
+"""
+import io
+import json
+import mmap
+import os
+import numpy as np
+from PIL import Image
+from utils import pointcloud_utils
+
+PACK_EXTENSION = ".lctpack"
+PACK_MAGIC = b"LCTPACK1"
+PACK_VERSION = 1
+BLOB_ALIGNMENT = 64
+NPY_HEADER_LIMIT = 65536
+
+# magic, version, reserved, index offset, index length
+PACK_HEADER = np.dtype([("magic", "S8"), ("version", "<u4"), ("reserved", "<u4"), ("index_offset", "<u8"), ("index_length", "<u8")])
+
+# Open scenes, keyed by absolute path
+_open_scenes = {}
+
+
+def entry_key(path):
+    """Splits a path relative to the scene root into its (kind, sensor, frame) key
+    Args:
+        path: relative path using '/' separators, eg: 'cameras/CAM_FRONT/3.jpg'
+    Returns:
+        kind: top level directory (cameras, pointcloud, bounding, ...), or '' for files in the scene root
+        sensor: sensor name for cameras/ and pointcloud/, otherwise None
+        frame: frame number, or None for files that do not belong to a frame
+        """
+    parts = path.split("/")
+    if len(parts) == 1:
+        return "", None, None
+    kind = parts[0]
+    sensor = None
+    if kind in ("cameras", "pointcloud") and len(parts) == 3:
+        sensor = parts[1]
+
+    # The frame number is either a directory (bounding/3/boxes.json) or a file name (ego/3.json)
+    frame = None
+    for part in parts[1:]:
+        stem = os.path.splitext(part)[0]
+        if stem.isdigit():
+            frame = int(stem)
+            break
+    return kind, sensor, frame
+
+
+class DirectorySource:
+    """Reads a scene stored as a loose LCT directory"""
+    packed = False
+
+    def __init__(self, path):
+        self.path = path
+
+    def full_path(self, path):
+        return os.path.join(self.path, *path.split("/"))
+
+    def exists(self, path):
+        return os.path.exists(self.full_path(path))
+
+    def mtime(self, path):
+        return os.path.getmtime(self.full_path(path))
+
+    def listdir(self, path):
+        """Returns the names of the entries of one directory of the scene"""
+        return os.listdir(self.full_path(path))
+
+    def read_bytes(self, path):
+        with open(self.full_path(path), "rb") as f:
+            return f.read()
+
+    def read_json(self, path):
+        with open(self.full_path(path)) as f:
+            return json.load(f)
+
+    def read_image(self, path):
+        return Image.open(self.full_path(path))
+
+    def load_npy(self, path):
+        return np.load(self.full_path(path), mmap_mode="r")
+
+    def points_path(self, sensor, frame_num):
+        """Returns the relative path of the point cloud of one sensor and frame"""
+        full_path = pointcloud_utils.points_path(self.path, sensor, frame_num)
+        return "pointcloud/" + sensor + "/" + os.path.basename(full_path)
+
+    def read_points(self, sensor, frame_num):
+        return pointcloud_utils.load_points(pointcloud_utils.points_path(self.path, sensor, frame_num))
+
+    def read_bin(self, path):
+        """Returns the (points, intensity) arrays of a .bin file of the scene, see pointcloud_utils.read_bin"""
+        return pointcloud_utils.read_bin(self.full_path(path))
+
+    def count_points(self, sensor, frame_num):
+        """Returns the number of points of one sensor and frame, reading only the file header"""
+        return pointcloud_utils.count_points(pointcloud_utils.points_path(self.path, sensor, frame_num))
+
+
+class PackSource:
+    """Reads a scene stored as a single pack file"""
+    packed = True
+
+    def __init__(self, path):
+        self.path = path
+        self.file = open(path, "rb")
+        self.buffer = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        # Copied, so the mapping can be closed if this is not a pack
+        header = np.frombuffer(self.buffer, dtype=PACK_HEADER, count=1).copy()
+        if header["magic"][0] != PACK_MAGIC:
+            self.buffer.close()
+            self.file.close()
+            raise ValueError(path + " is not an LCT scene pack")
+        index_offset = int(header["index_offset"][0])
+        index_length = int(header["index_length"][0])
+        self.entries = json.loads(self.buffer[index_offset:index_offset + index_length])
+
+        # Lookup tables by path, and by directory for listdir()
+        self.lookup = {}
+        self.children = {}
+        for entry in self.entries:
+            self.lookup[entry["path"]] = entry
+            parts = entry["path"].split("/")
+            for depth in range(len(parts)):
+                self.children.setdefault("/".join(parts[:depth]), set()).add(parts[depth])
+        self.pack_mtime = os.path.getmtime(path)
+
+    def entry(self, path):
+        if path not in self.lookup:
+            raise FileNotFoundError(os.path.join(self.path, path))
+        return self.lookup[path]
+
+    def frames(self, kind, sensor=None):
+        """Returns the sorted frame numbers that have at least one blob of a kind (and sensor)"""
+        return sorted({entry["frame"] for entry in self.entries
+                       if entry["kind"] == kind and entry["frame"] is not None and (sensor is None or entry["sensor"] == sensor)})
+
+    def exists(self, path):
+        return path.rstrip("/") in self.lookup or path.rstrip("/") in self.children
+
+    def mtime(self, path):
+        self.entry(path)
+        return self.pack_mtime
+
+    def listdir(self, path):
+        path = path.rstrip("/")
+        if path not in self.children:
+            raise FileNotFoundError(os.path.join(self.path, path))
+        return sorted(self.children[path])
+
+    def view(self, path):
+        """Returns a memoryview of one blob, without copying it"""
+        entry = self.entry(path)
+        return memoryview(self.buffer)[entry["offset"]:entry["offset"] + entry["length"]]
+
+    def read_bytes(self, path):
+        return bytes(self.view(path))
+
+    def read_json(self, path):
+        return json.loads(bytes(self.view(path)))
+
+    def read_image(self, path):
+        return Image.open(io.BytesIO(self.view(path)))
+
+    def load_npy(self, path):
+        entry = self.entry(path)
+        # Only the header is parsed from a copy, the array itself stays in the mapping
+        stream = io.BytesIO(self.view(path)[:NPY_HEADER_LIMIT])
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(stream)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(stream)
+        count = int(np.prod(shape))
+        array = np.frombuffer(self.buffer, dtype=dtype, count=count, offset=entry["offset"] + stream.tell())
+        return array.reshape(shape, order="F" if fortran_order else "C")
+
+    def points_path(self, sensor, frame_num):
+        base = "pointcloud/" + sensor + "/" + str(frame_num)
+        if base + pointcloud_utils.BIN_EXTENSION in self.lookup:
+            return base + pointcloud_utils.BIN_EXTENSION
+        return base + pointcloud_utils.PCD_EXTENSION
+
+    def read_points(self, sensor, frame_num):
+        return self.read_bin(self.points_path(sensor, frame_num))[0]
+
+    def read_bin(self, path):
+        return pointcloud_utils.bin_from_buffer(self.buffer, self.entry(path)["offset"])
+
+    def count_points(self, sensor, frame_num):
+        header = np.frombuffer(self.buffer, dtype=pointcloud_utils.BIN_HEADER, count=1,
+                               offset=self.entry(self.points_path(sensor, frame_num))["offset"])
+        return int(header["num_points"][0])
+
+
+def is_pack(path):
+    return os.path.isfile(path)
+
+
+def open_scene(path):
+    """Opens a scene for reading, reusing an already open scene when possible
+    Args:
+        path: path to an LCT directory or scene pack
+    Returns:
+        DirectorySource or PackSource object
+        """
+    key = os.path.abspath(path)
+    source = _open_scenes.get(key)
+    if source is None or (source.packed and source.pack_mtime != os.path.getmtime(key)):
+        source = PackSource(path) if is_pack(path) else DirectorySource(path)
+        _open_scenes[key] = source
+    return source
+
+
+def _walk_scene(lct_path):
+    """Yields the relative path of every file of an LCT directory"""
+    for root, dirs, files in os.walk(lct_path):
+        dirs.sort()
+        for name in sorted(files):
+            if name == ".DS_Store":
+                continue
+            yield os.path.relpath(os.path.join(root, name), lct_path).replace(os.sep, "/")
+
+
+def write_pack(lct_path, pack_path):
+    """Packs an LCT directory into a single scene pack
+       Point clouds stored as .pcd are converted to the .bin layout, so they can be read in place
+    Args:
+        lct_path: path to LCT directory
+        pack_path: path of the pack file to write
+    Returns:
+        number of blobs written
+        """
+    entries = []
+    with open(pack_path, "wb") as f:
+        f.write(np.zeros(1, dtype=PACK_HEADER).tobytes())
+        for path in _walk_scene(lct_path):
+            full_path = os.path.join(lct_path, *path.split("/"))
+            kind, sensor, frame = entry_key(path)
+            if kind == "pointcloud" and path.endswith(pointcloud_utils.PCD_EXTENSION):
+                blob = pointcloud_utils.bin_bytes(pointcloud_utils.load_points(full_path))
+                path = path[:-len(pointcloud_utils.PCD_EXTENSION)] + pointcloud_utils.BIN_EXTENSION
+            else:
+                with open(full_path, "rb") as blob_file:
+                    blob = blob_file.read()
+
+            # Keep every blob aligned so arrays can be viewed in place
+            padding = -f.tell() % BLOB_ALIGNMENT
+            f.write(b"\0" * padding)
+            entries.append({"path": path, "kind": kind, "sensor": sensor, "frame": frame,
+                            "offset": f.tell(), "length": len(blob)})
+            f.write(blob)
+
+        index = json.dumps(entries).encode("utf-8")
+        header = np.zeros(1, dtype=PACK_HEADER)
+        header["magic"] = PACK_MAGIC
+        header["version"] = PACK_VERSION
+        header["index_offset"] = f.tell()
+        header["index_length"] = len(index)
+        f.write(index)
+        f.seek(0)
+        f.write(header.tobytes())
+    return len(entries)
+
+
+def read_pack(pack_path, lct_path):
+    """Unpacks a scene pack into an LCT directory
+    Args:
+        pack_path: path to scene pack
+        lct_path: path of the LCT directory to create
+    Returns:
+        number of files written
+        """
+    source = PackSource(pack_path)
+    for entry in source.entries:
+        full_path = os.path.join(lct_path, *entry["path"].split("/"))
+        os.makedirs(os.path.dirname(full_path), exist_ok=True)
+        with open(full_path, "wb") as f:
+            f.write(source.view(entry["path"]))
+    return len(source.entries)
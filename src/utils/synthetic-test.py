@@ -0,0 +1,146 @@
+import unittest
+import os
+import shutil
+import sys
+import tempfile
+import numpy as np
+
+# Run from anywhere, eg: python utils/synthetic-test.py
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from utils import box_store
+from utils import manifest
+from utils import pointcloud_utils
+from utils import pose_table
+from utils import scene_loader
+from utils import synthetic_scene
+from utils import testing
+
+# These tests run offline on a scene written by synthetic_scene, no downloaded dataset is needed
+
+NUM_FRAMES = 12
+NUM_CAMERAS = 2
+NUM_LIDARS = 2
+POINTS_PER_SWEEP = 5000
+
+scene_dir = tempfile.TemporaryDirectory()
+lct_path = os.path.join(scene_dir.name, "synthetic")
+
+
+def setUpModule():
+    synthetic_scene.generate_scene(lct_path, num_frames=NUM_FRAMES, num_cameras=NUM_CAMERAS, num_lidars=NUM_LIDARS,
+                                   points_per_sweep=POINTS_PER_SWEEP, image_size=(320, 180))
+
+
+def tearDownModule():
+    scene_dir.cleanup()
+
+
+# tests that the scene passes the same validation the viewer and the conversion tools use
+class TestLayout(unittest.TestCase):
+    def test_is_lct_directory(self):
+        self.assertTrue(testing.is_lct_directory(lct_path))
+
+    def test_manifest(self):
+        meta = manifest.load_manifest(lct_path)
+        self.assertEqual(meta.num_frames, NUM_FRAMES)
+        self.assertEqual(len(meta.camera_sensors), NUM_CAMERAS)
+        self.assertEqual(len(meta.lidar_sensors), NUM_LIDARS)
+        self.assertEqual(sorted(meta.gt_classes), sorted(synthetic_scene.CLASSES))
+
+    def test_pose_table(self):
+        self.assertEqual(pose_table.load_pose_table(lct_path).num_frames, NUM_FRAMES)
+
+
+# tests that classes added by the editor after conversion are in the manifest's class catalog
+class TestEditedCatalog(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.TemporaryDirectory()
+        self.lct_path = os.path.join(self.work_dir.name, "synthetic")
+        shutil.copytree(lct_path, self.lct_path)
+
+    def tearDown(self):
+        self.work_dir.cleanup()
+
+    def rename_first_box(self, kind, annotation):
+        boxes = box_store.load_frame_boxes(self.lct_path, kind, 1)
+        boxes['boxes'][0]['annotation'] = annotation
+        box_store.save_frame_boxes(self.lct_path, kind, 1, boxes)
+
+    def test_unedited(self):
+        meta = manifest.load_manifest(self.lct_path)
+        self.assertEqual(meta.classes("bounding"), meta.gt_classes)
+        self.assertEqual(meta.classes("pred_bounding"), meta.pred_classes)
+
+    def test_added_classes(self):
+        self.rename_first_box("bounding", "new_gt_class")
+        self.rename_first_box("pred_bounding", "new_pred_class")
+        meta = manifest.load_manifest(self.lct_path)
+        self.assertEqual(meta.classes("bounding"), meta.gt_classes + ["new_gt_class"])
+        self.assertEqual(meta.classes("pred_bounding"), meta.pred_classes + ["new_pred_class"])
+
+    def test_added_classes_without_box_store(self):
+        shutil.rmtree(os.path.join(self.lct_path, box_store.STORE_DIR, "bounding"))
+        self.rename_first_box("bounding", "new_gt_class")
+        self.assertIn("new_gt_class", manifest.load_manifest(self.lct_path).classes("bounding"))
+
+
+# tests that the viewer and the command line tools can open the scene once it is packed into one file
+class TestPack(unittest.TestCase):
+    def setUp(self):
+        self.pack_path = os.path.join(scene_dir.name, "synthetic" + scene_loader.PACK_EXTENSION)
+        if not os.path.exists(self.pack_path):
+            scene_loader.write_pack(lct_path, self.pack_path)
+
+    def test_is_lct_directory(self):
+        self.assertTrue(testing.is_lct_directory(self.pack_path))
+
+    def test_not_a_pack(self):
+        not_pack = os.path.join(scene_dir.name, "not-a-pack" + scene_loader.PACK_EXTENSION)
+        with open(not_pack, "wb") as f:
+            f.write(b"\0" * 64)
+        self.assertFalse(testing.is_lct_directory(not_pack))
+
+    def test_boxes(self):
+        for frame_num in range(NUM_FRAMES):
+            for kind in box_store.BOX_KINDS:
+                self.assertEqual(box_store.load_frame_boxes(self.pack_path, kind, frame_num),
+                                 box_store.load_frame_boxes(lct_path, kind, frame_num))
+
+
+# tests that the point clouds and boxes agree with each other
+class TestContents(unittest.TestCase):
+    def test_points_per_sweep(self):
+        for sensor in os.listdir(os.path.join(lct_path, "pointcloud")):
+            points = pointcloud_utils.load_points(pointcloud_utils.points_path(lct_path, sensor, 0))
+            self.assertEqual(len(points), POINTS_PER_SWEEP)
+
+    def test_internal_points(self):
+        for frame_num in range(NUM_FRAMES):
+            boxes = box_store.load_frame_boxes(lct_path, "bounding", frame_num)['boxes']
+            total = sum(box['internal_pts'] for box in boxes)
+            self.assertLessEqual(total, POINTS_PER_SWEEP * NUM_LIDARS)
+            self.assertGreater(total, 0)
+
+    def test_tracks_move_plausibly(self):
+        # Tracks seen in consecutive frames move no faster than the fastest class, relative to the vehicle
+        max_speed = max(speed for (_, _, speed, _) in synthetic_scene.CLASSES.values()) * 1.2 + synthetic_scene.EGO_SPEED
+        max_step = max_speed * synthetic_scene.FRAME_PERIOD * 1.5
+        previous = {}
+        for frame_num in range(NUM_FRAMES):
+            boxes = box_store.load_frame_boxes(lct_path, "bounding", frame_num)['boxes']
+            current = {box['id']: np.array(box['origin']) for box in boxes}
+            for track_id in current.keys() & previous.keys():
+                self.assertLess(np.linalg.norm(current[track_id] - previous[track_id]), max_step)
+            previous = current
+
+    def test_predictions(self):
+        pred_names = {pred_name for (pred_name, _, _, _) in synthetic_scene.CLASSES.values()}
+        for frame_num in range(NUM_FRAMES):
+            boxes = box_store.load_frame_boxes(lct_path, "pred_bounding", frame_num)['boxes']
+            for box in boxes:
+                self.assertIn(box['annotation'], pred_names)
+                self.assertTrue(0 <= box['confidence'] <= 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,382 @@
+"""
+synthetic_scene.py
+
+Generates synthetic LCT scenes, so the viewer, the benchmarks and the tests can run without a
+downloaded dataset, at any scale.
+
+The ego vehicle drives along a gently curving road. Objects are tracks with a constant speed and
+yaw rate that appear near the vehicle and live for about TRACK_FRAMES frames, so every track id
+spans consecutive frames with plausible motion. Every lidar sweep casts rays from the sensor
+against the ground, a ring of distant walls and the ground truth boxes, so boxes occlude each
+other and their internal point counts match the cloud. Predictions are noisy copies of most
+ground truth boxes, with some of them mislabeled, plus low confidence false positives.
+Everything is written through dataformat_utils, like the conversion tools do.
+"""
+import os
+import numpy as np
+from PIL import Image
+from pyquaternion import Quaternion
+from utils import dataformat_utils
+
+FRAME_PERIOD = 0.1
+START_TIMESTAMP = 1500000000000000
+EGO_SPEED = 10.0
+# Mean number of frames a track lives for
+TRACK_FRAMES = 100
+# Distance from the vehicle at which tracks appear
+SPAWN_RANGE = (8.0, 60.0)
+
+# GT name: (prediction name, [w, l, h], speed in m/s, share of the tracks)
+CLASSES = {
+    'vehicle.car': ('car', [1.9, 4.6, 1.7], 9.0, 0.55),
+    'vehicle.truck': ('truck', [2.6, 8.5, 3.3], 7.0, 0.1),
+    'vehicle.bicycle': ('bicycle', [0.6, 1.8, 1.4], 4.0, 0.1),
+    'human.pedestrian.adult': ('pedestrian', [0.7, 0.7, 1.8], 1.3, 0.25),
+}
+SIZE_VARIATION = 0.1
+
+# Detections of the ground truth boxes
+DETECTION_RECALL = 0.9
+POSITION_NOISE = 0.15
+SIZE_NOISE = 0.05
+YAW_NOISE = 0.05
+CONFUSION_RATE = 0.05
+
+CAMERA_NAMES = ["CAM_FRONT", "CAM_FRONT_RIGHT", "CAM_BACK_RIGHT", "CAM_BACK", "CAM_BACK_LEFT", "CAM_FRONT_LEFT"]
+# Camera facing the vehicle's x axis, with z forward, x right and y down in the camera frame
+FRONT_CAMERA_ROTATION = [0.5, -0.5, 0.5, -0.5]
+CAMERA_HEIGHT = 1.5
+CAMERA_FOV = 70.0
+
+LIDAR_HEIGHT = 1.8
+LIDAR_BEAMS = 32
+LIDAR_ELEVATION = (-30.0, 10.0)
+LIDAR_RANGE = 80.0
+WALL_RANGE = (30.0, 80.0)
+RANGE_NOISE = 0.02
+
+
+def yaw_quaternion(yaw):
+    """Returns the [w,x,y,z] quaternion of a rotation about the z axis"""
+    return [float(np.cos(yaw / 2)), 0.0, 0.0, float(np.sin(yaw / 2))]
+
+
+def camera_names(num_cameras):
+    """Returns the nuScenes camera names for up to 6 cameras, numbered names otherwise"""
+    if num_cameras <= len(CAMERA_NAMES):
+        return CAMERA_NAMES[:num_cameras]
+    return ["CAM_" + str(i) for i in range(num_cameras)]
+
+
+def ego_trajectory(num_frames):
+    """Returns the pose of the vehicle in every frame
+    Args:
+        num_frames: number of frames
+    Returns:
+        positions: [num_frames, 2] (x, y) in the world frame
+        yaws: [num_frames] heading in radians
+        """
+    t = np.arange(num_frames) * FRAME_PERIOD
+    yaws = 0.3 * np.sin(2 * np.pi * t / 60)
+    steps = EGO_SPEED * FRAME_PERIOD * np.stack((np.cos(yaws), np.sin(yaws)), axis=1)
+    positions = np.concatenate((np.zeros((1, 2)), np.cumsum(steps[:-1], axis=0)))
+    return positions, yaws
+
+
+class Tracks:
+    """Objects of a scene, each moving with a constant speed and yaw rate between its first and last frame"""
+    def __init__(self, num_frames, boxes_per_frame, ego_positions, ego_yaws, rng):
+        """
+        Args:
+            num_frames: number of frames
+            boxes_per_frame: mean number of tracks alive in a frame
+            ego_positions: [num_frames, 2] positions of the vehicle
+            ego_yaws: [num_frames] headings of the vehicle
+            rng: numpy random generator
+            """
+        # Lifetimes are uniform in [TRACK_FRAMES / 2, 3 * TRACK_FRAMES / 2], tracks may start before the
+        # first frame so the first frames are as busy as the others
+        self.max_lifetime = 3 * TRACK_FRAMES // 2
+        num_tracks = int(round(boxes_per_frame * (num_frames + TRACK_FRAMES) / TRACK_FRAMES))
+        names = list(CLASSES)
+        shares = np.array([CLASSES[name][3] for name in names])
+        self.class_ids = rng.choice(len(names), num_tracks, p=shares / shares.sum())
+        self.names = names
+        starts = rng.integers(-TRACK_FRAMES, max(num_frames, 1), num_tracks)
+        order = np.argsort(starts, kind="stable")
+        self.class_ids = self.class_ids[order]
+        self.starts = starts[order]
+        self.ends = self.starts + rng.integers(TRACK_FRAMES // 2, self.max_lifetime + 1, num_tracks)
+
+        base_sizes = np.array([CLASSES[name][1] for name in names])[self.class_ids]
+        self.sizes = base_sizes * rng.uniform(1 - SIZE_VARIATION, 1 + SIZE_VARIATION, (num_tracks, 1))
+        speeds = np.array([CLASSES[name][2] for name in names])[self.class_ids]
+        self.speeds = speeds * rng.uniform(0.5, 1.2, num_tracks)
+        self.yaw_rates = rng.normal(0, 0.05, num_tracks)
+
+        # Placed around the vehicle at the first frame they are seen in
+        first = np.clip(self.starts, 0, num_frames - 1)
+        angle = rng.uniform(0, 2 * np.pi, num_tracks)
+        distance = rng.uniform(SPAWN_RANGE[0], SPAWN_RANGE[1], num_tracks)
+        offset = distance[:, None] * np.stack((np.cos(angle), np.sin(angle)), axis=1)
+        self.positions = ego_positions[first] + offset
+        # Vehicles drive along the road in either direction, pedestrians walk anywhere
+        along_road = ego_yaws[first] + np.where(rng.random(num_tracks) < 0.7, 0.0, np.pi)
+        walking = np.array([name.startswith("human") for name in names])[self.class_ids]
+        self.yaws = np.where(walking, rng.uniform(0, 2 * np.pi, num_tracks), along_road)
+        # Motion is measured from the frame the track is placed in
+        self.first = first
+        self.ids = np.array(["track_" + str(i) for i in range(num_tracks)])
+
+    def alive(self, frame_num):
+        """Returns the indices of the tracks present in a frame"""
+        low = np.searchsorted(self.starts, frame_num - self.max_lifetime, side="right")
+        high = np.searchsorted(self.starts, frame_num, side="right")
+        candidates = np.arange(low, high)
+        return candidates[self.ends[candidates] > frame_num]
+
+    def states(self, indices, frame_num):
+        """Returns the world positions [n, 2] and yaws [n] of some tracks in a frame"""
+        t = (frame_num - self.first[indices]) * FRAME_PERIOD
+        yaw0 = self.yaws[indices]
+        rate = self.yaw_rates[indices]
+        speed = self.speeds[indices]
+        yaws = yaw0 + rate * t
+        # Exact integration of a constant yaw rate, straight lines where it is close to zero
+        turning = np.abs(rate) > 1e-6
+        safe_rate = np.where(turning, rate, 1.0)
+        dx = np.where(turning, speed / safe_rate * (np.sin(yaws) - np.sin(yaw0)), speed * t * np.cos(yaw0))
+        dy = np.where(turning, speed / safe_rate * (np.cos(yaw0) - np.cos(yaws)), speed * t * np.sin(yaw0))
+        return self.positions[indices] + np.stack((dx, dy), axis=1), yaws
+
+
+def camera_intrinsic(image_size, fov=CAMERA_FOV):
+    """Returns the 3x3 intrinsic matrix of a pinhole camera with a horizontal field of view in degrees"""
+    focal = image_size[0] / (2 * np.tan(np.radians(fov) / 2))
+    return [[focal, 0.0, image_size[0] / 2], [0.0, focal, image_size[1] / 2], [0.0, 0.0, 1.0]]
+
+
+def camera_image(image_size, rng):
+    """Returns a sky and ground image with some noise, so it compresses like a photo"""
+    width, height = image_size
+    rows = np.linspace(0, 1, height)[:, None, None]
+    sky = np.array([150, 190, 235]) * (1 - rows) + np.array([200, 210, 220]) * rows
+    ground = np.array([95, 95, 90]) + 40 * rows
+    image = np.where(rows < 0.5, sky, ground) + rng.normal(0, 12, (height, width, 3))
+    return Image.fromarray(np.clip(image, 0, 255).astype(np.uint8))
+
+
+def lidar_origins(num_sensors):
+    """Returns the position of every lidar sensor in the ego frame, one on the roof and the others at the corners"""
+    corners = [[1.5, 0.9, 0.8], [1.5, -0.9, 0.8], [-1.5, 0.9, 0.8], [-1.5, -0.9, 0.8]]
+    origins = [[0.0, 0.0, LIDAR_HEIGHT]] + [corners[i % len(corners)] for i in range(num_sensors - 1)]
+    return np.array(origins[:num_sensors])
+
+
+def _sector(azimuths, center, half_width):
+    """Returns the indices of the rays, sorted by azimuth in [0, 2pi), within half_width of an azimuth"""
+    if half_width >= np.pi:
+        return np.arange(len(azimuths))
+    low = (center - half_width) % (2 * np.pi)
+    high = (center + half_width) % (2 * np.pi)
+    start, stop = np.searchsorted(azimuths, low), np.searchsorted(azimuths, high, side="right")
+    if low <= high:
+        return np.arange(start, stop)
+    return np.concatenate((np.arange(start, len(azimuths)), np.arange(0, stop)))
+
+
+def cast_rays(origin, directions, azimuths, centers, sizes, yaws, rng):
+    """Casts lidar rays against the ground, distant walls and boxes
+    Args:
+        origin: [3] position of the sensor in the ego frame
+        directions: [n, 3] unit directions of the rays, sorted by azimuth
+        azimuths: [n] sorted azimuths of the rays in [0, 2pi)
+        centers: [m, 3] centers of the boxes in the ego frame
+        sizes: [m, 3] (w, l, h) of the boxes
+        yaws: [m] headings of the boxes in the ego frame
+        rng: numpy random generator
+    Returns:
+        points: [n, 3] points where the rays hit, in the ego frame
+        hits: [n] index of the box every ray hit, -1 for the ground and walls
+        """
+    n = len(directions)
+    ranges = rng.uniform(WALL_RANGE[0], WALL_RANGE[1], n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ground = np.where(directions[:, 2] < 0, -origin[2] / directions[:, 2], np.inf)
+    ranges = np.minimum(np.minimum(ranges, ground), LIDAR_RANGE)
+    hits = np.full(n, -1, dtype=np.int64)
+
+    for i in range(len(centers)):
+        # Only the rays within the azimuth range the box covers can hit it
+        relative = origin - centers[i]
+        distance = np.hypot(relative[0], relative[1])
+        radius = np.hypot(sizes[i][0], sizes[i][1]) / 2
+        half_width = np.arcsin(radius / distance) if distance > radius else np.pi
+        rays = _sector(azimuths, np.arctan2(-relative[1], -relative[0]) % (2 * np.pi), half_width)
+        if len(rays) == 0:
+            continue
+
+        # Slab test in the frame of the box, x along its length
+        cos, sin = np.cos(yaws[i]), np.sin(yaws[i])
+        local_origin = np.array([cos * relative[0] + sin * relative[1], -sin * relative[0] + cos * relative[1], relative[2]])
+        d = directions[rays]
+        local_directions = np.stack((cos * d[:, 0] + sin * d[:, 1], -sin * d[:, 0] + cos * d[:, 1], d[:, 2]), axis=1)
+        half = np.array([sizes[i][1], sizes[i][0], sizes[i][2]]) / 2
+        with np.errstate(divide="ignore", invalid="ignore"):
+            t1 = (-half - local_origin) / local_directions
+            t2 = (half - local_origin) / local_directions
+        t_enter = np.max(np.minimum(t1, t2), axis=1)
+        t_exit = np.min(np.maximum(t1, t2), axis=1)
+        closer = (t_exit >= t_enter) & (t_enter > 0) & (t_enter < ranges[rays])
+        ranges[rays[closer]] = t_enter[closer]
+        hits[rays[closer]] = i
+
+    ranges = ranges + rng.normal(0, RANGE_NOISE, n)
+    return origin + directions * ranges[:, None], hits
+
+
+def lidar_directions(num_rays, rng):
+    """Returns the unit directions of the rays of one sweep, spread over the beams of a spinning lidar
+    Returns:
+        directions: [n, 3] unit directions, in the order the lidar spins through them
+        azimuths: [n] sorted azimuths in [0, 2pi)
+        """
+    elevations = np.radians(np.linspace(LIDAR_ELEVATION[0], LIDAR_ELEVATION[1], LIDAR_BEAMS))[rng.integers(0, LIDAR_BEAMS, num_rays)]
+    azimuths = np.sort(rng.uniform(0, 2 * np.pi, num_rays))
+    directions = np.stack((np.cos(elevations) * np.cos(azimuths), np.cos(elevations) * np.sin(azimuths), np.sin(elevations)), axis=1)
+    return directions, azimuths
+
+
+def predictions(gt_boxes, pred_rate, false_positive_rate, rng):
+    """Returns noisy detections of the ground truth boxes of a frame plus some false positives
+    Args:
+        gt_boxes: (origins, sizes, yaws, class ids) of the ground truth boxes in the ego frame
+        pred_rate: probability that a ground truth box is detected
+        false_positive_rate: mean number of false positives per frame, placed around the vehicle
+        rng: numpy random generator
+    Returns:
+        origins, sizes, rotations, annotation names and confidences of the predicted boxes
+        """
+    origins, sizes, yaws, class_ids = gt_boxes
+    names = list(CLASSES)
+    detected = rng.random(len(origins)) < pred_rate
+    pred_origins = origins[detected] + rng.normal(0, POSITION_NOISE, (int(detected.sum()), 3)) * [1, 1, 0.3]
+    pred_sizes = sizes[detected] * rng.normal(1, SIZE_NOISE, (int(detected.sum()), 3))
+    pred_yaws = yaws[detected] + rng.normal(0, YAW_NOISE, int(detected.sum()))
+    pred_classes = class_ids[detected]
+    confused = rng.random(len(pred_classes)) < CONFUSION_RATE
+    pred_classes = np.where(confused, rng.integers(0, len(names), len(pred_classes)), pred_classes)
+    confidences = 100 * rng.beta(5, 2, len(pred_classes))
+
+    num_false = rng.poisson(false_positive_rate)
+    false_classes = rng.integers(0, len(names), num_false)
+    angle = rng.uniform(0, 2 * np.pi, num_false)
+    distance = rng.uniform(SPAWN_RANGE[0], SPAWN_RANGE[1], num_false)
+    false_sizes = np.array([CLASSES[names[c]][1] for c in false_classes]).reshape(-1, 3)
+    false_origins = np.stack((distance * np.cos(angle), distance * np.sin(angle), false_sizes[:, 2] / 2), axis=1)
+
+    pred_origins = np.concatenate((pred_origins, false_origins))
+    pred_sizes = np.concatenate((pred_sizes, false_sizes))
+    pred_yaws = np.concatenate((pred_yaws, rng.uniform(0, 2 * np.pi, num_false)))
+    pred_classes = np.concatenate((pred_classes, false_classes)).astype(np.int64)
+    confidences = np.concatenate((confidences, 100 * rng.beta(2, 5, num_false)))
+    return (pred_origins.tolist(), pred_sizes.tolist(), [yaw_quaternion(yaw) for yaw in pred_yaws],
+            [CLASSES[names[c]][0] for c in pred_classes], [int(c) for c in np.clip(np.round(confidences), 0, 100)])
+
+
+def generate_scene(path, num_frames=40, num_cameras=6, num_lidars=1, points_per_sweep=30000, gt_boxes=30, pred_boxes=35,
+                   image_size=(1600, 900), seed=0, binary_points=False, build_lod=False, verbose=False):
+    """Writes a synthetic LCT directory
+    Args:
+        path: path of the LCT directory to create
+        num_frames: number of frames
+        num_cameras: number of cameras, spread evenly around the vehicle
+        num_lidars: number of lidar sensors
+        points_per_sweep: number of points of every sweep of every lidar sensor
+        gt_boxes: mean number of ground truth boxes per frame
+        pred_boxes: mean number of predicted boxes per frame, noisy detections first and false positives for the rest
+        image_size: (width, height) of the camera images
+        seed: random seed, the same arguments always write the same scene
+        binary_points: True to store point clouds in the .bin format instead of .pcd, like the -b flag of the converters
+        build_lod: True to build the level-of-detail pyramid of the point clouds
+        verbose: True to print a progress bar
+    Returns:
+        None
+        """
+    rng = np.random.default_rng(seed)
+    parent, name = os.path.split(os.path.abspath(path))
+    dataformat_utils.create_lct_directory(parent, name)
+    path = os.path.join(parent, name)
+
+    names = list(CLASSES)
+    dataformat_utils.create_annotation_map(path, {gt_name: [CLASSES[gt_name][0]] for gt_name in names})
+
+    # Cameras evenly spread around the vehicle, clockwise from the front like nuScenes
+    cameras = camera_names(num_cameras)
+    intrinsic = camera_intrinsic(image_size)
+    for i, camera in enumerate(cameras):
+        yaw = -2 * np.pi * i / num_cameras
+        rotation = Quaternion(yaw_quaternion(yaw)) * Quaternion(FRONT_CAMERA_ROTATION)
+        translation = [float(np.cos(yaw)), float(np.sin(yaw)), CAMERA_HEIGHT]
+        dataformat_utils.create_rgb_sensor_directory(path, camera, translation, list(rotation.elements), intrinsic)
+        # Every frame of a camera shares one image, encoding it once keeps large scenes quick to write
+        dataformat_utils.add_rgb_frame(path, camera, 0, camera_image(image_size, rng))
+
+    lidars = (["LIDAR_TOP"] + ["LIDAR_" + str(i) for i in range(1, num_lidars)])[:num_lidars]
+    for lidar in lidars:
+        dataformat_utils.create_lidar_sensor_directory(path, lidar)
+    origins = lidar_origins(num_lidars)
+
+    ego_positions, ego_yaws = ego_trajectory(num_frames)
+    tracks = Tracks(num_frames, gt_boxes, ego_positions, ego_yaws, rng)
+    pred_rate = min(DETECTION_RECALL, pred_boxes / gt_boxes) if gt_boxes > 0 else 0.0
+    false_positive_rate = max(pred_boxes - pred_rate * gt_boxes, 0.0)
+    timestamps = [START_TIMESTAMP + int(frame_num * FRAME_PERIOD * 1e6) for frame_num in range(num_frames)]
+
+    if verbose:
+        dataformat_utils.print_progress_bar(0, num_frames)
+    for frame_num in range(num_frames):
+        dataformat_utils.create_ego_directory(path, frame_num, [float(ego_positions[frame_num][0]), float(ego_positions[frame_num][1]), 0.0],
+                                              yaw_quaternion(ego_yaws[frame_num]))
+
+        # Ground truth boxes in the ego frame
+        indices = tracks.alive(frame_num)
+        positions, yaws = tracks.states(indices, frame_num)
+        cos, sin = np.cos(ego_yaws[frame_num]), np.sin(ego_yaws[frame_num])
+        relative = positions - ego_positions[frame_num]
+        sizes = tracks.sizes[indices]
+        centers = np.stack((cos * relative[:, 0] + sin * relative[:, 1], -sin * relative[:, 0] + cos * relative[:, 1],
+                            sizes[:, 2] / 2), axis=1)
+        yaws = yaws - ego_yaws[frame_num]
+
+        internal_points = np.zeros(len(indices), dtype=np.int64)
+        for sensor, origin in zip(lidars, origins):
+            directions, azimuths = lidar_directions(points_per_sweep, rng)
+            points, hits = cast_rays(origin, directions, azimuths, centers, sizes, yaws, rng)
+            internal_points += np.bincount(hits[hits >= 0], minlength=len(indices))
+            dataformat_utils.add_lidar_frame(path, sensor, frame_num, points.astype(np.float32), binary=binary_points)
+
+        dataformat_utils.create_frame_bounding_directory(path, frame_num, centers.tolist(), sizes.tolist(),
+                                                         [yaw_quaternion(yaw) for yaw in yaws],
+                                                         [names[c] for c in tracks.class_ids[indices]], [101] * len(indices),
+                                                         tracks.ids[indices].tolist(), internal_points.tolist())
+        (pred_origins, pred_sizes, pred_rotations, pred_names, confidences) = predictions(
+            (centers, sizes, yaws, tracks.class_ids[indices]), pred_rate, false_positive_rate, rng)
+        dataformat_utils.create_frame_bounding_directory(path, frame_num, pred_origins, pred_sizes, pred_rotations, pred_names,
+                                                         confidences, None, None, predicted=True)
+
+        if frame_num > 0:
+            for camera in cameras:
+                dataformat_utils.add_rgb_frame_from_jpg(path, camera, frame_num, os.path.join(path, "cameras", camera, "0.jpg"))
+        if verbose:
+            dataformat_utils.print_progress_bar(frame_num + 1, num_frames)
+
+    dataformat_utils.add_timestamps(path, [str(timestamp) for timestamp in timestamps])
+    dataformat_utils.create_box_store(path)
+    dataformat_utils.create_manifest(path)
+    dataformat_utils.create_frame_index(path)
+    dataformat_utils.create_pose_table(path, timestamps)
+    dataformat_utils.create_image_cache(path)
+    if build_lod:
+        dataformat_utils.create_lod(path)
+    dataformat_utils.add_metadata(path, 'synthetic', ['timestamps.json'])
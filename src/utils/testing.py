@@ -5,15 +5,21 @@ Testing functions to validate LVT directories
 
 """
 import os
+from utils import scene_loader
+
+# Directories every LCT scene has at its root
+LCT_DIRECTORIES = ["cameras", "pointcloud", "bounding", "ego", "pred_bounding"]
 
 
 def is_lct_directory(path):
     """Tests to see if specified directory conforms to LCT spec
     Args:
-        path: path to LCT directory
+        path: path to LCT directory or scene pack
     Returns:
         is_verified: True if LCT directory is valid or False if not
     """
+    if scene_loader.is_pack(path):
+        return is_lct_pack(path)
 
     # Individual verification bools
     cameras_exist = os.path.exists(os.path.join(path, "cameras"))
@@ -59,6 +65,32 @@ def is_lct_directory(path):
 
 
 
+def is_lct_pack(path):
+    """Tests to see if a scene pack holds an LCT directory, by reading its index
+    Args:
+        path: path to scene pack
+    Returns:
+        is_verified: True if the pack is valid or False if not
+    """
+    try:
+        source = scene_loader.open_scene(path)
+    except (OSError, ValueError):
+        print(path + " is not an LCT scene pack.\n")
+        return False
+
+    is_verified = True
+    for name in LCT_DIRECTORIES:
+        if not source.exists(name):
+            print("There is no directory named \"" + name + "\" in the scene pack.\n")
+            is_verified = False
+    if source.exists("bounding"):
+        for frame in source.listdir("bounding"):
+            if not source.exists("bounding/" + frame + "/boxes.json"):
+                print("There is not a boxes.json file in the " + frame + " directory")
+                is_verified = False
+    return is_verified
+
+
 def check_inside_cameras(path):
     """Checks to make sure that all the subdirectories of cameras only have Extrinsic.json, Intrinsic.json and .jpg files
     Prints out reason for invalidity if one exists
@@ -103,7 +135,7 @@ def check_inside_cameras(path):
 
 
 def check_inside_pointcloud(path):
-    """Checks to make sure that all the subdirectories of pointcloud only have .pcd files
+    """Checks to make sure that all the subdirectories of pointcloud only have .pcd or .bin files
     Prints out reason for invalidity if one exists
     Args:
         path: path to pointcloud directory
@@ -120,9 +152,9 @@ def check_inside_pointcloud(path):
             if file == ".DS_Store":
                 continue # check for MacOS
             extension = file[-4:]
-            if extension != ".pcd":
+            if extension != ".pcd" and extension != ".bin":
                 is_verified = False
-                print("There is a file in " + dir + " that is not a .pcd file")
+                print("There is a file in " + dir + " that is not a .pcd or .bin file")
     
     return is_verified
 
@@ -0,0 +1,416 @@
+"""
+viewer-benchmark.py
+
+Measures the latency of the viewer's update stages without opening any window.
+
+The viewer's data path (fetch_frame_data, update_poses, update_bounding, update_image,
+update_pointcloud, update_box_geometry) runs against an LCT directory or scene pack, with the 3D
+scene rendered by an OffscreenRenderer. Scripted frame sweeps, filter toggles and sensor switches
+are replayed, and the p50/p95/p99 latency of every stage and the peak RSS of the process are
+printed and written to a JSON file, so results can be compared across commits. Without a scene,
+a synthetic one is generated (see utils/synthetic_scene.py), so the benchmark also runs offline.
+
+Startup is recorded too: the time to import lct in a fresh interpreter, to show the first frame,
+and to load the class catalog the GUI fills its filter lists from in the background.
+
+Stages that only exist for the GUI are left out: the finer LOD levels are not streamed in (the
+benchmark measures what is shown on a switch), and LOD pyramids are never written to the scene.
+"""
+import functools
+import getopt
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import open3d as o3d
+import lct
+from utils import frame_cache
+from utils import image_utils
+from utils import manifest
+from utils import matching
+from utils import pose_table
+from utils import prefetch
+from utils import render_utils
+from utils import scene_loader
+from utils import synthetic_scene
+from utils import testing
+
+# Stages of Window.update() that are timed, in the order they run
+STAGES = ["fetch_frame_data", "update_poses", "update_bounding", "update_image", "update_pointcloud", "update_box_geometry"]
+PERCENTILES = (50, 95, 99)
+RENDER_SIZE = (1280, 720)
+# Fresh interpreters lct is imported in, the median import time is reported
+IMPORT_RUNS = 3
+
+
+def parse_options():
+    """Parses the command line options
+    Args:
+        None
+    Returns:
+        lct_path: path to LCT directory or scene pack, or "" to generate a synthetic scene
+        synthetic_frames: number of frames of the synthetic scene
+        output_path: path of the JSON results file
+        num_frames: number of frames in every sweep, 0 for every frame
+        repeats: number of times every scenario is replayed
+        use_prefetch: True to switch frames through the prefetcher
+        dwell: seconds spent on every frame before switching to the next one
+        budget: point budget, 0 to draw every point
+        """
+    lct_path = ""
+    synthetic_frames = 100
+    output_path = "viewer-benchmark.json"
+    num_frames = 0
+    repeats = 1
+    use_prefetch = False
+    dwell = 0.0
+    budget = 0
+
+    try:
+        opts, _ = getopt.getopt(sys.argv[1:], "hf:g:o:n:r:pd:b:", "help")
+    except getopt.GetoptError as err:
+        print(err)
+        sys.exit(2)
+
+    for opt, arg in opts:
+        if opt in ("-h", "--help"):
+            print("OPTIONAL: -f to specify the LCT directory or scene pack to benchmark (default a synthetic scene)")
+            print("OPTIONAL: -g to specify the number of frames of the synthetic scene when -f is not given (default 100)")
+            print("OPTIONAL: -o to specify the JSON results file (default viewer-benchmark.json)")
+            print("OPTIONAL: -n to specify the number of frames in every sweep (default every frame)")
+            print("OPTIONAL: -r to specify how many times every scenario is replayed (default 1)")
+            print("OPTIONAL: -p to switch frames through the prefetcher, like the GUI does")
+            print("OPTIONAL: -d to specify the milliseconds spent on every frame before the next switch (default 0)")
+            print("OPTIONAL: -b to draw the point cloud within a point budget")
+            sys.exit(2)
+        elif opt == "-f":
+            lct_path = arg
+        elif opt == "-g":
+            synthetic_frames = int(arg)
+        elif opt == "-o":
+            output_path = arg
+        elif opt == "-n":
+            num_frames = int(arg)
+        elif opt == "-r":
+            repeats = int(arg)
+        elif opt == "-p":
+            use_prefetch = True
+        elif opt == "-d":
+            dwell = int(arg) / 1000
+        elif opt == "-b":
+            budget = int(arg)
+        else:
+            sys.exit(2)
+
+    if lct_path != "" and not (scene_loader.is_pack(lct_path) or testing.is_lct_directory(lct_path)):
+        sys.exit("-f must be an LVT directory or scene pack (.lctpack)")
+    return (lct_path, synthetic_frames, output_path, num_frames, repeats, use_prefetch, dwell, budget)
+
+
+class HeadlessWidget:
+    """Stands in for the windows and widgets the update stages draw into"""
+    def __init__(self, scene=None):
+        self.scene = scene
+
+    def post_redraw(self):
+        pass
+
+    def force_redraw(self):
+        pass
+
+    def update_image(self, image):
+        pass
+
+    def add_3d_label(self, position, text):
+        return HeadlessWidget()
+
+    def remove_3d_label(self, label):
+        pass
+
+
+class HeadlessWindow(lct.Window):
+    """Viewer window whose update stages run without a GUI, rendering into an OffscreenRenderer"""
+    def __init__(self, lct_dir, use_prefetch=False, budget=0):
+        self.lct_path = lct_dir
+        self.scene = scene_loader.open_scene(lct_dir)
+        self.manifest = manifest.load_manifest(lct_dir)
+        self.poses = pose_table.load_pose_table(lct_dir)
+        self.pointcloud_generation = 0
+        self.point_budget_enabled = budget > 0
+        self.point_budget = budget
+        self.point_grid = None
+        self.shown_points = None
+        self.point_budget_pending = False
+        if self.manifest is not None:
+            self.camera_sensors = list(self.manifest.camera_sensors)
+            self.lidar_sensors = list(self.manifest.lidar_sensors)
+            self.num_frames = self.manifest.num_frames
+            self.pred_frames = self.num_frames - 1
+        else:
+            self.camera_sensors, self.lidar_sensors = self.get_cams_and_pointclouds(lct_dir)
+            self.num_frames = len([entry for entry in self.scene.listdir("bounding") if entry != ".DS_Store"])
+            self.pred_frames = len(self.scene.listdir("bounding")) - 1
+
+        # Same defaults as the GUI
+        self.box_data_name = ["bounding"]
+        self.min_confidence = 50
+        self.highlight_faults = False
+        self.show_false_positive = False
+        self.show_incorrect_annotations = False
+        self.match_criterion = matching.MatchCriterion()
+        self.show_gt = False
+        self.compare_bounding = False
+        self.show_score = False
+        self.boxes_to_render = []
+        self.box_indices = []
+        self.box_table = None
+        self.label_list = []
+        self.filter_arr = []
+        self.pred_filter_arr = []
+        self.rgb_sensor_name = self.camera_sensors[0]
+        self.pcd_paths = []
+        self.frame_num = 0
+        self.boxes = {'boxes': []}
+        self.pred_boxes = {'boxes': []}
+        # Filled in by populate_class_filters, like the GUI does once the class catalog is loaded
+        self.gt_classes = []
+        self.pred_classes = []
+        self.all_pred_annotations = []
+        self.check_horiz = []
+        self.pred_check_horiz = []
+        self.color_map = {}
+        self.pred_color_map = {}
+
+        self.renderer = o3d.visualization.rendering.OffscreenRenderer(*RENDER_SIZE)
+        self.renderer.scene.set_background([0, 0, 0, 255])
+        self.controls = HeadlessWidget()
+        self.pointcloud_window = HeadlessWidget()
+        self.image_window = HeadlessWidget()
+        self.image_widget = HeadlessWidget()
+        self.precision_recall_label = HeadlessWidget()
+        self.precision_recall_image = HeadlessWidget()
+        self.widget3d = HeadlessWidget(self.renderer.scene)
+
+        self.mat = o3d.visualization.rendering.MaterialRecord()
+        self.mat.shader = "defaultUnlit"
+        self.mat.point_size = 2
+        self.line_mat = o3d.visualization.rendering.MaterialRecord()
+        self.line_mat.shader = "unlitLine"
+        self.line_mat.line_width = .25
+        self.pointcloud_slot = render_utils.PointCloudSlot(self.widget3d.scene, "Point Cloud", self.mat)
+        self.rgb_line_slot = render_utils.PosedSlot(self.widget3d.scene, "RGB Line", render_utils.camera_line(), self.line_mat)
+
+        self.frame_data = None
+        self.pending_frame = None
+        self.use_prefetch = use_prefetch
+        # Ready frames are picked up by step(), there is no event loop to post them to
+        self.prefetcher = prefetch.FramePrefetcher(self.load_frame_data)
+        self.match_sweep = None
+        self.match_sweep_key = None
+        self.precision_recall = None
+        # Durations of every stage by scenario, and of the stages run by the current step
+        self.timings = {}
+        self.recording = None
+        for name in STAGES:
+            setattr(self, name, self.timed_stage(name, getattr(type(self), name)))
+
+    def populate_class_filters(self, gt_classes, pred_classes):
+        # There are no filter checkboxes, update_bounding reads colors from the color maps only
+        self.gt_classes = list(gt_classes)
+        self.pred_classes = list(pred_classes)
+        self.all_pred_annotations = list(pred_classes)
+        for i, annotation in enumerate(self.gt_classes + self.pred_classes):
+            target = self.color_map if i < len(self.gt_classes) else self.pred_color_map
+            target[annotation] = lct.colorlist[i % len(lct.colorlist)]
+        self.update(lct.DIRTY_COLORS)
+
+    def on_precision_recall_ready(self, result):
+        # Shown by the next update_bounding, there is no event loop to post it to
+        pass
+
+    def refine_pointcloud(self, generation, lod, frame_num, frame_extrinsic):
+        # Finer levels are streamed in after the user settles on a frame, not part of a switch
+        pass
+
+    def write_frame_lod(self, frame_num, points=None, lod=None):
+        # The benchmark never writes to the scene it measures
+        pass
+
+    def timed_stage(self, name, method):
+        """Wraps an update stage so its duration is recorded while a step is being timed"""
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            result = method(self, *args, **kwargs)
+            if self.recording is not None:
+                self.recording.setdefault(name, []).append(time.perf_counter() - start)
+            return result
+        return timed
+
+    def setup_camera(self):
+        """Looks down at the vehicle from 150m, like the GUI does when it opens a scene"""
+        center = np.asarray(self.poses.pose(self.frame_num)['translation'], dtype=np.float32)
+        eye = center + np.array([0, 0, 150.0], dtype=np.float32)
+        self.renderer.setup_camera(60.0, center, eye, [1, 0, 0])
+
+    def step(self, stages, action):
+        """Runs one scripted user action and renders the result
+        Args:
+            stages: dictionary from stage name to the list of its durations, None to run the action untimed
+            action: function without arguments that changes the window's state and calls update()
+        Returns:
+            None
+            """
+        self.recording = stages
+        start = time.perf_counter()
+        action()
+        if self.pending_frame is not None:
+            # The GUI shows a frame that is still being prefetched once it is loaded
+            self.prefetcher.wait(self.pending_frame)
+            self.show_loaded_frame(self.pending_frame)
+        update_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        self.renderer.render_to_image()
+        render_time = time.perf_counter() - start
+        self.recording = None
+        if stages is not None:
+            stages.setdefault("update", []).append(update_time)
+            stages.setdefault("render", []).append(render_time)
+
+    def switch_frame(self, frame_num):
+        if self.use_prefetch:
+            self.on_frame_switch(frame_num)
+        else:
+            self.frame_num = frame_num
+            self.update(lct.DIRTY_FRAME)
+
+
+def run_frame_sweep(window, frames, dwell):
+    stages = window.timings.setdefault("frame_sweep", {})
+    for frame_num in frames:
+        window.step(stages, functools.partial(window.switch_frame, frame_num))
+        if dwell > 0:
+            time.sleep(dwell)
+
+
+def run_filter_toggles(window, frames):
+    stages = window.timings.setdefault("filter_toggles", {})
+    for frame_num in frames:
+        window.step(None, functools.partial(window.switch_frame, frame_num))
+        for annotation in window.gt_classes:
+            window.step(stages, functools.partial(window.on_filter_check, annotation, True))
+            window.step(stages, functools.partial(window.on_filter_check, annotation, False))
+        for annotation in window.pred_classes:
+            window.step(stages, functools.partial(window.on_pred_filter_check, annotation, True))
+            window.step(stages, functools.partial(window.on_pred_filter_check, annotation, False))
+        window.step(stages, functools.partial(window.on_confidence_switch, 0))
+        window.step(stages, functools.partial(window.on_confidence_switch, 50))
+
+
+def run_sensor_switches(window, frames):
+    stages = window.timings.setdefault("sensor_switches", {})
+    for frame_num in frames:
+        window.step(None, functools.partial(window.switch_frame, frame_num))
+        for camera in window.camera_sensors[1:] + window.camera_sensors[:1]:
+            window.step(stages, functools.partial(window.on_sensor_select, camera, 0))
+
+
+def summarize(stages):
+    """Returns the sample count, mean and percentiles of every stage, in milliseconds"""
+    summary = {}
+    for name, times in stages.items():
+        times = np.asarray(times) * 1000
+        summary[name] = {'count': len(times), 'mean': float(np.mean(times))}
+        for percentile in PERCENTILES:
+            summary[name]['p' + str(percentile)] = float(np.percentile(times, percentile))
+    return summary
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of the process in MB, or None where it is not available"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Bytes on macOS, kilobytes everywhere else
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def import_time():
+    """Returns the median time taken to import lct in a fresh interpreter, in seconds"""
+    code = "import time; start = time.perf_counter(); import lct; print(time.perf_counter() - start)"
+    times = []
+    for _ in range(IMPORT_RUNS):
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__)))
+        if result.returncode != 0:
+            return None
+        times.append(float(result.stdout.strip().splitlines()[-1]))
+    return float(np.median(times))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+if __name__ == "__main__":
+    (lct_path, synthetic_frames, output_path, num_frames, repeats, use_prefetch, dwell, budget) = parse_options()
+    synthetic = lct_path == ""
+    if synthetic:
+        synthetic_dir = tempfile.TemporaryDirectory()
+        lct_path = os.path.join(synthetic_dir.name, "synthetic")
+        print("generating a synthetic scene of " + str(synthetic_frames) + " frames")
+        synthetic_scene.generate_scene(lct_path, num_frames=synthetic_frames)
+
+    start = time.perf_counter()
+    window = HeadlessWindow(lct_path, use_prefetch, budget)
+    window.setup_camera()
+    window.update()
+    first_frame = time.perf_counter() - start
+    start = time.perf_counter()
+    window.populate_class_filters(*window.class_catalog())
+    catalog = time.perf_counter() - start
+
+    frames = list(range(window.num_frames if num_frames <= 0 else min(num_frames, window.num_frames)))
+    for _ in range(repeats):
+        run_frame_sweep(window, frames, dwell)
+        run_filter_toggles(window, frames[:max(1, len(frames) // 10)])
+        run_sensor_switches(window, frames[:max(1, len(frames) // 10)])
+    window.prefetcher.shutdown()
+
+    import_seconds = import_time()
+    results = {
+        'lct_path': "synthetic" if synthetic else os.path.abspath(lct_path),
+        'commit': git_commit(),
+        'time': time.strftime("%Y-%m-%dT%H:%M:%S"),
+        'options': {'synthetic_frames': synthetic_frames if synthetic else None, 'frames': len(frames), 'repeats': repeats, 'prefetch': use_prefetch,
+                    'dwell_ms': dwell * 1000, 'point_budget': budget, 'render_size': list(RENDER_SIZE),
+                    'display_size': list(image_utils.DISPLAY_SIZE)},
+        'startup': {'import_ms': None if import_seconds is None else import_seconds * 1000, 'first_frame_ms': first_frame * 1000, 'catalog_ms': catalog * 1000},
+        'peak_rss_mb': peak_rss_mb(),
+        'frame_cache': frame_cache.get_cache().stats(),
+        'scenarios': {scenario: summarize(stages) for scenario, stages in window.timings.items()},
+    }
+    with open(output_path, "w") as f:
+        json.dump(results, f, indent=2)
+
+    for scenario, summary in results['scenarios'].items():
+        print(scenario)
+        print("  stage                  count    p50 (ms)    p95 (ms)    p99 (ms)")
+        for name in STAGES + ["update", "render"]:
+            if name in summary:
+                s = summary[name]
+                print(f"  {name:<20} {s['count']:>7}  {s['p50']:>10.2f}  {s['p95']:>10.2f}  {s['p99']:>10.2f}")
+    startup = results['startup']
+    print("startup: first frame " + f"{startup['first_frame_ms']:.1f} ms, class catalog {startup['catalog_ms']:.1f} ms, import " +
+          ("n/a" if startup['import_ms'] is None else f"{startup['import_ms']:.1f} ms"))
+    print("peak RSS: " + ("n/a" if results['peak_rss_mb'] is None else f"{results['peak_rss_mb']:.1f} MB"))
+    print("results written to " + output_path)
@@ -45,10 +45,15 @@ def parse_options():
     Returns:
         input_path: Path to waymo dataset being read into LVT
         output_path: Path where user wants LVT to generate generic data format used in program
+        batch_processing: True if input_path is a directory of tfrecord files
+        binary_points: True if point clouds should be stored as .bin files instead of .pcd files
+        build_lod: True if a level-of-detail pyramid should be built for the point clouds
     """
     input_path = ""
     output_path = ""
     batch_processing = False
+    binary_points = False
+    build_lod = False
 
     # User is able to specify -h, -f, -o, and -r options
     # -h brings up help menu
@@ -57,8 +62,10 @@ def parse_options():
     # -o is used to specify the path to the directory where the LVT format will go. If -r is specified then this folder will contain output
     # folders for each .tfrecord file read in
     # -r is used to specify the user is trying to batch process a set of files corresponding to the directory given with the -f flag
+    # -b is used to store point clouds in the float32 .bin format instead of .pcd
+    # -l is used to build a level-of-detail pyramid of the merged point clouds
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hf:o:r", "help")
+        opts, args = getopt.getopt(sys.argv[1:], "hf:o:rbl", "help")
     except getopt.GetoptError as err:
         print(err)
         sys.exit(2)
@@ -68,6 +75,8 @@ def parse_options():
             print("REQUIRED: -f to specify the path to the Waymo file")
             print("REQUIRED: -o to specify the name of the directory where the LVT format will go. Will be a folder in the current directory")
             print("OPTIONAL: -r to specify that the input to -f is a directory containing only tfrecord files to be converted")
+            print("OPTIONAL: -b to store point clouds in the float32 .bin format instead of .pcd")
+            print("OPTIONAL: -l to build a level-of-detail pyramid so the viewer can stream point clouds coarse to fine")
             sys.exit(2)
         elif opt == "-f":
             input_path = arg
@@ -76,10 +85,14 @@ def parse_options():
         elif opt == "-r":
             # Indicates that the user is trying to run batch processing
             batch_processing = True
+        elif opt == "-b":
+            binary_points = True
+        elif opt == "-l":
+            build_lod = True
         else:
             sys.exit(2)
 
-    return (input_path, output_path, batch_processing)
+    return (input_path, output_path, batch_processing, binary_points, build_lod)
 
 def extract_bounding(frame, frame_num, lct_path):
     """Extracts the bounding data from a waymo frame and converts it into our intermediate format
@@ -200,7 +213,7 @@ def setup_lidar(frame, lct_path, translations, rotations):
         translations[sensor] = translation
         rotations[sensor] = rotation
 
-def extract_lidar(frame, frame_num, lct_path, translations, rotations):
+def extract_lidar(frame, frame_num, lct_path, translations, rotations, binary_points=False):
     """Extracts LiDAR data from one frame and puts it in the lct file system
     Args:
         frame: waymo frame
@@ -208,6 +221,7 @@ def extract_lidar(frame, frame_num, lct_path, translations, rotations):
         lct_path: path to LCT directory
         translations: translation dictionary
         rotations: rotation dictionary
+        binary_points: True to write .bin files instead of .pcd files
     Returns:
         None
         """
@@ -220,7 +234,7 @@ def extract_lidar(frame, frame_num, lct_path, translations, rotations):
     for i, points in enumerate(point_clouds):
         # Sensor numbers are indexed from 1 in Waymo
         sensor = i+1
-        dataformat_utils.add_lidar_frame(lct_path, Lidar_Name[sensor], frame_num, points)
+        dataformat_utils.add_lidar_frame(lct_path, Lidar_Name[sensor], frame_num, points, binary=binary_points)
 
 def extract_ego(frame, frame_num, lct_path):
     """Extracts ego data from one frame and puts it in the lct file system
@@ -247,7 +261,7 @@ def count_frames(dataset):
         frame_count += 1
     return frame_count
 
-def convert_dataset(output_path, dataset):
+def convert_dataset(output_path, dataset, binary_points=False, build_lod=False):
     # Add metadata
     dataformat_utils.add_metadata(output_path, 'waymo', ['timestamps.json'])
 
@@ -258,6 +272,7 @@ def convert_dataset(output_path, dataset):
     frame_count = count_frames(dataset)
     executor = concurrent.futures.ThreadPoolExecutor(os.cpu_count() + 1)
     futures = []
+    timestamps = []
 
     # start progress bar
     dataformat_utils.print_progress_bar(0, frame_count)
@@ -265,6 +280,7 @@ def convert_dataset(output_path, dataset):
     for frame_num, data in enumerate(dataset):
         frame = open_dataset.Frame()
         frame.ParseFromString(bytearray(data.numpy()))
+        timestamps.append(frame.timestamp_micros)
         if frame_num == 0:
             setup_rgb(frame, output_path)
             setup_lidar(frame, output_path, translations, rotations)
@@ -274,7 +290,7 @@ def convert_dataset(output_path, dataset):
         # executor.submit starts a multithreaded proecss corresponding to the functions passed in as the first arg of the function call
         futures.append([executor.submit(extract_bounding, frame, frame_num, output_path),
         executor.submit(extract_rgb, frame, frame_num, output_path),
-        executor.submit(extract_lidar, frame, frame_num, output_path, translations, rotations),
+        executor.submit(extract_lidar, frame, frame_num, output_path, translations, rotations, binary_points),
         executor.submit(extract_ego, frame, frame_num, output_path)])
 
     # When each frame is done processing, update progress bar
@@ -284,8 +300,17 @@ def convert_dataset(output_path, dataset):
         frame_num += 1
         dataformat_utils.print_progress_bar(frame_num, frame_count)
 
+    # Every frame has been written, so the boxes can be packed into the scene-level store
+    dataformat_utils.create_box_store(output_path)
+    dataformat_utils.create_manifest(output_path)
+    dataformat_utils.create_frame_index(output_path)
+    dataformat_utils.create_pose_table(output_path, timestamps)
+    dataformat_utils.create_image_cache(output_path)
+    if build_lod:
+        dataformat_utils.create_lod(output_path)
+
 if __name__ == "__main__":
-    (input_path, output_path, batch_processing) = parse_options()
+    (input_path, output_path, batch_processing, binary_points, build_lod) = parse_options()
 
     # This list will remain empty if we're not batch processing, but if we're batch processing then it will list all the items being
     # proccessed
@@ -332,6 +357,6 @@ if __name__ == "__main__":
     if batch_processing:
         executor_batch = concurrent.futures.ThreadPoolExecutor(os.cpu_count() + 1)
         for dataset, item_name in zip(datasets, batch_items):
-            convert_dataset(output_path + "/" + item_name, dataset)
+            convert_dataset(output_path + "/" + item_name, dataset, binary_points, build_lod)
     else:
-        convert_dataset(output_path, datasets[0])
\ No newline at end of file
+        convert_dataset(output_path, datasets[0], binary_points, build_lod)
\ No newline at end of file
@@ -8,6 +8,8 @@ import getopt
 import os
 from utils import geometry_utils
 from utils import dataformat_utils
+from utils import box_store
+from utils import pointcloud_utils
 from waymo_open_dataset.utils import frame_utils
 import tensorflow as tf
 from waymo_open_dataset import dataset_pb2 as open_dataset
@@ -74,18 +76,18 @@ def clear_labels(labels):
     return labels
 
 def extract_bounding(frame, frame_num, input_path):
-    annotations = json.load(open(input_path + "/bounding/" + str(frame_num) + "/boxes.json"))
+    annotations = box_store.load_frame_boxes(input_path, "bounding", frame_num)
 
     # Keeps everything in old frame except annotations
     new_laser_labels = clear_labels(frame.laser_labels)
 
     
     # Load pointcloud points
-    pcd1 = o3d.io.read_point_cloud(input_path + "pointcloud/FRONT/" + str(frame_num) + ".pcd").points
-    pcd2 = o3d.io.read_point_cloud(input_path + "pointcloud/REAR/" + str(frame_num) + ".pcd").points
-    pcd3 = o3d.io.read_point_cloud(input_path + "pointcloud/SIDE_LEFT/" + str(frame_num) + ".pcd").points 
-    pcd4 = o3d.io.read_point_cloud(input_path + "pointcloud/SIDE_RIGHT/" + str(frame_num) + ".pcd").points 
-    pcd5 = o3d.io.read_point_cloud(input_path + "pointcloud/TOP/" + str(frame_num) + ".pcd").points     
+    pcd1 = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "FRONT", frame_num))
+    pcd2 = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "REAR", frame_num))
+    pcd3 = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "SIDE_LEFT", frame_num))
+    pcd4 = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "SIDE_RIGHT", frame_num))
+    pcd5 = pointcloud_utils.load_points(pointcloud_utils.points_path(input_path, "TOP", frame_num))
     
     for box in annotations["boxes"]:
         # assign a new random tracking id if one is not stored